@@ -16,6 +16,8 @@ import smtplib
 import hashlib  # <--- QUESTO MANCAVA E CAUSA ERRORI
 import math
 import time
+import tempfile
+import threading
 import mimetypes
 from urllib.parse import unquote, quote
 from pathlib import Path
@@ -44,7 +46,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 
 # Database (SQLAlchemy)
-from sqlalchemy import create_engine, Column, Integer, String, Text, Float, Date, ForeignKey, Boolean, or_, Identity, text, Index, inspect, case
+from sqlalchemy import create_engine, Column, Integer, String, Text, Float, Date, ForeignKey, Boolean, or_, and_, select, union_all, literal, Identity, text, Index, inspect, case
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship, scoped_session, selectinload
 from sqlalchemy.sql import func
 from sqlalchemy.exc import IntegrityError
@@ -288,6 +290,46 @@ def _codice_entrata_varianti(codice_entrata):
 app.jinja_env.globals['_codice_entrata_varianti'] = _codice_entrata_varianti
 
 
+def _chiave_codice_entrata(codice_entrata):
+    """Chiave canonica del codice entrata, uguale per barcode vecchi e nuovi.
+    È la forma senza cliente normalizzata, salvata in codice_entrata_key su articoli
+    e righe dei buoni di carico: ogni ricerca da QR/barcode diventa un confronto
+    di uguaglianza sull'indice.
+    Esempi:
+    - ENT-20260511-RFDEWAVE-71526 -> ENT2026051171526
+    - ENT-20260511-71526 -> ENT2026051171526
+    """
+    codice = (codice_entrata or '').strip()
+    parts = codice.split('-') if codice else []
+    if len(parts) >= 4 and parts[0].upper() == 'ENT':
+        resto = '-'.join(parts[3:]).strip()
+        if resto:
+            codice = f"ENT-{parts[1]}-{resto}"
+    return normalize_text_key(codice) or None
+
+
+def _cliente_codice_entrata(codice_entrata):
+    """Cliente contenuto nel codice entrata nuovo (ENT-data-CLIENTE-n), '' per i barcode vecchi."""
+    parts = (codice_entrata or '').strip().split('-')
+    if len(parts) >= 4 and parts[0].upper() == 'ENT' and '-'.join(parts[3:]).strip():
+        return _norm_token(parts[2])
+    return ''
+
+
+def _filtra_righe_codice_entrata(codice_entrata, rows):
+    """Tiene le righe trovate per chiave che non appartengono al codice nuovo di un altro cliente.
+    La chiave canonica unisce barcode vecchi e nuovi; clienti diversi con stessa data
+    e stesso N. arrivo restano però entrate separate.
+    """
+    cliente = _cliente_codice_entrata(codice_entrata)
+    if not cliente:
+        return list(rows or [])
+    return [
+        r for r in (rows or [])
+        if _cliente_codice_entrata(getattr(r, 'codice_entrata', None)) in ('', cliente)
+    ]
+
+
 def _codice_entrata_preferito(codice_entrata, rows=None):
     """Calcola il codice entrata preferito usando il cliente quando possibile.
     Se il barcode richiesto è vecchio, lo aggiorna al nuovo formato stabile.
@@ -464,6 +506,28 @@ def to_date_db(val):
     return None
 
 
+def parse_data_articolo(value):
+    """
+    Converte le date testuali degli articoli (YYYY-MM-DD, DD/MM/YYYY, timestamp...)
+    in datetime.date. Usata per tenere allineate le colonne DATE data_ingresso_dt/data_uscita_dt.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    s = str(value).strip().replace('T', ' ').split(' ')[0]
+    if not s:
+        return None
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d", "%d.%m.%Y", "%d/%m/%y"):
+        try:
+            return datetime.strptime(s[:10], fmt).date()
+        except Exception:
+            pass
+    return None
+
+
 
 def _safe_date_ymd(value):
     s = (value or '').strip()
@@ -708,6 +772,13 @@ class Articolo(Base):
     data_ingresso = Column(String(32)); n_ddt_ingresso = Column(Text)
     data_uscita = Column(String(32)); n_ddt_uscita = Column(Text)
     codice_entrata = Column(String(255))
+    # Copie DATE di data_ingresso/data_uscita (allineate dal before_flush, usate nei filtri SQL)
+    data_ingresso_dt = Column(Date)
+    data_uscita_dt = Column(Date)
+    # Cliente normalizzato con normalize_text_key (filtri per cliente indicizzati); Text come cliente
+    cliente_key = Column(Text)
+    # Codice entrata canonico (_chiave_codice_entrata): lookup QR/barcode per uguaglianza
+    codice_entrata_key = Column(String(255))
     created_by = Column(String(64))
     updated_by = Column(String(64))
     updated_at = Column(String(32))
@@ -737,6 +808,99 @@ class StoricoModificaLegacy(Base):
     data_modifica = Column(Text)
 
 
+class DashboardSnapshot(Base):
+    """Totali delle giacenze attive per la Home: una riga per cliente più la riga globale.
+
+    Aggiornata per differenza dagli hook di flush degli articoli e riallineata
+    periodicamente con un ricalcolo completo (vedi sezione 4a).
+    """
+    __tablename__ = "dashboard_snapshot"
+    cliente = Column(String(255), primary_key=True)  # UPPER(TRIM(cliente)); '__TOTALE__' = globale
+    righe = Column(Integer, nullable=False, default=0)
+    colli = Column(Integer, nullable=False, default=0)
+    m2 = Column(Float, nullable=False, default=0)
+    peso = Column(Float, nullable=False, default=0)
+    doganali = Column(Integer, nullable=False, default=0)
+    aggiornato_il = Column(String(32))
+    ricalcolato_il = Column(String(32))  # solo sulla riga globale: ultimo ricalcolo completo
+
+
+class FatturazioneSnapshot(Base):
+    """Report fatturazione già calcolato per un mese (righe e totali per cliente).
+
+    I mesi chiusi vengono serviti da qui senza ricalcolo; lo snapshot viene
+    invalidato quando una modifica articolo tocca date/m2 di quel mese (vedi sezione 4a):
+    dati svuotati e versione incrementata, così un calcolo iniziato prima non lo riscrive.
+    """
+    __tablename__ = "fatturazione_snapshot"
+    anno = Column(Integer, primary_key=True)
+    mese = Column(Integer, primary_key=True)
+    versione = Column(Integer, nullable=False, default=0)
+    chiuso = Column(Boolean, nullable=False, default=False)
+    dati = Column(Text)  # JSON {"rows": [...], "totals": {...}}
+    calcolato_il = Column(String(32))
+    calcolato_da = Column(String(255))
+
+
+class ImportExcelJob(Base):
+    """Import Excel eseguito in background: stato, avanzamento e checkpoint.
+
+    riga_checkpoint è l'ultima riga del foglio già salvata: ogni blocco di righe
+    viene inserito e committato insieme al checkpoint, così un job interrotto
+    riprende esattamente da lì.
+    """
+    __tablename__ = "import_excel_job"
+    id = Column(String(32), primary_key=True)
+    profilo = Column(String(255))
+    file_nome = Column(String(512))
+    file_path = Column(Text)
+    stato = Column(String(20), nullable=False, default='IN_CODA')  # IN_CODA / IN_CORSO / COMPLETATO / ERRORE
+    riga_intestazione = Column(Integer, nullable=False, default=1)
+    riga_checkpoint = Column(Integer, nullable=False, default=0)
+    righe_totali = Column(Integer)
+    importati = Column(Integer, nullable=False, default=0)
+    id_articoli = Column(Text)  # JSON [[da, a], ...]: ID creati dai blocchi salvati, per lo storico finale
+    errore = Column(Text)
+    utente = Column(String(64))
+    creato_il = Column(String(32))
+    aggiornato_il = Column(String(32))
+
+
+class AccettazioneOcrJob(Base):
+    """Lettura (testo PDF/OCR) di un documento di Accettazione Entrata eseguita in background.
+
+    risultato contiene i campi estratti (JSON) usati per precompilare la conferma.
+    """
+    __tablename__ = "accettazione_ocr_job"
+    id = Column(String(32), primary_key=True)
+    file_salvato = Column(String(512), nullable=False)
+    file_nome = Column(String(512))
+    stato = Column(String(20), nullable=False, default='IN_CODA')  # IN_CODA / IN_CORSO / COMPLETATO / ERRORE
+    risultato = Column(Text)
+    errore = Column(Text)
+    arrivo_prefill = Column(String(64))
+    colli_prefill = Column(String(32))
+    utente = Column(String(64))
+    creato_il = Column(String(32))
+    aggiornato_il = Column(String(32))
+
+
+class OcrCache(Base):
+    """Testo estratto (testo PDF e OCR) dei documenti caricati, per contenuto del file.
+
+    Chiave: digest del file, tipo di estrazione e pagina (0 = documento intero).
+    Dimensione totale limitata con eliminazione dei meno usati (vedi sezione 4d).
+    """
+    __tablename__ = "ocr_cache"
+    digest = Column(String(64), primary_key=True)
+    tipo = Column(String(32), primary_key=True)
+    pagina = Column(Integer, primary_key=True)
+    testo = Column(Text)
+    dimensione = Column(Integer, nullable=False, default=0)
+    creato_il = Column(String(32))
+    usato_il = Column(String(32), index=True)
+
+
 class Attachment(Base):
     __tablename__ = "attachments"
     id = Column(Integer, Identity(start=1), primary_key=True)
@@ -775,6 +939,7 @@ class BuonoCaricoScan(Base):
     messaggio = Column(Text)
     scanned_at = Column(String(32))
     scanned_by = Column(String(64))
+    id_offline = Column(String(64))  # id della scansione raccolta offline (reinvii idempotenti)
 
 
 class BuonoCaricoRiga(Base):
@@ -790,9 +955,27 @@ class BuonoCaricoRiga(Base):
     n_ddt_ingresso = Column(Text)
     data_ingresso = Column(String(32))
     codice_entrata = Column(String(255))
+    codice_entrata_key = Column(String(255))  # _chiave_codice_entrata(codice_entrata), allineata dal before_flush
     colli_previsti = Column(Integer)
     peso_previsto = Column(Float)
 
+
+class BuonoCaricoContatore(Base):
+    """Colli previsti / caricati / errori per QR di un buono, aggiornati a ogni scansione.
+
+    Una riga per chiave QR più la riga '__TOTALE__' del buono; ricostruita dalle
+    righe e dalle scansioni quando manca (vedi routes/buoni_qr.py).
+    """
+    __tablename__ = "buoni_carico_contatori"
+    __table_args__ = (Index("ux_buoni_carico_contatori_chiave", "buono_id", "qr_key", unique=True),)
+    id = Column(Integer, Identity(start=1), primary_key=True)
+    buono_id = Column(Integer, ForeignKey("buoni_carico.id", ondelete="CASCADE"), nullable=False)
+    qr_key = Column(String(255), nullable=False)  # _key_codice_entrata_buono(); '__TOTALE__' = buono
+    codice = Column(String(255))  # codice entrata da mostrare/salvare
+    previsti = Column(Integer, nullable=False, default=0)
+    ok = Column(Integer, nullable=False, default=0)
+    errori = Column(Integer, nullable=False, default=0)
+
 Base.metadata.create_all(engine)
 
 
@@ -872,6 +1055,105 @@ def ensure_audit_schema(engine):
 ensure_audit_schema(engine)
 
 
+# Colonne calcolate dagli altri campi dell'articolo, usate nei filtri SQL indicizzati.
+# nome colonna -> (campo sorgente, tipo SQL, funzione di calcolo)
+ARTICOLI_COLONNE_DERIVATE = {
+    'data_ingresso_dt': ('data_ingresso', 'DATE', parse_data_articolo),
+    'data_uscita_dt': ('data_uscita', 'DATE', parse_data_articolo),
+    'cliente_key': ('cliente', 'TEXT', lambda v: normalize_text_key(v) or None),
+    'codice_entrata_key': ('codice_entrata', 'VARCHAR(255)', _chiave_codice_entrata),
+}
+
+
+def ensure_articoli_colonne_derivate_schema(engine):
+    """Aggiunge le colonne derivate degli articoli se il database è già esistente."""
+    try:
+        insp = inspect(engine)
+        cols = {c.get('name'): str(c.get('type')).upper() for c in insp.get_columns('articoli')}
+    except Exception as e:
+        print(f"[WARN] impossibile ispezionare schema colonne derivate articoli: {e}")
+        return
+
+    for col, (_, typ, _) in ARTICOLI_COLONNE_DERIVATE.items():
+        if col not in cols:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE articoli ADD COLUMN {col} {typ}"))
+                print(f"[OK] aggiunta colonna {col} ad articoli")
+            except Exception as e:
+                print(f"[WARN] impossibile aggiungere colonna {col}: {e}")
+        elif typ == 'TEXT' and cols[col].startswith('VARCHAR') and engine.dialect.name == 'postgresql':
+            # Colonna creata VARCHAR(255) da versioni precedenti: la sorgente è Text, un valore lungo
+            # farebbe fallire backfill e flush. VARCHAR -> TEXT su PostgreSQL non riscrive la tabella.
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE articoli ALTER COLUMN {col} TYPE TEXT"))
+                print(f"[OK] colonna {col} di articoli convertita in TEXT")
+            except Exception as e:
+                print(f"[WARN] impossibile convertire colonna {col} in TEXT: {e}")
+
+
+def backfill_articoli_colonne_derivate(engine, batch_size=1000):
+    """Compila a blocchi le colonne derivate degli articoli partendo dai campi sorgente.
+
+    Legge solo le righe con un campo sorgente valorizzato ma senza la colonna derivata,
+    avanzando per id: i valori non interpretabili restano NULL e non bloccano il ciclo.
+    """
+    from sqlalchemy import update, bindparam
+
+    t = Articolo.__table__
+    derivate = list(ARTICOLI_COLONNE_DERIVATE.items())
+    da_compilare = or_(*[
+        (t.c[col] == None) & (func.coalesce(t.c[src], '') != '')
+        for col, (src, _, _) in derivate
+    ])
+    colonne = [t.c.id_articolo]
+    for col, (src, _, _) in derivate:
+        colonne += [t.c[src], t.c[col]]
+    stmt = (
+        update(t)
+        .where(t.c.id_articolo == bindparam('b_id'))
+        .values(**{col: bindparam(f'b_{col}') for col, _ in derivate})
+    )
+    last_id = 0
+    aggiornate = 0
+    try:
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(
+                    t.select()
+                    .with_only_columns(*colonne)
+                    .where(da_compilare, t.c.id_articolo > last_id)
+                    .order_by(t.c.id_articolo)
+                    .limit(batch_size)
+                ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                params = []
+                for row in rows:
+                    valori = {'b_id': row[0]}
+                    cambiato = False
+                    for i, (col, (_, _, fn)) in enumerate(derivate):
+                        sorgente, attuale = row[1 + 2 * i], row[2 + 2 * i]
+                        nuovo = attuale if attuale is not None else fn(sorgente)
+                        cambiato = cambiato or nuovo != attuale
+                        valori[f'b_{col}'] = nuovo
+                    if cambiato:
+                        params.append(valori)
+                if params:
+                    conn.execute(stmt, params)
+                    aggiornate += len(params)
+        if aggiornate:
+            print(f"[OK] colonne derivate articoli compilate su {aggiornate} righe")
+    except Exception as e:
+        print(f"[WARN] backfill colonne derivate articoli fallito: {e}")
+
+
+ensure_articoli_colonne_derivate_schema(engine)
+backfill_articoli_colonne_derivate(engine)
+
+
 def _current_username_for_audit():
     try:
         if has_request_context() and getattr(current_user, 'is_authenticated', False):
@@ -883,6 +1165,442 @@ def _current_username_for_audit():
 
 from sqlalchemy import event
 
+
+def _sync_articolo_colonne_derivate(obj, campi=None):
+    """Ricalcola le colonne derivate dell'articolo (tutte, o solo quelle dei campi indicati)."""
+    for col, (src, _, fn) in ARTICOLI_COLONNE_DERIVATE.items():
+        if campi is None or src in campi:
+            setattr(obj, col, fn(getattr(obj, src, None)))
+
+
+@event.listens_for(SessionLocal.session_factory, 'before_flush')
+def _buoni_carico_righe_before_flush(session_db, flush_context, instances):
+    """Allinea codice_entrata_key delle righe buono nuove o con codice entrata modificato."""
+    for obj in list(session_db.new) + list(session_db.dirty):
+        if isinstance(obj, BuonoCaricoRiga):
+            chiave = _chiave_codice_entrata(obj.codice_entrata)
+            if obj.codice_entrata_key != chiave:
+                obj.codice_entrata_key = chiave
+
+
+# ========================================================
+# 4a. SNAPSHOT DASHBOARD (totali Home aggiornati per differenza)
+# ========================================================
+# Gli hook di flush calcolano il contributo di ogni articolo creato, modificato
+# o eliminato (prima/dopo) e applicano solo la differenza alla tabella
+# dashboard_snapshot. Le operazioni bulk che saltano il flush leggono il
+# contributo delle sole righe toccate prima e dopo l'operazione
+# (dashboard_snapshot_articoli / dashboard_snapshot_aggiorna_articoli).
+# Un thread in background rifà periodicamente il ricalcolo completo, fuori dalle
+# richieste: un solo processo alla volta, prenotandolo sulla riga globale.
+DASHBOARD_SNAPSHOT_TOTALE = '__TOTALE__'
+DASHBOARD_SNAPSHOT_CAMPI = ('cliente', 'data_uscita', 'n_colli', 'm2', 'peso', 'stato')
+DASHBOARD_SNAPSHOT_METRICHE = ('righe', 'colli', 'm2', 'peso', 'doganali')
+# Secondi fra due controlli del thread di riconciliazione.
+DASHBOARD_SNAPSHOT_CONTROLLO_S = 60
+# 'forza': una differenza non calcolabile in questo processo richiede il ricalcolo al prossimo controllo.
+# 'pid': processo in cui è attivo il thread di riconciliazione (uno per processo, avviato alla prima richiesta).
+DASHBOARD_SNAPSHOT_STATE = {'forza': False, 'pid': None}
+DASHBOARD_SNAPSHOT_LOCK = threading.Lock()
+
+
+def dashboard_cliente_expr():
+    """Chiave cliente della dashboard: UPPER(TRIM(cliente))."""
+    return func.upper(func.trim(func.coalesce(Articolo.cliente, '')))
+
+
+def dashboard_attivo_expr():
+    """Articolo in giacenza: data uscita vuota (o valori spuri tipo NONE/NaT)."""
+    return func.upper(func.trim(func.coalesce(Articolo.data_uscita, ''))).in_(['', 'NONE', 'NULL', 'NAT'])
+
+
+def _snapshot_contributo(valori):
+    """Contributo di un articolo allo snapshot: (cliente, metriche) o None se non è in giacenza.
+
+    Replica in Python dashboard_attivo_expr() e le somme di dashboard_snapshot_ricalcola().
+    """
+    if valori is None:
+        return None
+    if str(valori.get('data_uscita') or '').strip().upper() not in ('', 'NONE', 'NULL', 'NAT'):
+        return None
+    cliente = str(valori.get('cliente') or '').strip().upper()
+    return cliente, {
+        'righe': 1,
+        'colli': to_int_eu(valori.get('n_colli')),
+        'm2': to_float_eu(valori.get('m2')),
+        'peso': to_float_eu(valori.get('peso')),
+        'doganali': 1 if 'DOGANA' in str(valori.get('stato') or '').upper() else 0,
+    }
+
+
+def _snapshot_valori_precedenti(obj, campi=DASHBOARD_SNAPSHOT_CAMPI):
+    """Valori dei campi snapshot prima delle modifiche pendenti (None se non ricostruibili)."""
+    stato = inspect(obj)
+    valori = {}
+    for nome in campi:
+        hist = stato.attrs[nome].history
+        if hist.deleted:
+            valori[nome] = hist.deleted[0]
+        elif hist.added:
+            # Valore precedente mai caricato: la differenza non è calcolabile.
+            return None
+        else:
+            valori[nome] = getattr(obj, nome, None)
+    return valori
+
+
+def _snapshot_accumula(delta, contributo, segno):
+    if contributo is None:
+        return
+    cliente, metriche = contributo
+    for chiave in (cliente, DASHBOARD_SNAPSHOT_TOTALE):
+        rec = delta.setdefault(chiave, dict.fromkeys(DASHBOARD_SNAPSHOT_METRICHE, 0))
+        for nome, valore in metriche.items():
+            rec[nome] += segno * valore
+
+
+def _dashboard_snapshot_applica(conn, delta, sostituisci=False, extra=None):
+    """Somma le differenze alle righe dello snapshot (UPSERT atomico dove disponibile).
+
+    Con sostituisci=True scrive i valori così come sono (ricalcolo completo); extra
+    aggiunge colonne da impostare, per cliente ({cliente: {colonna: valore}}).
+    """
+    from sqlalchemy import update, insert
+
+    t = DashboardSnapshot.__table__
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    dialect = conn.dialect.name
+    for cliente, metriche in delta.items():
+        if not sostituisci and not any(metriche.values()):
+            continue
+        altri = dict((extra or {}).get(cliente) or {}, aggiornato_il=now)
+        if sostituisci:
+            nuovi = dict(metriche)
+        else:
+            nuovi = {nome: t.c[nome] + valore for nome, valore in metriche.items()}
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as upsert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as upsert
+            stmt = upsert(t).values(cliente=cliente, **metriche, **altri)
+            if sostituisci:
+                set_ = {nome: stmt.excluded[nome] for nome in metriche}
+            else:
+                set_ = {nome: t.c[nome] + stmt.excluded[nome] for nome in metriche}
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[t.c.cliente],
+                set_=dict(set_, **{nome: stmt.excluded[nome] for nome in altri}),
+            )
+            conn.execute(stmt)
+            continue
+        res = conn.execute(update(t).where(t.c.cliente == cliente).values(**nuovi, **altri))
+        if not res.rowcount:
+            conn.execute(insert(t).values(cliente=cliente, **metriche, **altri))
+
+
+def _dashboard_snapshot_somme(conn, *condizioni):
+    """Somme delle giacenze attive per cliente, più la riga globale: {cliente: metriche}."""
+    cliente_expr = dashboard_cliente_expr()
+    rows = conn.execute(
+        select(
+            cliente_expr,
+            func.count(Articolo.id_articolo),
+            func.coalesce(func.sum(Articolo.n_colli), 0),
+            func.coalesce(func.sum(Articolo.m2), 0),
+            func.coalesce(func.sum(Articolo.peso), 0),
+            func.coalesce(func.sum(case(
+                (func.upper(func.coalesce(Articolo.stato, '')).like('%DOGANA%'), 1), else_=0
+            )), 0),
+        )
+        .where(dashboard_attivo_expr(), *condizioni)
+        .group_by(cliente_expr)
+    ).all()
+
+    totale = dict.fromkeys(DASHBOARD_SNAPSHOT_METRICHE, 0)
+    somme = {}
+    for cliente, righe, colli, m2_val, peso_val, doganali in rows:
+        rec = {
+            'righe': int(righe or 0),
+            'colli': int(colli or 0),
+            'm2': float(m2_val or 0),
+            'peso': float(peso_val or 0),
+            'doganali': int(doganali or 0),
+        }
+        for nome in DASHBOARD_SNAPSHOT_METRICHE:
+            totale[nome] += rec[nome]
+        somme[cliente or ''] = rec
+    somme[DASHBOARD_SNAPSHOT_TOTALE] = totale
+    return somme
+
+
+def dashboard_snapshot_articoli(conn, ids):
+    """Contributo attuale allo snapshot degli articoli indicati (prima di un'operazione bulk)."""
+    ids = [i for i in (ids or []) if i]
+    contributo = {}
+    for i in range(0, len(ids), 1000):
+        for cliente, metriche in _dashboard_snapshot_somme(conn, Articolo.id_articolo.in_(ids[i:i + 1000])).items():
+            if cliente == DASHBOARD_SNAPSHOT_TOTALE and not metriche['righe']:
+                continue
+            rec = contributo.setdefault(cliente, dict.fromkeys(DASHBOARD_SNAPSHOT_METRICHE, 0))
+            for nome, valore in metriche.items():
+                rec[nome] += valore
+    return contributo
+
+
+def dashboard_snapshot_aggiorna_articoli(conn, ids, prima):
+    """Dopo un UPDATE/DELETE bulk: applica allo snapshot la differenza fra il contributo
+    attuale degli articoli e quello letto prima con dashboard_snapshot_articoli()."""
+    dopo = dashboard_snapshot_articoli(conn, ids)
+    delta = {}
+    for cliente in set(prima) | set(dopo):
+        vuoto = dict.fromkeys(DASHBOARD_SNAPSHOT_METRICHE, 0)
+        p, d = prima.get(cliente, vuoto), dopo.get(cliente, vuoto)
+        delta[cliente] = {nome: d[nome] - p[nome] for nome in DASHBOARD_SNAPSHOT_METRICHE}
+    _dashboard_snapshot_applica(conn, delta)
+
+
+def dashboard_snapshot_ricalcola(conn):
+    """Riallinea lo snapshot a un ricalcolo completo (GROUP BY sulle giacenze attive).
+
+    Su PostgreSQL la tabella viene prima bloccata in EXCLUSIVE MODE (le letture restano
+    libere): le transazioni che hanno già scritto una differenza vengono attese e sono
+    comprese nel GROUP BY, quelle successive applicano la loro differenza dopo il commit
+    del ricalcolo. I valori sono scritti con UPSERT; i clienti senza giacenze spariscono.
+    """
+    from sqlalchemy import delete
+
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text("LOCK TABLE dashboard_snapshot IN EXCLUSIVE MODE"))
+    somme = _dashboard_snapshot_somme(conn)
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    t = DashboardSnapshot.__table__
+    conn.execute(delete(t).where(t.c.cliente.notin_(list(somme))))
+    _dashboard_snapshot_applica(
+        conn, somme, sostituisci=True, extra={DASHBOARD_SNAPSHOT_TOTALE: {'ricalcolato_il': now}}
+    )
+
+
+def ensure_dashboard_snapshot(engine):
+    """Inizializza lo snapshot al primo avvio (o dopo un ripristino che lo ha svuotato)."""
+    try:
+        cols = {c.get('name') for c in inspect(engine).get_columns('dashboard_snapshot')}
+        if 'ricalcolato_il' not in cols:
+            with engine.begin() as conn:
+                conn.execute(text("ALTER TABLE dashboard_snapshot ADD COLUMN ricalcolato_il VARCHAR(32)"))
+            print('[OK] aggiunta colonna ricalcolato_il a dashboard_snapshot')
+    except Exception as e:
+        print(f"[WARN] impossibile aggiungere ricalcolato_il a dashboard_snapshot: {e}")
+    try:
+        with engine.begin() as conn:
+            presente = conn.execute(
+                select(DashboardSnapshot.cliente).where(DashboardSnapshot.cliente == DASHBOARD_SNAPSHOT_TOTALE)
+            ).first()
+            if presente is None:
+                dashboard_snapshot_ricalcola(conn)
+                print("[OK] snapshot dashboard inizializzato")
+    except Exception as e:
+        print(f"[WARN] snapshot dashboard non inizializzato: {e}")
+
+
+def dashboard_snapshot_minuti():
+    """Intervallo del ricalcolo completo (DASHBOARD_SNAPSHOT_MINUTI, default 60; 0 = disattivato)."""
+    try:
+        return float(os.environ.get('DASHBOARD_SNAPSHOT_MINUTI', '60') or 0)
+    except ValueError:
+        return 60.0
+
+
+def dashboard_snapshot_riconcilia_se_dovuto():
+    """Ricalcolo completo se è passato l'intervallo dall'ultimo (di qualsiasi processo) o se forzato.
+
+    La prenotazione è un UPDATE condizionato di ricalcolato_il sulla riga globale, in una
+    transazione a parte: fra più worker solo quello che lo aggiorna esegue il ricalcolo.
+    """
+    from sqlalchemy import update
+
+    minuti = dashboard_snapshot_minuti()
+    if minuti <= 0:
+        return False
+    t = DashboardSnapshot.__table__
+    adesso = datetime.now()
+    soglia = (adesso - timedelta(minutes=minuti)).strftime('%Y-%m-%d %H:%M:%S')
+    forza = DASHBOARD_SNAPSHOT_STATE['forza']
+    DASHBOARD_SNAPSHOT_STATE['forza'] = False
+    try:
+        if not forza:
+            with engine.begin() as conn:
+                res = conn.execute(
+                    update(t)
+                    .where(
+                        t.c.cliente == DASHBOARD_SNAPSHOT_TOTALE,
+                        or_(t.c.ricalcolato_il.is_(None), t.c.ricalcolato_il <= soglia),
+                    )
+                    .values(ricalcolato_il=adesso.strftime('%Y-%m-%d %H:%M:%S'))
+                )
+                if res.rowcount != 1:
+                    return False
+        with engine.begin() as conn:
+            dashboard_snapshot_ricalcola(conn)
+        return True
+    except Exception as e:
+        print(f"[WARN] riconciliazione snapshot dashboard fallita: {e}")
+        return False
+
+
+def _dashboard_snapshot_riconciliatore():
+    while True:
+        time.sleep(DASHBOARD_SNAPSHOT_CONTROLLO_S)
+        try:
+            dashboard_snapshot_riconcilia_se_dovuto()
+        except Exception:
+            pass
+
+
+def dashboard_snapshot_avvia_riconciliatore():
+    """Avvia il thread di riconciliazione una volta per processo.
+
+    Chiamato alla prima richiesta e non all'import: con gunicorn --preload il modulo viene
+    importato nel master e i thread non sopravvivono al fork dei worker. Fra più worker il
+    ricalcolo resta uno solo per intervallo grazie alla prenotazione su ricalcolato_il.
+    """
+    pid = os.getpid()
+    if DASHBOARD_SNAPSHOT_STATE['pid'] == pid or dashboard_snapshot_minuti() <= 0:
+        return
+    with DASHBOARD_SNAPSHOT_LOCK:
+        if DASHBOARD_SNAPSHOT_STATE['pid'] == pid:
+            return
+        DASHBOARD_SNAPSHOT_STATE['pid'] = pid
+        threading.Thread(
+            target=_dashboard_snapshot_riconciliatore, daemon=True, name='dashboard-snapshot'
+        ).start()
+
+
+def dashboard_snapshot_leggi(session_db, cliente=None):
+    """Totali e righe per cliente dallo snapshot.
+
+    Restituisce (totali, righe_clienti) oppure None se lo snapshot non è disponibile:
+    in quel caso la Home ricalcola i valori con le query dirette.
+    """
+    try:
+        q = session_db.query(DashboardSnapshot)
+        if cliente:
+            q = q.filter(DashboardSnapshot.cliente.in_([cliente.strip().upper(), DASHBOARD_SNAPSHOT_TOTALE]))
+        rows = q.all()
+    except Exception:
+        session_db.rollback()
+        return None
+
+    totali = dict.fromkeys(DASHBOARD_SNAPSHOT_METRICHE, 0)
+    righe_clienti = []
+    trovato_totale = False
+    for r in rows:
+        valori = {nome: getattr(r, nome) or 0 for nome in DASHBOARD_SNAPSHOT_METRICHE}
+        if r.cliente == DASHBOARD_SNAPSHOT_TOTALE:
+            trovato_totale = True
+            if not cliente:
+                totali = valori
+            continue
+        if valori['righe'] <= 0:
+            continue
+        righe_clienti.append(dict(valori, cliente=r.cliente))
+        if cliente:
+            totali = valori
+    # Senza riga globale lo snapshot non è mai stato inizializzato.
+    if not trovato_totale:
+        return None
+    righe_clienti.sort(key=lambda x: x['cliente'])
+    return totali, righe_clienti
+
+
+# --- Snapshot report fatturazione (mesi chiusi) ---
+# Campi che cambiano il report di un mese: una modifica elimina gli snapshot
+# dei mesi compresi fra ingresso e uscita dell'articolo (prima e dopo la modifica).
+FATTURAZIONE_SNAPSHOT_CAMPI = ('cliente', 'data_ingresso', 'data_uscita', 'm2', 'n_colli', 'stato')
+
+
+def _mese_indice(d):
+    return d.year * 12 + d.month - 1
+
+
+def _fatturazione_intervallo_mesi(valori):
+    """Mesi (indice da, indice a / None = aperto) in cui l'articolo compare nel report, o None."""
+    if valori is None:
+        # Valori precedenti sconosciuti: invalida tutti i mesi.
+        return (None, None)
+    d_ing = parse_data_articolo(valori.get('data_ingresso'))
+    d_usc = parse_data_articolo(valori.get('data_uscita'))
+    date_note = [d for d in (d_ing, d_usc) if d]
+    if not date_note:
+        return None
+    da = _mese_indice(min(date_note))
+    if d_ing and not d_usc:
+        return (da, None)
+    return (da, _mese_indice(max(date_note)))
+
+
+def fatturazione_snapshot_invalida(conn, intervalli):
+    """Invalida gli snapshot dei mesi negli intervalli [(da, a), ...] (None = senza limite).
+
+    La riga del mese resta con dati vuoti e versione incrementata: il report salva un
+    nuovo calcolo solo se la versione è ancora quella letta prima di calcolare.
+    """
+    from sqlalchemy import update
+
+    t = FatturazioneSnapshot.__table__
+    indice = t.c.anno * 12 + t.c.mese - 1
+    for da, a in set(intervalli):
+        condizioni = []
+        if da is not None:
+            condizioni.append(indice >= da)
+        if a is not None:
+            condizioni.append(indice <= a)
+        conn.execute(
+            update(t).where(*condizioni).values(versione=t.c.versione + 1, chiuso=False, dati=None)
+        )
+
+
+def fatturazione_snapshot_invalida_articoli(session_db, ids):
+    """Per le operazioni bulk: invalida i mesi toccati dagli articoli indicati (stato attuale)."""
+    ids = [i for i in (ids or []) if i]
+    if not ids:
+        return
+    intervalli = set()
+    for i in range(0, len(ids), 1000):
+        for ing, usc in session_db.query(Articolo.data_ingresso, Articolo.data_uscita).filter(
+            Articolo.id_articolo.in_(ids[i:i + 1000])
+        ):
+            intervallo = _fatturazione_intervallo_mesi({'data_ingresso': ing, 'data_uscita': usc})
+            if intervallo:
+                intervalli.add(intervallo)
+    if intervalli:
+        fatturazione_snapshot_invalida(session_db.connection(), intervalli)
+
+
+def ensure_fatturazione_snapshot_schema(engine):
+    try:
+        cols = {c.get('name') for c in inspect(engine).get_columns('fatturazione_snapshot')}
+    except Exception as e:
+        print(f"[WARN] impossibile ispezionare schema fatturazione_snapshot: {e}")
+        return
+    if 'versione' not in cols:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("ALTER TABLE fatturazione_snapshot ADD COLUMN versione INTEGER NOT NULL DEFAULT 0"))
+            print('[OK] aggiunta colonna versione a fatturazione_snapshot')
+        except Exception as e:
+            print(f"[WARN] impossibile aggiungere versione a fatturazione_snapshot: {e}")
+
+
+ensure_fatturazione_snapshot_schema(engine)
+ensure_dashboard_snapshot(engine)
+
+
+@app.before_request
+def _dashboard_snapshot_avvia_riconciliatore():
+    dashboard_snapshot_avvia_riconciliatore()
+
+
 @event.listens_for(SessionLocal.session_factory, 'before_flush')
 def _audit_articoli_before_flush(session_db, flush_context, instances):
     """Compila l'audit e registra nello storico le modifiche future degli articoli."""
@@ -890,13 +1608,34 @@ def _audit_articoli_before_flush(session_db, flush_context, instances):
     now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
     nuovi_articoli = []
+    # Differenze da applicare allo snapshot dashboard dopo il flush.
+    delta_snapshot = {}
+    # Mesi del report fatturazione da invalidare dopo il flush.
+    mesi_fatturazione = set()
     for obj in list(session_db.new):
         if isinstance(obj, Articolo):
+            _sync_articolo_colonne_derivate(obj)
             if not getattr(obj, 'created_by', None):
                 obj.created_by = user
             obj.updated_by = user
             obj.updated_at = now
             nuovi_articoli.append(obj)
+            _snapshot_accumula(delta_snapshot, _snapshot_contributo(
+                {nome: getattr(obj, nome, None) for nome in DASHBOARD_SNAPSHOT_CAMPI}
+            ), 1)
+            mesi_fatturazione.add(_fatturazione_intervallo_mesi(
+                {nome: getattr(obj, nome, None) for nome in FATTURAZIONE_SNAPSHOT_CAMPI}
+            ))
+
+    for obj in list(session_db.deleted):
+        if isinstance(obj, Articolo):
+            precedenti = _snapshot_valori_precedenti(obj)
+            if precedenti is None:
+                DASHBOARD_SNAPSHOT_STATE['forza'] = True
+            _snapshot_accumula(delta_snapshot, _snapshot_contributo(precedenti), -1)
+            mesi_fatturazione.add(_fatturazione_intervallo_mesi(
+                _snapshot_valori_precedenti(obj, FATTURAZIONE_SNAPSHOT_CAMPI)
+            ))
 
     if nuovi_articoli:
         pending = session_db.info.setdefault('_storico_nuovi_articoli', [])
@@ -904,7 +1643,7 @@ def _audit_articoli_before_flush(session_db, flush_context, instances):
             if obj not in pending:
                 pending.append(obj)
 
-    campi_esclusi = {'updated_by', 'updated_at', 'created_by', 'attachments'}
+    campi_esclusi = {'updated_by', 'updated_at', 'created_by', 'attachments'} | set(ARTICOLI_COLONNE_DERIVATE)
     for obj in list(session_db.dirty):
         if not isinstance(obj, Articolo) or not session_db.is_modified(obj, include_collections=False):
             continue
@@ -922,6 +1661,28 @@ def _audit_articoli_before_flush(session_db, flush_context, instances):
             nuovo = hist.added[0] if hist.added else getattr(obj, nome, None)
             modifiche[nome] = {'prima': precedente, 'dopo': nuovo}
 
+        if modifiche:
+            _sync_articolo_colonne_derivate(obj, modifiche)
+
+        if set(modifiche) & set(DASHBOARD_SNAPSHOT_CAMPI):
+            precedenti = _snapshot_valori_precedenti(obj)
+            if precedenti is None:
+                # Valore precedente sconosciuto: forza il ricalcolo completo al prossimo controllo.
+                DASHBOARD_SNAPSHOT_STATE['forza'] = True
+            else:
+                _snapshot_accumula(delta_snapshot, _snapshot_contributo(precedenti), -1)
+                _snapshot_accumula(delta_snapshot, _snapshot_contributo(
+                    {nome: getattr(obj, nome, None) for nome in DASHBOARD_SNAPSHOT_CAMPI}
+                ), 1)
+
+        if set(modifiche) & set(FATTURAZIONE_SNAPSHOT_CAMPI):
+            mesi_fatturazione.add(_fatturazione_intervallo_mesi(
+                _snapshot_valori_precedenti(obj, FATTURAZIONE_SNAPSHOT_CAMPI)
+            ))
+            mesi_fatturazione.add(_fatturazione_intervallo_mesi(
+                {nome: getattr(obj, nome, None) for nome in FATTURAZIONE_SNAPSHOT_CAMPI}
+            ))
+
         if modifiche and getattr(obj, 'id_articolo', None):
             session_db.add(StoricoArticolo(
                 articolo_id=obj.id_articolo,
@@ -934,10 +1695,27 @@ def _audit_articoli_before_flush(session_db, flush_context, instances):
         obj.updated_by = user
         obj.updated_at = now
 
+    # Sovrascritto ad ogni flush: un flush fallito non deve riapplicare differenze vecchie.
+    session_db.info['_dashboard_delta'] = delta_snapshot
+    session_db.info['_fatturazione_invalida'] = [m for m in mesi_fatturazione if m]
+
 
 @event.listens_for(SessionLocal.session_factory, 'after_flush_postexec')
 def _audit_articoli_after_flush(session_db, flush_context):
     """Registra la creazione dopo che PostgreSQL ha assegnato l'ID articolo."""
+    delta_snapshot = session_db.info.pop('_dashboard_delta', None)
+    if delta_snapshot:
+        try:
+            _dashboard_snapshot_applica(session_db.connection(), delta_snapshot)
+        except Exception as e:
+            DASHBOARD_SNAPSHOT_STATE['forza'] = True
+            print(f"[WARN] aggiornamento snapshot dashboard fallito: {e}")
+
+    mesi_fatturazione = session_db.info.pop('_fatturazione_invalida', None)
+    if mesi_fatturazione:
+        # Nella stessa transazione del flush: se la modifica viene annullata, lo snapshot resta.
+        fatturazione_snapshot_invalida(session_db.connection(), mesi_fatturazione)
+
     pending = session_db.info.pop('_storico_nuovi_articoli', [])
     if not pending:
         return
@@ -1014,6 +1792,16 @@ def ensure_db_indexes(engine):
         # Date come stringa: indice comunque utile per ordinamenti/filtri grezzi
         idx_specs.append(('ix_articoli_data_ingresso', [Articolo.data_ingresso], {}))
         idx_specs.append(('ix_articoli_data_uscita', [Articolo.data_uscita], {}))
+        # Date tipizzate: range scan per giacenze, export, fatturazione e API
+        idx_specs.append(('ix_articoli_data_ingresso_dt', [Articolo.data_ingresso_dt], {}))
+        idx_specs.append(('ix_articoli_data_uscita_dt', [Articolo.data_uscita_dt], {}))
+        # Cliente normalizzato + uscita: serve i filtri "cliente in giacenza" (data_uscita_dt IS NULL)
+        idx_specs.append(('ix_articoli_cliente_key_uscita', [Articolo.cliente_key, Articolo.data_uscita_dt], {}))
+        # Codice entrata canonico: dettaglio entrata da QR/barcode vecchi e nuovi
+        idx_specs.append(('ix_articoli_codice_entrata_key', [Articolo.codice_entrata_key], {}))
+        # Buoni di carico: righe e scansioni lette/raggruppate per buono
+        idx_specs.append(('ix_buoni_carico_righe_buono_id', [BuonoCaricoRiga.buono_id], {}))
+        idx_specs.append(('ix_buoni_carico_scansioni_buono_esito', [BuonoCaricoScan.buono_id, BuonoCaricoScan.esito], {}))
 
         for name, cols, kwargs in idx_specs:
             try:
@@ -1027,6 +1815,162 @@ def ensure_db_indexes(engine):
 ensure_db_indexes(engine)
 
 
+# ========================================================
+# 4c. INDICE DI RICERCA TESTUALE (ricerche "contiene")
+# ========================================================
+# PostgreSQL: un solo indice GIN pg_trgm sull'espressione che concatena i campi ricercati;
+# ILIKE '%testo%' su quell'espressione fa da prefiltro indicizzato ai confronti per campo.
+# SQLite: tabella FTS5 'articoli_search' (tokenizer trigram) allineata ad ogni flush.
+# Altri database: ILIKE semplice.
+ARTICOLI_SEARCH_FIELDS = [
+    'codice_articolo', 'descrizione', 'cliente', 'fornitore', 'magazzino', 'posizione',
+    'protocollo', 'ordine', 'commessa', 'lotto', 'serial_number', 'ns_rif', 'stato',
+    'buono_n', 'n_arrivo', 'codice_entrata', 'n_ddt_ingresso', 'n_ddt_uscita', 'mezzi_in_uscita',
+]
+SEARCH_INDEX_STATE = {'mode': 'like'}
+
+
+def _articoli_search_concat(prefisso=''):
+    """Espressione SQL che concatena i campi di ricerca (stessa forma nell'indice e nelle query)."""
+    return " || ' ' || ".join(f"coalesce({prefisso}{c}, '')" for c in ARTICOLI_SEARCH_FIELDS)
+
+
+def ensure_search_index(engine):
+    """Prepara l'indice di ricerca adatto al database e imposta SEARCH_INDEX_STATE['mode']."""
+    dialect = engine.dialect.name
+    if dialect == 'postgresql':
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        except Exception as e:
+            print(f"[WARN] estensione pg_trgm non disponibile, ricerca senza indice: {e}")
+            return
+        # CONCURRENTLY non blocca le scritture su articoli ma va eseguito fuori transazione.
+        try:
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                valido = conn.execute(text(
+                    "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                    "WHERE c.relname = 'ix_articoli_search_trgm'"
+                )).scalar()
+                if valido is False:
+                    # Build concorrente interrotto: l'indice resta INVALID e va ricreato.
+                    conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS ix_articoli_search_trgm"))
+                if not valido:
+                    conn.execute(text(
+                        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_articoli_search_trgm ON articoli "
+                        f"USING gin (({_articoli_search_concat()}) gin_trgm_ops)"
+                    ))
+                    print("[OK] indice trigram di ricerca creato su articoli")
+                # Vecchi indici trigram per singolo campo: sostituiti dall'indice sull'espressione.
+                for col in ARTICOLI_SEARCH_FIELDS:
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS ix_articoli_trgm_{col}"))
+        except Exception as e:
+            print(f"[WARN] indice trigram di ricerca non creato: {e}")
+        SEARCH_INDEX_STATE['mode'] = 'trgm'
+    elif dialect == 'sqlite':
+        cols = ', '.join(ARTICOLI_SEARCH_FIELDS)
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS articoli_search USING fts5({cols}, tokenize='trigram')"
+                ))
+                n_idx = conn.execute(text("SELECT COUNT(*) FROM articoli_search")).scalar() or 0
+                n_art = conn.execute(text("SELECT COUNT(*) FROM articoli")).scalar() or 0
+                # Ricostruzione completa se l'indice non è allineato (primo avvio, cancellazioni bulk...)
+                if n_idx != n_art:
+                    conn.execute(text("DELETE FROM articoli_search"))
+                    conn.execute(text(
+                        f"INSERT INTO articoli_search(rowid, {cols}) SELECT id_articolo, {cols} FROM articoli"
+                    ))
+                    print(f"[OK] indice ricerca FTS5 ricostruito su {n_art} articoli")
+            SEARCH_INDEX_STATE['mode'] = 'fts5'
+        except Exception as e:
+            print(f"[WARN] indice ricerca FTS5 non disponibile, ricerca senza indice: {e}")
+
+
+ensure_search_index(engine)
+
+
+def articoli_search_filter(term, fields=None):
+    """Condizione SQL: `term` contenuto (senza distinzione maiuscole) in almeno uno dei campi."""
+    from sqlalchemy import literal_column
+
+    s = (term or '').strip()
+    fields = list(fields or ARTICOLI_SEARCH_FIELDS)
+    # Il tokenizer trigram serve solo testi di almeno 3 caratteri.
+    if SEARCH_INDEX_STATE['mode'] == 'fts5' and len(s) >= 3 and set(fields) <= set(ARTICOLI_SEARCH_FIELDS):
+        match = '{%s} : "%s"' % (' '.join(fields), s.replace('"', '""'))
+        return Articolo.id_articolo.in_(
+            select(literal_column('rowid'))
+            .select_from(text('articoli_search'))
+            .where(literal_column('articoli_search').op('MATCH')(literal(match)))
+        )
+    per_campo = or_(*[getattr(Articolo, f).ilike(f"%{s}%") for f in fields])
+    if SEARCH_INDEX_STATE['mode'] == 'trgm' and set(fields) <= set(ARTICOLI_SEARCH_FIELDS):
+        # Se un campo contiene il testo lo contiene anche la concatenazione: il prefiltro
+        # usa l'indice trigram senza cambiare i risultati.
+        return and_(literal_column(f"({_articoli_search_concat('articoli.')})").ilike(f"%{s}%"), per_campo)
+    return per_campo
+
+
+def search_index_refresh(session_db, ids):
+    """Riallinea l'indice FTS5 per gli articoli indicati (dopo UPDATE/DELETE bulk che saltano il flush)."""
+    from sqlalchemy import bindparam
+
+    ids = [int(i) for i in (ids or []) if i]
+    if SEARCH_INDEX_STATE['mode'] != 'fts5' or not ids:
+        return
+    cols = ', '.join(ARTICOLI_SEARCH_FIELDS)
+    conn = session_db.connection()
+    conn.execute(
+        text("DELETE FROM articoli_search WHERE rowid IN :ids").bindparams(bindparam('ids', expanding=True)),
+        {'ids': ids},
+    )
+    conn.execute(
+        text(
+            f"INSERT INTO articoli_search(rowid, {cols}) "
+            f"SELECT id_articolo, {cols} FROM articoli WHERE id_articolo IN :ids"
+        ).bindparams(bindparam('ids', expanding=True)),
+        {'ids': ids},
+    )
+
+
+@event.listens_for(SessionLocal.session_factory, 'after_flush')
+def _search_index_after_flush(session_db, flush_context):
+    """Allinea la tabella FTS5 con gli articoli creati, modificati o eliminati nel flush."""
+    if SEARCH_INDEX_STATE['mode'] != 'fts5':
+        return
+    from sqlalchemy import bindparam
+
+    salvati = [
+        o for o in list(session_db.new) + list(session_db.dirty)
+        if isinstance(o, Articolo) and getattr(o, 'id_articolo', None)
+    ]
+    eliminati = [
+        o.id_articolo for o in session_db.deleted
+        if isinstance(o, Articolo) and getattr(o, 'id_articolo', None)
+    ]
+    ids = [o.id_articolo for o in salvati] + eliminati
+    if not ids:
+        return
+
+    conn = session_db.connection()
+    conn.execute(
+        text("DELETE FROM articoli_search WHERE rowid IN :ids").bindparams(bindparam('ids', expanding=True)),
+        {'ids': ids},
+    )
+    if salvati:
+        cols = ', '.join(ARTICOLI_SEARCH_FIELDS)
+        params = ', '.join(f':{c}' for c in ARTICOLI_SEARCH_FIELDS)
+        conn.execute(
+            text(f"INSERT INTO articoli_search(rowid, {cols}) VALUES (:rowid, {params})"),
+            [
+                dict({c: getattr(o, c, None) for c in ARTICOLI_SEARCH_FIELDS}, rowid=o.id_articolo)
+                for o in salvati
+            ],
+        )
+
+
 def ensure_buoni_carico_multi_schema(engine):
     """Crea tabella righe buono carico e aggiunge campi se il DB esiste già."""
     try:
@@ -1047,10 +1991,79 @@ def ensure_buoni_carico_multi_schema(engine):
                             conn.execute(text(f"ALTER TABLE buoni_carico ADD COLUMN {col} {typ}"))
                     except Exception as e:
                         print(f"[WARN] colonna buoni_carico.{col}: {e}")
+        if "buoni_carico_scansioni" in tables:
+            cols = {c.get("name") for c in insp.get_columns("buoni_carico_scansioni")}
+            if "id_offline" not in cols:
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(text("ALTER TABLE buoni_carico_scansioni ADD COLUMN id_offline VARCHAR(64)"))
+                except Exception as e:
+                    print(f"[WARN] colonna buoni_carico_scansioni.id_offline: {e}")
+            try:
+                Index("ux_buoni_carico_scansioni_id_offline", BuonoCaricoScan.id_offline, unique=True).create(bind=engine, checkfirst=True)
+            except Exception as e:
+                print(f"[WARN] indice non creato ux_buoni_carico_scansioni_id_offline: {e}")
+        if "buoni_carico_righe" in tables:
+            cols = {c.get("name") for c in insp.get_columns("buoni_carico_righe")}
+            if "codice_entrata_key" not in cols:
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(text("ALTER TABLE buoni_carico_righe ADD COLUMN codice_entrata_key VARCHAR(255)"))
+                except Exception as e:
+                    print(f"[WARN] colonna buoni_carico_righe.codice_entrata_key: {e}")
+            try:
+                Index("ix_buoni_carico_righe_codice_entrata_key", BuonoCaricoRiga.codice_entrata_key, BuonoCaricoRiga.buono_id).create(bind=engine, checkfirst=True)
+            except Exception as e:
+                print(f"[WARN] indice non creato ix_buoni_carico_righe_codice_entrata_key: {e}")
     except Exception as e:
         print(f"[WARN] ensure_buoni_carico_multi_schema fallita: {e}")
 
+
+def backfill_buoni_carico_righe_codice_entrata_key(engine, batch_size=1000):
+    """Compila a blocchi codice_entrata_key delle righe buono che ne sono prive, avanzando per id."""
+    from sqlalchemy import update, bindparam
+
+    t = BuonoCaricoRiga.__table__
+    stmt = (
+        update(t)
+        .where(t.c.id == bindparam('b_id'))
+        .values(codice_entrata_key=bindparam('b_key'))
+    )
+    last_id = 0
+    aggiornate = 0
+    try:
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(
+                    t.select()
+                    .with_only_columns(t.c.id, t.c.codice_entrata)
+                    .where(
+                        t.c.codice_entrata_key == None,
+                        func.coalesce(t.c.codice_entrata, '') != '',
+                        t.c.id > last_id,
+                    )
+                    .order_by(t.c.id)
+                    .limit(batch_size)
+                ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                params = [
+                    {'b_id': rid, 'b_key': _chiave_codice_entrata(codice)}
+                    for rid, codice in rows
+                    if _chiave_codice_entrata(codice)
+                ]
+                if params:
+                    conn.execute(stmt, params)
+                    aggiornate += len(params)
+        if aggiornate:
+            print(f"[OK] codice_entrata_key compilata su {aggiornate} righe buoni di carico")
+    except Exception as e:
+        print(f"[WARN] backfill codice_entrata_key righe buoni fallito: {e}")
+
+
 ensure_buoni_carico_multi_schema(engine)
+backfill_buoni_carico_righe_codice_entrata_key(engine)
 
 
 
@@ -1106,9 +2119,104 @@ def ensure_lavorazioni_extra_schema(engine):
                 except Exception as e:
                     print(f"[WARN] impossibile aggiungere lavorazioni.{col}: {e}")
     except Exception as e:
-        print(f"[WARN] ensure_lavorazioni_extra_schema fallita: {e}")
+        print(f"[WARN] ensure_lavorazioni_extra_schema fallita: {e}")
+
+ensure_lavorazioni_extra_schema(engine)
+
+# ========================================================
+# 4d. CACHE TESTO/OCR DOCUMENTI (per contenuto del file)
+# ========================================================
+# Import PDF, accettazione entrata e buono da email salvano il testo estratto
+# (testo incorporato e OCR) con chiave digest del file + tipo + pagina: lo stesso
+# documento ricaricato non viene riletto né passato di nuovo in OCR.
+# Il tipo include la versione dell'estrazione: cambiando la logica si cambia il tipo.
+# OCR_CACHE_MAX_MB limita la dimensione totale (default 50; 0 = cache disattivata).
+
+
+def _ocr_cache_max_bytes():
+    try:
+        return int(float(os.environ.get('OCR_CACHE_MAX_MB', '50') or 0) * 1024 * 1024)
+    except ValueError:
+        return 50 * 1024 * 1024
+
+
+def ocr_cache_digest(path):
+    """Digest del file per la cache (None se non leggibile o cache disattivata)."""
+    if _ocr_cache_max_bytes() <= 0:
+        return None
+    digest = _file_digest(Path(path))
+    return None if digest == "N/A" else digest
+
+
+def ocr_cache_leggi(digest, tipo, pagine=(0,)):
+    """Testi in cache {pagina: testo} per le pagine richieste; aggiorna l'ultimo utilizzo (LRU)."""
+    from sqlalchemy import update
+
+    if not digest:
+        return {}
+    t = OcrCache.__table__
+    try:
+        with engine.begin() as conn:
+            trovati = dict(conn.execute(
+                select(t.c.pagina, t.c.testo).where(
+                    t.c.digest == digest, t.c.tipo == tipo, t.c.pagina.in_(list(pagine))
+                )
+            ).all())
+            if trovati:
+                conn.execute(
+                    update(t)
+                    .where(t.c.digest == digest, t.c.tipo == tipo, t.c.pagina.in_(list(trovati)))
+                    .values(usato_il=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                )
+        return trovati
+    except Exception as e:
+        print(f"[WARN] lettura cache OCR fallita: {e}")
+        return {}
+
+
+def ocr_cache_salva(digest, tipo, testi):
+    """Salva {pagina: testo} in cache ed elimina i meno usati oltre OCR_CACHE_MAX_MB."""
+    from sqlalchemy import delete, insert
+
+    testi = {p: v for p, v in (testi or {}).items() if v}
+    if not digest or not testi:
+        return
+    t = OcrCache.__table__
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        with engine.begin() as conn:
+            conn.execute(delete(t).where(t.c.digest == digest, t.c.tipo == tipo, t.c.pagina.in_(list(testi))))
+            conn.execute(insert(t), [
+                {'digest': digest, 'tipo': tipo, 'pagina': p, 'testo': v,
+                 'dimensione': len(v.encode('utf-8')), 'creato_il': now, 'usato_il': now}
+                for p, v in testi.items()
+            ])
+            _ocr_cache_riduci(conn)
+    except Exception as e:
+        print(f"[WARN] salvataggio cache OCR fallito: {e}")
+
+
+def _ocr_cache_riduci(conn):
+    """Elimina le voci usate meno di recente finché la cache torna al 90% del limite."""
+    from sqlalchemy import delete
+
+    t = OcrCache.__table__
+    limite = _ocr_cache_max_bytes()
+    totale = conn.execute(select(func.coalesce(func.sum(t.c.dimensione), 0))).scalar() or 0
+    if totale <= limite:
+        return
+    da_liberare = totale - int(limite * 0.9)
+    vecchie = []
+    for digest, tipo, pagina, dimensione in conn.execute(
+        select(t.c.digest, t.c.tipo, t.c.pagina, t.c.dimensione).order_by(t.c.usato_il.asc())
+    ):
+        vecchie.append((digest, tipo, pagina))
+        da_liberare -= dimensione or 0
+        if da_liberare <= 0:
+            break
+    for digest, tipo, pagina in vecchie:
+        conn.execute(delete(t).where(t.c.digest == digest, t.c.tipo == tipo, t.c.pagina == pagina))
 
-ensure_lavorazioni_extra_schema(engine)
 
 # ========================================================
 # 5. GESTIONE UTENTI (Definizione PRIMA dell'uso)
@@ -3593,6 +4701,15 @@ REPORT_FATTURAZIONE_HTML = """
         <div class="mt-3 small text-muted">
             Per i clienti standard il report mostra M2 presenti nel mese, giacenza a fine mese, M2 usciti, M2 entrate doganali e il picco M2 occupati nel mese. Per Galvano Tecnica viene mostrato solo il totale pallet ancora in giacenza a fine mese selezionato, usando la colonna N° Colli.
         </div>
+        {% if snapshot %}
+        <form method="post" action="{{ url_for('report_fatturazione_ricalcola') }}" class="mt-3 d-flex align-items-center gap-3 flex-wrap">
+            <input type="hidden" name="mese" value="{{ mese }}">
+            <input type="hidden" name="anno" value="{{ anno }}">
+            <span class="badge bg-secondary"><i class="bi bi-lock"></i> Mese chiuso</span>
+            <span class="small text-muted">Dati salvati il {{ snapshot.calcolato_il }} da {{ snapshot.calcolato_da }}</span>
+            <button type="submit" class="btn btn-sm btn-outline-primary"><i class="bi bi-arrow-repeat"></i> Ricalcola</button>
+        </form>
+        {% endif %}
     </div>
 </div>
 
@@ -4813,6 +5930,12 @@ IMPORT_EXCEL_HTML = """
                     <label for="excel_file" class="form-label fw-bold">2. Carica File Excel</label>
                     <input class="form-control" type="file" id="excel_file" name="excel_file" accept=".xlsx,.xls,.xlsm" required>
                 </div>
+
+                <div class="form-check mb-3">
+                    <input class="form-check-input" type="checkbox" id="in_background" name="in_background" value="1">
+                    <label class="form-check-label" for="in_background">Importa in background (file molto grandi, solo .xlsx)</label>
+                    <div class="form-text">Le righe vengono salvate a blocchi: se l'import si interrompe riprende dall'ultimo blocco salvato.</div>
+                </div>
                 
                 <div class="d-grid gap-2">
                     <button type="submit" class="btn btn-primary btn-lg">Avvia Importazione</button>
@@ -4820,7 +5943,73 @@ IMPORT_EXCEL_HTML = """
                 </div>
             </form>
             {% endif %}
-            
+
+            {% if job_id %}
+            <div id="import-job" class="card mt-4 p-3" data-url="{{ url_for('import_excel_job_stato', job_id=job_id) }}" data-riprendi="{{ url_for('import_excel_job_riprendi', job_id=job_id) }}">
+                <div class="d-flex justify-content-between align-items-center mb-2">
+                    <strong><i class="bi bi-hourglass-split"></i> Import in background</strong>
+                    <span id="import-job-stato" class="badge bg-secondary">...</span>
+                </div>
+                <div class="small text-muted mb-2" id="import-job-file"></div>
+                <div class="progress mb-2" style="height: 22px;">
+                    <div id="import-job-barra" class="progress-bar progress-bar-striped progress-bar-animated" style="width: 0%">0%</div>
+                </div>
+                <div class="small" id="import-job-dettaglio"></div>
+                <div class="alert alert-danger small mt-2 d-none" id="import-job-errore"></div>
+                <div class="d-flex gap-2 mt-2">
+                    <button type="button" class="btn btn-sm btn-warning d-none" id="import-job-riprendi"><i class="bi bi-arrow-repeat"></i> Riprendi dal checkpoint</button>
+                    <a href="{{ url_for('giacenze') }}" class="btn btn-sm btn-outline-primary d-none" id="import-job-giacenze">Vai alle giacenze</a>
+                </div>
+            </div>
+            <script>
+            (function () {
+                const box = document.getElementById('import-job');
+                const badge = document.getElementById('import-job-stato');
+                const barra = document.getElementById('import-job-barra');
+                const btnRiprendi = document.getElementById('import-job-riprendi');
+                const colori = {IN_CODA: 'bg-secondary', IN_CORSO: 'bg-primary', COMPLETATO: 'bg-success', ERRORE: 'bg-danger'};
+                let timer = null;
+
+                function aggiorna() {
+                    fetch(box.dataset.url, {credentials: 'same-origin'})
+                        .then(r => r.json())
+                        .then(j => {
+                            if (!j.ok) { clearInterval(timer); badge.textContent = j.errore || 'Errore'; return; }
+                            badge.textContent = j.stato;
+                            badge.className = 'badge ' + (colori[j.stato] || 'bg-secondary');
+                            document.getElementById('import-job-file').textContent = (j.file || '') + ' · profilo ' + (j.profilo || '');
+                            barra.style.width = j.percentuale + '%';
+                            barra.textContent = j.percentuale + '%';
+                            document.getElementById('import-job-dettaglio').textContent =
+                                'Righe lette: ' + j.righe_lette + (j.righe_totali ? ' / ' + j.righe_totali : '') + ' · Articoli importati: ' + j.importati;
+                            const err = document.getElementById('import-job-errore');
+                            err.classList.toggle('d-none', !j.errore);
+                            err.textContent = j.errore || '';
+                            btnRiprendi.classList.toggle('d-none', j.stato !== 'ERRORE');
+                            if (j.stato === 'COMPLETATO' || j.stato === 'ERRORE') {
+                                barra.classList.remove('progress-bar-animated');
+                                document.getElementById('import-job-giacenze').classList.toggle('d-none', j.stato !== 'COMPLETATO');
+                                clearInterval(timer);
+                                timer = null;
+                            }
+                        })
+                        .catch(() => {});
+                }
+
+                btnRiprendi.addEventListener('click', function () {
+                    fetch(box.dataset.riprendi, {method: 'POST', credentials: 'same-origin'}).then(() => {
+                        btnRiprendi.classList.add('d-none');
+                        if (!timer) { timer = setInterval(aggiorna, 2000); }
+                        aggiorna();
+                    });
+                });
+
+                aggiorna();
+                timer = setInterval(aggiorna, 2000);
+            })();
+            </script>
+            {% endif %}
+
             <div class="mt-4 text-center">
                 <a href="{{ url_for('manage_mappe') }}" class="small text-decoration-none"><i class="bi bi-gear"></i> Gestisci file mappe_excel.json</a>
             </div>
@@ -5994,6 +7183,35 @@ def _warehouse_readonly_guard():
         return None
     return None
 
+def aggregati_condizionali(db, metriche, filtri=None, outerjoin=None, modello=None):
+    """Calcola più COUNT/SUM condizionali con un'unica query (un solo round-trip).
+
+    `metriche` è un dict ordinato nome -> (condizione, colonna):
+    - colonna None  = conteggio delle righe che soddisfano la condizione;
+    - condizione None = somma/conteggio su tutte le righe filtrate.
+    `filtri` sono i filtri comuni (WHERE), `outerjoin` un'eventuale
+    coppia (subquery, on) da agganciare in LEFT JOIN.
+    Restituisce un dict nome -> valore (0 se la somma è vuota).
+    """
+    modello = modello or Articolo
+    colonne = []
+    for nome, (condizione, colonna) in metriche.items():
+        if condizione is None and colonna is None:
+            colonne.append(func.count().label(nome))
+            continue
+        valore = colonna if colonna is not None else 1
+        expr = case((condizione, valore), else_=0) if condizione is not None else valore
+        colonne.append(func.coalesce(func.sum(expr), 0).label(nome))
+
+    q = db.query(*colonne).select_from(modello)
+    if outerjoin is not None:
+        q = q.outerjoin(*outerjoin)
+    if filtri:
+        q = q.filter(*filtri)
+    row = q.one()
+    return dict(row._mapping)
+
+
 @app.route('/')
 @app.route('/home')
 @login_required
@@ -6005,19 +7223,18 @@ def home():
     rendeva la pagina lenta e poteva causare timeout su Render.
 
     Questa versione usa soprattutto COUNT/SUM direttamente nel database e carica
-    solo pochi record per esempi e ultimi movimenti.
+    solo pochi record per esempi e ultimi movimenti. Totali e contatori degli
+    alert arrivano da un'unica query a somme condizionali (aggregati_condizionali).
     """
     db = SessionLocal()
     try:
         today_obj = date.today()
-        today_iso = today_obj.strftime('%Y-%m-%d')
-        today_it = today_obj.strftime('%d/%m/%Y')
-        cutoff_90_iso = (today_obj - timedelta(days=90)).strftime('%Y-%m-%d')
+        cutoff_90 = today_obj - timedelta(days=90)
         cliente_corrente = current_cliente()
 
         def _cliente_filter(model=Articolo):
             if cliente_corrente:
-                return [func.upper(model.cliente) == cliente_corrente.upper()]
+                return [model.cliente_key == normalize_text_key(cliente_corrente)]
             return []
 
         active_filter = [
@@ -6026,30 +7243,6 @@ def home():
 
         all_filter = _cliente_filter(Articolo)
 
-        def _scalar(query, default=0):
-            try:
-                v = query.scalar()
-                return default if v is None else v
-            except Exception:
-                return default
-
-        def _count_articoli(extra_filters=None):
-            q = db.query(func.count(Articolo.id_articolo))
-            filters = list(extra_filters or [])
-            if filters:
-                q = q.filter(*filters)
-            return int(_scalar(q, 0) or 0)
-
-        def _sum_articoli(column, extra_filters=None):
-            q = db.query(func.coalesce(func.sum(column), 0))
-            filters = list(extra_filters or [])
-            if filters:
-                q = q.filter(*filters)
-            try:
-                return float(q.scalar() or 0)
-            except Exception:
-                return 0.0
-
         def _examples(extra_filters, attr, max_items=5):
             try:
                 col = getattr(Articolo, attr)
@@ -6083,59 +7276,104 @@ def home():
                     'examples': examples or []
                 })
 
+        # ========================================================
+        # CONTATORI HOME IN UN SOLO PASSAGGIO
+        # Totali, entrate/uscite del giorno, doganali e contatori degli alert
+        # vengono calcolati con un'unica query a somme condizionali (CASE WHEN)
+        # invece di una COUNT/SUM separata per ciascun valore.
+        # ========================================================
+        attivo = active_filter[0]
+
+        # Flag foto/PDF per articolo: una sola aggregazione su attachments in LEFT JOIN,
+        # al posto delle subquery correlate attachments.any() valutate riga per riga.
+        allegati = (
+            select(
+                Attachment.articolo_id.label('articolo_id'),
+                func.max(case((Attachment.kind == 'photo', 1), else_=0)).label('has_photo'),
+                func.max(case((Attachment.kind == 'doc', 1), else_=0)).label('has_doc'),
+            )
+            .group_by(Attachment.articolo_id)
+            .subquery()
+        )
+
+        qr_mancante = or_(Articolo.codice_entrata == None, Articolo.codice_entrata == "")
+        metriche_home = {
+            # Colonne DATE: valgono sia le date ISO YYYY-MM-DD sia quelle italiane DD/MM/YYYY.
+            'entrate_oggi': (Articolo.data_ingresso_dt == today_obj, None),
+            'uscite_oggi': (Articolo.data_uscita_dt == today_obj, None),
+            'qr_mancante': (and_(attivo, qr_mancante), None),
+            'senza_foto': (and_(attivo, func.coalesce(allegati.c.has_photo, 0) == 0), None),
+            'senza_pdf': (and_(attivo, func.coalesce(allegati.c.has_doc, 0) == 0), None),
+            'oltre_90': (and_(attivo, Articolo.data_ingresso_dt <= cutoff_90), None),
+        }
+        # Totali giacenza e riepilogo clienti dallo snapshot (sezione 4a); se non è
+        # disponibile vengono calcolati nella stessa query aggregata.
+        snapshot = dashboard_snapshot_leggi(db, cliente_corrente)
+        if snapshot is None:
+            metriche_home.update({
+                'tot_giacenza': (attivo, None),
+                'tot_m2': (attivo, Articolo.m2),
+                'tot_peso': (attivo, Articolo.peso),
+                'tot_colli': (attivo, Articolo.n_colli),
+                'doganali': (and_(attivo, func.upper(func.coalesce(Articolo.stato, '')).like('%DOGANA%')), None),
+            })
+        try:
+            aggregati = aggregati_condizionali(
+                db, metriche_home,
+                filtri=all_filter,
+                outerjoin=(allegati, allegati.c.articolo_id == Articolo.id_articolo),
+            )
+        except Exception:
+            db.rollback()
+            aggregati = {nome: 0 for nome in metriche_home}
+        if snapshot is not None:
+            aggregati.update({
+                'tot_giacenza': snapshot[0]['righe'],
+                'tot_m2': snapshot[0]['m2'],
+                'tot_peso': snapshot[0]['peso'],
+                'tot_colli': snapshot[0]['colli'],
+                'doganali': snapshot[0]['doganali'],
+            })
+
         dashboard = {
-            'tot_giacenza': _count_articoli(active_filter),
-            'tot_m2': round(_sum_articoli(Articolo.m2, active_filter), 2),
-            'tot_peso': round(_sum_articoli(Articolo.peso, active_filter), 2),
-            'tot_colli': int(_sum_articoli(Articolo.n_colli, active_filter)),
-            # Supporta sia formato ISO YYYY-MM-DD sia formato italiano DD/MM/YYYY.
-            'entrate_oggi': _count_articoli(all_filter + [
-                or_(Articolo.data_ingresso == today_iso, Articolo.data_ingresso == today_it)
-            ]),
-            'uscite_oggi': _count_articoli(all_filter + [
-                or_(Articolo.data_uscita == today_iso, Articolo.data_uscita == today_it)
-            ]),
-            'doganali': _count_articoli(active_filter + [
-                func.upper(func.coalesce(Articolo.stato, '')).like('%DOGANA%')
-            ]),
+            'tot_giacenza': int(aggregati['tot_giacenza'] or 0),
+            'tot_m2': round(float(aggregati['tot_m2'] or 0), 2),
+            'tot_peso': round(float(aggregati['tot_peso'] or 0), 2),
+            'tot_colli': int(aggregati['tot_colli'] or 0),
+            'entrate_oggi': int(aggregati['entrate_oggi'] or 0),
+            'uscite_oggi': int(aggregati['uscite_oggi'] or 0),
+            'doganali': int(aggregati['doganali'] or 0),
             'buoni_aperti': 0,
             'buoni_creati': 0,
             'buoni_usciti': 0,
         }
 
-        def _buoni_base_query():
-            q = db.query(func.count(BuonoCarico.id))
-            if cliente_corrente:
-                q = q.filter(func.upper(func.coalesce(BuonoCarico.cliente, '')) == cliente_corrente.upper())
-            return q
-
+        # Buoni: i tre contatori con una sola query sulla tabella buoni_carico.
+        stato_buono = func.upper(func.coalesce(BuonoCarico.stato, ''))
+        filtri_buoni = []
+        if cliente_corrente:
+            filtri_buoni.append(func.upper(func.coalesce(BuonoCarico.cliente, '')) == cliente_corrente.upper())
         try:
-            stato_buono = func.upper(func.coalesce(BuonoCarico.stato, ''))
-            dashboard['buoni_creati'] = int(_buoni_base_query().filter(~stato_buono.in_(['ELIMINATO'])).scalar() or 0)
-            dashboard['buoni_aperti'] = int(_buoni_base_query().filter(
-                ~stato_buono.in_(['CARICATO', 'CHIUSO', 'COMPLETATO', 'ELIMINATO'])
-            ).scalar() or 0)
-            dashboard['buoni_usciti'] = int(_buoni_base_query().filter(
-                stato_buono.in_(['CARICATO', 'CHIUSO', 'COMPLETATO'])
-            ).scalar() or 0)
+            buoni = aggregati_condizionali(db, {
+                'buoni_creati': (~stato_buono.in_(['ELIMINATO']), None),
+                'buoni_aperti': (~stato_buono.in_(['CARICATO', 'CHIUSO', 'COMPLETATO', 'ELIMINATO']), None),
+                'buoni_usciti': (stato_buono.in_(['CARICATO', 'CHIUSO', 'COMPLETATO']), None),
+            }, filtri=filtri_buoni, modello=BuonoCarico)
+            for nome, valore in buoni.items():
+                dashboard[nome] = int(valore or 0)
         except Exception:
-            dashboard['buoni_aperti'] = 0
-            dashboard['buoni_creati'] = 0
-            dashboard['buoni_usciti'] = 0
+            db.rollback()
 
         # Ultimi movimenti: carica poche colonne e pochi record, non tutti gli articoli.
         movimenti = []
 
         def _add_movimenti_ingresso():
             q = db.query(
-                Articolo.data_ingresso, Articolo.cliente, Articolo.codice_articolo,
+                Articolo.data_ingresso_dt, Articolo.cliente, Articolo.codice_articolo,
                 Articolo.descrizione, Articolo.n_arrivo, Articolo.n_ddt_ingresso
-            ).filter(*(all_filter + [Articolo.data_ingresso != None, Articolo.data_ingresso != ""]))
+            ).filter(*(all_filter + [Articolo.data_ingresso_dt != None]))
             q = q.order_by(Articolo.id_articolo.desc()).limit(20)
-            for d_in_raw, cli, cod, desc, arr, ddt in q.all():
-                d_in = to_date_db(d_in_raw)
-                if not d_in:
-                    continue
+            for d_in, cli, cod, desc, arr, ddt in q.all():
                 movimenti.append({
                     'data_sort': d_in,
                     'data': d_in.strftime('%d/%m/%Y'),
@@ -6149,14 +7387,11 @@ def home():
 
         def _add_movimenti_uscita():
             q = db.query(
-                Articolo.data_uscita, Articolo.cliente, Articolo.codice_articolo,
+                Articolo.data_uscita_dt, Articolo.cliente, Articolo.codice_articolo,
                 Articolo.descrizione, Articolo.n_arrivo, Articolo.n_ddt_uscita
-            ).filter(*(all_filter + [Articolo.data_uscita != None, Articolo.data_uscita != ""]))
+            ).filter(*(all_filter + [Articolo.data_uscita_dt != None]))
             q = q.order_by(Articolo.id_articolo.desc()).limit(20)
-            for d_out_raw, cli, cod, desc, arr, ddt in q.all():
-                d_out = to_date_db(d_out_raw)
-                if not d_out:
-                    continue
+            for d_out, cli, cod, desc, arr, ddt in q.all():
                 movimenti.append({
                     'data_sort': d_out,
                     'data': d_out.strftime('%d/%m/%Y'),
@@ -6185,16 +7420,16 @@ def home():
         # ========================================================
         dashboard_alerts = []
 
-        missing_qr_filter = active_filter + [
-            or_(Articolo.codice_entrata == None, Articolo.codice_entrata == "")
-        ]
+        # I contatori arrivano dalla query aggregata; gli esempi (LIMIT 5)
+        # vengono letti solo quando l'alert ha davvero qualcosa da mostrare.
+        missing_qr_filter = active_filter + [qr_mancante]
         _add_alert(
             dashboard_alerts,
             'danger',
             'QR / codice entrata mancante',
-            _count_articoli(missing_qr_filter),
+            aggregati['qr_mancante'],
             'Articoli in giacenza senza codice entrata collegato.',
-            _examples(missing_qr_filter, 'n_arrivo')
+            _examples(missing_qr_filter, 'n_arrivo') if aggregati['qr_mancante'] else []
         )
 
         senza_foto_filter = active_filter + [
@@ -6208,45 +7443,67 @@ def home():
             dashboard_alerts,
             'warning',
             'Foto mancante',
-            _count_articoli(senza_foto_filter),
+            aggregati['senza_foto'],
             'Articoli in giacenza senza foto arrivo.',
-            _examples(senza_foto_filter, 'n_arrivo')
+            _examples(senza_foto_filter, 'n_arrivo') if aggregati['senza_foto'] else []
         )
 
         _add_alert(
             dashboard_alerts,
             'warning',
             'Documento PDF mancante',
-            _count_articoli(senza_pdf_filter),
+            aggregati['senza_pdf'],
             'Articoli in giacenza senza documento arrivo PDF.',
-            _examples(senza_pdf_filter, 'n_arrivo')
+            _examples(senza_pdf_filter, 'n_arrivo') if aggregati['senza_pdf'] else []
         )
 
-        def _duplicate_summary(attr, extra_filters=None, exclude_clienti=None):
-            exclude_clienti = {c.upper() for c in (exclude_clienti or [])}
-            col = getattr(Articolo, attr)
-            filters = list(extra_filters or [])
-            filters += [col != None, col != ""]
-            if exclude_clienti:
-                filters.append(~func.upper(func.coalesce(Articolo.cliente, '')).in_(list(exclude_clienti)))
+        def _duplicate_summaries(specs, extra_filters=None, max_groups=50):
+            """Gruppi duplicati per più campi con una sola query (UNION ALL dei GROUP BY).
 
-            try:
-                rows_dup = (
-                    db.query(col, func.count(Articolo.id_articolo).label('cnt'))
-                    .filter(*filters)
+            Ogni ramo è limitato in SQL ai max_groups gruppi più numerosi.
+            specs: dict campo -> clienti esclusi. Restituisce campo -> (n. gruppi, esempi).
+            """
+            parti = []
+            for attr, exclude_clienti in specs.items():
+                exclude_clienti = {c.upper() for c in (exclude_clienti or [])}
+                col = getattr(Articolo, attr)
+                filters = list(extra_filters or [])
+                filters += [col != None, col != ""]
+                if exclude_clienti:
+                    filters.append(~func.upper(func.coalesce(Articolo.cliente, '')).in_(list(exclude_clienti)))
+                ramo = (
+                    select(
+                        literal(attr).label('campo'),
+                        col.label('valore'),
+                        func.count(Articolo.id_articolo).label('cnt'),
+                    )
+                    .where(*filters)
                     .group_by(col)
                     .having(func.count(Articolo.id_articolo) > 1)
-                    .order_by(func.count(Articolo.id_articolo).desc())
-                    .limit(50)
-                    .all()
+                    .order_by(func.count(Articolo.id_articolo).desc(), col)
+                    .limit(max_groups)
+                    .subquery()
                 )
-                total_groups = len(rows_dup)
-                examples = [str(v or '').strip() for v, c in rows_dup[:5] if str(v or '').strip()]
-                return total_groups, examples
+                parti.append(select(ramo.c.campo, ramo.c.valore, ramo.c.cnt))
+
+            risultato = {attr: (0, []) for attr in specs}
+            try:
+                gruppi = {attr: [] for attr in specs}
+                for campo, valore, cnt in db.execute(union_all(*parti)).all():
+                    gruppi.setdefault(campo, []).append((valore, int(cnt or 0)))
+                for attr, rows_dup in gruppi.items():
+                    rows_dup.sort(key=lambda r: (-r[1], str(r[0] or '')))
+                    examples = [str(v or '').strip() for v, c in rows_dup[:5] if str(v or '').strip()]
+                    risultato[attr] = (len(rows_dup), examples)
             except Exception:
-                return 0, []
+                db.rollback()
+            return risultato
 
-        dup_arrivi_count, dup_arrivi_examples = _duplicate_summary('n_arrivo', active_filter)
+        duplicati = _duplicate_summaries(
+            {'n_arrivo': None, 'serial_number': {'DUFERCO'}},
+            active_filter
+        )
+        dup_arrivi_count, dup_arrivi_examples = duplicati['n_arrivo']
         _add_alert(
             dashboard_alerts,
             'warning',
@@ -6256,11 +7513,7 @@ def home():
             dup_arrivi_examples
         )
 
-        dup_serial_count, dup_serial_examples = _duplicate_summary(
-            'serial_number',
-            active_filter,
-            exclude_clienti={'DUFERCO'}
-        )
+        dup_serial_count, dup_serial_examples = duplicati['serial_number']
         _add_alert(
             dashboard_alerts,
             'warning',
@@ -6309,21 +7562,18 @@ def home():
             uscite_senza_mezzo_examples
         )
 
-        # Merce ferma da oltre 90 giorni.
-        # Nota: confronto SQL affidabile quando data_ingresso è in formato YYYY-MM-DD.
-        # Le date non ISO restano gestibili dalle pagine di dettaglio, ma qui evitiamo scan completo.
+        # Merce ferma da oltre 90 giorni (colonna DATE: include anche le date non ISO).
         vecchie_filter = active_filter + [
-            Articolo.data_ingresso != None,
-            Articolo.data_ingresso != "",
-            Articolo.data_ingresso <= cutoff_90_iso
+            Articolo.data_ingresso_dt != None,
+            Articolo.data_ingresso_dt <= cutoff_90
         ]
         _add_alert(
             dashboard_alerts,
             'info',
             'Giacenze oltre 90 giorni',
-            _count_articoli(vecchie_filter),
+            aggregati['oltre_90'],
             'Articoli ancora in giacenza da almeno 90 giorni.',
-            _examples(vecchie_filter, 'n_arrivo')
+            _examples(vecchie_filter, 'n_arrivo') if aggregati['oltre_90'] else []
         )
 
         level_order = {'danger': 0, 'warning': 1, 'info': 2}
@@ -6337,19 +7587,25 @@ def home():
         # ========================================================
         dashboard_clienti = []
         try:
-            rows_clienti = (
-                db.query(
-                    func.coalesce(Articolo.cliente, '').label('cliente'),
-                    func.count(Articolo.id_articolo).label('righe'),
-                    func.coalesce(func.sum(Articolo.n_colli), 0).label('colli'),
-                    func.coalesce(func.sum(Articolo.m2), 0).label('m2'),
-                    func.coalesce(func.sum(Articolo.peso), 0).label('peso'),
+            if snapshot is not None:
+                rows_clienti = [
+                    (r['cliente'], r['righe'], r['colli'], r['m2'], r['peso'])
+                    for r in snapshot[1]
+                ]
+            else:
+                rows_clienti = (
+                    db.query(
+                        func.coalesce(Articolo.cliente, '').label('cliente'),
+                        func.count(Articolo.id_articolo).label('righe'),
+                        func.coalesce(func.sum(Articolo.n_colli), 0).label('colli'),
+                        func.coalesce(func.sum(Articolo.m2), 0).label('m2'),
+                        func.coalesce(func.sum(Articolo.peso), 0).label('peso'),
+                    )
+                    .filter(*active_filter)
+                    .group_by(func.coalesce(Articolo.cliente, ''))
+                    .order_by(func.coalesce(Articolo.cliente, '').asc())
+                    .all()
                 )
-                .filter(*active_filter)
-                .group_by(func.coalesce(Articolo.cliente, ''))
-                .order_by(func.coalesce(Articolo.cliente, '').asc())
-                .all()
-            )
 
             # Precalcolo buoni per cliente, così non faccio query dentro al template.
             buoni_by_cliente = {}
@@ -6446,32 +7702,79 @@ def home():
 
 
 # ========================================================
-# GESTIONE MAPPE EXCEL (CORRETTA + LOG DEBUG)
+# GESTIONE MAPPE EXCEL (registro in memoria, riletto solo se il file cambia)
 # ========================================================
+MAPPE_EXCEL_CACHE = {}
+MAPPE_EXCEL_LOCK = threading.Lock()
 
-def load_mappe():
-    """Carica mappe_excel.json: prima da config. (con punto), poi fallback su root."""
-    config_path = APP_DIR / "config" / "mappe_excel.json"   # <-- cartella con il punto
+
+def _mappe_excel_path():
+    """mappe_excel.json letto dall'import: prima da config/, poi fallback su root."""
+    config_path = APP_DIR / "config" / "mappe_excel.json"
     root_path = APP_DIR / "mappe_excel.json"
+    return config_path if config_path.exists() else root_path
 
-    json_path = config_path if config_path.exists() else root_path
-    print(f"DEBUG scelto json_path: {json_path}")
 
-    if not json_path.exists():
-        print("DEBUG NESSUN mappe_excel.json trovato -> {}")
-        print("=== FINE DEBUG load_mappe() ===\n")
-        return {}
+def _mappe_excel_compila(column_map):
+    """Intestazioni del profilo già normalizzate: ((INTESTAZIONE_MAIUSCOLA, campo_db), ...)."""
+    if not isinstance(column_map, dict):
+        return ()
+    return tuple((str(header).strip().upper(), campo) for header, campo in column_map.items())
+
 
+def mappe_excel_registro(json_path=None):
+    """Contenuto di mappe_excel.json dal registro in memoria.
+
+    Il file viene riletto e riparsato solo quando cambiano mtime o dimensione.
+    Restituisce {'path', 'testo', 'profili', 'intestazioni', 'errore'}, dove
+    intestazioni[profilo] è la mappa colonne precompilata (_mappe_excel_compila).
+    """
+    json_path = Path(json_path) if json_path else _mappe_excel_path()
     try:
-        raw = json_path.read_text(encoding="utf-8")
-        data = json.loads(raw)
-        print(f"DEBUG size={len(raw)} bytes | profili={len(data) if isinstance(data, dict) else 'N/A'}")
-        print("=== FINE DEBUG load_mappe() ===\n")
-        return data if isinstance(data, dict) else {}
-    except Exception as e:
-        print(f"DEBUG ERRORE parsing mappe: {e}")
-        print("=== FINE DEBUG load_mappe() ===\n")
-        return {}
+        st = json_path.stat()
+        firma = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        firma = None
+
+    with MAPPE_EXCEL_LOCK:
+        voce = MAPPE_EXCEL_CACHE.get(str(json_path))
+        if voce is not None and voce['firma'] == firma:
+            return voce
+
+        voce = {'path': json_path, 'firma': firma, 'testo': '', 'profili': {}, 'intestazioni': {}, 'errore': None}
+        if firma is None:
+            app.logger.debug(f"[MAPPE] nessun file {json_path} -> nessun profilo")
+        else:
+            try:
+                voce['testo'] = json_path.read_text(encoding="utf-8")
+                data = json.loads(voce['testo'])
+                voce['profili'] = data if isinstance(data, dict) else {}
+                voce['intestazioni'] = {
+                    nome: _mappe_excel_compila(conf.get('column_map') if isinstance(conf, dict) else None)
+                    for nome, conf in voce['profili'].items()
+                }
+                app.logger.debug(f"[MAPPE] caricato {json_path}: {firma[1]} bytes, {len(voce['profili'])} profili")
+            except Exception as e:
+                voce['errore'] = str(e)
+                app.logger.debug(f"[MAPPE] errore lettura/parsing {json_path}: {e}")
+        MAPPE_EXCEL_CACHE[str(json_path)] = voce
+        return voce
+
+
+def mappe_excel_invalida():
+    """Svuota il registro (dopo una scrittura del file da parte dell'editor)."""
+    with MAPPE_EXCEL_LOCK:
+        MAPPE_EXCEL_CACHE.clear()
+
+
+def load_mappe():
+    """Profili di mappatura di mappe_excel.json (dal registro in memoria)."""
+    return mappe_excel_registro()['profili']
+
+
+def mappe_excel_intestazioni(profilo):
+    """Mappa colonne precompilata del profilo ((INTESTAZIONE_MAIUSCOLA, campo_db), ...)."""
+    return mappe_excel_registro()['intestazioni'].get(profilo, ())
 
 
 @app.route('/manage_mappe', methods=['GET', 'POST'])
@@ -6479,55 +7782,30 @@ def load_mappe():
 def manage_mappe():
     json_path = APP_DIR / "mappe_excel.json"
 
-    print("\n=== DEBUG manage_mappe() ===")
-    print(f"DEBUG manage_mappe: json_path={json_path}")
-
     if request.method == 'POST':
         content = request.form.get('json_content', '')
         try:
             json.loads(content)  # Validazione
-            print(f"DEBUG manage_mappe: scrivo su {json_path}")
-
             json_path.write_text(content, encoding='utf-8')
-
-            try:
-                size = json_path.stat().st_size
-            except Exception:
-                size = "N/A"
-            print(f"DEBUG manage_mappe: scritto OK. md5={_file_digest(json_path)} size={size}")
-
+            mappe_excel_invalida()
+            app.logger.debug(f"[MAPPE] manage_mappe: scritto {json_path} md5={_file_digest(json_path)}")
             flash("Mappa aggiornata con successo.", "success")
         except json.JSONDecodeError as e:
-            print(f"DEBUG manage_mappe: JSON NON valido: {e}")
+            app.logger.debug(f"[MAPPE] manage_mappe: JSON non valido: {e}")
             flash(f"Errore nel formato JSON: {e}", "danger")
         except Exception as e:
-            print(f"DEBUG manage_mappe: ERRORE scrittura file: {e}")
+            app.logger.debug(f"[MAPPE] manage_mappe: errore scrittura {json_path}: {e}")
             flash(f"Errore scrittura mappa: {e}", "danger")
-
-        print("=== FINE DEBUG manage_mappe() ===\n")
         return redirect(url_for('manage_mappe'))
 
     # GET
-    content = ""
-    if json_path.exists():
-        try:
-            content = json_path.read_text(encoding='utf-8')
-            print(f"DEBUG manage_mappe GET: file esiste, md5={_file_digest(json_path)} size={len(content)}")
-        except Exception as e:
-            print(f"DEBUG manage_mappe GET: errore lettura file: {e}")
-    else:
-        print("DEBUG manage_mappe GET: file NON esiste")
-
-    print("=== FINE DEBUG manage_mappe() ===\n")
+    content = mappe_excel_registro(json_path)['testo']
     return render_template('mappe_excel.html', content=content)
 
 
 @app.post('/upload_mappe_json')
 @login_required
 def upload_mappe_json():
-    import json
-    import hashlib
-
     if 'json_file' not in request.files:
         flash("Nessun file selezionato", "warning")
         return redirect(url_for('manage_mappe'))
@@ -6539,20 +7817,6 @@ def upload_mappe_json():
 
     target = APP_DIR / "mappe_excel.json"
 
-    def file_digest(path):
-        try:
-            h = hashlib.md5()
-            with open(path, "rb") as fp:
-                for chunk in iter(lambda: fp.read(8192), b""):
-                    h.update(chunk)
-            return h.hexdigest()
-        except Exception:
-            return "N/A"
-
-    print("\n=== DEBUG upload_mappe_json() ===")
-    print(f"DEBUG upload_mappe_json: filename={f.filename}")
-    print(f"DEBUG upload_mappe_json: target={target}")
-
     try:
         raw = f.read()
 
@@ -6572,103 +7836,586 @@ def upload_mappe_json():
             pass
 
         target.write_text(content, encoding="utf-8")
-
-        size = target.stat().st_size if target.exists() else "N/A"
-        print(f"DEBUG upload_mappe_json: scritto OK. md5={file_digest(target)} size={size}")
+        mappe_excel_invalida()
+        app.logger.debug(f"[MAPPE] upload_mappe_json: {f.filename} -> {target} md5={_file_digest(target)}")
 
         flash("File mappe_excel.json caricato correttamente.", "success")
 
     except Exception as e:
-        print(f"DEBUG upload_mappe_json: ERRORE: {e}")
+        app.logger.debug(f"[MAPPE] upload_mappe_json: errore {f.filename}: {e}")
         flash(f"Errore nel file caricato: {e}", "danger")
 
-    print("=== FINE DEBUG upload_mappe_json() ===\n")
     return redirect(url_for('manage_mappe'))
 
 
-# --- GESTIONE TRASPORTI (ADMIN) ---
+# --- GESTIONE TRASPORTI (ADMIN) ---
+
+
+
+
+
+
+# --- GESTIONE LAVORAZIONI (ADMIN) ---
+def canonical_cliente_picking(value):
+    """Normalizza il cliente nel Picking.
+    Regola importante: tutte le varianti di Galvano devono diventare sempre
+    GALVANO TECNICA, altrimenti il record viene salvato ma poi non compare
+    correttamente nei filtri/lista.
+    """
+    raw = (value or '').strip()
+    if not raw:
+        raise ValueError("Cliente obbligatorio.")
+
+    norm = normalize_text_key(raw)
+
+    # Varianti reali viste in inserimento/import: Galvano, Galvanotecnica,
+    # Cotugno Galvanotecnica, Galvano Tecnica Spa, ecc.
+    if 'GALVANO' in norm:
+        return 'GALVANO TECNICA'
+
+    for c in get_clienti_utenti():
+        if normalize_text_key(c) == norm:
+            return c
+
+    # Se non è presente negli utenti, salva comunque pulito in maiuscolo
+    # invece di perdere il record dalla visualizzazione.
+    return raw.upper()
+
+
+def _clean_picking_upper_bound(value):
+    """Nei filtri Picking, un valore massimo 0 / 0,0 inserito dal browser
+    viene spesso interpretato come filtro attivo e nasconde le righe.
+    Lo trattiamo come campo vuoto.
+    """
+    s = str(value or '').strip().replace(' ', '')
+    return '' if s in {'0', '0,0', '0.0', '0,00', '0.00'} else (value or '').strip()
+
+
+def _has_active_picking_filters(filtri):
+    """True solo se l'utente ha inserito un filtro reale.
+    I valori automatici del telefono/browser tipo 0,0 non devono filtrare.
+    """
+    for v in (filtri or {}).values():
+        ss = str(v or '').strip()
+        if not ss:
+            continue
+        if ss.replace(' ', '') in {'0', '0,0', '0.0', '0,00', '0.00'}:
+            continue
+        return True
+    return False
+
+
+def _normalize_existing_galvano_picking(db):
+    """Sistema anche i vecchi record Picking Galvano salvati con varianti."""
+    changed = False
+    try:
+        rows = db.query(Lavorazione).all()
+        for rec in rows:
+            raw = getattr(rec, 'cliente', '') or ''
+            norm = normalize_text_key(raw)
+            if 'GALVANO' in norm and raw != 'GALVANO TECNICA':
+                rec.cliente = 'GALVANO TECNICA'
+                changed = True
+        if changed:
+            db.commit()
+    except Exception:
+        try:
+            db.rollback()
+        except Exception:
+            pass
+    return changed
+
+
+# ========================================================
+# PICKING / LAVORAZIONI
+# Le route /lavorazioni e /stampa_picking_pdf sono in routes/picking.py
+# Manteniamo qui solo modello e funzioni helper condivise.
+# ========================================================
+
+# --- IMPORT EXCEL ---
+# Righe inserite per blocco (INSERT multiplo) durante l'import Excel.
+IMPORT_EXCEL_BLOCCO = 1000
+IMPORT_EXCEL_CAMPI_FLOAT = ('larghezza', 'lunghezza', 'altezza', 'peso', 'm2', 'm3')
+IMPORT_EXCEL_CAMPI_INT = ('n_colli', 'pezzo')
+IMPORT_EXCEL_CAMPI_DATA = ('data_ingresso', 'data_uscita')
+
+
+def _import_excel_data(val):
+    """
+    Ritorna data in formato YYYY-MM-DD oppure None.
+    Gestisce:
+    - datetime / pd.Timestamp / date
+    - numpy.datetime64
+    - seriale Excel (int/float)
+    - stringhe (dd/mm/yyyy, dd/mm/yy, dd.mm.yyyy, ecc.)
+    """
+    import numpy as np
+
+    if val is None:
+        return None
+
+    # NaN/NaT
+    try:
+        if pd.isna(val):
+            return None
+    except Exception:
+        pass
+
+    # date/datetime/pandas timestamp
+    if isinstance(val, (datetime, pd.Timestamp)):
+        return val.strftime("%Y-%m-%d")
+    if isinstance(val, date) and not isinstance(val, datetime):
+        return val.strftime("%Y-%m-%d")
+
+    # numpy datetime64
+    if isinstance(val, np.datetime64):
+        try:
+            dt = pd.to_datetime(val, errors="coerce")
+            if pd.isna(dt):
+                return None
+            return dt.strftime("%Y-%m-%d")
+        except Exception:
+            return None
+
+    # Seriali Excel (giorni da 1899-12-30)
+    # Pandas a volte legge le date come float/int
+    if isinstance(val, (int, float)) and val > 0:
+        try:
+            dt = pd.to_datetime(val, unit="D", origin="1899-12-30", errors="coerce")
+            if pd.isna(dt):
+                return None
+            return dt.strftime("%Y-%m-%d")
+        except Exception:
+            pass  # continua sotto a tentare come stringa
+
+    # Stringhe
+    s = str(val).strip()
+    if not s:
+        return None
+
+    # prova formati comuni
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d/%m/%y", "%Y/%m/%d", "%d-%m-%Y", "%d-%m-%y", "%d.%m.%Y", "%d.%m.%y"):
+        try:
+            return datetime.strptime(s[:10], fmt).strftime("%Y-%m-%d")
+        except Exception:
+            pass
+
+    # fallback Pandas (dayfirst=True per Italia)
+    try:
+        dt = pd.to_datetime(s, errors="coerce", dayfirst=True)
+        if pd.isna(dt):
+            return None
+        return dt.strftime("%Y-%m-%d")
+    except Exception:
+        return None
+
+
+def import_excel_prepara_righe(df, intestazioni):
+    """Converte il foglio letto da pandas nelle righe articolo da inserire (colonna per colonna).
+
+    Stesse regole dell'import riga per riga: celle vuote ignorate, numeri con la
+    virgola, decimali non validi = 0, interi non validi = 1, date anche come
+    seriale Excel; m2/m3 calcolati dalle misure se m2 manca o è 0.
+    intestazioni è la mappa colonne precompilata del profilo (mappe_excel_intestazioni).
+    Restituisce una lista di dict {campo_db: valore} (solo i campi valorizzati).
+    """
+    import numpy as np
+
+    df_cols_upper = {str(c).strip().upper(): c for c in df.columns}
+    out = pd.DataFrame(index=df.index)
+    has_data = pd.Series(False, index=df.index)
+
+    for header_upper, db_field in intestazioni:
+        col_name = df_cols_upper.get(header_upper)
+        if col_name is None:
+            continue
+        col = df[col_name]
+        testo = col.astype(str).str.strip()
+        piena = col.notna() & (testo != '')
+
+        if db_field in IMPORT_EXCEL_CAMPI_FLOAT or db_field in IMPORT_EXCEL_CAMPI_INT:
+            if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+                num = col.astype(float)
+            else:
+                num = pd.to_numeric(testo.str.replace(',', '.', regex=False), errors='coerce')
+            if db_field in IMPORT_EXCEL_CAMPI_FLOAT:
+                val = num.fillna(0.0).astype(object)
+            else:
+                val = pd.Series(
+                    [int(v) if np.isfinite(v) else 1 for v in np.trunc(num.to_numpy(dtype=float, na_value=np.nan))],
+                    index=df.index, dtype=object,
+                )
+        elif db_field in IMPORT_EXCEL_CAMPI_DATA:
+            if pd.api.types.is_datetime64_any_dtype(col):
+                val = col.dt.strftime('%Y-%m-%d').astype(object)
+            else:
+                # Date ripetute su molte righe: converte una volta ogni valore distinto.
+                distinti = {v: _import_excel_data(v) for v in pd.unique(col[piena])}
+                val = col.map(lambda v: distinti.get(v) if v in distinti else None).astype(object)
+            piena &= val.notna()
+        else:
+            val = testo.astype(object)
+
+        if db_field not in out:
+            out[db_field] = pd.Series(None, index=df.index, dtype=object)
+        out[db_field] = val.where(piena, out[db_field])
+        has_data |= piena
+
+    righe = ~df.isnull().all(axis=1) & has_data
+    out = out[righe]
+    if out.empty:
+        return []
+
+    # Calcoli automatici se mancano: m2 = L x P x colli, m3 = L x P x H x colli.
+    def _num(campo, default):
+        if campo not in out:
+            return pd.Series(default, index=out.index, dtype=float)
+        return pd.to_numeric(out[campo], errors='coerce').fillna(default).astype(float)
+
+    m2 = _num('m2', 0.0)
+    lung, larg, alt = _num('lunghezza', 0.0), _num('larghezza', 0.0), _num('altezza', 0.0)
+    colli = _num('n_colli', 0.0).replace(0.0, 1.0)
+    calcola = (m2 == 0) & (lung > 0) & (larg > 0)
+    if calcola.any():
+        for campo in ('m2', 'm3'):
+            if campo not in out:
+                out[campo] = pd.Series(None, index=out.index, dtype=object)
+        base = lung * larg * colli
+        out.loc[calcola, 'm2'] = base[calcola].round(3)
+        out.loc[calcola, 'm3'] = (base * alt.where(alt > 0, 0.0))[calcola].round(3)
+
+    records = out.astype(object).where(out.notna(), None).to_dict('records')
+    return [{k: v for k, v in rec.items() if v is not None} for rec in records]
+
+
+def import_excel_intervalli_id(ids, intervalli=None):
+    """Aggiunge gli ID agli intervalli [[da, a], ...], fondendo quelli contigui."""
+    intervalli = [list(x) for x in (intervalli or [])]
+    for id_art in sorted(ids):
+        if intervalli and id_art == intervalli[-1][1] + 1:
+            intervalli[-1][1] = id_art
+        else:
+            intervalli.append([id_art, id_art])
+    return intervalli
+
+
+def import_excel_registra_storico(db, intervalli, origine, utente, now=None):
+    """Un solo evento IMPORT nello storico per l'intero import, sul primo articolo creato."""
+    if not intervalli:
+        return
+    dettagli = {
+        'import_excel': {'prima': None, 'dopo': origine},
+        'articoli_creati': {'prima': None, 'dopo': sum(b - a + 1 for a, b in intervalli)},
+        'id_articoli': {'prima': None, 'dopo': ', '.join(
+            f"{a}-{b}" if a != b else str(a) for a, b in intervalli
+        )},
+    }
+    db.add(StoricoArticolo(
+        articolo_id=intervalli[0][0],
+        evento='IMPORT',
+        dettagli=json.dumps(dettagli, ensure_ascii=False, default=str),
+        operatore=utente,
+        creato_il=now or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    ))
+
+
+def import_excel_inserisci(db, records, origine, utente=None, storico=True):
+    """Inserisce le righe articolo con INSERT multipli a blocchi di IMPORT_EXCEL_BLOCCO.
+
+    Gli INSERT bulk non passano dagli hook di flush: qui vengono compilati audit,
+    codice entrata e colonne derivate, registrato un solo evento di storico per
+    import e applicate a indice di ricerca e snapshot le righe create. Con
+    storico=False l'evento resta al chiamante (job a blocchi: uno a fine import).
+    Il commit resta al chiamante. Restituisce gli ID creati.
+    """
+    from sqlalchemy import insert
+
+    utente = utente or _current_username_for_audit() or 'SISTEMA'
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    t = Articolo.__table__
+    colonne = [c.name for c in t.columns if c.name != 'id_articolo']
+    derivate_cache = {col: {} for col in ARTICOLI_COLONNE_DERIVATE}
+    conn = db.connection()
+    ids = []
+    mesi_fatturazione = set()
+    delta_snapshot = {}
+
+    for i in range(0, len(records), IMPORT_EXCEL_BLOCCO):
+        blocco = []
+        for rec in records[i:i + IMPORT_EXCEL_BLOCCO]:
+            riga = dict.fromkeys(colonne)
+            riga.update(rec)
+            riga['codice_entrata'] = ensure_codice_entrata(
+                riga.get('codice_entrata'),
+                n_arrivo=strip_arrivo_progressivo(riga.get('n_arrivo')),
+                n_ddt=riga.get('n_ddt_ingresso'),
+                data_ingresso=riga.get('data_ingresso'),
+                cliente=riga.get('cliente'),
+            )
+            for col, (src, _, fn) in ARTICOLI_COLONNE_DERIVATE.items():
+                cache = derivate_cache[col]
+                sorgente = riga.get(src)
+                if sorgente not in cache:
+                    cache[sorgente] = fn(sorgente)
+                riga[col] = cache[sorgente]
+            riga['created_by'] = riga['updated_by'] = utente
+            riga['updated_at'] = now
+            mesi_fatturazione.add(_fatturazione_intervallo_mesi(riga))
+            _snapshot_accumula(delta_snapshot, _snapshot_contributo(riga), 1)
+            blocco.append(riga)
+        risultato = conn.execute(insert(t).returning(t.c.id_articolo, sort_by_parameter_order=True), blocco)
+        nuovi = [r[0] for r in risultato]
+        search_index_refresh(db, nuovi)
+        ids.extend(nuovi)
 
+    if not ids:
+        return ids
 
+    if storico:
+        import_excel_registra_storico(db, import_excel_intervalli_id(ids), origine, utente, now)
+    _dashboard_snapshot_applica(conn, delta_snapshot)
+    fatturazione_snapshot_invalida(conn, [m for m in mesi_fatturazione if m])
+    return ids
 
+# --- IMPORT EXCEL IN BACKGROUND (job a blocchi con checkpoint) ---
+IMPORT_EXCEL_JOB_DIR = MEDIA_DIR / "import_jobs"
+# Secondi senza avanzamento dopo i quali un job IN_CORSO è considerato interrotto e può ripartire.
+IMPORT_EXCEL_JOB_TIMEOUT = 300
 
 
+def ensure_import_excel_job_schema(engine):
+    try:
+        cols = {c.get('name') for c in inspect(engine).get_columns('import_excel_job')}
+    except Exception as e:
+        print(f"[WARN] impossibile ispezionare schema import_excel_job: {e}")
+        return
+    if 'id_articoli' not in cols:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("ALTER TABLE import_excel_job ADD COLUMN id_articoli TEXT"))
+            print('[OK] aggiunta colonna id_articoli a import_excel_job')
+        except Exception as e:
+            print(f"[WARN] impossibile aggiungere id_articoli a import_excel_job: {e}")
 
-# --- GESTIONE LAVORAZIONI (ADMIN) ---
-def canonical_cliente_picking(value):
-    """Normalizza il cliente nel Picking.
-    Regola importante: tutte le varianti di Galvano devono diventare sempre
-    GALVANO TECNICA, altrimenti il record viene salvato ma poi non compare
-    correttamente nei filtri/lista.
-    """
-    raw = (value or '').strip()
-    if not raw:
-        raise ValueError("Cliente obbligatorio.")
 
-    norm = normalize_text_key(raw)
+ensure_import_excel_job_schema(engine)
 
-    # Varianti reali viste in inserimento/import: Galvano, Galvanotecnica,
-    # Cotugno Galvanotecnica, Galvano Tecnica Spa, ecc.
-    if 'GALVANO' in norm:
-        return 'GALVANO TECNICA'
 
-    for c in get_clienti_utenti():
-        if normalize_text_key(c) == norm:
-            return c
+def _import_excel_job_righe():
+    """Righe del foglio per blocco/commit (IMPORT_EXCEL_JOB_RIGHE, default 2000)."""
+    try:
+        return max(100, int(os.environ.get('IMPORT_EXCEL_JOB_RIGHE', '2000') or 2000))
+    except ValueError:
+        return 2000
+
+
+def _import_excel_intestazioni(valori):
+    """Nomi colonna come li assegna pandas: 'Unnamed: n' se vuoti, suffisso .1/.2 se duplicati."""
+    nomi, visti = [], {}
+    for i, v in enumerate(valori):
+        nome = str(v) if v is not None and str(v).strip() != '' else f'Unnamed: {i}'
+        if nome in visti:
+            visti[nome] += 1
+            nome = f'{nome}.{visti[nome]}'
+        else:
+            visti[nome] = 0
+        nomi.append(nome)
+    return nomi
 
-    # Se non è presente negli utenti, salva comunque pulito in maiuscolo
-    # invece di perdere il record dalla visualizzazione.
-    return raw.upper()
 
+def import_excel_job_avvia(job_id):
+    threading.Thread(
+        target=import_excel_job_esegui, args=(job_id,), daemon=True, name=f'import-excel-{job_id}'
+    ).start()
 
-def _clean_picking_upper_bound(value):
-    """Nei filtri Picking, un valore massimo 0 / 0,0 inserito dal browser
-    viene spesso interpretato come filtro attivo e nasconde le righe.
-    Lo trattiamo come campo vuoto.
-    """
-    s = str(value or '').strip().replace(' ', '')
-    return '' if s in {'0', '0,0', '0.0', '0,00', '0.00'} else (value or '').strip()
 
+def import_excel_job_interrotto(job):
+    """True se il job risulta in esecuzione/in coda ma non avanza da IMPORT_EXCEL_JOB_TIMEOUT secondi."""
+    if job.stato not in ('IN_CODA', 'IN_CORSO'):
+        return False
+    limite = (datetime.now() - timedelta(seconds=IMPORT_EXCEL_JOB_TIMEOUT)).strftime('%Y-%m-%d %H:%M:%S')
+    return (job.aggiornato_il or '') < limite
+
+
+def _import_excel_job_prendi(db, job_id):
+    """Assegna il job a questo thread con un UPDATE condizionato (un solo esecutore anche con più worker)."""
+    now = datetime.now()
+    limite = (now - timedelta(seconds=IMPORT_EXCEL_JOB_TIMEOUT)).strftime('%Y-%m-%d %H:%M:%S')
+    presi = (
+        db.query(ImportExcelJob)
+        .filter(
+            ImportExcelJob.id == job_id,
+            or_(
+                ImportExcelJob.stato.in_(['IN_CODA', 'ERRORE']),
+                and_(ImportExcelJob.stato == 'IN_CORSO', ImportExcelJob.aggiornato_il < limite),
+            ),
+        )
+        .update(
+            {ImportExcelJob.stato: 'IN_CORSO', ImportExcelJob.errore: None,
+             ImportExcelJob.aggiornato_il: now.strftime('%Y-%m-%d %H:%M:%S')},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return presi == 1
 
-def _has_active_picking_filters(filtri):
-    """True solo se l'utente ha inserito un filtro reale.
-    I valori automatici del telefono/browser tipo 0,0 non devono filtrare.
-    """
-    for v in (filtri or {}).values():
-        ss = str(v or '').strip()
-        if not ss:
-            continue
-        if ss.replace(' ', '') in {'0', '0,0', '0.0', '0,00', '0.00'}:
-            continue
-        return True
-    return False
 
+def import_excel_job_esegui(job_id):
+    """Esegue (o riprende dal checkpoint) un import: lettura in streaming e un commit per blocco di righe."""
+    from openpyxl import load_workbook
 
-def _normalize_existing_galvano_picking(db):
-    """Sistema anche i vecchi record Picking Galvano salvati con varianti."""
-    changed = False
+    db = SessionLocal()
+    wb = None
     try:
-        rows = db.query(Lavorazione).all()
-        for rec in rows:
-            raw = getattr(rec, 'cliente', '') or ''
-            norm = normalize_text_key(raw)
-            if 'GALVANO' in norm and raw != 'GALVANO TECNICA':
-                rec.cliente = 'GALVANO TECNICA'
-                changed = True
-        if changed:
+        if not _import_excel_job_prendi(db, job_id):
+            return
+        job = db.get(ImportExcelJob, job_id)
+        config = load_mappe().get(job.profilo)
+        if not config:
+            raise RuntimeError(f"Profilo '{job.profilo}' non trovato.")
+        intestazioni_profilo = mappe_excel_intestazioni(job.profilo)
+        riga_intestazione = job.riga_intestazione or 1
+        righe_per_blocco = _import_excel_job_righe()
+
+        file_path = job.file_path
+        wb = load_workbook(file_path, read_only=True, data_only=True)
+        ws = wb.worksheets[0]
+        if job.righe_totali is None and ws.max_row:
+            job.righe_totali = max(0, ws.max_row - riga_intestazione)
+        intestazioni = _import_excel_intestazioni(next(
+            ws.iter_rows(min_row=riga_intestazione, max_row=riga_intestazione, values_only=True), ()
+        ))
+        n_col = len(intestazioni)
+        checkpoint = max(job.riga_checkpoint or 0, riga_intestazione)
+        file_nome, profilo, utente = job.file_nome, job.profilo, job.utente
+        db.commit()
+
+        def _salva_blocco(righe, ultima_riga):
+            """Inserisce il blocco e sposta il checkpoint nella stessa transazione.
+
+            L'UPDATE è condizionato al checkpoint letto: se un altro esecutore ha già
+            salvato queste righe il blocco viene annullato (False). Gli ID creati si
+            accumulano sul job: lo storico IMPORT viene scritto una volta a fine import.
+            """
+            # dtype=object: ogni cella resta il valore letto dal foglio, senza conversioni per colonna.
+            df = pd.DataFrame(righe, columns=intestazioni, dtype=object)
+            records = import_excel_prepara_righe(df, intestazioni_profilo)
+            ids = import_excel_inserisci(db, records, file_nome, utente=utente, storico=False)
+            intervalli = import_excel_intervalli_id(ids, intervalli_letti[0])
+            aggiornati = db.query(ImportExcelJob).filter(
+                ImportExcelJob.id == job_id, ImportExcelJob.riga_checkpoint == checkpoint_letto[0]
+            ).update({
+                ImportExcelJob.riga_checkpoint: ultima_riga,
+                ImportExcelJob.importati: ImportExcelJob.importati + len(ids),
+                ImportExcelJob.id_articoli: json.dumps(intervalli),
+                ImportExcelJob.aggiornato_il: datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            }, synchronize_session=False)
+            if aggiornati != 1:
+                db.rollback()
+                return False
             db.commit()
-    except Exception:
-        try:
+            checkpoint_letto[0] = ultima_riga
+            intervalli_letti[0] = intervalli
+            return True
+
+        checkpoint_letto = [job.riga_checkpoint or 0]
+        intervalli_letti = [json.loads(job.id_articoli or '[]')]
+        righe = []
+        numero_riga = checkpoint
+        for numero_riga, valori in enumerate(ws.iter_rows(min_row=checkpoint + 1, values_only=True), start=checkpoint + 1):
+            valori = tuple(valori[:n_col]) + (None,) * (n_col - len(valori))
+            righe.append(valori)
+            if len(righe) >= righe_per_blocco:
+                if not _salva_blocco(righe, numero_riga):
+                    return
+                righe = []
+        if righe and not _salva_blocco(righe, numero_riga):
+            return
+
+        completato = db.query(ImportExcelJob).filter(
+            ImportExcelJob.id == job_id, ImportExcelJob.riga_checkpoint == checkpoint_letto[0]
+        ).update({
+            ImportExcelJob.stato: 'COMPLETATO',
+            ImportExcelJob.aggiornato_il: datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }, synchronize_session=False)
+        if completato != 1:
             db.rollback()
+            return
+        # Storico dell'intero import nella stessa transazione del completamento.
+        import_excel_registra_storico(db, intervalli_letti[0], f"{file_nome} (profilo {profilo})", utente)
+        db.commit()
+        try:
+            Path(file_path).unlink()
         except Exception:
             pass
-    return changed
+    except Exception as e:
+        db.rollback()
+        print(f"[WARN] import Excel {job_id} interrotto: {e}")
+        try:
+            db.query(ImportExcelJob).filter(ImportExcelJob.id == job_id).update(
+                {ImportExcelJob.stato: 'ERRORE', ImportExcelJob.errore: str(e)[:2000],
+                 ImportExcelJob.aggiornato_il: datetime.now().strftime('%Y-%m-%d %H:%M:%S')},
+                synchronize_session=False,
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+    finally:
+        if wb is not None:
+            wb.close()
+        db.close()
+        SessionLocal.remove()
 
 
-# ========================================================
-# PICKING / LAVORAZIONI
-# Le route /lavorazioni e /stampa_picking_pdf sono in routes/picking.py
-# Manteniamo qui solo modello e funzioni helper condivise.
-# ========================================================
+def import_excel_job_crea(file, profile_name, header_row):
+    """Salva il file caricato e registra il job (IN_CODA); l'avvio resta al chiamante."""
+    IMPORT_EXCEL_JOB_DIR.mkdir(parents=True, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    nome = secure_filename(file.filename or '') or 'import.xlsx'
+    destinazione = IMPORT_EXCEL_JOB_DIR / f"{job_id}_{nome}"
+    file.save(str(destinazione))
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    db = SessionLocal()
+    try:
+        db.add(ImportExcelJob(
+            id=job_id,
+            profilo=profile_name,
+            file_nome=file.filename,
+            file_path=str(destinazione),
+            stato='IN_CODA',
+            riga_intestazione=max(1, int(header_row or 1)),
+            riga_checkpoint=0,
+            importati=0,
+            utente=_current_username_for_audit() or 'SISTEMA',
+            creato_il=now,
+            aggiornato_il=now,
+        ))
+        db.commit()
+    finally:
+        db.close()
+    return job_id
+
+
+def _import_excel_job_json(job):
+    lette = max(0, (job.riga_checkpoint or 0) - (job.riga_intestazione or 1))
+    totali = job.righe_totali or 0
+    if job.stato == 'COMPLETATO':
+        percentuale = 100
+    else:
+        percentuale = min(99, int(lette * 100 / totali)) if totali else 0
+    return {
+        'id': job.id,
+        'file': job.file_nome,
+        'profilo': job.profilo,
+        'stato': job.stato,
+        'righe_lette': lette,
+        'righe_totali': totali,
+        'importati': job.importati or 0,
+        'percentuale': percentuale,
+        'errore': job.errore,
+        'aggiornato_il': job.aggiornato_il,
+    }
+
 
 @app.route('/import_excel', methods=['GET', 'POST'])
 @login_required
@@ -6678,7 +8425,21 @@ def import_excel():
     profiles = list(mappe.keys()) if mappe else []
 
     if request.method == 'GET':
-        return render_template('import_excel.html', profiles=profiles)
+        job_id = request.args.get('job')
+        if not job_id:
+            # Mostra l'ultimo import in background non concluso (ad es. dopo un riavvio).
+            db = SessionLocal()
+            try:
+                ultimo = (db.query(ImportExcelJob.id)
+                          .filter(ImportExcelJob.stato != 'COMPLETATO')
+                          .order_by(ImportExcelJob.creato_il.desc())
+                          .first())
+                job_id = ultimo[0] if ultimo else None
+            except Exception:
+                db.rollback()
+            finally:
+                db.close()
+        return render_template('import_excel.html', profiles=profiles, job_id=job_id)
 
     # POST logic
     profile_name = request.form.get('profile')
@@ -6693,161 +8454,25 @@ def import_excel():
     if not file or file.filename == '':
         return redirect(request.url)
 
+    if request.form.get('in_background'):
+        job_id = import_excel_job_crea(file, profile_name, mappe[profile_name].get('header_row', 1))
+        import_excel_job_avvia(job_id)
+        flash("Import avviato in background: puoi seguire l'avanzamento da questa pagina.", "info")
+        return redirect(url_for('import_excel', job=job_id))
+
     db = SessionLocal()
     try:
         config = mappe[profile_name]
         header_row_idx = int(config.get('header_row', 1)) - 1
-        column_map = config.get('column_map', {}) or {}
 
         import pandas as pd
-        import numpy as np
-        from datetime import datetime, date
 
         xls = pd.ExcelFile(file, engine="openpyxl")
         df = xls.parse(0, header=header_row_idx)
 
-        # Mappa colonne (case-insensitive)
-        df_cols_upper = {str(c).strip().upper(): c for c in df.columns}
-
-        # ✅ HELPER DATA SUPER-ROBUSTO
-        def to_date_db(val):
-            """
-            Ritorna data in formato YYYY-MM-DD oppure None.
-            Gestisce:
-            - datetime / pd.Timestamp / date
-            - numpy.datetime64
-            - seriale Excel (int/float)
-            - stringhe (dd/mm/yyyy, dd/mm/yy, dd.mm.yyyy, ecc.)
-            """
-            if val is None:
-                return None
-
-            # NaN/NaT
-            try:
-                if pd.isna(val):
-                    return None
-            except Exception:
-                pass
-
-            # date/datetime/pandas timestamp
-            if isinstance(val, (datetime, pd.Timestamp)):
-                return val.strftime("%Y-%m-%d")
-            if isinstance(val, date) and not isinstance(val, datetime):
-                return val.strftime("%Y-%m-%d")
-
-            # numpy datetime64
-            if isinstance(val, np.datetime64):
-                try:
-                    dt = pd.to_datetime(val, errors="coerce")
-                    if pd.isna(dt):
-                        return None
-                    return dt.strftime("%Y-%m-%d")
-                except Exception:
-                    return None
-
-            # Seriali Excel (giorni da 1899-12-30)
-            # Pandas a volte legge le date come float/int
-            if isinstance(val, (int, float)) and val > 0:
-                try:
-                    dt = pd.to_datetime(val, unit="D", origin="1899-12-30", errors="coerce")
-                    if pd.isna(dt):
-                        return None
-                    return dt.strftime("%Y-%m-%d")
-                except Exception:
-                    pass  # continua sotto a tentare come stringa
-
-            # Stringhe
-            s = str(val).strip()
-            if not s:
-                return None
-
-            # prova formati comuni
-            for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d/%m/%y", "%Y/%m/%d", "%d-%m-%Y", "%d-%m-%y", "%d.%m.%Y", "%d.%m.%y"):
-                try:
-                    return datetime.strptime(s[:10], fmt).strftime("%Y-%m-%d")
-                except Exception:
-                    pass
-
-            # fallback Pandas (dayfirst=True per Italia)
-            try:
-                dt = pd.to_datetime(s, errors="coerce", dayfirst=True)
-                if pd.isna(dt):
-                    return None
-                return dt.strftime("%Y-%m-%d")
-            except Exception:
-                return None
-
-        imported_count = 0
-
-        for _, row in df.iterrows():
-            if row.isnull().all():
-                continue
-
-            new_art = Articolo()
-            has_data = False
-
-            for excel_header, db_field in column_map.items():
-                key = str(excel_header).strip().upper()
-                col_name = df_cols_upper.get(key)
-                if col_name is None:
-                    continue
-
-                val = row[col_name]
-
-                # se vuoto, skip
-                try:
-                    if pd.isna(val) or str(val).strip() == "":
-                        continue
-                except Exception:
-                    pass
-
-                # Conversioni
-                if db_field in ['larghezza', 'lunghezza', 'altezza', 'peso', 'm2', 'm3']:
-                    try:
-                        val = float(str(val).replace(',', '.'))
-                    except Exception:
-                        val = 0.0
-
-                elif db_field in ['n_colli', 'pezzo']:
-                    try:
-                        val = int(float(str(val).replace(',', '.')))
-                    except Exception:
-                        val = 1
-
-                elif db_field in ['data_ingresso', 'data_uscita']:
-                    val = to_date_db(val)  # ✅ QUI ORA PRENDE ANCHE SERIALI EXCEL
-
-                else:
-                    val = str(val).strip()
-
-                if val is not None and str(val).strip() != "":
-                    setattr(new_art, db_field, val)
-                    has_data = True
-
-            if has_data:
-                # Calcoli automatici se mancano
-                try:
-                    if not new_art.m2 or float(new_art.m2) == 0:
-                        l = float(new_art.lunghezza or 0)
-                        w = float(new_art.larghezza or 0)
-                        h = float(new_art.altezza or 0)
-                        c = int(new_art.n_colli or 1)
-
-                        if l > 0 and w > 0:
-                            new_art.m2 = round(l * w * c, 3)
-                            new_art.m3 = round(l * w * (h if h > 0 else 0) * c, 3)
-                except Exception:
-                    pass
-
-                new_art.codice_entrata = ensure_codice_entrata(
-                    getattr(new_art, 'codice_entrata', None),
-                    n_arrivo=strip_arrivo_progressivo(getattr(new_art, 'n_arrivo', None)),
-                    n_ddt=getattr(new_art, 'n_ddt_ingresso', None),
-                    data_ingresso=getattr(new_art, 'data_ingresso', None),
-                    cliente=getattr(new_art, 'cliente', None)
-                )
-                db.add(new_art)
-                imported_count += 1
+        records = import_excel_prepara_righe(df, mappe_excel_intestazioni(profile_name))
+        ids = import_excel_inserisci(db, records, f"{file.filename} (profilo {profile_name})")
+        imported_count = len(ids)
 
         db.commit()
         flash(f"{imported_count} articoli importati con successo.", "success")
@@ -6861,6 +8486,39 @@ def import_excel():
         db.close()
 
 
+@app.get('/import_excel/job/<job_id>')
+@login_required
+@require_admin
+def import_excel_job_stato(job_id):
+    db = SessionLocal()
+    try:
+        job = db.get(ImportExcelJob, job_id)
+        if job is None:
+            return jsonify({'ok': False, 'errore': 'Job non trovato.'}), 404
+        if import_excel_job_interrotto(job):
+            # Nessun avanzamento (es. riavvio del server): riprende dal checkpoint.
+            import_excel_job_avvia(job_id)
+        return jsonify(dict(_import_excel_job_json(job), ok=True))
+    finally:
+        db.close()
+
+
+@app.post('/import_excel/job/<job_id>/riprendi')
+@login_required
+@require_admin
+def import_excel_job_riprendi(job_id):
+    db = SessionLocal()
+    try:
+        job = db.get(ImportExcelJob, job_id)
+        if job is None:
+            return jsonify({'ok': False, 'errore': 'Job non trovato.'}), 404
+        if job.stato == 'ERRORE' or import_excel_job_interrotto(job):
+            import_excel_job_avvia(job_id)
+        return jsonify({'ok': True})
+    finally:
+        db.close()
+
+
 def get_all_fields_map():
     return {
         'codice_articolo': 'Codice Articolo', 'pezzo': 'Pezzi','lotto':'Lotto',
@@ -6877,6 +8535,10 @@ def get_all_fields_map():
     }
 
 # --- EXPORTAZIONE EXCEL ---
+# Righe lette per blocco dal cursore durante l'export (anche campione per le larghezze colonne).
+EXPORT_EXCEL_BLOCCO = 1000
+
+
 @app.get('/export_excel')
 @login_required
 
@@ -6884,7 +8546,7 @@ def export_excel():
     import math
     import re
     from sqlalchemy import func
-    from datetime import datetime, date
+    from datetime import datetime
 
     db = SessionLocal()
     try:
@@ -6893,13 +8555,13 @@ def export_excel():
 
         if session.get('role') == 'client':
             user_key_norm = normalize_text_key(current_user.id or '')
-            cliente_db_norm = normalized_sql_text(Articolo.cliente)
+            cliente_db_norm = Articolo.cliente_key
             qs = qs.filter(cliente_db_norm == user_key_norm)
         else:
             if args.get('cliente'):
                 cliente_norm = normalize_text_key(args.get('cliente'))
                 if cliente_norm:
-                    qs = qs.filter(normalized_sql_text(Articolo.cliente) == cliente_norm)
+                    qs = qs.filter(Articolo.cliente_key == cliente_norm)
 
         if args.get('id'):
             try:
@@ -6915,7 +8577,7 @@ def export_excel():
         for field in text_filters:
             val = args.get(field)
             if val and val.strip():
-                qs = qs.filter(getattr(Articolo, field).ilike(f"%{val.strip()}%"))
+                qs = qs.filter(articoli_search_filter(val, [field]))
         m2_da = args.get('m2_da')
         m2_a = args.get('m2_a')
         m2_legacy = args.get('m2')  # compatibilità: vecchio filtro singolo (es. "1,25" o "1-2")
@@ -6946,26 +8608,6 @@ def export_excel():
         if m2_da_f is None and m2_a_f is None and m2_legacy:
             m2_filter = parse_float_filter(m2_legacy)
 
-        all_rows = qs.all()
-
-        # Nuovo filtro M2 DA/A
-        if m2_da_f is not None or m2_a_f is not None:
-            tmp = []
-            for r in all_rows:
-                n = _to_float_it(r.m2)
-                if n is None:
-                    continue
-                if m2_da_f is not None and n < m2_da_f:
-                    continue
-                if m2_a_f is not None and n > m2_a_f:
-                    continue
-                tmp.append(r)
-            all_rows = tmp
-        elif m2_filter is not None:
-            all_rows = [r for r in all_rows if match_numeric_filter(r.m2, m2_filter)]
-
-        filtered_rows = []
-
         def get_date_arg(k):
             v = args.get(k)
             try:
@@ -6976,44 +8618,31 @@ def export_excel():
         d_ing_da, d_ing_a = get_date_arg('data_ing_da'), get_date_arg('data_ing_a')
         d_usc_da, d_usc_a = get_date_arg('data_usc_da'), get_date_arg('data_usc_a')
 
-        def parse_d(val):
-            if isinstance(val, date):
-                return val
-            if not val:
-                return None
-            if isinstance(val, str):
-                s = val.strip().split(' ')[0][:10]
-                for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d"):
-                    try:
-                        return datetime.strptime(s, fmt).date()
-                    except Exception:
-                        pass
-            return None
-
-        if any([d_ing_da, d_ing_a, d_usc_da, d_usc_a]):
-            for r in all_rows:
-                keep = True
-                if d_ing_da or d_ing_a:
-                    rd = parse_d(r.data_ingresso)
-                    if not rd or (d_ing_da and rd < d_ing_da) or (d_ing_a and rd > d_ing_a):
-                        keep = False
-                if keep and (d_usc_da or d_usc_a):
-                    rd = parse_d(r.data_uscita)
-                    if not rd or (d_usc_da and rd < d_usc_da) or (d_usc_a and rd > d_usc_a):
-                        keep = False
-                if keep:
-                    filtered_rows.append(r)
-        else:
-            filtered_rows = all_rows
+        if d_ing_da:
+            qs = qs.filter(Articolo.data_ingresso_dt >= d_ing_da)
+        if d_ing_a:
+            qs = qs.filter(Articolo.data_ingresso_dt <= d_ing_a)
+        if d_usc_da:
+            qs = qs.filter(Articolo.data_uscita_dt >= d_usc_da)
+        if d_usc_a:
+            qs = qs.filter(Articolo.data_uscita_dt <= d_usc_a)
 
         if args.get('solo_giacenza') == '1':
-            tmp = []
-            for r in filtered_rows:
-                has_data_usc = parse_d(r.data_uscita) is not None
-                has_ddt_usc = bool((r.n_ddt_uscita or '').strip())
-                if (not has_data_usc) and (not has_ddt_usc):
-                    tmp.append(r)
-            filtered_rows = tmp
+            qs = qs.filter(
+                Articolo.data_uscita_dt == None,
+                func.coalesce(func.trim(Articolo.n_ddt_uscita), '') == '',
+            )
+
+        # Filtri M2 in SQL: nessuna riga scartata dopo la lettura.
+        if m2_da_f is not None:
+            qs = qs.filter(Articolo.m2 >= m2_da_f)
+        if m2_a_f is not None:
+            qs = qs.filter(Articolo.m2 <= m2_a_f)
+        if m2_filter is not None:
+            if m2_filter[0] == 'range':
+                qs = qs.filter(Articolo.m2.between(m2_filter[1], m2_filter[2]))
+            else:
+                qs = qs.filter(Articolo.m2.between(m2_filter[1] - 0.0005, m2_filter[1] + 0.0005))
 
         def fmt_num(val, dec=2):
             try:
@@ -7023,67 +8652,94 @@ def export_excel():
             except Exception:
                 return ''
 
-        export_rows = []
-        for r in filtered_rows:
-            export_rows.append({
-                'ID': r.id_articolo,
-                'Codice': r.codice_articolo or '',
-                'Pz': r.pezzo or '',
-                'Larg': fmt_num(r.larghezza, 2),
-                'Lung': fmt_num(r.lunghezza, 2),
-                'Alt': fmt_num(r.altezza, 2),
-                'M2': fmt_num(r.m2, 3),
-                'M3': fmt_num(r.m3, 3),
-                'Descrizione': r.descrizione or '',
-                'Protocollo': r.protocollo or '',
-                'Commessa': r.commessa or '',
-                'Ordine': r.ordine or '',
-                'Colli': r.n_colli if r.n_colli is not None else '',
-                'Fornitore': r.fornitore or '',
-                'Magazzino': r.magazzino or '',
-                'Data Ing': r.data_ingresso or '',
-                'DDT Ing': r.n_ddt_ingresso or '',
-                'DDT Usc': r.n_ddt_uscita or '',
-                'Data Usc': r.data_uscita or '',
-                'Mezzo Usc': r.mezzi_in_uscita or '',
-                'Cliente': r.cliente or '',
-                'Kg': fmt_num(r.peso, 2),
-                'Posiz': r.posizione or '',
-                'N.Arr': r.n_arrivo or '',
-                'N.Buono': r.buono_n or '',
-                'Note': r.note or '',
-                'Lotto': r.lotto or '',
-                'Ns.Rif': getattr(r, 'ns_rif', '') or '',
-                'Serial': r.serial_number or '',
-                'Stato': r.stato or '',
-            })
-
-        df = pd.DataFrame(export_rows, columns=[
+        colonne = [
             'ID', 'Codice', 'Pz', 'Larg', 'Lung', 'Alt', 'M2', 'M3', 'Descrizione',
             'Protocollo', 'Commessa', 'Ordine', 'Colli', 'Fornitore', 'Magazzino',
             'Data Ing', 'DDT Ing', 'DDT Usc', 'Data Usc', 'Mezzo Usc', 'Cliente',
             'Kg', 'Posiz', 'N.Arr', 'N.Buono', 'Note', 'Lotto', 'Ns.Rif', 'Serial', 'Stato'
-        ])
+        ]
 
-        bio = io.BytesIO()
-        with pd.ExcelWriter(bio, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Giacenze')
-            ws = writer.book['Giacenze']
-            for col_cells in ws.columns:
-                max_length = 0
-                col_letter = col_cells[0].column_letter
-                for cell in col_cells:
-                    val = '' if cell.value is None else str(cell.value)
-                    if len(val) > max_length:
-                        max_length = len(val)
-                ws.column_dimensions[col_letter].width = min(max(max_length + 2, 10), 40)
-            ws.freeze_panes = 'A2'
-        bio.seek(0)
+        def _riga_export(r):
+            return [
+                r.id_articolo,
+                r.codice_articolo or '',
+                r.pezzo or '',
+                fmt_num(r.larghezza, 2),
+                fmt_num(r.lunghezza, 2),
+                fmt_num(r.altezza, 2),
+                fmt_num(r.m2, 3),
+                fmt_num(r.m3, 3),
+                r.descrizione or '',
+                r.protocollo or '',
+                r.commessa or '',
+                r.ordine or '',
+                r.n_colli if r.n_colli is not None else '',
+                r.fornitore or '',
+                r.magazzino or '',
+                r.data_ingresso or '',
+                r.n_ddt_ingresso or '',
+                r.n_ddt_uscita or '',
+                r.data_uscita or '',
+                r.mezzi_in_uscita or '',
+                r.cliente or '',
+                fmt_num(r.peso, 2),
+                r.posizione or '',
+                r.n_arrivo or '',
+                r.buono_n or '',
+                r.note or '',
+                r.lotto or '',
+                getattr(r, 'ns_rif', '') or '',
+                r.serial_number or '',
+                r.stato or '',
+            ]
+
+        # Export in streaming a memoria costante:
+        # - yield_per legge gli articoli a blocchi (cursore lato server su PostgreSQL);
+        # - il workbook write-only di openpyxl scrive le righe su disco man mano;
+        # - il file temporaneo viene inviato a blocchi e cancellato alla chiusura.
+        from itertools import chain, islice
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font
+        from openpyxl.utils import get_column_letter
+
+        righe = (_riga_export(r) for r in qs.yield_per(EXPORT_EXCEL_BLOCCO))
+
+        # In modalità write-only le larghezze vanno fissate prima delle righe:
+        # si stimano sulle prime righe, tenute in memoria solo per questo.
+        anteprima = list(islice(righe, EXPORT_EXCEL_BLOCCO))
+        larghezze = [len(c) for c in colonne]
+        for riga in anteprima:
+            for i, val in enumerate(riga):
+                larghezze[i] = max(larghezze[i], len('' if val is None else str(val)))
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('Giacenze')
+        for i, max_length in enumerate(larghezze, start=1):
+            ws.column_dimensions[get_column_letter(i)].width = min(max(max_length + 2, 10), 40)
+        ws.freeze_panes = 'A2'
+
+        intestazione = []
+        for nome in colonne:
+            cella = WriteOnlyCell(ws, value=nome)
+            cella.font = Font(bold=True)
+            intestazione.append(cella)
+        ws.append(intestazione)
+        for riga in chain(anteprima, righe):
+            ws.append(riga)
+
+        tmp = tempfile.TemporaryFile(suffix='.xlsx')
+        try:
+            wb.save(tmp)
+            tmp.seek(0)
+        except Exception:
+            tmp.close()
+            raise
 
         ts = datetime.now().strftime('%Y%m%d_%H%M')
         filename = f'Giacenze_Filtrate_{ts}.xlsx' if request.args else f'Giacenze_Totali_{ts}.xlsx'
         return send_file(
-            bio,
+            tmp,
             as_attachment=True,
             download_name=filename,
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
@@ -7162,17 +8818,16 @@ def go_scan_entrata():
 def dettaglio_entrata(codice_entrata):
     db = SessionLocal()
     try:
-        varianti_codice = _codice_entrata_varianti(codice_entrata)
         qs = (
             db.query(Articolo)
             .options(selectinload(Articolo.attachments))
-            .filter(Articolo.codice_entrata.in_(varianti_codice))
+            .filter(Articolo.codice_entrata_key == _chiave_codice_entrata(codice_entrata))
             .order_by(Articolo.id_articolo.desc())
         )
         if session.get('role') == 'client':
             user_key_norm = normalize_text_key(current_user.id or '')
-            qs = qs.filter(normalized_sql_text(Articolo.cliente) == user_key_norm)
-        rows = qs.all()
+            qs = qs.filter(Articolo.cliente_key == user_key_norm)
+        rows = _filtra_righe_codice_entrata(codice_entrata, qs.all())
         if not rows:
             flash(f'Entrata {codice_entrata} non trovata.', 'warning')
             return redirect(url_for('scan_entrata'))
@@ -7205,12 +8860,11 @@ def dettaglio_entrata(codice_entrata):
 def verifica_entrata(codice_entrata):
     db = SessionLocal()
     try:
-        varianti_codice = _codice_entrata_varianti(codice_entrata)
-        qs = db.query(Articolo).filter(Articolo.codice_entrata.in_(varianti_codice)).order_by(Articolo.id_articolo.desc())
+        qs = db.query(Articolo).filter(Articolo.codice_entrata_key == _chiave_codice_entrata(codice_entrata)).order_by(Articolo.id_articolo.desc())
         if session.get('role') == 'client':
             user_key_norm = normalize_text_key(current_user.id or '')
-            qs = qs.filter(normalized_sql_text(Articolo.cliente) == user_key_norm)
-        rows = qs.all()
+            qs = qs.filter(Articolo.cliente_key == user_key_norm)
+        rows = _filtra_righe_codice_entrata(codice_entrata, qs.all())
         if not rows:
             flash(f'Entrata {codice_entrata} non trovata.', 'warning')
             return redirect(url_for('scan_entrata'))
@@ -7236,8 +8890,10 @@ def verifica_entrata(codice_entrata):
 def correggi_entrata(codice_entrata):
     db = SessionLocal()
     try:
-        varianti_codice = _codice_entrata_varianti(codice_entrata)
-        rows = db.query(Articolo).filter(Articolo.codice_entrata.in_(varianti_codice)).order_by(Articolo.id_articolo.desc()).all()
+        rows = _filtra_righe_codice_entrata(
+            codice_entrata,
+            db.query(Articolo).filter(Articolo.codice_entrata_key == _chiave_codice_entrata(codice_entrata)).order_by(Articolo.id_articolo.desc()).all()
+        )
         if not rows:
             flash(f'Entrata {codice_entrata} non trovata.', 'warning')
             return redirect(url_for('scan_entrata'))
@@ -8173,7 +9829,11 @@ def delete_rows():
         clean_ids = [int(x) for x in ids if x.isdigit()]
         
         # Esegue la cancellazione
+        fatturazione_snapshot_invalida_articoli(db, clean_ids)
+        snapshot_prima = dashboard_snapshot_articoli(db.connection(), clean_ids)
         affected = db.query(Articolo).filter(Articolo.id_articolo.in_(clean_ids)).delete(synchronize_session=False)
+        search_index_refresh(db, clean_ids)
+        dashboard_snapshot_aggiorna_articoli(db.connection(), clean_ids, snapshot_prima)
         db.commit()
         
         flash(f"Eliminati {affected} articoli.", "success")
@@ -8202,7 +9862,11 @@ def bulk_delete():
                 if path.exists(): path.unlink()
             except Exception: pass
 
+    fatturazione_snapshot_invalida_articoli(db, ids)
+    snapshot_prima = dashboard_snapshot_articoli(db.connection(), ids)
     db.query(Articolo).filter(Articolo.id_articolo.in_(ids)).delete(synchronize_session=False)
+    search_index_refresh(db, ids)
+    dashboard_snapshot_aggiorna_articoli(db.connection(), ids, snapshot_prima)
     db.commit()
     flash(f"{len(ids)} articoli e i loro allegati sono stati eliminati.", "success")
     return redirect(url_for('giacenze'))
@@ -8860,7 +10524,7 @@ def _auto_create_entry_from_label(db, form, codice_entrata):
     existing = (
         db.query(Articolo)
           .filter(Articolo.codice_entrata == codice_entrata)
-          .filter(normalized_sql_text(Articolo.cliente) == normalize_text_key(cliente_value))
+          .filter(Articolo.cliente_key == normalize_text_key(cliente_value))
           .order_by(Articolo.id_articolo.asc())
           .all()
     )
@@ -9808,9 +11472,14 @@ def pwa_manifest():
 
 @app.route("/service-worker.js")
 def pwa_service_worker():
-    """Service worker leggero: cache minima delle pagine principali, senza toccare dati sensibili."""
+    """Service worker leggero: cache minima delle pagine principali, senza toccare dati sensibili.
+
+    Le scansioni QR dei buoni di carico fatte senza rete vengono messe in coda (IndexedDB)
+    e inviate in blocco a /api/buoni_carico/scansioni_offline appena la connessione torna.
+    Le pagine di scansione in cache (dettaglio buono compreso) vengono eliminate al logout.
+    """
     js = """
-const CACHE_NAME = 'camar-gestionale-v1';
+const CACHE_NAME = 'camar-gestionale-v3';
 const CORE_ASSETS = [
   '/login',
   '/chatbot',
@@ -9833,19 +11502,152 @@ self.addEventListener('activate', event => {
   self.clients.claim();
 });
 
+// --- Scansioni QR offline: coda sul dispositivo, inviata in blocco al ritorno della rete ---
+const SCAN_DB = 'camar-scansioni';
+const SCAN_STORE = 'coda';
+const SCAN_INVIO_URL = '/api/buoni_carico/scansioni_offline';
+const SCAN_BLOCCO = 100;
+const SCAN_SYNC_TAG = 'camar-scansioni';
+
+function scanStore(mode, fn) {
+  return new Promise((resolve, reject) => {
+    const open = indexedDB.open(SCAN_DB, 1);
+    open.onupgradeneeded = () => open.result.createObjectStore(SCAN_STORE, { keyPath: 'id' });
+    open.onerror = () => reject(open.error);
+    open.onsuccess = () => {
+      const db = open.result;
+      const tx = db.transaction(SCAN_STORE, mode);
+      const out = fn(tx.objectStore(SCAN_STORE));
+      tx.oncomplete = () => { db.close(); resolve(out instanceof IDBRequest ? out.result : undefined); };
+      tx.onerror = () => { db.close(); reject(tx.error); };
+    };
+  });
+}
+
+function scanNotifica(msg) {
+  return self.clients.matchAll({ type: 'window', includeUncontrolled: true })
+    .then(list => list.forEach(client => client.postMessage(msg)));
+}
+
+// Scansione contenuta in una POST verso le route di scansione (null se non lo è).
+function scanDaRichiesta(req, url) {
+  if (req.method !== 'POST') return null;
+  const m = url.pathname.match(/^\\/buoni_carico\\/(\\d+)\\/scansiona$/);
+  if (!m && url.pathname !== '/scan_qr_operativo' && url.pathname !== '/api/scan_qr_operativo') return null;
+  const copia = req.clone();
+  const json = (copia.headers.get('Content-Type') || '').includes('json');
+  return (json ? copia.json() : copia.formData().then(form => Object.fromEntries(form.entries())))
+    .catch(() => ({}))
+    .then(dati => ({
+      id: (self.crypto && self.crypto.randomUUID) ? self.crypto.randomUUID() : Date.now() + '-' + Math.random().toString(16).slice(2),
+      codice: dati.codice_scansionato || dati.codice || '',
+      buono_id: m ? m[1] : (dati.buono_id || null),
+      origine: m ? 'buono' : 'operativo',
+      ts: Date.now()
+    }));
+}
+
+function scanRispostaOffline(url, voce, inCoda) {
+  const messaggio = 'Offline: scansione salvata sul dispositivo (' + inCoda + ' in coda), verrà inviata al ritorno della rete.';
+  if (url.pathname.startsWith('/api/')) {
+    return new Response(JSON.stringify({ ok: true, esito: 'IN_CODA', messaggio: messaggio, in_coda: inCoda }), {
+      status: 202, headers: { 'Content-Type': 'application/json' }
+    });
+  }
+  const codice = String(voce.codice).replace(/[&<>"]/g, c => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;' }[c]));
+  return new Response(
+    '<!doctype html><meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1">' +
+    '<title>Scansione in coda</title><body style="font-family:sans-serif;padding:24px">' +
+    '<h3>Offline: scansione salvata</h3><p><code>' + codice + '</code></p><p>' + messaggio + '</p>' +
+    '<button onclick="history.back()">Continua a scansionare</button>' +
+    '<script>setTimeout(function(){ history.back(); }, 1500);<\\/script>',
+    { status: 200, headers: { 'Content-Type': 'text/html; charset=utf-8' } }
+  );
+}
+
+function scanAccoda(voce) {
+  return scanStore('readwrite', store => { store.put(voce); })
+    .then(() => scanStore('readonly', store => store.count()))
+    .then(inCoda => {
+      if (self.registration.sync) self.registration.sync.register(SCAN_SYNC_TAG).catch(() => null);
+      scanNotifica({ tipo: 'scansioni_in_coda', in_coda: inCoda });
+      return inCoda;
+    });
+}
+
+// Invia la coda in ordine di ora di scansione, a blocchi; una sola spedizione alla volta.
+let scanInvioInCorso = null;
+function scanInvia() {
+  if (scanInvioInCorso) return scanInvioInCorso;
+  scanInvioInCorso = scanStore('readonly', store => store.getAll()).then(coda => {
+    if (!coda.length) return false;
+    coda.sort((a, b) => a.ts - b.ts);
+    const blocco = coda.slice(0, SCAN_BLOCCO);
+    return fetch(SCAN_INVIO_URL, {
+      method: 'POST',
+      credentials: 'same-origin',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ scansioni: blocco })
+    })
+      .then(resp => resp.ok ? resp.json() : Promise.reject(new Error('HTTP ' + resp.status)))
+      .then(esito => {
+        if (!esito || !Array.isArray(esito.risultati)) throw new Error('risposta non valida');
+        return scanStore('readwrite', store => blocco.forEach(voce => store.delete(voce.id)))
+          .then(() => scanNotifica({ tipo: 'scansioni_inviate', risultati: esito.risultati, in_coda: coda.length - blocco.length }))
+          .then(() => coda.length > blocco.length);
+      });
+  }).finally(() => { scanInvioInCorso = null; });
+  return scanInvioInCorso.then(altre => altre ? scanInvia() : null);
+}
+
+self.addEventListener('sync', event => {
+  if (event.tag === SCAN_SYNC_TAG) event.waitUntil(scanInvia());
+});
+
+self.addEventListener('message', event => {
+  if (event.data && event.data.tipo === 'invia_scansioni') event.waitUntil(scanInvia().catch(() => null));
+});
+
+// Pagine di scansione (con dati del buono): in cache solo finché l'utente non esce.
+const PAGINA_SCANSIONE = /^\\/(scan_qr_operativo|buoni_carico\\/\\d+)$/;
+
+function paginaScansioneRimuovi() {
+  return caches.open(CACHE_NAME).then(cache => cache.keys().then(reqs => Promise.all(
+    reqs.filter(r => PAGINA_SCANSIONE.test(new URL(r.url).pathname)).map(r => cache.delete(r))
+  )));
+}
+
 self.addEventListener('fetch', event => {
   const req = event.request;
   const url = new URL(req.url);
 
-  // Non mettere mai in cache POST, API e file allegati.
-  if (req.method !== 'GET' || url.pathname.startsWith('/chatbot/api') || url.pathname.startsWith('/camy-ai/api') || url.pathname.startsWith('/api/') || url.pathname.startsWith('/media/')) {
+  if (url.pathname === '/logout') {
+    event.waitUntil(paginaScansioneRimuovi().catch(() => null));
+    return;
+  }
+
+  // Scansione QR: prima si svuota la coda (ordine di lettura), poi si invia; senza rete va in coda.
+  const scansione = scanDaRichiesta(req, url);
+  if (scansione) {
+    event.respondWith(
+      scanInvia().catch(() => null)
+        .then(() => fetch(req))
+        .catch(() => scansione.then(voce => scanAccoda(voce).then(inCoda => scanRispostaOffline(url, voce, inCoda))))
+    );
+    return;
+  }
+
+  // Non mettere mai in cache POST, API, file allegati e flussi live (SSE).
+  if (req.method !== 'GET' || (req.headers.get('Accept') || '').includes('text/event-stream') || url.pathname.startsWith('/chatbot/api') || url.pathname.startsWith('/camy-ai/api') || url.pathname.startsWith('/api/') || url.pathname.startsWith('/media/')) {
     return;
   }
 
   event.respondWith(
     fetch(req).then(resp => {
       const copy = resp.clone();
-      if (resp.ok && (url.pathname === '/chatbot' || url.pathname === '/camy-ai' || url.pathname === '/login' || url.pathname === '/manifest.webmanifest')) {
+      // Pagine di scansione in cache: restano utilizzabili anche senza rete (es. dentro i rimorchi).
+      const paginaScansione = PAGINA_SCANSIONE.test(url.pathname);
+      if (resp.ok && (paginaScansione || url.pathname === '/chatbot' || url.pathname === '/camy-ai' || url.pathname === '/login' || url.pathname === '/manifest.webmanifest')) {
         caches.open(CACHE_NAME).then(cache => cache.put(req, copy)).catch(() => null);
       }
       return resp;
@@ -20,15 +20,17 @@ def register_accettazione_entrata_routes(app_obj, deps):
 
     import os
     import re
+    import json
     import uuid
     import shutil
+    import threading
     from pathlib import Path
-    from datetime import date, datetime
+    from datetime import date, datetime, timedelta
 
-    from flask import request, redirect, url_for, flash, render_template_string
+    from flask import request, redirect, url_for, flash, render_template_string, jsonify
     from flask_login import login_required
     from werkzeug.utils import secure_filename
-    from sqlalchemy import or_
+    from sqlalchemy import or_, and_
 
     ACCETTAZIONE_ENTRATA_HTML = """
     {% extends 'base.html' %}
@@ -57,6 +59,7 @@ def register_accettazione_entrata_routes(app_obj, deps):
 
         <form method="POST" enctype="multipart/form-data" class="row g-3">
           <input type="hidden" name="step" value="upload">
+          <input type="hidden" name="modalita" value="job">
           <input type="hidden" name="arrivo_prefill" value="{{ arrivo_prefill or '' }}">
           <input type="hidden" name="colli_prefill" value="{{ colli_prefill or '' }}">
           <div class="col-md-8">
@@ -184,6 +187,49 @@ def register_accettazione_entrata_routes(app_obj, deps):
     {% endblock %}
     """
 
+    ACCETTAZIONE_ATTESA_HTML = """
+    {% extends 'base.html' %}
+    {% block content %}
+    <div class="container-fluid py-3">
+      <div class="card shadow-sm p-4">
+        <div class="d-flex justify-content-between align-items-center mb-3">
+          <div>
+            <h3 class="mb-0">⏳ Lettura documento in corso</h3>
+            <small class="text-muted">{{ job.file_nome }}</small>
+          </div>
+          <a href="{{ url_for('accettazione_entrata') }}" class="btn btn-outline-secondary btn-sm">Nuovo documento</a>
+        </div>
+        <div class="alert alert-info py-2 mb-0">
+          <span class="spinner-border spinner-border-sm me-2"></span>
+          <span id="accettazione-job-stato">CAMY sta leggendo il documento (OCR). La pagina si aggiorna da sola appena i dati sono pronti.</span>
+        </div>
+      </div>
+    </div>
+    <script>
+    (function () {
+      var url = "{{ url_for('accettazione_entrata_job_stato', job_id=job.id) }}";
+      function controlla() {
+        fetch(url, {credentials: 'same-origin'})
+          .then(function (r) { return r.json(); })
+          .then(function (d) {
+            if (d.stato === 'COMPLETATO' || d.stato === 'ERRORE' || !d.ok) { window.location.reload(); return; }
+            setTimeout(controlla, 2000);
+          })
+          .catch(function () { setTimeout(controlla, 4000); });
+      }
+      setTimeout(controlla, 1500);
+    })();
+    </script>
+    {% endblock %}
+    """
+
+    # Letture in background: una alla volta, per non far concorrere più OCR sulla stessa macchina.
+    ACCETTAZIONE_JOB_PARALLELI = threading.BoundedSemaphore(1)
+    # Secondi senza aggiornamenti dopo i quali un job IN_CODA/IN_CORSO è considerato interrotto.
+    ACCETTAZIONE_JOB_TIMEOUT = 180
+    # Ogni quanti secondi un job assegnato aggiorna aggiornato_il (anche mentre attende il turno).
+    ACCETTAZIONE_JOB_BATTITO = 30
+
     def _safe_to_float_it(value):
         try:
             s = str(value or '').strip()
@@ -229,6 +275,8 @@ def register_accettazione_entrata_routes(app_obj, deps):
                 image = ImageOps.grayscale(image)
                 max_w, max_h = 1500, 2100
                 image.thumbnail((max_w, max_h))
+                # Bitmap non compresso per il file temporaneo di tesseract: evita la codifica PNG.
+                image.format = 'PPM'
             except Exception:
                 pass
 
@@ -241,50 +289,85 @@ def register_accettazione_entrata_routes(app_obj, deps):
         except Exception as e:
             raise RuntimeError(f"Tesseract OCR non disponibile o troppo lento: {e}")
 
-    def _ocr_pdf_with_fitz(path, max_pages=1):
-        """OCR PDF scansionato usando PyMuPDF/fitz per trasformare le pagine in immagini."""
+    # Pagine senza testo incorporato da passare all'OCR (sul piano Free basta la prima).
+    ACCETTAZIONE_OCR_MAX_PAGINE = 1
+    ACCETTAZIONE_TESTO_MIN = 25
+
+    def _render_pagine_pypdfium2(pdf, indici):
+        """Rasterizza le pagine indicate dal documento pypdfium2 già aperto."""
+        try:
+            if pdf is None:
+                raise RuntimeError('documento non aperto')
+            return {i: pdf[i].render(scale=1.35).to_pil() for i in indici}
+        except Exception as e:
+            raise RuntimeError(f"pypdfium2: {e}")
+
+    def _render_pagine_fitz(data, indici):
+        """Rasterizza le pagine indicate con PyMuPDF/fitz (se installato)."""
         try:
             import fitz
             from PIL import Image
             import io
-            out = []
-            doc = fitz.open(str(path))
-            for i, page in enumerate(doc):
-                if i >= max_pages:
-                    break
-                pix = page.get_pixmap(matrix=fitz.Matrix(1.35, 1.35), alpha=False)
-                img = Image.open(io.BytesIO(pix.tobytes('png')))
-                out.append(_ocr_image_with_tesseract(img))
-            return '\n'.join(out).strip()
+            doc = fitz.open(stream=data, filetype='pdf')
+            out = {}
+            for i in indici:
+                pix = doc[i].get_pixmap(matrix=fitz.Matrix(1.35, 1.35), alpha=False)
+                out[i] = Image.open(io.BytesIO(pix.tobytes('png')))
+            return out
         except Exception as e:
             raise RuntimeError(f"PyMuPDF/fitz: {e}")
 
-    def _ocr_pdf_with_pypdfium2(path, max_pages=1):
-        """OCR PDF scansionato usando pypdfium2, più facile da usare su Render."""
+    def _render_pagine_pdf2image(data, indici):
+        """Rasterizza le pagine indicate con pdf2image/poppler."""
         try:
-            import pypdfium2 as pdfium
-            out = []
-            pdf = pdfium.PdfDocument(str(path))
-            n = min(len(pdf), max_pages)
-            for i in range(n):
-                page = pdf[i]
-                bitmap = page.render(scale=1.35).to_pil()
-                out.append(_ocr_image_with_tesseract(bitmap))
-            return '\n'.join(out).strip()
+            from pdf2image import convert_from_bytes
+            out = {}
+            for i in indici:
+                images = convert_from_bytes(data, dpi=140, first_page=i + 1, last_page=i + 1)
+                if images:
+                    out[i] = images[0]
+            return out
         except Exception as e:
-            raise RuntimeError(f"pypdfium2: {e}")
+            raise RuntimeError(f"pdf2image/poppler: {e}")
 
-    def _ocr_pdf_with_pdf2image(path, max_pages=1):
-        """OCR PDF scansionato usando pdf2image/poppler."""
+    def _testo_pagine_pdf(data, pdf_doc, detail):
+        """Livello testo pagina per pagina: lista di [testo, ha_immagini].
+
+        pdfplumber legge i byte già in memoria; le pagine rimaste vuote si riprovano sul
+        documento pypdfium2 aperto (lo stesso usato poi per rasterizzare).
+        """
+        import io
+        pagine = []
         try:
-            from pdf2image import convert_from_path
-            images = convert_from_path(str(path), dpi=140, first_page=1, last_page=max_pages)
-            out = []
-            for img in images:
-                out.append(_ocr_image_with_tesseract(img))
-            return '\n'.join(out).strip()
+            import pdfplumber
+            with pdfplumber.open(io.BytesIO(data)) as pdf:
+                for p in pdf.pages:
+                    try:
+                        testo = (p.extract_text() or '').strip()
+                    except Exception:
+                        testo = ''
+                    try:
+                        ha_immagini = bool(p.images)
+                    except Exception:
+                        ha_immagini = True
+                    pagine.append([testo, ha_immagini])
         except Exception as e:
-            raise RuntimeError(f"pdf2image/poppler: {e}")
+            detail.append(f"pdfplumber: {e}")
+
+        # Alcuni PDF OCR non vengono letti da pdfplumber: secondo tentativo sul livello testo con pdfium.
+        if pdf_doc is not None and (not pagine or any(len(t) < ACCETTAZIONE_TESTO_MIN for t, _ in pagine)):
+            try:
+                if not pagine:
+                    pagine = [['', True] for _ in range(len(pdf_doc))]
+                for i, (testo, _) in enumerate(pagine[:len(pdf_doc)]):
+                    if len(testo) >= ACCETTAZIONE_TESTO_MIN:
+                        continue
+                    testo2 = (pdf_doc[i].get_textpage().get_text_bounded() or '').replace('\r\n', '\n').strip()
+                    if len(testo2) > len(testo):
+                        pagine[i][0] = testo2
+            except Exception as e:
+                detail.append(f"pypdfium2 testo: {e}")
+        return pagine
 
     def _ocr_image_file(path):
         try:
@@ -295,75 +378,99 @@ def register_accettazione_entrata_routes(app_obj, deps):
             raise RuntimeError(f"OCR immagine: {e}")
 
     def _extract_pdf_text(path):
-        """Legge testo da PDF normale; se è scansione, prova OCR automatico."""
+        """Testo del documento caricato: dalla cache documenti se il file è già stato letto."""
+        digest = ocr_cache_digest(path)
+        cached = ocr_cache_leggi(digest, 'accettazione:v2').get(0)
+        if cached:
+            return cached, 'Testo letto dalla cache documenti (file già elaborato).'
+        text, detail = _extract_pdf_text_file(path)
+        if text and len(text.strip()) >= ACCETTAZIONE_TESTO_MIN:
+            ocr_cache_salva(digest, 'accettazione:v2', {0: text})
+        return text, detail
+
+    def _extract_pdf_text_file(path):
+        """Legge testo da PDF normale; le pagine scansionate passano all'OCR automatico.
+
+        Il file è letto una volta: il livello testo è controllato pagina per pagina e solo le
+        pagine senza testo vengono rasterizzate (in memoria) per tesseract.
+        """
         path = Path(path)
-        text = ''
         detail = []
 
-        # 1) PDF con testo incorporato
-        try:
-            if str(path).lower().endswith('.pdf'):
-                import pdfplumber
-                with pdfplumber.open(path) as pdf:
-                    parts = []
-                    for p in pdf.pages:
-                        try:
-                            parts.append(p.extract_text() or '')
-                        except Exception:
-                            parts.append('')
-                    text = '\n'.join(parts).strip()
-        except Exception as e:
-            detail.append(f"pdfplumber: {e}")
-
-        if text and len(text.strip()) >= 25:
-            return text, 'Testo PDF letto senza OCR.'
+        if not str(path).lower().endswith('.pdf'):
+            # Foto JPG/PNG
+            try:
+                ocr_text = _ocr_image_file(path)
+                if ocr_text and len(ocr_text.strip()) >= ACCETTAZIONE_TESTO_MIN:
+                    return ocr_text, 'OCR riuscito su immagine.'
+            except Exception as e:
+                detail.append(str(e))
+            return '', ' | '.join(detail) if detail else 'Nessun testo rilevato.'
 
-        # 1b) Alcuni PDF OCR non vengono letti da pdfplumber: prova anche PyMuPDF come testo incorporato.
         try:
-            if str(path).lower().endswith('.pdf'):
-                import fitz
-                doc = fitz.open(str(path))
-                parts = []
-                for page in doc:
-                    try:
-                        parts.append(page.get_text('text') or '')
-                    except Exception:
-                        parts.append('')
-                text2 = '\n'.join(parts).strip()
-                if text2 and len(text2.strip()) >= 25:
-                    return text2, 'Testo PDF OCR letto con PyMuPDF.'
+            data = path.read_bytes()
         except Exception as e:
-            detail.append(f"PyMuPDF text: {e}")
+            return '', f"Lettura file: {e}"
 
-        # 1c) Ultimo tentativo su PDF con testo: pdfminer.six.
+        pdf_doc = None
         try:
-            if str(path).lower().endswith('.pdf'):
-                from pdfminer.high_level import extract_text
-                text3 = (extract_text(str(path)) or '').strip()
-                if text3 and len(text3.strip()) >= 25:
-                    return text3, 'Testo PDF OCR letto con pdfminer.'
+            import pypdfium2 as pdfium
+            pdf_doc = pdfium.PdfDocument(data)
         except Exception as e:
-            detail.append(f"pdfminer: {e}")
-
-        # 2) PDF scansionato: OCR
-        if str(path).lower().endswith('.pdf'):
-            for func in (_ocr_pdf_with_pypdfium2, _ocr_pdf_with_fitz, _ocr_pdf_with_pdf2image):
-                try:
-                    ocr_text = func(path)
-                    if ocr_text and len(ocr_text.strip()) >= 25:
-                        return ocr_text, f"OCR riuscito con {func.__name__.replace('_ocr_pdf_with_', '')}."
-                except Exception as e:
-                    detail.append(str(e))
-        else:
-            # 3) foto JPG/PNG
+            detail.append(f"pypdfium2: {e}")
+        try:
+            return _leggi_pagine_pdf(data, pdf_doc, detail)
+        finally:
+            if pdf_doc is not None:
+                pdf_doc.close()
+
+    def _leggi_pagine_pdf(data, pdf_doc, detail):
+        """Testo incorporato per pagina e OCR delle sole pagine scansionate."""
+        pagine = _testo_pagine_pdf(data, pdf_doc, detail) or [['', True]]
+        testi = [t for t, _ in pagine]
+        text = '\n'.join(testi).strip()
+        # OCR solo sulle pagine con immagini e senza testo: le pagine bianche non costano nulla.
+        da_ocr = [i for i, (t, img) in enumerate(pagine) if img and len(t) < ACCETTAZIONE_TESTO_MIN]
+        if len(text) < ACCETTAZIONE_TESTO_MIN:
+            # Nessun testo nel documento: anche le pagine senza immagini (es. testo convertito
+            # in tracciati vettoriali, frequente nei DDT stampati) passano all'OCR.
+            da_ocr = [i for i, (t, _) in enumerate(pagine) if len(t) < ACCETTAZIONE_TESTO_MIN]
+        da_ocr = da_ocr[:ACCETTAZIONE_OCR_MAX_PAGINE]
+        if not da_ocr:
+            if len(text) >= ACCETTAZIONE_TESTO_MIN:
+                return text, 'Testo PDF letto senza OCR.'
+            return text, ' | '.join(detail) if detail else 'Nessun testo rilevato.'
+
+        # Rasterizza solo le pagine da leggere, col primo motore disponibile; le immagini restano in memoria.
+        immagini, motore = {}, ''
+        for func, sorgente in ((_render_pagine_pypdfium2, pdf_doc), (_render_pagine_fitz, data), (_render_pagine_pdf2image, data)):
             try:
-                ocr_text = _ocr_image_file(path)
-                if ocr_text and len(ocr_text.strip()) >= 25:
-                    return ocr_text, 'OCR riuscito su immagine.'
+                immagini = func(sorgente, da_ocr)
+                if immagini:
+                    motore = func.__name__.replace('_render_pagine_', '')
+                    break
             except Exception as e:
                 detail.append(str(e))
 
-        return text or '', ' | '.join(detail) if detail else 'Nessun testo rilevato.'
+        letti = []
+        for i, img in sorted(immagini.items()):
+            try:
+                ocr_text = (_ocr_image_with_tesseract(img) or '').strip()
+            except Exception as e:
+                detail.append(str(e))
+                continue
+            if len(ocr_text) > len(testi[i]):
+                testi[i] = ocr_text
+                letti.append(str(i + 1))
+
+        ocr_text = '\n'.join(testi).strip()
+        if letti and len(ocr_text) >= ACCETTAZIONE_TESTO_MIN:
+            if len(text) >= ACCETTAZIONE_TESTO_MIN:
+                return ocr_text, f"Testo PDF letto; OCR con {motore} sulle pagine senza testo ({', '.join(letti)})."
+            return ocr_text, f"OCR riuscito con {motore} (pagine {', '.join(letti)})."
+        if len(text) >= ACCETTAZIONE_TESTO_MIN:
+            return text, 'Testo PDF letto senza OCR.'
+        return text, ' | '.join(detail) if detail else 'Nessun testo rilevato.'
 
     def _first_match(text, patterns, flags=re.I | re.M):
         for pat in patterns:
@@ -480,6 +587,177 @@ def register_accettazione_entrata_routes(app_obj, deps):
         file_storage.save(out)
         return saved, original, out
 
+    def _accettazione_job_avvia(job_id):
+        """Assegna il job con l'UPDATE condizionato e solo se riesce avvia il thread di lettura.
+
+        L'assegnazione aggiorna aggiornato_il: un secondo tentativo entro ACCETTAZIONE_JOB_TIMEOUT
+        (altro polling, altro worker) non passa, quindi al massimo un avvio per finestra.
+        """
+        db = SessionLocal()
+        try:
+            if not _accettazione_job_prendi(db, job_id):
+                return False
+        finally:
+            db.close()
+        threading.Thread(
+            target=_accettazione_job_esegui, args=(job_id,), daemon=True, name=f'accettazione-ocr-{job_id}'
+        ).start()
+        return True
+
+    def _accettazione_job_battito(job_id, fine):
+        """Aggiorna aggiornato_il del job finché il thread che lo esegue non imposta `fine`."""
+        while not fine.wait(ACCETTAZIONE_JOB_BATTITO):
+            db = SessionLocal()
+            try:
+                db.query(AccettazioneOcrJob).filter(
+                    AccettazioneOcrJob.id == job_id, AccettazioneOcrJob.stato == 'IN_CORSO'
+                ).update(
+                    {AccettazioneOcrJob.aggiornato_il: datetime.now().strftime('%Y-%m-%d %H:%M:%S')},
+                    synchronize_session=False,
+                )
+                db.commit()
+            except Exception:
+                db.rollback()
+            finally:
+                db.close()
+
+    def _accettazione_job_interrotto(job):
+        """True se il job è in coda/in corso ma non si aggiorna da ACCETTAZIONE_JOB_TIMEOUT secondi."""
+        if job.stato not in ('IN_CODA', 'IN_CORSO'):
+            return False
+        limite = (datetime.now() - timedelta(seconds=ACCETTAZIONE_JOB_TIMEOUT)).strftime('%Y-%m-%d %H:%M:%S')
+        return (job.aggiornato_il or '') < limite
+
+    def _accettazione_job_prendi(db, job_id):
+        """Assegna il job con un UPDATE condizionato (un solo esecutore anche con più worker)."""
+        now = datetime.now()
+        limite = (now - timedelta(seconds=ACCETTAZIONE_JOB_TIMEOUT)).strftime('%Y-%m-%d %H:%M:%S')
+        presi = (
+            db.query(AccettazioneOcrJob)
+            .filter(
+                AccettazioneOcrJob.id == job_id,
+                or_(
+                    AccettazioneOcrJob.stato == 'IN_CODA',
+                    and_(AccettazioneOcrJob.stato == 'IN_CORSO', AccettazioneOcrJob.aggiornato_il < limite),
+                ),
+            )
+            .update(
+                {AccettazioneOcrJob.stato: 'IN_CORSO', AccettazioneOcrJob.aggiornato_il: now.strftime('%Y-%m-%d %H:%M:%S')},
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        return presi == 1
+
+    def _accettazione_job_esegui(job_id):
+        """Legge il documento del job già assegnato (testo PDF/OCR) ed estrae i campi dell'entrata.
+
+        Dall'assegnazione alla fine, anche in attesa del turno, il battito tiene aggiornato
+        aggiornato_il: il job risulta interrotto solo se il processo che lo esegue si ferma.
+        """
+        fine = threading.Event()
+        threading.Thread(
+            target=_accettazione_job_battito, args=(job_id, fine), daemon=True, name=f'accettazione-battito-{job_id}'
+        ).start()
+        try:
+            with ACCETTAZIONE_JOB_PARALLELI:
+                _accettazione_job_leggi(job_id)
+        finally:
+            fine.set()
+
+    def _accettazione_job_leggi(job_id):
+        db = SessionLocal()
+        try:
+            job = db.get(AccettazioneOcrJob, job_id)
+            if job is None or job.stato != 'IN_CORSO':
+                return
+            try:
+                text, ocr_detail = _extract_pdf_text(DOCS_DIR / job.file_salvato)
+                extracted = _extract_arrival_fields(text)
+                extracted['ocr_detail'] = ocr_detail
+                job.risultato = json.dumps(extracted, ensure_ascii=False)
+                job.stato = 'COMPLETATO'
+            except Exception as e:
+                app.logger.warning("Accettazione entrata: lettura documento %s fallita: %s", job.file_salvato, e)
+                job.stato = 'ERRORE'
+                job.errore = str(e)
+            job.aggiornato_il = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            db.commit()
+        except Exception:
+            db.rollback()
+            app.logger.exception("Accettazione entrata: job %s non eseguito", job_id)
+        finally:
+            db.close()
+            SessionLocal.remove()
+
+    def _accettazione_job_crea(saved_filename, original_filename):
+        job_id = uuid.uuid4().hex
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        db = SessionLocal()
+        try:
+            db.add(AccettazioneOcrJob(
+                id=job_id,
+                file_salvato=saved_filename,
+                file_nome=original_filename,
+                stato='IN_CODA',
+                arrivo_prefill=(request.form.get('arrivo_prefill') or '').strip(),
+                colli_prefill=(request.form.get('colli_prefill') or '').strip(),
+                utente=_current_username_for_audit() or 'SISTEMA',
+                creato_il=now,
+                aggiornato_il=now,
+            ))
+            db.commit()
+        finally:
+            db.close()
+        return job_id
+
+    def _accettazione_job_conferma(job_id, clienti):
+        """Pagina del job: attesa finché la lettura è in corso, poi conferma precompilata."""
+        db = SessionLocal()
+        try:
+            job = db.get(AccettazioneOcrJob, job_id)
+            if job is None:
+                flash('Lettura documento non trovata: carica di nuovo il file.', 'warning')
+                return redirect(url_for('accettazione_entrata'))
+            if job.stato in ('IN_CODA', 'IN_CORSO'):
+                # Un eventuale riavvio lo decide il polling di stato della pagina d'attesa.
+                return render_template_string(ACCETTAZIONE_ATTESA_HTML, job=job)
+            if job.stato == 'COMPLETATO':
+                extracted = json.loads(job.risultato or '{}')
+            else:
+                # Lettura fallita: resta la compilazione manuale.
+                extracted = _extract_arrival_fields('')
+                extracted['ocr_detail'] = job.errore or ''
+            return render_template_string(
+                ACCETTAZIONE_CONFERMA_HTML,
+                extracted=extracted,
+                saved_filename=job.file_salvato,
+                original_filename=job.file_nome,
+                clienti=clienti,
+                today_ita=date.today().strftime('%d/%m/%Y'),
+                arrivo_prefill=job.arrivo_prefill or '',
+                colli_prefill=job.colli_prefill or ''
+            )
+        finally:
+            db.close()
+
+    @app.get('/accettazione_entrata/job/<job_id>')
+    @login_required
+    def accettazione_entrata_job_stato(job_id):
+        if session.get('role') not in ('admin', 'magazzino'):
+            return jsonify({'ok': False, 'errore': 'Accesso negato.'}), 403
+        db = SessionLocal()
+        try:
+            job = db.get(AccettazioneOcrJob, job_id)
+            if job is None:
+                return jsonify({'ok': False, 'errore': 'Job non trovato.'}), 404
+            if _accettazione_job_interrotto(job):
+                # Nessun battito (es. riavvio del server): rilancia la lettura, se l'assegnazione riesce.
+                _accettazione_job_avvia(job.id)
+            return jsonify({'ok': True, 'id': job.id, 'stato': job.stato, 'errore': job.errore})
+        finally:
+            db.close()
+
     @app.route('/accettazione_entrata', methods=['GET', 'POST'])
     @login_required
     def accettazione_entrata():
@@ -499,6 +777,9 @@ def register_accettazione_entrata_routes(app_obj, deps):
             db.close()
 
         if request.method == 'GET':
+            job_id = (request.args.get('job') or '').strip()
+            if job_id:
+                return _accettazione_job_conferma(job_id, clienti)
             return render_template_string(
                 ACCETTAZIONE_ENTRATA_HTML,
                 arrivo_prefill=(request.args.get('arrivo') or '').strip(),
@@ -514,6 +795,11 @@ def register_accettazione_entrata_routes(app_obj, deps):
                 return redirect(url_for('accettazione_entrata'))
             try:
                 saved_filename, original_filename, saved_path = _copy_to_docs(f)
+                if (request.form.get('modalita') or '').strip() == 'job':
+                    # Lettura/OCR in background: la richiesta torna subito e la pagina attende il risultato.
+                    job_id = _accettazione_job_crea(saved_filename, original_filename)
+                    _accettazione_job_avvia(job_id)
+                    return redirect(url_for('accettazione_entrata', job=job_id))
                 text, ocr_detail = _extract_pdf_text(saved_path)
                 extracted = _extract_arrival_fields(text)
                 extracted['ocr_detail'] = ocr_detail
@@ -15,7 +15,7 @@ import os
 from datetime import datetime
 
 from flask import request, jsonify
-from sqlalchemy import or_, func
+from sqlalchemy import func
 
 
 def register_api_routes(app_obj, deps):
@@ -103,7 +103,8 @@ def register_api_routes(app_obj, deps):
 
         db = SessionLocal()
         try:
-            qry = db.query(Articolo).filter(func.upper(Articolo.cliente) == cliente)
+            qry = db.query(Articolo).filter(Articolo.cliente_key == normalize_text_key(cliente))
+            qry = qry.filter(Articolo.data_uscita_dt == None)
             qry = qry.filter((Articolo.data_uscita == None) | (Articolo.data_uscita == ""))
 
             if lotto:
@@ -111,15 +112,9 @@ def register_api_routes(app_obj, deps):
             if stato:
                 qry = qry.filter(func.upper(Articolo.stato) == stato.upper())
             if q:
-                like = f"%{q}%"
-                qry = qry.filter(or_(
-                    Articolo.codice_articolo.ilike(like),
-                    Articolo.descrizione.ilike(like),
-                    Articolo.lotto.ilike(like),
-                    Articolo.serial_number.ilike(like),
-                    Articolo.ns_rif.ilike(like),
-                    Articolo.codice_entrata.ilike(like),
-                ))
+                qry = qry.filter(articoli_search_filter(q, [
+                    'codice_articolo', 'descrizione', 'lotto', 'serial_number', 'ns_rif', 'codice_entrata',
+                ]))
 
             total = qry.count()
             rows = qry.order_by(Articolo.id_articolo.desc()).offset(offset).limit(limit).all()
@@ -193,7 +188,8 @@ def register_api_routes(app_obj, deps):
                     func.coalesce(func.sum(Articolo.m3), 0).label("m3"),
                 )
                 .filter(
-                    func.upper(Articolo.cliente) == cliente,
+                    Articolo.cliente_key == normalize_text_key(cliente),
+                    Articolo.data_uscita_dt == None,
                     (Articolo.data_uscita == None) | (Articolo.data_uscita == ""),
                 )
                 .group_by(key_col)
@@ -230,7 +226,7 @@ def register_api_routes(app_obj, deps):
     def api_movimenti():
         """Movimenti ingresso/uscita ricostruiti dai campi articolo.
 
-        Versione alleggerita: legge solo le colonne necessarie e applica un limite di sicurezza.
+        Versione alleggerita: filtra per data in SQL sulle colonne DATE e applica un limite di sicurezza.
         """
         cliente = _api_get_cliente_from_key()
         if not cliente:
@@ -247,53 +243,40 @@ def register_api_routes(app_obj, deps):
 
         db = SessionLocal()
         try:
-            qry = db.query(Articolo).filter(func.upper(Articolo.cliente) == cliente)
+            base = db.query(Articolo).filter(Articolo.cliente_key == normalize_text_key(cliente))
             if lotto:
-                qry = qry.filter(Articolo.lotto == lotto)
-
-            rows = qry.order_by(Articolo.id_articolo.desc()).limit(limit).all()
+                base = base.filter(Articolo.lotto == lotto)
+
+            def _movimenti(date_col, tipo_mov, ddt_attr):
+                # Range sulle colonne DATE indicizzate, ordinato per data e limitato in SQL.
+                qry = base.filter(date_col != None)
+                if da:
+                    qry = qry.filter(date_col >= da)
+                if a:
+                    qry = qry.filter(date_col <= a)
+                rows = qry.order_by(date_col.desc(), Articolo.id_articolo.desc()).limit(limit).all()
+                return [{
+                    "data": getattr(art, date_col.key).isoformat(),
+                    "tipo": tipo_mov,
+                    "id": art.id_articolo,
+                    "codice": art.codice_articolo,
+                    "descrizione": art.descrizione,
+                    "lotto": art.lotto,
+                    "serial_number": art.serial_number,
+                    "colli": art.n_colli,
+                    "peso": art.peso,
+                    "m2": art.m2,
+                    "m3": art.m3,
+                    "ddt": getattr(art, ddt_attr),
+                    "magazzino": art.magazzino,
+                    "posizione": art.posizione,
+                } for art in rows]
 
             out = []
-            for art in rows:
-                d_in = to_date_db(art.data_ingresso)
-                if d_in and tipo in ("ingresso", "tutti"):
-                    if (not da or d_in >= da) and (not a or d_in <= a):
-                        out.append({
-                            "data": d_in.isoformat(),
-                            "tipo": "ingresso",
-                            "id": art.id_articolo,
-                            "codice": art.codice_articolo,
-                            "descrizione": art.descrizione,
-                            "lotto": art.lotto,
-                            "serial_number": art.serial_number,
-                            "colli": art.n_colli,
-                            "peso": art.peso,
-                            "m2": art.m2,
-                            "m3": art.m3,
-                            "ddt": art.n_ddt_ingresso,
-                            "magazzino": art.magazzino,
-                            "posizione": art.posizione,
-                        })
-
-                d_out = to_date_db(art.data_uscita)
-                if d_out and tipo in ("uscita", "tutti"):
-                    if (not da or d_out >= da) and (not a or d_out <= a):
-                        out.append({
-                            "data": d_out.isoformat(),
-                            "tipo": "uscita",
-                            "id": art.id_articolo,
-                            "codice": art.codice_articolo,
-                            "descrizione": art.descrizione,
-                            "lotto": art.lotto,
-                            "serial_number": art.serial_number,
-                            "colli": art.n_colli,
-                            "peso": art.peso,
-                            "m2": art.m2,
-                            "m3": art.m3,
-                            "ddt": art.n_ddt_uscita,
-                            "magazzino": art.magazzino,
-                            "posizione": art.posizione,
-                        })
+            if tipo in ("ingresso", "tutti"):
+                out += _movimenti(Articolo.data_ingresso_dt, "ingresso", "n_ddt_ingresso")
+            if tipo in ("uscita", "tutti"):
+                out += _movimenti(Articolo.data_uscita_dt, "uscita", "n_ddt_uscita")
 
             out.sort(key=lambda r: r.get("data") or "", reverse=True)
             if len(out) > limit:
@@ -62,6 +62,8 @@ def register_backup_routes(app_obj, deps):
         table_names = sorted(
             name for name in inspector.get_table_names()
             if name and not name.startswith("pg_") and name != "alembic_version"
+            # Indice di ricerca FTS5 (SQLite): è derivato da articoli e viene ricostruito all'avvio.
+            and not name.startswith("articoli_search")
         )
         if not table_names:
             raise RuntimeError("Il database non contiene tabelle esportabili.")
@@ -395,6 +397,16 @@ def register_backup_routes(app_obj, deps):
             if not db_export.exists():
                 raise RuntimeError("Nel backup manca database/database_export.json.")
             _restore_database_json(db_export)
+            # I backup precedenti non hanno le colonne derivate di articoli e righe buono: le ricompila.
+            backfill_articoli_colonne_derivate(engine)
+            backfill_buoni_carico_righe_codice_entrata_key(engine)
+            ensure_search_index(engine)
+            with engine.begin() as conn:
+                dashboard_snapshot_ricalcola(conn)
+                fatturazione_snapshot_invalida(conn, [(None, None)])
+                # Contatori QR dei buoni: derivati da righe e scansioni ripristinate, si ricostruiscono
+                # al primo uso (su SQLite il CASCADE su buono_id non scatta e resterebbero quelli vecchi).
+                conn.execute(text("DELETE FROM buoni_carico_contatori"))
 
             config_dir = tmpdir / "config"
             for name in ["mappe_excel.json", "destinatari_saved.json", "progressivi_ddt.json", "utenti_gestionale.json", "rubrica_email.json"]:
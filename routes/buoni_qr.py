@@ -154,12 +154,198 @@ def register_buoni_qr_routes(app_obj, deps):
     {% endblock %}
     """
 
+    # Stato della coda scansioni offline (service worker): registrazione, invio al ritorno
+    # della rete ed esito delle scansioni inviate in blocco.
+    SCANSIONI_OFFLINE_HTML = """
+    <div id="scan_offline_stato" class="alert alert-warning py-2 small mt-3" style="display:none;"></div>
+    <script>
+    (function(){
+        if (!('serviceWorker' in navigator)) return;
+        const box = document.getElementById("scan_offline_stato");
+        const MSG_OFFLINE = "Offline: le scansioni vengono salvate sul dispositivo e inviate al ritorno della rete.";
+
+        function mostra(msg, cls) {
+            if (!box) return;
+            box.className = "alert py-2 small mt-3 " + (cls || "alert-warning");
+            box.innerText = msg;
+            box.style.display = msg ? "block" : "none";
+        }
+
+        function inviaCoda() {
+            navigator.serviceWorker.ready.then(function(reg) {
+                if (reg.active) reg.active.postMessage({ tipo: "invia_scansioni" });
+            });
+        }
+
+        navigator.serviceWorker.register("/service-worker.js").then(inviaCoda).catch(function() {});
+        window.addEventListener("online", inviaCoda);
+        window.addEventListener("offline", function() { mostra(MSG_OFFLINE); });
+        if (!navigator.onLine) mostra(MSG_OFFLINE);
+
+        navigator.serviceWorker.addEventListener("message", function(event) {
+            const d = event.data || {};
+            if (d.tipo === "scansioni_in_coda") {
+                mostra("Offline: " + d.in_coda + " scansioni in coda sul dispositivo.");
+            } else if (d.tipo === "scansioni_inviate") {
+                const r = d.risultati || [];
+                const ko = r.filter(function(x) { return x.esito !== "OK"; });
+                let msg = "Inviate " + r.length + " scansioni fatte offline: " + (r.length - ko.length) + " OK";
+                if (ko.length) {
+                    msg += ", " + ko.length + " da controllare: " + ko.map(function(x) { return x.esito + " (" + (x.messaggio || "") + ")"; }).join("; ");
+                }
+                if (d.in_coda) msg += ". Ancora in coda: " + d.in_coda;
+                mostra(msg + ". Ricarica la pagina per i conteggi aggiornati.", ko.length ? "alert-danger" : "alert-success");
+            }
+        });
+    })();
+    </script>
+    """
+
+    # Vista live del dettaglio buono: riceve dal flusso SSE le scansioni nuove e i contatori
+    # e aggiorna conteggi, stato righe, scansioni errate e storico senza ricaricare la pagina.
+    BUONO_LIVE_HTML = """
+    <script>
+    (function(){
+        const badge = document.getElementById("buono_live");
+        if (!badge || !window.EventSource) return;
+        const BADGE_RIGA = {
+            caricato: ["bg-success", "Caricato"],
+            parziale: ["bg-info text-dark", "Parziale"],
+            mancante: ["bg-warning text-dark", "Mancante"]
+        };
+
+        function stato(testo, cls) {
+            badge.className = "badge fs-6 align-middle " + cls;
+            badge.innerText = testo;
+        }
+
+        function testo(id, valore) {
+            const el = document.getElementById(id);
+            if (el) el.innerText = valore;
+        }
+
+        function cella(tr, valore, codice) {
+            const td = document.createElement("td");
+            if (codice) {
+                const c = document.createElement("code");
+                c.textContent = valore || "";
+                td.appendChild(c);
+            } else {
+                td.textContent = valore || "";
+            }
+            tr.appendChild(td);
+        }
+
+        // Stessa assegnazione del riepilogo server: le scansioni OK di un QR coprono le righe in ordine.
+        function aggiornaRighe(qr) {
+            const usate = {};
+            document.querySelectorAll("tr[data-riga-id]").forEach(function(tr) {
+                const k = tr.dataset.qrKey || "";
+                const prev = parseInt(tr.dataset.colli || "0", 10);
+                const gia = usate[k] || 0;
+                const residuo = Math.max(0, (qr[k] ? qr[k].ok : 0) - gia);
+                let s = "mancante";
+                if (residuo >= prev && prev > 0) { s = "caricato"; usate[k] = gia + prev; }
+                else if (residuo > 0) { s = "parziale"; usate[k] = gia + residuo; }
+                const td = tr.querySelector(".live-stato-riga");
+                if (td) td.innerHTML = '<span class="badge ' + BADGE_RIGA[s][0] + '">' + BADGE_RIGA[s][1] + "</span>";
+                const chk = tr.querySelector(".chk-arrivo-carico");
+                if (chk) {
+                    chk.disabled = s === "caricato";
+                    if (chk.disabled) chk.checked = false;
+                }
+                const li = document.querySelector('li[data-riga-id="' + tr.dataset.rigaId + '"]');
+                if (li) li.style.display = s === "caricato" ? "none" : "";
+            });
+        }
+
+        function contatori(d) {
+            testo("live_pallet_previsti", d.pallet_previsti);
+            testo("live_ok", d.ok);
+            testo("live_mancanti", d.mancanti);
+            testo("live_stato", d.stato);
+            const esito = document.getElementById("live_esito");
+            if (esito) {
+                esito.className = "alert mt-3 mb-0 " + (d.mancanti > 0 ? "alert-warning" : "alert-success");
+                esito.innerHTML = d.mancanti > 0
+                    ? "Mancano ancora <strong>" + d.mancanti + "</strong> colli da caricare/scansionare."
+                    : "Tutti i colli previsti risultano caricati.";
+            }
+            aggiornaRighe(d.qr || {});
+        }
+
+        // Il server rimanda le scansioni della finestra di sovrapposizione: si scartano per id.
+        const visti = new Set();
+        document.querySelectorAll("#live_storico tr[data-scan-id]").forEach(function(tr) {
+            visti.add(parseInt(tr.dataset.scanId, 10));
+        });
+
+        function scansione(s) {
+            if (visti.has(s.id)) return;
+            visti.add(s.id);
+            const vuoto = document.getElementById("live_storico_vuoto");
+            if (vuoto) vuoto.remove();
+            const corpo = document.getElementById("live_storico");
+            if (corpo) {
+                const tr = document.createElement("tr");
+                tr.dataset.scanId = s.id;
+                cella(tr, s.scanned_at);
+                cella(tr, s.scanned_by || "-");
+                cella(tr, s.codice, true);
+                cella(tr, s.esito);
+                cella(tr, s.messaggio);
+                // Storico per id decrescente: una scansione arrivata in ritardo va al suo posto.
+                let prima = corpo.firstChild;
+                while (prima && !(prima.dataset && prima.dataset.scanId && parseInt(prima.dataset.scanId, 10) < s.id)) {
+                    prima = prima.nextSibling;
+                }
+                corpo.insertBefore(tr, prima);
+            }
+            if (s.esito === "SBAGLIATO" || s.esito === "ERRORE") {
+                const box = document.getElementById("live_sbagliati_box");
+                let lista = document.getElementById("live_sbagliati");
+                if (box && !lista) {
+                    const vuotoErr = document.getElementById("live_sbagliati_vuoto");
+                    if (vuotoErr) vuotoErr.remove();
+                    lista = document.createElement("ul");
+                    lista.id = "live_sbagliati";
+                    lista.className = "mb-0 mt-2";
+                    box.appendChild(lista);
+                }
+                if (box) box.className = "alert alert-danger mb-0";
+                if (lista) {
+                    const li = document.createElement("li");
+                    const b = document.createElement("strong");
+                    b.textContent = s.codice || "";
+                    const small = document.createElement("small");
+                    small.textContent = (s.scanned_at || "") + " - " + (s.messaggio || "");
+                    li.appendChild(b);
+                    li.appendChild(document.createElement("br"));
+                    li.appendChild(small);
+                    lista.insertBefore(li, lista.firstChild);
+                }
+            }
+        }
+
+        const es = new EventSource(badge.dataset.url + "?dopo=" + encodeURIComponent(badge.dataset.dopo || "0"));
+        es.onopen = function() { stato("Live", "bg-success"); };
+        es.onerror = function() { stato("Riconnessione…", "bg-secondary"); };
+        es.addEventListener("contatori", function(e) { contatori(JSON.parse(e.data)); });
+        es.addEventListener("scansione", function(e) { scansione(JSON.parse(e.data)); });
+        es.addEventListener("eliminato", function() {
+            es.close();
+            stato("Buono eliminato", "bg-danger");
+        });
+    })();
+    </script>
+    """
+
     BUONO_CARICO_DETTAGLIO_HTML = """
     {% extends 'base.html' %}
     {% block content %}
     <div class="container-fluid py-3">
       <div class="d-flex justify-content-between align-items-center mb-3">
-        <h3>📦 Buono di carico {{ buono.codice_buono }}</h3>
+        <h3>📦 Buono di carico {{ buono.codice_buono }} <span id="buono_live" class="badge bg-secondary fs-6 align-middle" data-url="{{ url_for('live_buono_carico', buono_id=buono.id) }}" data-dopo="{{ scansioni[0].id if scansioni else 0 }}">Live…</span></h3>
         <div>
           <a href="{{ url_for('buoni_carico') }}" class="btn btn-secondary btn-sm">Elenco buoni</a>
           <a href="{{ url_for('stampa_buono_carico_pdf', buono_id=buono.id) }}" class="btn btn-success btn-sm" target="_blank" rel="noopener">🖨️ Stampa buono</a>
@@ -184,18 +370,18 @@ def register_buoni_qr_routes(app_obj, deps):
                 <div class="col-md-2 mt-3"><strong>N. arrivo</strong><br>{{ buono.n_arrivo }}</div>
                 <div class="col-md-2"><strong>DDT</strong><br>{{ buono.n_ddt_ingresso or '-' }}</div>
                 <div class="col-md-2"><strong>Data</strong><br>{{ buono.data_ingresso or '-' }}</div>
-                <div class="col-md-3 mt-3"><strong>Colli previsti</strong><br>{{ buono.pallet_previsti or 0 }}</div>
-                <div class="col-md-3 mt-3"><strong>Colli caricati</strong><br>{{ caricati_ok }}</div>
-                <div class="col-md-3 mt-3"><strong>Mancanti</strong><br>{{ mancanti }}</div>
-                <div class="col-md-3 mt-3"><strong>Stato</strong><br>{{ buono.stato or 'DA CARICARE' }}</div>
+                <div class="col-md-3 mt-3"><strong>Colli previsti</strong><br><span id="live_pallet_previsti">{{ buono.pallet_previsti or 0 }}</span></div>
+                <div class="col-md-3 mt-3"><strong>Colli caricati</strong><br><span id="live_ok">{{ caricati_ok }}</span></div>
+                <div class="col-md-3 mt-3"><strong>Mancanti</strong><br><span id="live_mancanti">{{ mancanti }}</span></div>
+                <div class="col-md-3 mt-3"><strong>Stato</strong><br><span id="live_stato">{{ buono.stato or 'DA CARICARE' }}</span></div>
               </div>
               <hr>
               <strong>QR/Codice entrata corretto:</strong><br>
               <code>{{ buono.codice_entrata }}</code>
               {% if mancanti > 0 %}
-              <div class="alert alert-warning mt-3 mb-0">Mancano ancora <strong>{{ mancanti }}</strong> colli da caricare/scansionare.</div>
+              <div id="live_esito" class="alert alert-warning mt-3 mb-0">Mancano ancora <strong>{{ mancanti }}</strong> colli da caricare/scansionare.</div>
               {% else %}
-              <div class="alert alert-success mt-3 mb-0">Tutti i colli previsti risultano caricati.</div>
+              <div id="live_esito" class="alert alert-success mt-3 mb-0">Tutti i colli previsti risultano caricati.</div>
               {% endif %}
             </div>
           </div>
@@ -223,7 +409,7 @@ def register_buoni_qr_routes(app_obj, deps):
                 {% if riepilogo_scan.mancanti %}
                   <ul class="mb-0 mt-2">
                     {% for r in riepilogo_scan.mancanti %}
-                    <li>
+                    <li data-riga-id="{{ r.id }}">
                       <strong>{{ r.n_arrivo or '-' }}</strong>
                       {% if r.codice_articolo %} - {{ r.codice_articolo }}{% endif %}
                       {% if r.descrizione %} - {{ r.descrizione }}{% endif %}
@@ -238,10 +424,10 @@ def register_buoni_qr_routes(app_obj, deps):
             </div>
 
             <div class="col-md-6">
-              <div class="alert {% if riepilogo_scan.sbagliati %}alert-danger{% else %}alert-success{% endif %} mb-0">
+              <div id="live_sbagliati_box" class="alert {% if riepilogo_scan.sbagliati %}alert-danger{% else %}alert-success{% endif %} mb-0">
                 <strong>Scansioni non presenti nel buono:</strong>
                 {% if riepilogo_scan.sbagliati %}
-                  <ul class="mb-0 mt-2">
+                  <ul id="live_sbagliati" class="mb-0 mt-2">
                     {% for s in riepilogo_scan.sbagliati %}
                     <li>
                       <strong>{{ s.codice_scansionato }}</strong>
@@ -250,7 +436,7 @@ def register_buoni_qr_routes(app_obj, deps):
                     {% endfor %}
                   </ul>
                 {% else %}
-                  <div class="mt-2">Nessuna scansione errata.</div>
+                  <div id="live_sbagliati_vuoto" class="mt-2">Nessuna scansione errata.</div>
                 {% endif %}
               </div>
             </div>
@@ -281,7 +467,7 @@ def register_buoni_qr_routes(app_obj, deps):
             </thead>
             <tbody>
               {% for r in righe %}
-              <tr>
+              <tr data-riga-id="{{ r.id }}" data-qr-key="{{ r.codice_entrata_key or '' }}" data-colli="{{ r.colli_previsti or 0 }}">
                 {% set stato_riga = (riepilogo_scan.row_status or {}).get(r.id|string, 'mancante') %}
                 <td class="text-center">
                   <input type="checkbox"
@@ -300,7 +486,7 @@ def register_buoni_qr_routes(app_obj, deps):
                 <td>{{ r.colli_previsti or 0 }}</td>
                 <td>{{ r.peso_previsto|it_num(2) }}</td>
                 <td><code>{{ r.codice_entrata }}</code></td>
-                <td>
+                <td class="live-stato-riga">
                   {% if stato_riga == 'caricato' %}
                     <span class="badge bg-success">Caricato</span>
                   {% elif stato_riga == 'parziale' %}
@@ -355,9 +541,9 @@ def register_buoni_qr_routes(app_obj, deps):
         <div class="table-responsive">
           <table class="table table-sm table-striped mb-0">
             <thead><tr><th>Data/Ora</th><th>Utente</th><th>Codice scansionato</th><th>Esito</th><th>Messaggio</th></tr></thead>
-            <tbody>
+            <tbody id="live_storico">
               {% for s in scansioni %}
-              <tr>
+              <tr data-scan-id="{{ s.id }}">
                 <td>{{ s.scanned_at }}</td>
                 <td>{{ s.scanned_by or '-' }}</td>
                 <td><code>{{ s.codice_scansionato }}</code></td>
@@ -365,7 +551,7 @@ def register_buoni_qr_routes(app_obj, deps):
                 <td>{{ s.messaggio }}</td>
               </tr>
               {% else %}
-              <tr><td colspan="5" class="text-muted">Nessuna scansione registrata.</td></tr>
+              <tr id="live_storico_vuoto"><td colspan="5" class="text-muted">Nessuna scansione registrata.</td></tr>
               {% endfor %}
             </tbody>
           </table>
@@ -542,6 +728,8 @@ def register_buoni_qr_routes(app_obj, deps):
     }
     </script>
 
+    {{ scansioni_offline|safe }}
+    {{ buono_live|safe }}
     {% endblock %}
     """
 
@@ -607,12 +795,224 @@ def register_buoni_qr_routes(app_obj, deps):
 
 
     def _key_codice_entrata_buono(codice):
-        """Chiave normalizzata stabile per confrontare QR/codici entrata."""
-        vars_ = _codice_entrata_varianti(codice)
-        if vars_:
-            # usa la variante più corta/vecchia se presente, così vecchio e nuovo barcode coincidono
-            return normalize_text_key(sorted(vars_, key=lambda x: len(x))[0])
-        return normalize_text_key(codice)
+        """Chiave normalizzata stabile per confrontare QR/codici entrata.
+
+        È la stessa chiave canonica salvata in codice_entrata_key (forma senza cliente),
+        così vecchio e nuovo barcode coincidono.
+        """
+        return _chiave_codice_entrata(codice) or ""
+
+
+    # Contatori QR del buono (tabella buoni_carico_contatori): una riga per chiave QR
+    # con colli previsti / scansioni OK / errori, più la riga '__TOTALE__' con i valori
+    # del buono (previsti, colli caricati validi, errori). Le scansioni li aggiornano con
+    # UPDATE condizionati nella stessa transazione dell'inserimento in buoni_carico_scansioni;
+    # se mancano (buono nuovo o righe cambiate) vengono ricostruiti da righe e scansioni.
+    BUONO_CONTATORE_TOTALE = "__TOTALE__"
+    # Esito SBAGLIATO: scansione dal dettaglio del buono (anche in coda offline) e da scanner operativo.
+    BUONO_MSG_SBAGLIATO = "Arrivo sbagliato: questo QR non è collegato a questo buono di carico oppure non è da caricare."
+    BUONO_MSG_SBAGLIATO_OPERATIVO = "QR non collegato a questo buono."
+
+    # Vista live dei buoni (SSE su /buoni_carico/<id>/live): chi modifica scansioni o
+    # contatori segna il buono nella sessione; al commit i flussi aperti in questo processo
+    # vengono svegliati subito, quelli degli altri worker se ne accorgono al controllo
+    # periodico sul DB (scansioni con id successivo all'ultimo inviato + contatori).
+    # Su PostgreSQL gli id si assegnano all'INSERT ma diventano visibili al commit, quindi
+    # una scansione può comparire dopo una con id maggiore: ogni giro rilegge anche gli
+    # ultimi BUONI_LIVE_SOVRAPPOSIZIONE id già superati e le doppie si scartano per id
+    # (nel flusso e nella pagina, che dopo una riconnessione riceve di nuovo la finestra).
+    BUONI_LIVE_ATTESA_S = 2
+    BUONI_LIVE_DURATA_S = float(os.environ.get("BUONI_LIVE_DURATA_S", "50") or 50)
+    BUONI_LIVE_MAX_SCANSIONI = 200
+    BUONI_LIVE_SOVRAPPOSIZIONE = 50
+    _buoni_live_cond = threading.Condition()
+    _buoni_live_versioni = {}
+
+    def _buoni_live_segna(db, buono_id):
+        """Segna il buono come modificato: i flussi live vengono avvisati al commit."""
+        db.info.setdefault("_buoni_live", set()).add(buono_id)
+
+    @event.listens_for(SessionLocal.session_factory, "after_commit")
+    def _buoni_live_dopo_commit(session_db):
+        ids = session_db.info.pop("_buoni_live", None)
+        if ids:
+            with _buoni_live_cond:
+                for bid in ids:
+                    _buoni_live_versioni[bid] = _buoni_live_versioni.get(bid, 0) + 1
+                _buoni_live_cond.notify_all()
+
+    @event.listens_for(SessionLocal.session_factory, "after_rollback")
+    def _buoni_live_dopo_rollback(session_db):
+        session_db.info.pop("_buoni_live", None)
+
+    def _contatori_ricostruisci(db, buoni):
+        """Ricalcola da zero i contatori dei buoni con due query raggruppate (senza commit).
+
+        Righe: SUM(colli_previsti) per buono e codice entrata (chiave QR già salvata in
+        codice_entrata_key); scansioni: COUNT per buono, codice ed esito, con la chiave
+        calcolata una volta per codice distinto.
+        """
+        buoni = [b for b in buoni if b is not None]
+        ids = [b.id for b in buoni]
+        if not ids:
+            return
+        db.flush()  # righe/scansioni appena aggiunte (la sessione non fa autoflush)
+        for bid in ids:
+            _buoni_live_segna(db, bid)
+        db.query(BuonoCaricoContatore).filter(
+            BuonoCaricoContatore.buono_id.in_(ids)
+        ).delete(synchronize_session=False)
+
+        chiavi = {}
+
+        def _chiave(cod):
+            if cod not in chiavi:
+                chiavi[cod] = _key_codice_entrata_buono(cod)
+            return chiavi[cod]
+
+        righe_by_buono = defaultdict(list)
+        for bid, cod, chiave, colli, primo_id in (
+            db.query(
+                BuonoCaricoRiga.buono_id,
+                BuonoCaricoRiga.codice_entrata,
+                BuonoCaricoRiga.codice_entrata_key,
+                func.sum(BuonoCaricoRiga.colli_previsti),
+                func.min(BuonoCaricoRiga.id),
+            )
+            .filter(BuonoCaricoRiga.buono_id.in_(ids))
+            .group_by(BuonoCaricoRiga.buono_id, BuonoCaricoRiga.codice_entrata, BuonoCaricoRiga.codice_entrata_key)
+            .all()
+        ):
+            cod = (cod or "").strip()
+            if cod and chiave:
+                chiavi.setdefault(cod, chiave)
+            righe_by_buono[bid].append((primo_id, cod, int(colli or 0)))
+
+        scan_by_buono = defaultdict(list)
+        for bid, cod, esito, n in (
+            db.query(
+                BuonoCaricoScan.buono_id,
+                BuonoCaricoScan.codice_scansionato,
+                BuonoCaricoScan.esito,
+                func.count(BuonoCaricoScan.id),
+            )
+            .filter(
+                BuonoCaricoScan.buono_id.in_(ids),
+                BuonoCaricoScan.esito.in_(["OK", "ERRORE", "SBAGLIATO"])
+            )
+            .group_by(BuonoCaricoScan.buono_id, BuonoCaricoScan.codice_scansionato, BuonoCaricoScan.esito)
+            .all()
+        ):
+            scan_by_buono[bid].append(((cod or "").strip(), esito, int(n or 0)))
+
+        records = []
+        for buono in buoni:
+            expected_by_key = {}
+            canonical_by_key = {}
+            righe = sorted(righe_by_buono.get(buono.id, []))
+            if righe:
+                previsti = sum(colli for _, _, colli in righe)
+                for _, cod, colli in righe:
+                    if not cod:
+                        continue
+                    k = _chiave(cod)
+                    expected_by_key[k] = expected_by_key.get(k, 0) + colli
+                    canonical_by_key.setdefault(k, cod)
+            else:
+                previsti = int(buono.pallet_previsti or 0)
+                cod = (buono.codice_entrata or "").strip()
+                if cod:
+                    for c in [x.strip() for x in cod.split(";") if x.strip()]:
+                        k = _chiave(c)
+                        expected_by_key[k] = expected_by_key.get(k, 0) + int(buono.pallet_previsti or 0)
+                        canonical_by_key.setdefault(k, c)
+
+            ok_by_key = {}
+            errori_by_key = {}
+            ok_scansioni = 0
+            errori = 0
+            for cod, esito, n in scan_by_buono.get(buono.id, []):
+                k = _chiave(cod) if cod else None
+                if esito == "OK":
+                    ok_scansioni += n
+                    if k:
+                        ok_by_key[k] = ok_by_key.get(k, 0) + n
+                else:
+                    errori += n
+                    if k and esito == "ERRORE":
+                        errori_by_key[k] = errori_by_key.get(k, 0) + n
+
+            ok = sum(min(int(ok_by_key.get(k, 0)), int(prev or 0)) for k, prev in expected_by_key.items())
+            # fallback vecchi buoni senza righe/codici
+            if not expected_by_key:
+                ok = ok_scansioni
+
+            for k, prev in expected_by_key.items():
+                records.append(dict(
+                    buono_id=buono.id, qr_key=k, codice=canonical_by_key.get(k),
+                    previsti=prev, ok=ok_by_key.get(k, 0), errori=errori_by_key.get(k, 0),
+                ))
+            records.append(dict(
+                buono_id=buono.id, qr_key=BUONO_CONTATORE_TOTALE, codice=None,
+                previsti=previsti, ok=ok, errori=errori,
+            ))
+        db.execute(BuonoCaricoContatore.__table__.insert(), records)
+
+
+    def _contatori_assicura(db, buoni):
+        """Ricostruisce e salva i contatori dei buoni che non li hanno ancora."""
+        ids = [b.id for b in buoni]
+        if not ids:
+            return
+        presenti = {
+            bid for (bid,) in db.query(BuonoCaricoContatore.buono_id).filter(
+                BuonoCaricoContatore.buono_id.in_(ids),
+                BuonoCaricoContatore.qr_key == BUONO_CONTATORE_TOTALE
+            ).all()
+        }
+        mancanti = [b for b in buoni if b.id not in presenti]
+        if not mancanti:
+            return
+        try:
+            _contatori_ricostruisci(db, mancanti)
+            db.commit()
+        except IntegrityError:
+            # Ricostruiti nel frattempo da un'altra richiesta: valgono quelli.
+            db.rollback()
+
+
+    def _contatori_buono(db, buono):
+        """Contatori del buono per chiave QR (compresa '__TOTALE__'), in ordine di riga."""
+        _contatori_assicura(db, [buono])
+        rows = db.query(BuonoCaricoContatore).filter(
+            BuonoCaricoContatore.buono_id == buono.id
+        ).order_by(BuonoCaricoContatore.id.asc()).all()
+        return {c.qr_key: c for c in rows}
+
+
+    def _contatore_incrementa(db, buono_id, qr_key, campo, n=1, entro_previsti=False):
+        """Somma n al contatore con un UPDATE atomico.
+
+        Con entro_previsti=True aggiorna solo se ok + n non supera i previsti:
+        restituisce False se il QR (o il buono) è già completo.
+        """
+        col = getattr(BuonoCaricoContatore, campo)
+        q = db.query(BuonoCaricoContatore).filter(
+            BuonoCaricoContatore.buono_id == buono_id,
+            BuonoCaricoContatore.qr_key == qr_key
+        )
+        if entro_previsti:
+            q = q.filter(BuonoCaricoContatore.ok + n <= BuonoCaricoContatore.previsti)
+        _buoni_live_segna(db, buono_id)
+        return q.update({col: col + n}, synchronize_session=False) > 0
+
+
+    def _contatore_totale(db, buono_id):
+        """Riga '__TOTALE__' del buono riletta dal DB (dopo gli UPDATE atomici)."""
+        return db.query(BuonoCaricoContatore).filter(
+            BuonoCaricoContatore.buono_id == buono_id,
+            BuonoCaricoContatore.qr_key == BUONO_CONTATORE_TOTALE
+        ).populate_existing().first()
 
 
     def _conteggi_qr_buono_carico(db, buono):
@@ -622,93 +1022,86 @@ def register_buoni_qr_routes(app_obj, deps):
         ok_by_key = scansioni OK registrate per QR
         canonical_by_key = codice originale da mostrare/salvare
         """
-        righe = _righe_buono_carico(db, buono)
-
         expected_by_key = {}
+        ok_by_key = {}
         canonical_by_key = {}
+        for k, c in _contatori_buono(db, buono).items():
+            if k == BUONO_CONTATORE_TOTALE:
+                continue
+            expected_by_key[k] = int(c.previsti or 0)
+            if c.ok:
+                ok_by_key[k] = int(c.ok)
+            canonical_by_key[k] = c.codice or ""
+        return expected_by_key, ok_by_key, canonical_by_key
 
-        if righe:
-            for r in righe:
-                cod = (r.codice_entrata or "").strip()
-                if not cod:
-                    continue
-                k = _key_codice_entrata_buono(cod)
-                expected_by_key[k] = expected_by_key.get(k, 0) + int(r.colli_previsti or 0)
-                canonical_by_key.setdefault(k, cod)
-        else:
-            cod = (buono.codice_entrata or "").strip()
-            if cod:
-                for c in [x.strip() for x in cod.split(";") if x.strip()]:
-                    k = _key_codice_entrata_buono(c)
-                    expected_by_key[k] = expected_by_key.get(k, 0) + int(buono.pallet_previsti or 0)
-                    canonical_by_key.setdefault(k, c)
 
-        ok_by_key = {}
-        scansioni_ok = db.query(BuonoCaricoScan).filter(
-            BuonoCaricoScan.buono_id == buono.id,
-            BuonoCaricoScan.esito == "OK"
-        ).all()
-
-        for s in scansioni_ok:
-            cod = (s.codice_scansionato or "").strip()
-            if not cod:
-                continue
-            k = _key_codice_entrata_buono(cod)
-            ok_by_key[k] = ok_by_key.get(k, 0) + 1
+    def _contatore_per_scansione(db, buoni, codice_scansionato):
+        """Contatore QR compatibile con il codice scansionato, cercando sui buoni nell'ordine dato.
 
-        return expected_by_key, ok_by_key, canonical_by_key
+        Lookup per uguaglianza su (buono_id, qr_key) con la chiave canonica del codice, che
+        copre anche i barcode vecchi senza cliente; il confronto tollerante sul codice
+        normalizzato resta solo per i codici non trovati (es. letti senza trattini).
+        """
+        if not buoni:
+            return None
+        _contatori_assicura(db, buoni)
+        ids = [b.id for b in buoni]
+        ordine = {bid: i for i, bid in enumerate(ids)}
+
+        chiave = _key_codice_entrata_buono(codice_scansionato)
+        trovati = db.query(BuonoCaricoContatore).filter(
+            BuonoCaricoContatore.buono_id.in_(ids),
+            BuonoCaricoContatore.qr_key == chiave
+        ).all() if chiave else []
+
+        if not trovati and chiave:
+            candidati = db.query(BuonoCaricoContatore).filter(
+                BuonoCaricoContatore.buono_id.in_(ids),
+                BuonoCaricoContatore.qr_key != BUONO_CONTATORE_TOTALE
+            ).all()
+            trovati = [c for c in candidati if normalize_text_key(c.codice) == chiave]
+
+        if not trovati:
+            return None
+        return min(trovati, key=lambda c: (ordine.get(c.buono_id, len(ordine)), c.id))
 
 
     def _match_key_qr_buono(db, buono, codice_scansionato):
         """Trova la chiave QR del buono compatibile con il codice scansionato."""
-        expected_by_key, ok_by_key, canonical_by_key = _conteggi_qr_buono_carico(db, buono)
+        contatore = _contatore_per_scansione(db, [buono], codice_scansionato)
+        if contatore is None:
+            return None, codice_scansionato
+        return contatore.qr_key, contatore.codice or codice_scansionato
 
-        scan_variants = {_key_codice_entrata_buono(v) for v in _codice_entrata_varianti(codice_scansionato)}
-        scan_variants.add(_key_codice_entrata_buono(codice_scansionato))
 
-        for k in expected_by_key.keys():
-            if k in scan_variants:
-                return k, canonical_by_key.get(k) or codice_scansionato
-
-        # confronto extra tollerante sulle varianti testuali
-        scan_norms = {normalize_text_key(v) for v in _codice_entrata_varianti(codice_scansionato)}
-        scan_norms.add(normalize_text_key(codice_scansionato))
-        for k, canon in canonical_by_key.items():
-            vars_norm = {normalize_text_key(v) for v in _codice_entrata_varianti(canon)}
-            if vars_norm.intersection(scan_norms):
-                return k, canon
-
-        return None, codice_scansionato
+    def _stats_buoni_carico(db, buoni):
+        """Statistiche di più buoni in blocco: una query sulle righe '__TOTALE__' dei contatori."""
+        ids = [b.id for b in buoni]
+        if not ids:
+            return {}
+        _contatori_assicura(db, buoni)
+        totali = {
+            c.buono_id: c for c in db.query(BuonoCaricoContatore).filter(
+                BuonoCaricoContatore.buono_id.in_(ids),
+                BuonoCaricoContatore.qr_key == BUONO_CONTATORE_TOTALE
+            ).populate_existing().all()
+        }
+        out = {}
+        for bid in ids:
+            tot = totali.get(bid)
+            previsti = int(tot.previsti or 0) if tot else 0
+            ok = int(tot.ok or 0) if tot else 0
+            out[bid] = {
+                "ok": ok,
+                "mancanti": max(0, previsti - ok),
+                "previsti": previsti
+            }
+        return out
 
 
     def _stats_buono_carico(db, buono):
         """Statistiche buono carico: conta i colli reali per QR, non solo le righe."""
-        righe = _righe_buono_carico(db, buono)
-
-        if righe:
-            previsti = sum(int(r.colli_previsti or 0) for r in righe)
-        else:
-            previsti = int(buono.pallet_previsti or 0)
-
-        expected_by_key, ok_by_key, canonical_by_key = _conteggi_qr_buono_carico(db, buono)
-
-        ok = 0
-        for k, prev in expected_by_key.items():
-            ok += min(int(ok_by_key.get(k, 0)), int(prev or 0))
-
-        # fallback vecchi buoni senza righe/codici
-        if not expected_by_key:
-            ok = db.query(BuonoCaricoScan).filter(
-                BuonoCaricoScan.buono_id == buono.id,
-                BuonoCaricoScan.esito == "OK"
-            ).count()
-
-        return {
-            "ok": ok,
-            "mancanti": max(0, previsti - ok),
-            "previsti": previsti
-        }
-
+        return _stats_buoni_carico(db, [buono])[buono.id]
 
     def _riepilogo_scansioni_buono_carico(db, buono):
         """Riepiloga arrivi caricati/mancanti e scansioni non presenti nel buono.
@@ -735,7 +1128,7 @@ def register_buoni_qr_routes(app_obj, deps):
 
         for r in righe:
             cod = (r.codice_entrata or "").strip()
-            k = _key_codice_entrata_buono(cod)
+            k = r.codice_entrata_key or _key_codice_entrata_buono(cod)
             prev_riga = int(r.colli_previsti or 0)
             ok_disponibili = int(ok_by_key.get(k, 0))
             gia_usate = int(usate_by_key.get(k, 0))
@@ -769,20 +1162,79 @@ def register_buoni_qr_routes(app_obj, deps):
         }
 
 
-    def _aggiorna_stato_buono_carico(db, buono):
-        st = _stats_buono_carico(db, buono)
-        errori = db.query(BuonoCaricoScan).filter(BuonoCaricoScan.buono_id == buono.id, BuonoCaricoScan.esito.in_(["ERRORE", "SBAGLIATO"])).count()
-        if errori and st["ok"] < st["previsti"]:
+    def _stato_buono_da_totale(buono, tot):
+        previsti = int(tot.previsti or 0) if tot else 0
+        ok = int(tot.ok or 0) if tot else 0
+        errori = int(tot.errori or 0) if tot else 0
+        if errori and ok < previsti:
             buono.stato = "ERRORE"
-        elif st["ok"] >= st["previsti"] and st["previsti"] > 0:
+        elif ok >= previsti and previsti > 0:
             buono.stato = "COMPLETATO"
-        elif st["ok"] > 0:
+        elif ok > 0:
             buono.stato = "PARZIALE"
         else:
             buono.stato = "DA CARICARE"
+
+
+    def _aggiorna_stato_buono_carico(db, buono):
+        _contatori_assicura(db, [buono])
+        _stato_buono_da_totale(buono, _contatore_totale(db, buono.id))
         db.commit()
 
 
+    def _registra_scansione_buono(db, buono, codice, contatore, scanned_at=None, id_offline=None,
+                                  msg_sbagliato=BUONO_MSG_SBAGLIATO):
+        """Valuta la scansione sul buono e registra scansione, contatori e stato (commit a carico del chiamante).
+
+        contatore = contatore QR trovato con _contatore_per_scansione (None = QR non del buono).
+        """
+        if contatore is None:
+            esito = "SBAGLIATO"
+            msg = msg_sbagliato
+            codice_salvato = codice
+            _contatore_incrementa(db, buono.id, BUONO_CONTATORE_TOTALE, "errori")
+        else:
+            key_qr = contatore.qr_key
+            codice_salvato = contatore.codice or codice
+            previsti_qr = int(contatore.previsti or 0)
+            if previsti_qr <= 0:
+                # QR senza colli previsti: conta solo se il buono non è già completo
+                tot = _contatore_totale(db, buono.id)
+                if tot and int(tot.ok or 0) >= int(tot.previsti or 0):
+                    esito = "ERRORE"
+                else:
+                    _contatore_incrementa(db, buono.id, key_qr, "ok")
+                    esito = "OK"
+            elif not _contatore_incrementa(db, buono.id, key_qr, "ok", entro_previsti=True):
+                esito = "DUPLICATO"
+                msg = "Questo arrivo/QR ha già raggiunto tutti i colli previsti su questo buono."
+            elif not _contatore_incrementa(db, buono.id, BUONO_CONTATORE_TOTALE, "ok", entro_previsti=True):
+                _contatore_incrementa(db, buono.id, key_qr, "ok", n=-1)
+                esito = "ERRORE"
+            else:
+                esito = "OK"
+            if esito == "OK":
+                db.refresh(contatore)
+                msg = f"Arrivo/collo caricato correttamente ({int(contatore.ok or 0)}/{previsti_qr})."
+            if esito == "ERRORE":
+                msg = "Colli in più: hai già raggiunto il numero previsto per questo buono."
+                _contatore_incrementa(db, buono.id, key_qr, "errori")
+                _contatore_incrementa(db, buono.id, BUONO_CONTATORE_TOTALE, "errori")
+
+        scan = BuonoCaricoScan(
+            buono_id=buono.id,
+            codice_scansionato=codice_salvato,
+            esito=esito,
+            messaggio=msg,
+            scanned_at=scanned_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            scanned_by=_current_username_for_audit(),
+            id_offline=id_offline
+        )
+        db.add(scan)
+        _stato_buono_da_totale(buono, _contatore_totale(db, buono.id))
+        return scan
+
+
     @app.route("/buono_carico_da_riga", methods=["POST"])
     @login_required
     @require_admin_or_magazzino
@@ -797,8 +1249,6 @@ def register_buoni_qr_routes(app_obj, deps):
 
         db = SessionLocal()
         try:
-            Base.metadata.create_all(engine)
-
             articoli = (
                 db.query(Articolo)
                 .filter(Articolo.id_articolo.in_([int(x) for x in ids]))
@@ -939,7 +1389,6 @@ def register_buoni_qr_routes(app_obj, deps):
     def buoni_carico():
         db = SessionLocal()
         try:
-            Base.metadata.create_all(engine)
             if request.method == "POST":
                 cliente = validate_cliente_or_raise(request.form.get("cliente"))
                 fornitore = (request.form.get("fornitore") or "").strip()
@@ -990,7 +1439,7 @@ def register_buoni_qr_routes(app_obj, deps):
                 return redirect(url_for("dettaglio_buono_carico", buono_id=buono.id))
 
             buoni = db.query(BuonoCarico).order_by(BuonoCarico.id.desc()).limit(300).all()
-            stats = {b.id: _stats_buono_carico(db, b) for b in buoni}
+            stats = _stats_buoni_carico(db, buoni)
             return render_template_string(BUONI_CARICO_HTML, buoni=buoni, stats=stats, clienti=get_clienti_utenti(), oggi=date.today().strftime("%Y-%m-%d"))
         except Exception as e:
             db.rollback()
@@ -1019,6 +1468,8 @@ def register_buoni_qr_routes(app_obj, deps):
             riepilogo_scan = _riepilogo_scansioni_buono_carico(db, buono)
             return render_template_string(
                 BUONO_CARICO_DETTAGLIO_HTML,
+                scansioni_offline=SCANSIONI_OFFLINE_HTML,
+                buono_live=BUONO_LIVE_HTML,
                 buono=buono,
                 righe=_righe_buono_carico(db, buono),
                 scansioni=scansioni,
@@ -1029,6 +1480,128 @@ def register_buoni_qr_routes(app_obj, deps):
         finally:
             db.close()
 
+    def _buono_live_contatori(db, buono):
+        """Contatori del buono per il flusso live: totale, stato e valori per QR."""
+        totale = None
+        qr = {}
+        for c in db.query(BuonoCaricoContatore).filter(
+            BuonoCaricoContatore.buono_id == buono.id
+        ).order_by(BuonoCaricoContatore.id.asc()).all():
+            if c.qr_key == BUONO_CONTATORE_TOTALE:
+                totale = c
+            else:
+                qr[c.qr_key] = {"codice": c.codice, "previsti": int(c.previsti or 0), "ok": int(c.ok or 0), "errori": int(c.errori or 0)}
+        previsti = int(totale.previsti or 0) if totale else 0
+        ok = int(totale.ok or 0) if totale else 0
+        return {
+            "stato": buono.stato or "DA CARICARE",
+            "pallet_previsti": int(buono.pallet_previsti or 0),
+            "previsti": previsti,
+            "ok": ok,
+            "mancanti": max(0, previsti - ok),
+            "errori": int(totale.errori or 0) if totale else 0,
+            "qr": qr,
+        }
+
+    def _evento_sse(nome, dati, id_evento=None):
+        testa = f"id: {id_evento}\n" if id_evento is not None else ""
+        return f"{testa}event: {nome}\ndata: {json.dumps(dati, ensure_ascii=False)}\n\n"
+
+    @app.route("/buoni_carico/<int:buono_id>/live", methods=["GET"])
+    @login_required
+    @require_admin_or_magazzino
+    def live_buono_carico(buono_id):
+        """Flusso SSE del buono: scansioni nuove (event: scansione, id = id scansione) e
+        contatori aggiornati (event: contatori), condiviso da operatori e ufficio.
+
+        Riparte da Last-Event-ID (riconnessione automatica del browser) o da ?dopo=<id>.
+        Con server multi-thread il flusso resta aperto fino a BUONI_LIVE_DURATA_S; con worker
+        sincroni fa un solo giro e il browser si riconnette dopo 'retry', senza occupare il worker.
+        """
+        db = SessionLocal()
+        try:
+            buono = db.query(BuonoCarico).filter(BuonoCarico.id == buono_id).first()
+            if not buono:
+                abort(404)
+            _contatori_assicura(db, [buono])
+            ultimo = str(request.headers.get("Last-Event-ID") or request.args.get("dopo") or "").strip()
+            if ultimo.isdigit():
+                ultimo_id = int(ultimo)
+            else:
+                ultimo_id = db.query(func.max(BuonoCaricoScan.id)).filter(BuonoCaricoScan.buono_id == buono_id).scalar() or 0
+        finally:
+            db.close()
+
+        from flask import stream_with_context
+
+        durata = BUONI_LIVE_DURATA_S if request.environ.get("wsgi.multithread") else 0
+
+        def flusso():
+            nonlocal ultimo_id
+            yield f"retry: {1000 if durata else BUONI_LIVE_ATTESA_S * 1000}\n\n"
+            inviati = None
+            scansioni_inviate = set()
+            fine = time.monotonic() + durata
+            while True:
+                with _buoni_live_cond:
+                    versione = _buoni_live_versioni.get(buono_id, 0)
+                db = SessionLocal()
+                try:
+                    buono = db.query(BuonoCarico).filter(BuonoCarico.id == buono_id).first()
+                    if buono is None:
+                        yield _evento_sse("eliminato", {"buono_id": buono_id})
+                        return
+                    lette = db.query(BuonoCaricoScan).filter(
+                        BuonoCaricoScan.buono_id == buono_id,
+                        BuonoCaricoScan.id > ultimo_id - BUONI_LIVE_SOVRAPPOSIZIONE
+                    ).order_by(BuonoCaricoScan.id.asc()).limit(BUONI_LIVE_MAX_SCANSIONI).all()
+                    contatori = _buono_live_contatori(db, buono)
+                except Exception as e:
+                    try:
+                        scrivi_log_errore("Errore flusso live buono carico", e)
+                    except Exception:
+                        pass
+                    return
+                finally:
+                    db.close()
+
+                nuove = [s for s in lette if s.id not in scansioni_inviate]
+                for s in nuove:
+                    scansioni_inviate.add(s.id)
+                    # L'id dell'evento resta il massimo inviato: è il punto di ripresa.
+                    ultimo_id = max(ultimo_id, s.id)
+                    yield _evento_sse("scansione", {
+                        "id": s.id,
+                        "esito": s.esito,
+                        "codice": s.codice_scansionato,
+                        "messaggio": s.messaggio,
+                        "scanned_at": s.scanned_at,
+                        "scanned_by": s.scanned_by,
+                    }, ultimo_id)
+                scansioni_inviate = {i for i in scansioni_inviate if i > ultimo_id - BUONI_LIVE_SOVRAPPOSIZIONE}
+                if contatori != inviati:
+                    inviati = contatori
+                    yield _evento_sse("contatori", contatori)
+                elif not nuove:
+                    yield ": ping\n\n"
+
+                if len(lette) >= BUONI_LIVE_MAX_SCANSIONI:
+                    continue
+                resto = fine - time.monotonic()
+                if resto <= 0:
+                    return
+                with _buoni_live_cond:
+                    _buoni_live_cond.wait_for(
+                        lambda: _buoni_live_versioni.get(buono_id, 0) != versione,
+                        timeout=min(BUONI_LIVE_ATTESA_S, resto)
+                    )
+
+        return app.response_class(
+            stream_with_context(flusso()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     @app.route("/buoni_carico/<int:buono_id>/scansiona", methods=["POST"])
     @login_required
     @require_admin_or_magazzino
@@ -1050,39 +1623,10 @@ def register_buoni_qr_routes(app_obj, deps):
             if m:
                 codice = unquote(m.group(1)).strip()
 
-            expected_by_key, ok_by_key, canonical_by_key = _conteggi_qr_buono_carico(db, buono)
-            key_qr, codice_salvato = _match_key_qr_buono(db, buono, codice)
-
-            if not key_qr:
-                esito = "SBAGLIATO"
-                msg = "Arrivo sbagliato: questo QR non è collegato a questo buono di carico oppure non è da caricare."
-            else:
-                previsti_qr = int(expected_by_key.get(key_qr, 0))
-                gia_ok_qr = int(ok_by_key.get(key_qr, 0))
-
-                if gia_ok_qr >= previsti_qr and previsti_qr > 0:
-                    esito = "DUPLICATO"
-                    msg = "Questo arrivo/QR ha già raggiunto tutti i colli previsti su questo buono."
-                else:
-                    st = _stats_buono_carico(db, buono)
-                    if st["ok"] >= st["previsti"]:
-                        esito = "ERRORE"
-                        msg = "Colli in più: hai già raggiunto il numero previsto per questo buono."
-                    else:
-                        esito = "OK"
-                        msg = f"Arrivo/collo caricato correttamente ({gia_ok_qr + 1}/{previsti_qr})."
-
-            scan = BuonoCaricoScan(
-                buono_id=buono.id,
-                codice_scansionato=codice_salvato,
-                esito=esito,
-                messaggio=msg,
-                scanned_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                scanned_by=_current_username_for_audit()
-            )
-            db.add(scan)
+            contatore = _contatore_per_scansione(db, [buono], codice)
+            scan = _registra_scansione_buono(db, buono, codice, contatore)
+            esito, msg = scan.esito, scan.messaggio
             db.commit()
-            _aggiorna_stato_buono_carico(db, buono)
 
             flash(msg, "success" if esito == "OK" else ("warning" if esito == "DUPLICATO" else "danger"))
             return redirect(url_for("dettaglio_buono_carico", buono_id=buono.id))
@@ -1185,6 +1729,8 @@ def register_buoni_qr_routes(app_obj, deps):
         window.addEventListener('click', function(){ setTimeout(function(){ if(input) input.focus(); }, 100); });
       })();
     </script>
+
+    {{ scansioni_offline|safe }}
     {% endblock %}
     """
 
@@ -1195,83 +1741,137 @@ def register_buoni_qr_routes(app_obj, deps):
             codice = unquote(m.group(1)).strip()
         return codice
 
-    def _registra_scansione_qr_operativa(db, codice_raw, buono_id=None):
+    def _registra_scansione_qr_operativa(db, codice_raw, buono_id=None, scanned_at=None, id_offline=None, commit=True,
+                                         msg_sbagliato=BUONO_MSG_SBAGLIATO_OPERATIVO):
         """Registra una scansione da scanner fisico o Wi-Fi.
         Se buono_id non è indicato, cerca automaticamente il buono QR collegato.
+        Con commit=False fa solo flush (scansioni offline applicate in un'unica transazione).
+        msg_sbagliato è il messaggio dell'esito SBAGLIATO sul buono indicato.
         """
         codice = _pulizia_codice_qr_operativo(codice_raw)
         if not codice:
             return {"ok": False, "esito": "ERRORE", "messaggio": "Codice QR vuoto.", "buono_id": None}
 
-        buoni_da_controllare = []
-        if buono_id:
-            b = db.query(BuonoCarico).filter(BuonoCarico.id == int(buono_id)).first()
-            if b:
-                buoni_da_controllare = [b]
-        else:
-            buoni_da_controllare = (
-                db.query(BuonoCarico)
-                .filter(func.upper(func.coalesce(BuonoCarico.stato, '')).notin_(['ELIMINATO', 'COMPLETATO', 'CARICATO', 'CHIUSO']))
-                .order_by(BuonoCarico.id.desc())
-                .limit(300)
-                .all()
-            )
-            if not buoni_da_controllare:
-                buoni_da_controllare = db.query(BuonoCarico).order_by(BuonoCarico.id.desc()).limit(300).all()
-
-        buono_trovato = None
-        key_trovata = None
-        codice_salvato = codice
-        for b in buoni_da_controllare:
-            key_qr, cod_ok = _match_key_qr_buono(db, b, codice)
-            if key_qr:
-                buono_trovato = b
-                key_trovata = key_qr
-                codice_salvato = cod_ok
-                break
-
-        if not buono_trovato:
+        buoni_da_controllare = _buoni_candidati_scansione(db, buono_id)
+
+        # un solo lookup indicizzato sui contatori di tutti i buoni candidati
+        contatore = _contatore_per_scansione(db, buoni_da_controllare, codice)
+        if contatore is None:
             # se era stato scelto un buono specifico, registriamo comunque la scansione sbagliata su quel buono
             if buoni_da_controllare:
                 buono_trovato = buoni_da_controllare[0]
-                scan = BuonoCaricoScan(
-                    buono_id=buono_trovato.id,
-                    codice_scansionato=codice,
-                    esito="SBAGLIATO",
-                    messaggio="QR non collegato a questo buono.",
-                    scanned_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    scanned_by=_current_username_for_audit()
-                )
-                db.add(scan); db.commit()
-                return {"ok": False, "esito": "SBAGLIATO", "messaggio": scan.messaggio, "buono_id": buono_trovato.id}
+                scan = _registra_scansione_buono(db, buono_trovato, codice, None, scanned_at=scanned_at, id_offline=id_offline,
+                                                 msg_sbagliato=msg_sbagliato)
+                res = {"ok": False, "esito": "SBAGLIATO", "messaggio": scan.messaggio, "buono_id": buono_trovato.id}
+                db.commit() if commit else db.flush()
+                return res
             return {"ok": False, "esito": "NON_TROVATO", "messaggio": "Nessun buono QR collegato a questo codice.", "buono_id": None}
 
-        expected_by_key, ok_by_key, canonical_by_key = _conteggi_qr_buono_carico(db, buono_trovato)
-        previsti_qr = int(expected_by_key.get(key_trovata, 0))
-        gia_ok_qr = int(ok_by_key.get(key_trovata, 0))
-        if gia_ok_qr >= previsti_qr and previsti_qr > 0:
-            esito = "DUPLICATO"
-            msg = "Questo arrivo/QR ha già raggiunto tutti i colli previsti su questo buono."
-        else:
-            st = _stats_buono_carico(db, buono_trovato)
-            if st["ok"] >= st["previsti"]:
-                esito = "ERRORE"
-                msg = "Colli in più: hai già raggiunto il numero previsto per questo buono."
-            else:
-                esito = "OK"
-                msg = f"Arrivo/collo caricato correttamente ({gia_ok_qr + 1}/{previsti_qr})."
+        buono_trovato = next(b for b in buoni_da_controllare if b.id == contatore.buono_id)
+        scan = _registra_scansione_buono(db, buono_trovato, codice, contatore, scanned_at=scanned_at, id_offline=id_offline)
+        res = {"ok": scan.esito == "OK", "esito": scan.esito, "messaggio": scan.messaggio, "buono_id": buono_trovato.id, "buono": buono_trovato.codice_buono}
+        db.commit() if commit else db.flush()
+        return res
 
-        scan = BuonoCaricoScan(
-            buono_id=buono_trovato.id,
-            codice_scansionato=codice_salvato,
-            esito=esito,
-            messaggio=msg,
-            scanned_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            scanned_by=_current_username_for_audit()
+    def _buoni_candidati_scansione(db, buono_id=None):
+        if buono_id:
+            return db.query(BuonoCarico).filter(BuonoCarico.id == int(buono_id)).all()
+        buoni = (
+            db.query(BuonoCarico)
+            .filter(func.upper(func.coalesce(BuonoCarico.stato, '')).notin_(['ELIMINATO', 'COMPLETATO', 'CARICATO', 'CHIUSO']))
+            .order_by(BuonoCarico.id.desc())
+            .limit(300)
+            .all()
         )
-        db.add(scan); db.commit()
-        _aggiorna_stato_buono_carico(db, buono_trovato)
-        return {"ok": esito == "OK", "esito": esito, "messaggio": msg, "buono_id": buono_trovato.id, "buono": buono_trovato.codice_buono}
+        return buoni or db.query(BuonoCarico).order_by(BuonoCarico.id.desc()).limit(300).all()
+
+    # --- SCANSIONI OFFLINE (coda del service worker inviata in blocco) ---
+    BUONI_SCAN_OFFLINE_MAX = 500
+
+    def _ora_scansione_offline(valore):
+        """Data/ora di una scansione offline: epoch in millisecondi o ISO 8601; None se non valida."""
+        if valore is None or valore == '':
+            return datetime.now()
+        if isinstance(valore, bool):
+            return None
+        if isinstance(valore, str) and valore.strip().isdigit():
+            valore = int(valore.strip())
+        if isinstance(valore, (int, float)):
+            try:
+                return datetime.fromtimestamp(valore / 1000.0)
+            except (OverflowError, OSError, ValueError):
+                return None
+        try:
+            dt = datetime.fromisoformat(str(valore).strip().replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if dt.tzinfo is not None:
+            dt = dt.astimezone().replace(tzinfo=None)
+        return dt
+
+    def _applica_scansioni_offline(db, voci):
+        """Applica le scansioni offline in ordine di data/ora, senza commit.
+
+        voci = [{"id": "...", "codice": "...", "buono_id": facoltativo, "ts": ms o ISO, "origine": facoltativa}, ...]
+        origine "buono" = scansione dal dettaglio del buono: stesso messaggio della scansione online.
+        Restituisce un esito per voce, nell'ordine ricevuto: OK / DUPLICATO / SBAGLIATO / ERRORE.
+        Una voce con id già registrato (reinvio dopo risposta persa) restituisce l'esito salvato.
+        """
+        risultati = []
+        da_applicare = []
+        for i, voce in enumerate(voci):
+            voce = voce if isinstance(voce, dict) else {}
+            id_offline = str(voce.get('id') or '').strip()[:64] or None
+            res = {"id": id_offline, "esito": "ERRORE", "messaggio": "", "buono_id": None}
+            risultati.append(res)
+            codice = _pulizia_codice_qr_operativo(str(voce.get('codice') or voce.get('codice_scansionato') or ''))
+            ora = _ora_scansione_offline(voce.get('ts'))
+            buono_id = str(voce.get('buono_id') or '').strip() or None
+            if not codice:
+                res["messaggio"] = "Codice QR vuoto."
+            elif ora is None:
+                res["messaggio"] = "Data/ora della scansione non valida."
+            elif buono_id and not buono_id.isdigit():
+                res["messaggio"] = "Buono non valido."
+            else:
+                msg = BUONO_MSG_SBAGLIATO if voce.get('origine') == 'buono' else BUONO_MSG_SBAGLIATO_OPERATIVO
+                da_applicare.append((ora, i, id_offline, codice, buono_id, msg))
+
+        ids = [x[2] for x in da_applicare if x[2]]
+        registrate = {}
+        if ids:
+            registrate = {
+                s.id_offline: s for s in db.query(BuonoCaricoScan).filter(BuonoCaricoScan.id_offline.in_(ids)).all()
+            }
+        # contatori pronti prima di applicare il blocco (la ricostruzione fa commit)
+        candidati = {b.id: b for b in _buoni_candidati_scansione(db)}
+        for bid in {x[4] for x in da_applicare if x[4]}:
+            candidati.update({b.id: b for b in _buoni_candidati_scansione(db, bid)})
+        _contatori_assicura(db, list(candidati.values()))
+
+        applicate = {}
+        for ora, i, id_offline, codice, buono_id, msg in sorted(da_applicare, key=lambda x: (x[0], x[1])):
+            res = risultati[i]
+            if id_offline in registrate:
+                s = registrate[id_offline]
+                res.update(esito=s.esito, messaggio=s.messaggio, buono_id=s.buono_id)
+                continue
+            if id_offline in applicate:
+                res.update({k: v for k, v in applicate[id_offline].items() if k != "id"})
+                continue
+            esito = _registra_scansione_qr_operativa(
+                db, codice, buono_id,
+                scanned_at=ora.strftime("%Y-%m-%d %H:%M:%S"), id_offline=id_offline, commit=False,
+                msg_sbagliato=msg,
+            )
+            res.update(
+                esito=esito.get("esito") if esito.get("esito") in ("OK", "DUPLICATO", "SBAGLIATO") else "ERRORE",
+                messaggio=esito.get("messaggio") or "",
+                buono_id=esito.get("buono_id"),
+            )
+            if id_offline:
+                applicate[id_offline] = res
+        return risultati
 
     @app.route('/scan_qr_operativo', methods=['GET'])
     @login_required
@@ -1293,7 +1893,7 @@ def register_buoni_qr_routes(app_obj, deps):
                 .limit(30)
                 .all()
             )
-            return render_template_string(SCAN_QR_OPERATIVO_HTML, buoni=buoni, ultime=ultime)
+            return render_template_string(SCAN_QR_OPERATIVO_HTML, buoni=buoni, ultime=ultime, scansioni_offline=SCANSIONI_OFFLINE_HTML)
         finally:
             db.close()
 
@@ -1340,6 +1940,31 @@ def register_buoni_qr_routes(app_obj, deps):
             db.close()
 
 
+    @app.route('/api/buoni_carico/scansioni_offline', methods=['POST'])
+    @login_required
+    @require_admin_or_magazzino
+    def api_scansioni_offline_buoni_carico():
+        """Scansioni raccolte offline dal service worker, applicate in blocco in una sola transazione."""
+        payload = request.get_json(silent=True)
+        voci = payload.get('scansioni') if isinstance(payload, dict) else None
+        if not isinstance(voci, list):
+            return jsonify({"ok": False, "messaggio": 'Atteso JSON {"scansioni": [...]}.'}), 400
+        if len(voci) > BUONI_SCAN_OFFLINE_MAX:
+            return jsonify({"ok": False, "messaggio": f"Massimo {BUONI_SCAN_OFFLINE_MAX} scansioni per invio."}), 413
+        db = SessionLocal()
+        try:
+            risultati = _applica_scansioni_offline(db, voci)
+            db.commit()
+            return jsonify({"ok": True, "risultati": risultati})
+        except Exception as e:
+            db.rollback()
+            try: scrivi_log_errore('Errore scansioni offline buoni carico', e)
+            except Exception: pass
+            return jsonify({"ok": False, "messaggio": str(e)}), 500
+        finally:
+            db.close()
+
+
     @app.route("/buoni_carico/<int:buono_id>/segna_righe", methods=["POST"])
     @login_required
     @require_admin_or_magazzino
@@ -1386,7 +2011,7 @@ def register_buoni_qr_routes(app_obj, deps):
                     saltate += 1
                     continue
 
-                k = _key_codice_entrata_buono(codice)
+                k = r.codice_entrata_key or _key_codice_entrata_buono(codice)
                 previsti_totali = int(expected_by_key.get(k, 0))
                 gia_ok = int(ok_by_key.get(k, 0))
                 colli_riga = int(r.colli_previsti or 0)
@@ -1418,6 +2043,8 @@ def register_buoni_qr_routes(app_obj, deps):
                     aggiunte += 1
 
                 ok_by_key[k] = gia_ok + da_aggiungere
+                _contatore_incrementa(db, buono.id, k, "ok", n=da_aggiungere)
+                _contatore_incrementa(db, buono.id, BUONO_CONTATORE_TOTALE, "ok", n=da_aggiungere)
 
             db.commit()
             _aggiorna_stato_buono_carico(db, buono)
@@ -1476,8 +2103,6 @@ def register_buoni_qr_routes(app_obj, deps):
 
         db = SessionLocal()
         try:
-            Base.metadata.create_all(engine)
-
             buono = _trova_buono_carico_da_input(db, buono_input)
             if not buono:
                 session.pop("aggiungi_buono_carico", None)
@@ -1587,6 +2212,7 @@ def register_buoni_qr_routes(app_obj, deps):
             buono.pallet_previsti = int(buono.pallet_previsti or 0) + totale_colli_add
             buono.peso_previsto = float(buono.peso_previsto or 0) + totale_peso_add
 
+            _contatori_ricostruisci(db, [buono])
             _aggiorna_stato_buono_carico(db, buono)
             db.commit()
 
@@ -1629,12 +2255,18 @@ def register_buoni_qr_routes(app_obj, deps):
             except Exception:
                 pass
 
+            try:
+                db.query(BuonoCaricoContatore).filter(BuonoCaricoContatore.buono_id == buono.id).delete(synchronize_session=False)
+            except Exception:
+                pass
+
             try:
                 db.query(BuonoCaricoRiga).filter(BuonoCaricoRiga.buono_id == buono.id).delete(synchronize_session=False)
             except Exception:
                 pass
 
             db.delete(buono)
+            _buoni_live_segna(db, buono_id)
             db.commit()
             flash(f"Buono di carico {codice} eliminato.", "success")
             return redirect(url_for("buoni_carico"))
@@ -512,7 +512,7 @@ def register_camy_ai_routes(app_obj, deps):
         q = db.query(Articolo)
         cliente = _current_cliente()
         if cliente:
-            q = q.filter(func.upper(Articolo.cliente) == cliente)
+            q = q.filter(Articolo.cliente_key == normalize_text_key(cliente))
         return q
 
     def _active_filter(q):
@@ -4184,7 +4184,7 @@ def register_camy_ai_routes(app_obj, deps):
         else:
             oks.append("Nessuna riga attiva con DDT di uscita.")
 
-        galvano = active.filter(_sql_norm_col(Articolo.cliente).in_([_norm('GALVANO'), _norm('GALVANO TECNICA')]))
+        galvano = active.filter(Articolo.cliente_key.in_([normalize_text_key('GALVANO'), normalize_text_key('GALVANO TECNICA')]))
         galvano_no_code = galvano.filter(or_(Articolo.codice_articolo == None, Articolo.codice_articolo == "")).count()
         galvano_no_pieces = galvano.filter(or_(Articolo.pezzo == None, Articolo.pezzo == "", Articolo.pezzo == "0", Articolo.pezzo == "0.0")).count()
         galvano_no_lot = galvano.filter(or_(Articolo.lotto == None, Articolo.lotto == "")).count()
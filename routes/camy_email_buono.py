@@ -87,13 +87,22 @@ def register_camy_email_buono_routes(app_obj, deps):
             tmp_path = Path(tmp.name)
         try:
             if suffix == ".pdf":
-                return _extract_text_from_pdf(tmp_path)
-            if suffix in (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"):
-                return _extract_text_from_image(tmp_path)
-            try:
-                return tmp_path.read_text(encoding="utf-8", errors="ignore")
-            except Exception:
-                return ""
+                estrai, tipo = _extract_text_from_pdf, "camy_pdf:v1"
+            elif suffix in (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"):
+                estrai, tipo = _extract_text_from_image, "camy_img:v1"
+            else:
+                try:
+                    return tmp_path.read_text(encoding="utf-8", errors="ignore")
+                except Exception:
+                    return ""
+            # Stesso documento già caricato: testo/OCR dalla cache documenti.
+            digest = ocr_cache_digest(tmp_path)
+            testo = ocr_cache_leggi(digest, tipo).get(0)
+            if testo is None:
+                testo = estrai(tmp_path)
+                if testo.strip():
+                    ocr_cache_salva(digest, tipo, {0: testo})
+            return testo
         finally:
             try:
                 tmp_path.unlink(missing_ok=True)
@@ -350,7 +359,7 @@ def register_camy_email_buono_routes(app_obj, deps):
 
         q = db.query(Articolo).filter(or_(Articolo.data_uscita == None, Articolo.data_uscita == ""))
         if cliente:
-            q = q.filter(func.upper(Articolo.cliente) == cliente.upper())
+            q = q.filter(Articolo.cliente_key == normalize_text_key(cliente))
 
         conditions = []
         if code:
@@ -11,7 +11,7 @@ Regole operative:
 import re
 from datetime import date, datetime, timedelta
 from html import escape
-from sqlalchemy import or_, func
+from sqlalchemy import or_
 
 CLIENTE_PROTOCOLLO_OBBLIGATORIO = {"FINCANTIERI", "FINCANTIERI ARMATORE", "FINCANTIERI SCOPERTO"}
 CLIENTI_MEZZO_OBBLIGATORIO = {"FINCANTIERI", "FINCANTIERI ARMATORE", "FINCANTIERI SCOPERTO"}
@@ -128,7 +128,7 @@ def _riga_link(row):
     return f"ID <b>{rid}</b> | Arrivo {arr} | Codice {cod} | Pos. {pos} | Protocollo {proto}"
 
 
-def _filtered_rows_for_client_scope(db, Articolo, session, limit=5000):
+def _filtered_rows_for_client_scope(db, Articolo, session, normalize_text_key, limit=5000):
     cliente_bloccato = ""
     try:
         role = session.get('role') if session is not None else ''
@@ -140,7 +140,7 @@ def _filtered_rows_for_client_scope(db, Articolo, session, limit=5000):
 
     q = db.query(Articolo)
     if cliente_bloccato:
-        q = q.filter(func.upper(Articolo.cliente) == cliente_bloccato)
+        q = q.filter(Articolo.cliente_key == normalize_text_key(cliente_bloccato))
     try:
         return q.order_by(Articolo.id_articolo.desc()).limit(limit).all()
     except Exception:
@@ -239,7 +239,7 @@ def camy_daily_briefing(db, deps, msg=""):
     if Articolo is None:
         return "CAMY non riesce a leggere le tabelle del gestionale."
 
-    recent_art = _filtered_rows_for_client_scope(db, Articolo, session, limit=5000)
+    recent_art = _filtered_rows_for_client_scope(db, Articolo, session, deps.get("normalize_text_key"), limit=5000)
     att_map = _att_map_for_rows(db, Attachment, recent_art[:2000])
 
     specific = _specific_alert_response(msg, recent_art, att_map)
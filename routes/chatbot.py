@@ -285,7 +285,7 @@ def register_chatbot_routes(app_obj, deps):
         # I clienti vedono solo i propri dati. Admin e magazzino vedono tutto.
         if _user_role() == "client":
             cliente = (getattr(current_user, "id", "") or "").strip().upper()
-            q = q.filter(func.upper(Articolo.cliente) == cliente)
+            q = q.filter(Articolo.cliente_key == normalize_text_key(cliente))
         return q
 
     def _active_filter(q):
@@ -364,10 +364,9 @@ def register_chatbot_routes(app_obj, deps):
         if cli and _user_role() != "client":
             alias_norms = sorted({_norm_txt(a) for a in _cliente_aliases(cli) if _norm_txt(a)})
             if alias_norms:
-                col_norm = _sql_norm_col(Articolo.cliente)
-                q = q.filter(or_(*[col_norm == n for n in alias_norms]))
+                q = q.filter(Articolo.cliente_key.in_(alias_norms))
             else:
-                q = q.filter(func.upper(Articolo.cliente) == cli.upper())
+                q = q.filter(Articolo.cliente_key == normalize_text_key(cli))
         return q, cli
 
     def _extract_search_text(msg):
@@ -565,20 +564,10 @@ def register_chatbot_routes(app_obj, deps):
             out.extend(_fmt_row_html(a) for a in rows)
             return "<br>".join(out)
 
-        like = f"%{term}%"
-        q = q_base.filter(or_(
-            Articolo.codice_articolo.ilike(like),
-            Articolo.descrizione.ilike(like),
-            Articolo.n_arrivo.ilike(like),
-            Articolo.n_ddt_ingresso.ilike(like),
-            Articolo.n_ddt_uscita.ilike(like),
-            Articolo.cliente.ilike(like),
-            Articolo.fornitore.ilike(like),
-            Articolo.serial_number.ilike(like),
-            Articolo.lotto.ilike(like),
-            Articolo.posizione.ilike(like),
-            Articolo.codice_entrata.ilike(like),
-        ))
+        q = q_base.filter(articoli_search_filter(term, [
+            'codice_articolo', 'descrizione', 'n_arrivo', 'n_ddt_ingresso', 'n_ddt_uscita',
+            'cliente', 'fornitore', 'serial_number', 'lotto', 'posizione', 'codice_entrata',
+        ]))
 
         # Se chiede giacenza/magazzino/presente, preferisco righe ancora presenti.
         if any(w in (msg or "").lower() for w in ["giacenza", "giacenze", "magazzino", "presente", "presenti", "ancora"]):
@@ -902,8 +891,7 @@ def register_chatbot_routes(app_obj, deps):
             if cliente and _user_role() != "client":
                 alias_norms = sorted({_norm_txt(a) for a in _cliente_aliases(cliente) if _norm_txt(a)})
                 if alias_norms:
-                    col_norm = _sql_norm_col(Articolo.cliente)
-                    q = q.filter(or_(*[col_norm == n for n in alias_norms]))
+                    q = q.filter(Articolo.cliente_key.in_(alias_norms))
             return q
 
         # 1) Prima cerco solo righe ancora attive/in giacenza.
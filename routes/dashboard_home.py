@@ -17,10 +17,10 @@ def register_dashboard_home_routes(app_obj, deps):
 
     import re
     from pathlib import Path
-    from datetime import date, timedelta, datetime
+    from datetime import date, datetime
     from flask import render_template, render_template_string, request, redirect, url_for
     from flask_login import login_required
-    from sqlalchemy import func, or_, case
+    from sqlalchemy import func, or_, and_, case
 
     def _is_active_expr():
         return func.upper(func.trim(func.coalesce(Articolo.data_uscita, ''))).in_(['', 'NONE', 'NULL', 'NAT'])
@@ -182,20 +182,11 @@ def register_dashboard_home_routes(app_obj, deps):
 
         db = SessionLocal()
         try:
-            like_value = f"%{query_value}%"
             filters = [
-                or_(
-                    Articolo.codice_articolo.ilike(like_value),
-                    Articolo.lotto.ilike(like_value),
-                    Articolo.n_arrivo.ilike(like_value),
-                    Articolo.protocollo.ilike(like_value),
-                    Articolo.serial_number.ilike(like_value),
-                    Articolo.cliente.ilike(like_value),
-                    Articolo.n_ddt_ingresso.ilike(like_value),
-                    Articolo.n_ddt_uscita.ilike(like_value),
-                    Articolo.buono_n.ilike(like_value),
-                    Articolo.descrizione.ilike(like_value),
-                )
+                articoli_search_filter(query_value, [
+                    'codice_articolo', 'lotto', 'n_arrivo', 'protocollo', 'serial_number',
+                    'cliente', 'n_ddt_ingresso', 'n_ddt_uscita', 'buono_n', 'descrizione',
+                ])
             ]
             cliente_corrente = ''
             try:
@@ -205,7 +196,7 @@ def register_dashboard_home_routes(app_obj, deps):
             except Exception:
                 cliente_corrente = ''
             if cliente_corrente:
-                filters.append(func.upper(func.coalesce(Articolo.cliente, '')) == cliente_corrente)
+                filters.append(Articolo.cliente_key == normalize_text_key(cliente_corrente))
 
             rows = (
                 db.query(Articolo)
@@ -271,9 +262,6 @@ def register_dashboard_home_routes(app_obj, deps):
         db = SessionLocal()
         try:
             today_obj = date.today()
-            today_iso = today_obj.strftime('%Y-%m-%d')
-            today_it = today_obj.strftime('%d/%m/%Y')
-            cutoff_90_iso = (today_obj - timedelta(days=90)).strftime('%Y-%m-%d')
             cliente_corrente = current_cliente()
 
             def _cliente_filter(model=Articolo):
@@ -284,30 +272,6 @@ def register_dashboard_home_routes(app_obj, deps):
             active_filter = [_is_active_expr()] + _cliente_filter(Articolo)
             all_filter = _cliente_filter(Articolo)
 
-            def _scalar(query, default=0):
-                try:
-                    v = query.scalar()
-                    return default if v is None else v
-                except Exception:
-                    return default
-
-            def _count_articoli(extra_filters=None):
-                q = db.query(func.count(Articolo.id_articolo))
-                filters = list(extra_filters or [])
-                if filters:
-                    q = q.filter(*filters)
-                return int(_scalar(q, 0) or 0)
-
-            def _sum_articoli(column, extra_filters=None):
-                q = db.query(func.coalesce(func.sum(column), 0))
-                filters = list(extra_filters or [])
-                if filters:
-                    q = q.filter(*filters)
-                try:
-                    return float(q.scalar() or 0)
-                except Exception:
-                    return 0.0
-
             def _examples(extra_filters, attr, max_items=5):
                 try:
                     col = getattr(Articolo, attr)
@@ -342,20 +306,58 @@ def register_dashboard_home_routes(app_obj, deps):
                         'url': url or url_for('giacenze')
                     })
 
+            # Totali, movimenti del giorno e contatori degli alert in un'unica
+            # query a somme condizionali (CASE WHEN), invece di una COUNT/SUM per valore.
+            attivo = _is_active_expr()
+            ddt_uscita_compilato = and_(Articolo.n_ddt_uscita != None, Articolo.n_ddt_uscita != '')
+            metriche_home = {
+                'entrate_oggi': (Articolo.data_ingresso_dt == today_obj, None),
+                'uscite_oggi': (Articolo.data_uscita_dt == today_obj, None),
+                'colli_negativi': (and_(attivo, Articolo.n_colli < 0), None),
+                'attivi_con_ddt': (and_(attivo, ddt_uscita_compilato), None),
+            }
+            # Totali giacenza e riepilogo clienti dallo snapshot mantenuto dagli hook di flush;
+            # se non è disponibile si ricalcolano nella stessa query aggregata.
+            snapshot = dashboard_snapshot_leggi(db, cliente_corrente)
+            if snapshot is None:
+                metriche_home.update({
+                    'tot_giacenza': (attivo, None),
+                    'tot_m2': (attivo, Articolo.m2),
+                    'tot_peso': (attivo, Articolo.peso),
+                    'tot_colli': (attivo, Articolo.n_colli),
+                    'doganali': (and_(attivo, func.upper(func.coalesce(Articolo.stato, '')).like('%DOGANA%')), None),
+                })
+            try:
+                aggregati = aggregati_condizionali(db, metriche_home, filtri=all_filter)
+            except Exception as aggregati_error:
+                try:
+                    db.rollback()
+                except Exception:
+                    pass
+                try:
+                    app_obj.logger.warning(f"[DASHBOARD] contatori non disponibili: {aggregati_error}")
+                except Exception:
+                    pass
+                aggregati = {nome: 0 for nome in metriche_home}
+
+            if snapshot is not None:
+                totali_snapshot = snapshot[0]
+                aggregati.update({
+                    'tot_giacenza': totali_snapshot['righe'],
+                    'tot_m2': totali_snapshot['m2'],
+                    'tot_peso': totali_snapshot['peso'],
+                    'tot_colli': totali_snapshot['colli'],
+                    'doganali': totali_snapshot['doganali'],
+                })
+
             dashboard = {
-                'tot_giacenza': _count_articoli(active_filter),
-                'tot_m2': round(_sum_articoli(Articolo.m2, active_filter), 2),
-                'tot_peso': round(_sum_articoli(Articolo.peso, active_filter), 2),
-                'tot_colli': int(_sum_articoli(Articolo.n_colli, active_filter)),
-                'entrate_oggi': _count_articoli(all_filter + [
-                    or_(Articolo.data_ingresso == today_iso, Articolo.data_ingresso == today_it)
-                ]),
-                'uscite_oggi': _count_articoli(all_filter + [
-                    or_(Articolo.data_uscita == today_iso, Articolo.data_uscita == today_it)
-                ]),
-                'doganali': _count_articoli(active_filter + [
-                    func.upper(func.coalesce(Articolo.stato, '')).like('%DOGANA%')
-                ]),
+                'tot_giacenza': int(aggregati['tot_giacenza'] or 0),
+                'tot_m2': round(float(aggregati['tot_m2'] or 0), 2),
+                'tot_peso': round(float(aggregati['tot_peso'] or 0), 2),
+                'tot_colli': int(aggregati['tot_colli'] or 0),
+                'entrate_oggi': int(aggregati['entrate_oggi'] or 0),
+                'uscite_oggi': int(aggregati['uscite_oggi'] or 0),
+                'doganali': int(aggregati['doganali'] or 0),
                 'buoni_aperti': 0,
                 'buoni_creati': 0,
                 'buoni_usciti': 0,
@@ -557,24 +559,21 @@ def register_dashboard_home_routes(app_obj, deps):
                 negativi_filter = active_filter + [Articolo.n_colli < 0]
                 _add_alert(
                     dashboard_alerts, 'danger', 'Colli negativi',
-                    _count_articoli(negativi_filter),
+                    aggregati['colli_negativi'],
                     'Righe in giacenza con numero colli negativo.',
-                    _examples(negativi_filter, 'id_articolo'),
+                    _examples(negativi_filter, 'id_articolo') if aggregati['colli_negativi'] else [],
                     url_for('dashboard_ricerca_globale', q='-')
                 )
             except Exception:
                 pass
 
             try:
-                ddt_attivo_filter = active_filter + [
-                    Articolo.n_ddt_uscita != None,
-                    Articolo.n_ddt_uscita != ''
-                ]
+                ddt_attivo_filter = active_filter + [ddt_uscita_compilato]
                 _add_alert(
                     dashboard_alerts, 'danger', 'Articoli attivi con DDT uscita',
-                    _count_articoli(ddt_attivo_filter),
+                    aggregati['attivi_con_ddt'],
                     'Righe ancora considerate in giacenza ma con DDT di uscita compilato.',
-                    _examples(ddt_attivo_filter, 'n_ddt_uscita'),
+                    _examples(ddt_attivo_filter, 'n_ddt_uscita') if aggregati['attivi_con_ddt'] else [],
                     url_for('giacenze', solo_in_giacenza='1')
                 )
             except Exception:
@@ -610,19 +609,25 @@ def register_dashboard_home_routes(app_obj, deps):
                     )
                 )
 
-                rows_clienti = (
-                    db.query(
-                        cliente_expr.label('cliente'),
-                        func.count(Articolo.id_articolo).label('righe'),
-                        func.coalesce(func.sum(Articolo.n_colli), 0).label('colli'),
-                        func.coalesce(func.sum(Articolo.m2), 0).label('m2'),
-                        func.coalesce(func.sum(Articolo.peso), 0).label('peso'),
+                if snapshot is not None:
+                    rows_clienti = [
+                        (r['cliente'], r['righe'], r['colli'], r['m2'], r['peso'])
+                        for r in snapshot[1]
+                    ]
+                else:
+                    rows_clienti = (
+                        db.query(
+                            cliente_expr.label('cliente'),
+                            func.count(Articolo.id_articolo).label('righe'),
+                            func.coalesce(func.sum(Articolo.n_colli), 0).label('colli'),
+                            func.coalesce(func.sum(Articolo.m2), 0).label('m2'),
+                            func.coalesce(func.sum(Articolo.peso), 0).label('peso'),
+                        )
+                        .filter(*active_filter)
+                        .group_by(cliente_expr)
+                        .order_by(cliente_expr.asc())
+                        .all()
                     )
-                    .filter(*active_filter)
-                    .group_by(cliente_expr)
-                    .order_by(cliente_expr.asc())
-                    .all()
-                )
 
                 for cliente_val, righe_val, colli_val, m2_val, peso_val in rows_clienti:
                     nome_cliente = str(cliente_val or '').strip().upper()
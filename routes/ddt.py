@@ -284,6 +284,7 @@ def register_ddt_routes(app_obj, deps):
                     raise RuntimeError('Numero DDT vuoto: salvataggio annullato.')
                 valori_uscita = {
                     Articolo.data_uscita: data_salvata,
+                    Articolo.data_uscita_dt: data_ddt_obj,
                     Articolo.n_ddt_uscita: n_ddt_salvato,
                 }
                 # Aggiornamento SQL esplicito anche del mezzo: evita che il valore
@@ -292,13 +293,24 @@ def register_ddt_routes(app_obj, deps):
                 if mezzo_giacenze:
                     valori_uscita[Articolo.mezzi_in_uscita] = mezzo_giacenze
 
+                # Modifiche ORM (uscita, colli/peso parziali) scritte prima dell'UPDATE bulk:
+                # gli hook di flush ne applicano la differenza allo snapshot dashboard.
+                db.flush()
+                # Report fatturazione: i mesi chiusi toccati dagli articoli (prima dell'uscita).
+                fatturazione_snapshot_invalida_articoli(db, ids)
+                snapshot_prima = dashboard_snapshot_articoli(db.connection(), ids)
                 db.query(Articolo).filter(Articolo.id_articolo.in_(ids)).update(
                     valori_uscita,
                     synchronize_session=False
                 )
+                # L'UPDATE bulk non passa dal flush: riallinea l'indice di ricerca (DDT uscita, mezzo).
+                search_index_refresh(db, ids)
+                fatturazione_snapshot_invalida_articoli(db, ids)
                 # Forza il flush prima del commit e verifica che tutte le righe
                 # selezionate siano state effettivamente aggiornate.
                 db.flush()
+                # Snapshot dashboard: differenza dovuta al solo UPDATE bulk sulle righe del DDT.
+                dashboard_snapshot_aggiorna_articoli(db.connection(), ids, snapshot_prima)
                 verifica_q = db.query(Articolo.id_articolo).filter(
                     Articolo.id_articolo.in_(ids),
                     Articolo.data_uscita == data_salvata,
@@ -17,24 +17,6 @@ def register_fatturazione_routes(app_obj, deps):
     }
 
 
-    def parse_any_date(value):
-        if not value:
-            return None
-        if isinstance(value, datetime):
-            return value.date()
-        if isinstance(value, date):
-            return value
-        s = str(value).strip().split(' ')[0]
-        if not s:
-            return None
-        for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d"):
-            try:
-                return datetime.strptime(s[:10], fmt).date()
-            except Exception:
-                pass
-        return None
-
-
     def _cliente_report_config():
         configs = []
         for cli in get_clienti_utenti():
@@ -63,19 +45,93 @@ def register_fatturazione_routes(app_obj, deps):
             return default_if_blank
 
 
+    def _picco_occupazione(intervalli, first_day, last_day):
+        """Picco giornaliero di m2 occupati nel periodo, con sweep sugli eventi ordinati.
+
+        `intervalli` sono tuple (data_ingresso, data_uscita, m2): l'articolo occupa
+        i giorni da data_ingresso a data_uscita compresi (uscita None = ancora presente).
+        Ogni articolo genera un evento +m2 all'ingresso (o al primo giorno del periodo)
+        e un evento -m2 il giorno dopo l'uscita: il picco è il massimo della somma
+        progressiva, valutata dopo aver applicato tutti gli eventi dello stesso giorno.
+        """
+        eventi = {}
+        for d_ing, d_usc, m2 in intervalli:
+            if d_ing is None or d_ing > last_day or (d_usc is not None and d_usc < first_day) or not m2:
+                continue
+            inizio = max(d_ing, first_day)
+            eventi[inizio] = eventi.get(inizio, 0.0) + m2
+            if d_usc is not None and d_usc < last_day:
+                fine = d_usc + timedelta(days=1)
+                eventi[fine] = eventi.get(fine, 0.0) - m2
+
+        picco = 0.0
+        occupati = 0.0
+        for giorno in sorted(eventi):
+            occupati += eventi[giorno]
+            if occupati > picco:
+                picco = occupati
+        return picco
+
+
     def _compute_report_fatturazione_data(mese: int, anno: int):
         mese = max(1, min(12, int(mese)))
         anno = int(anno)
         first_day = date(anno, mese, 1)
         last_day = date(anno, mese, calendar.monthrange(anno, mese)[1])
 
+        configs = _cliente_report_config()
+        norms = [conf['norm'] for conf in configs if conf['norm']]
+
+        d_ing = Articolo.data_ingresso_dt
+        d_usc = Articolo.data_uscita_dt
+        m2_val = func.coalesce(Articolo.m2, 0)
+        presente_nel_mese = and_(d_ing <= last_day, or_(d_usc == None, d_usc >= first_day))
+        presente_fine_mese = and_(d_ing <= last_day, or_(d_usc == None, d_usc >= last_day))
+        uscito_nel_mese = d_usc.between(first_day, last_day)
+        entrato_nel_mese = d_ing.between(first_day, last_day)
+        ingresso_doganale = and_(entrato_nel_mese, normalized_sql_text(func.coalesce(Articolo.stato, '')).like('%DOGAN%'))
+        # GALVANO TECNICA: pallet (N° colli, vuoti/negativi = 0) ancora in giacenza a fine mese,
+        # cioè entrati entro la fine del mese e NON usciti entro la fine del mese.
+        pallet_fine_mese = and_(d_ing <= last_day, or_(d_usc == None, d_usc > last_day), Articolo.n_colli > 0)
+
+        def _somma(condizione, valore):
+            return func.coalesce(func.sum(case((condizione, valore), else_=0)), 0)
+
         db = SessionLocal()
         try:
-            articoli = db.query(Articolo).all()
+            # Solo gli articoli dei clienti configurati che toccano il mese, aggregati per cliente in SQL.
+            filtro_mese = [
+                Articolo.cliente_key.in_(norms),
+                or_(presente_nel_mese, uscito_nel_mese, entrato_nel_mese),
+            ]
+            somme = {
+                cli_key: vals
+                for cli_key, *vals in db.query(
+                    Articolo.cliente_key,
+                    _somma(presente_nel_mese, m2_val),
+                    _somma(presente_fine_mese, m2_val),
+                    _somma(uscito_nel_mese, m2_val),
+                    _somma(ingresso_doganale, m2_val),
+                    _somma(pallet_fine_mese, Articolo.n_colli),
+                )
+                .filter(*filtro_mese)
+                .group_by(Articolo.cliente_key)
+                .all()
+            } if norms else {}
+
+            # Intervalli di presenza per il picco m2 (solo clienti a m2).
+            intervalli = {}
+            norms_m2 = [conf['norm'] for conf in configs if conf['mode'] != 'pallet' and conf['norm'] in somme]
+            if norms_m2:
+                for cli_key, ing, usc, m2 in (
+                    db.query(Articolo.cliente_key, d_ing, d_usc, Articolo.m2)
+                    .filter(Articolo.cliente_key.in_(norms_m2), presente_nel_mese, Articolo.m2 != 0)
+                    .all()
+                ):
+                    intervalli.setdefault(cli_key, []).append((ing, usc, _safe_float(m2)))
         finally:
             db.close()
 
-        configs = _cliente_report_config()
         rows = []
         totals = {
             'm2_presenti': 0.0,
@@ -96,65 +152,19 @@ def register_fatturazione_routes(app_obj, deps):
                 'picco_m2_occupati': 0.0,
                 'pallet_giacenza': 0.0,
             }
-            norm_cli = conf['norm']
-
-            cliente_articoli = [art for art in articoli if normalize_text_key(getattr(art, 'cliente', '')) == norm_cli]
-
-            for art in cliente_articoli:
-                d_ing = parse_any_date(getattr(art, 'data_ingresso', None))
-                d_usc = parse_any_date(getattr(art, 'data_uscita', None))
-                stato_norm = normalize_text_key(getattr(art, 'stato', ''))
-                m2 = _safe_float(getattr(art, 'm2', 0))
-
-                presente_nel_mese = d_ing is not None and d_ing <= last_day and (d_usc is None or d_usc >= first_day)
-                presente_fine_mese = d_ing is not None and d_ing <= last_day and (d_usc is None or d_usc >= last_day)
-                uscito_nel_mese = d_usc is not None and first_day <= d_usc <= last_day
-                ingresso_doganale = d_ing is not None and first_day <= d_ing <= last_day and 'DOGAN' in stato_norm
-
+            vals = somme.get(conf['norm'])
+            if vals:
+                m2_presenti, m2_fine_mese, m2_usciti, doganali_m2, pallet = vals
                 if conf['mode'] == 'pallet':
-                    # GALVANO TECNICA:
-                    # deve contare SOLO i pallet ancora in giacenza nel mese selezionato,
-                    # cioè entrati entro la fine del mese e NON usciti entro la fine del mese.
-                    # Se una riga è uscita durante il mese selezionato, non va conteggiata.
-                    pallet_ancora_in_giacenza_fine_mese = (
-                        d_ing is not None
-                        and d_ing <= last_day
-                        and (d_usc is None or d_usc > last_day)
-                    )
-
-                    # Per GALVANO TECNICA il conteggio deve usare la colonna N° Colli
-                    # come nella schermata Giacenze. I campi vuoti NON devono valere 1,
-                    # altrimenti il report conta una riga vuota come un bancale e gonfia il totale.
-                    # Inoltre vengono esclusi tutti i record già usciti entro la fine del mese.
-                    pallet_qty = _safe_int(getattr(art, 'n_colli', None), default_if_blank=0)
-                    if pallet_qty < 0:
-                        pallet_qty = 0
-
-                    if pallet_ancora_in_giacenza_fine_mese:
-                        row['pallet_giacenza'] += pallet_qty
+                    row['pallet_giacenza'] += float(pallet or 0)
                 else:
-                    if presente_nel_mese:
-                        row['m2_presenti'] += m2
-                    if presente_fine_mese:
-                        row['m2_fine_mese'] += m2
-                    if uscito_nel_mese:
-                        row['m2_usciti'] += m2
-                    if ingresso_doganale:
-                        row['entrate_doganali_m2'] += m2
-
-            if conf['mode'] != 'pallet':
-                peak = 0.0
-                for day_num in range(1, last_day.day + 1):
-                    current_day = date(anno, mese, day_num)
-                    occupied_m2 = 0.0
-                    for art in cliente_articoli:
-                        d_ing = parse_any_date(getattr(art, 'data_ingresso', None))
-                        d_usc = parse_any_date(getattr(art, 'data_uscita', None))
-                        if d_ing is not None and d_ing <= current_day and (d_usc is None or d_usc >= current_day):
-                            occupied_m2 += _safe_float(getattr(art, 'm2', 0))
-                    if occupied_m2 > peak:
-                        peak = occupied_m2
-                row['picco_m2_occupati'] = peak
+                    row['m2_presenti'] += float(m2_presenti or 0)
+                    row['m2_fine_mese'] += float(m2_fine_mese or 0)
+                    row['m2_usciti'] += float(m2_usciti or 0)
+                    row['entrate_doganali_m2'] += float(doganali_m2 or 0)
+                    row['picco_m2_occupati'] = _picco_occupazione(
+                        intervalli.get(conf['norm'], []), first_day, last_day
+                    )
 
             if any(abs(v) > 1e-9 for k, v in row.items() if k != 'cliente'):
                 rows.append(row)
@@ -164,6 +174,100 @@ def register_fatturazione_routes(app_obj, deps):
         return rows, totals, first_day, last_day
 
 
+    def _fatturazione_snapshot_versione(anno, mese):
+        """Versione attuale della riga snapshot del mese (creata vuota se manca), None se non leggibile."""
+        from sqlalchemy.exc import IntegrityError
+
+        db = SessionLocal()
+        try:
+            snap = db.get(FatturazioneSnapshot, (anno, mese))
+            if snap is None:
+                try:
+                    db.add(FatturazioneSnapshot(anno=anno, mese=mese, versione=0, chiuso=False))
+                    db.commit()
+                except IntegrityError:
+                    # Creata nel frattempo da un'altra richiesta.
+                    db.rollback()
+                snap = db.get(FatturazioneSnapshot, (anno, mese))
+            return int(snap.versione or 0) if snap is not None else None
+        except Exception as e:
+            db.rollback()
+            print(f"[WARN] snapshot fatturazione {mese:02d}/{anno} non disponibile: {e}")
+            return None
+        finally:
+            db.close()
+
+
+    def _report_fatturazione_mese(mese: int, anno: int, ricalcola: bool = False):
+        """Report del mese servito dallo snapshot se il mese è chiuso.
+
+        Un mese è chiuso quando è terminato: il primo calcolo viene salvato in
+        fatturazione_snapshot e riusato finché una modifica agli articoli di quel
+        mese non lo invalida (o finché non viene richiesto il ricalcolo).
+        Prima del calcolo si legge la versione della riga del mese (creandola se manca):
+        il salvataggio è un UPDATE condizionato a quella versione, quindi un'invalidazione
+        arrivata durante il calcolo (o ancora in corso, che tiene bloccata la riga) lo scarta.
+        Restituisce (rows, totals, first_day, last_day, snapshot) dove snapshot è
+        None per i mesi aperti o non salvati, altrimenti {'calcolato_il', 'calcolato_da'}.
+        """
+        mese = max(1, min(12, int(mese)))
+        anno = int(anno)
+        first_day = date(anno, mese, 1)
+        last_day = date(anno, mese, calendar.monthrange(anno, mese)[1])
+        chiuso = last_day < date.today()
+
+        if chiuso and not ricalcola:
+            db = SessionLocal()
+            try:
+                snap = db.get(FatturazioneSnapshot, (anno, mese))
+                if snap is not None and snap.chiuso and snap.dati:
+                    dati = json.loads(snap.dati)
+                    return dati['rows'], dati['totals'], first_day, last_day, {
+                        'calcolato_il': snap.calcolato_il,
+                        'calcolato_da': snap.calcolato_da,
+                    }
+            except Exception as e:
+                print(f"[WARN] snapshot fatturazione {mese:02d}/{anno} non leggibile: {e}")
+            finally:
+                db.close()
+
+        versione = None
+        if chiuso:
+            versione = _fatturazione_snapshot_versione(anno, mese)
+
+        rows, totals, first_day, last_day = _compute_report_fatturazione_data(mese, anno)
+        if versione is None:
+            return rows, totals, first_day, last_day, None
+
+        info = {
+            'calcolato_il': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'calcolato_da': _current_username_for_audit() or 'SISTEMA',
+        }
+        db = SessionLocal()
+        try:
+            salvati = db.query(FatturazioneSnapshot).filter(
+                FatturazioneSnapshot.anno == anno,
+                FatturazioneSnapshot.mese == mese,
+                FatturazioneSnapshot.versione == versione,
+            ).update({
+                FatturazioneSnapshot.chiuso: True,
+                FatturazioneSnapshot.dati: json.dumps({'rows': rows, 'totals': totals}),
+                FatturazioneSnapshot.calcolato_il: info['calcolato_il'],
+                FatturazioneSnapshot.calcolato_da: info['calcolato_da'],
+            }, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            salvati = 0
+            print(f"[WARN] snapshot fatturazione {mese:02d}/{anno} non salvato: {e}")
+        finally:
+            db.close()
+        if salvati != 1:
+            # Invalidato durante il calcolo: il risultato non viene conservato come mese chiuso.
+            return rows, totals, first_day, last_day, None
+        return rows, totals, first_day, last_day, info
+
+
     @app.route('/report_fatturazione')
     @login_required
     @require_admin
@@ -171,7 +275,7 @@ def register_fatturazione_routes(app_obj, deps):
         today = date.today()
         mese = request.args.get('mese', today.month, type=int)
         anno = request.args.get('anno', today.year, type=int)
-        rows, totals, first_day, last_day = _compute_report_fatturazione_data(mese, anno)
+        rows, totals, first_day, last_day, snapshot = _report_fatturazione_mese(mese, anno)
         return render_template(
             'report_fatturazione.html',
             title='Report Fatturazione',
@@ -181,9 +285,22 @@ def register_fatturazione_routes(app_obj, deps):
             totals=totals,
             periodo_da=first_day,
             periodo_a=last_day,
+            snapshot=snapshot,
         )
 
 
+    @app.route('/report_fatturazione/ricalcola', methods=['POST'])
+    @login_required
+    @require_admin
+    def report_fatturazione_ricalcola():
+        today = date.today()
+        mese = request.form.get('mese', today.month, type=int)
+        anno = request.form.get('anno', today.year, type=int)
+        _report_fatturazione_mese(mese, anno, ricalcola=True)
+        flash(f'Report fatturazione {mese:02d}/{anno} ricalcolato.', 'success')
+        return redirect(url_for('report_fatturazione', mese=mese, anno=anno))
+
+
     @app.route('/report_fatturazione/export_excel')
     @login_required
     @require_admin
@@ -196,7 +313,7 @@ def register_fatturazione_routes(app_obj, deps):
         today = date.today()
         mese = request.args.get('mese', today.month, type=int)
         anno = request.args.get('anno', today.year, type=int)
-        rows, totals, first_day, last_day = _compute_report_fatturazione_data(mese, anno)
+        rows, totals, first_day, last_day, _ = _report_fatturazione_mese(mese, anno)
 
         wb = Workbook()
         ws = wb.active
@@ -273,43 +390,71 @@ def register_fatturazione_routes(app_obj, deps):
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
 
-    def _parse_data_db_helper(val):
-        """
-        Accetta:
-        - date / datetime
-        - stringa 'YYYY-MM-DD'
-        - stringa 'DD/MM/YYYY'
-        - stringa con orario 'YYYY-MM-DD HH:MM:SS'
-        Ritorna date oppure None.
+    # --- LOGICA CALCOLO COSTI (ROBUSTA) ---
+    # Quantità giornaliere in milionesimi (interi): somme esatte, indipendenti dall'ordine
+    # degli articoli. Il vecchio calcolo giorno per giorno sommava float e, sui valori che
+    # cadono esattamente a metà del millesimo, poteva arrotondare diversamente; ora il
+    # millesimo si arrotonda per eccesso a metà sul valore esatto (_formatta_milionesimi).
+    # Confronto con il vecchio calcolo: tools/verifica_fatturazione_occupazione.py.
+    OCCUPAZIONE_SCALA = 1_000_000
+
+    def _formatta_milionesimi(valore):
+        """Valore in milionesimi con 3 decimali, arrotondato per eccesso a metà (ROUND_HALF_UP)."""
+        millesimi = (abs(int(valore)) + 500) // 1000
+        segno = '-' if valore < 0 and millesimi else ''
+        return f"{segno}{millesimi // 1000}.{millesimi % 1000:03d}"
+
+    def _occupazione_giornaliera(intervalli, d_start, d_end):
+        """Occupazione giornaliera per cliente con array delle differenze (NumPy).
+
+        `intervalli`: tuple (cliente, inizio, fine, qty) con inizio/fine inclusi e già
+        limitati al periodo d_start..d_end. Per ogni intervallo si somma qty nella cella
+        di inizio e si sottrae nella cella successiva alla fine; la somma cumulativa dà il
+        valore di ogni giorno. In parallelo si contano gli articoli presenti, così un giorno
+        senza articoli resta escluso come nel calcolo giorno per giorno.
+        Ritorna {cliente: (valori_giornalieri in milionesimi interi, articoli_presenti)}.
         """
-        if val is None:
-            return None
-
-        if isinstance(val, datetime):
-            return val.date()
+        import numpy as np
+
+        scala = OCCUPAZIONE_SCALA
+        n_giorni = (d_end - d_start).days + 1
+        per_cliente = {}
+        for cliente, inizio, fine, qty in intervalli:
+            starts, ends, qtys = per_cliente.setdefault(cliente, ([], [], []))
+            starts.append((inizio - d_start).days)
+            ends.append((fine - d_start).days + 1)
+            qtys.append(qty)
+
+        risultato = {}
+        for cliente, (starts, ends, qtys) in per_cliente.items():
+            starts = np.asarray(starts, dtype=np.int64)
+            ends = np.asarray(ends, dtype=np.int64)
+            qtys = np.rint(np.asarray(qtys, dtype=np.float64) * scala).astype(np.int64)
+            diff_val = np.zeros(n_giorni + 1, dtype=np.int64)
+            diff_cnt = np.zeros(n_giorni + 1, dtype=np.int64)
+            np.add.at(diff_val, starts, qtys)
+            np.add.at(diff_val, ends, -qtys)
+            np.add.at(diff_cnt, starts, 1)
+            np.add.at(diff_cnt, ends, -1)
+            risultato[cliente] = (np.cumsum(diff_val[:-1]), np.cumsum(diff_cnt[:-1]))
+        return risultato
+
+
+    def _segmenti_mensili(d_start, d_end):
+        """Indici [a, b) dei giorni del periodo divisi per mese: [(anno, mese, a, b), ...]."""
+        segmenti = []
+        a = 0
+        curr = d_start
+        while curr <= d_end:
+            fine_mese = date(curr.year, curr.month, calendar.monthrange(curr.year, curr.month)[1])
+            fine = min(fine_mese, d_end)
+            b = (fine - d_start).days + 1
+            segmenti.append((curr.year, curr.month, a, b))
+            a = b
+            curr = fine + timedelta(days=1)
+        return segmenti
 
-        if isinstance(val, date):
-            return val
 
-        s = str(val).strip()
-        if not s:
-            return None
-
-        # prova YYYY-MM-DD
-        try:
-            return datetime.strptime(s[:10], "%Y-%m-%d").date()
-        except Exception:
-            pass
-
-        # prova DD/MM/YYYY
-        try:
-            return datetime.strptime(s[:10], "%d/%m/%Y").date()
-        except Exception:
-            pass
-
-        return None
-
-    # --- LOGICA CALCOLO COSTI (ROBUSTA) ---
     def _calcola_logica_costi(articoli, data_da, data_a, raggruppamento, m2_multiplier: float = 1.0, metric: str = "m2"):
         """
         metric:
@@ -318,11 +463,9 @@ def register_fatturazione_routes(app_obj, deps):
           - "pezzi" => usa art.pezzi / art.pezzo
         Ritorna SEMPRE anche m2_tot/m2_medio per compatibilità template.
         """
-        from collections import defaultdict
+        import numpy as np
         from datetime import timedelta, date, datetime
 
-        val_per_giorno = defaultdict(float)
-
         def to_date_obj(d):
             if not d:
                 return None
@@ -386,16 +529,17 @@ def register_fatturazione_routes(app_obj, deps):
             # fallback
             return 0.0
 
+        intervalli = []
         for art in articoli:
             qty = get_qty(art)
             if qty <= 0:
                 continue
 
-            d_ingr = to_date_obj(getattr(art, "data_ingresso", None))
+            d_ingr = to_date_obj(getattr(art, "data_ingresso_dt", None))
             if not d_ingr:
                 continue
 
-            d_usc = to_date_obj(getattr(art, "data_uscita", None))
+            d_usc = to_date_obj(getattr(art, "data_uscita_dt", None))
 
             inizio = max(d_ingr, d_start)
             if d_usc:
@@ -407,19 +551,16 @@ def register_fatturazione_routes(app_obj, deps):
                 continue
 
             cliente_key = (getattr(art, "cliente", None) or "SCONOSCIUTO").strip().upper()
+            intervalli.append((cliente_key, inizio, fine, qty))
 
-            curr = inizio
-            while curr <= fine:
-                val_per_giorno[(cliente_key, curr)] += qty
-                curr += timedelta(days=1)
-
+        occupazione = _occupazione_giornaliera(intervalli, d_start, d_end)
         risultati_finali = []
 
         def pack_row(periodo, cliente, tot, medio, giorni):
             # ✅ compatibilità: restituisco SEMPRE anche m2_tot/m2_medio
             # così il template admin che stampa r.m2_tot / r.m2_medio funziona sempre.
-            tot_s = f"{tot:.3f}" if isinstance(tot, (int, float)) else str(tot)
-            med_s = f"{medio:.3f}" if isinstance(medio, (int, float)) else str(medio)
+            tot_s = _formatta_milionesimi(tot)
+            med_s = _formatta_milionesimi(medio)
 
             return {
                 "periodo": periodo,
@@ -434,35 +575,30 @@ def register_fatturazione_routes(app_obj, deps):
             }
 
         if raggruppamento == "giorno":
-            sorted_keys = sorted(val_per_giorno.keys(), key=lambda k: (k[0], k[1]))
-            for cliente, giorno in sorted_keys:
-                val = val_per_giorno[(cliente, giorno)]
-                risultati_finali.append(
-                    pack_row(giorno.strftime("%d/%m/%Y"), cliente, val, val, 1)
-                )
+            for cliente in sorted(occupazione):
+                valori, presenti = occupazione[cliente]
+                for idx in np.flatnonzero(presenti > 0):
+                    val = int(valori[idx])
+                    giorno = d_start + timedelta(days=int(idx))
+                    risultati_finali.append(
+                        pack_row(giorno.strftime("%d/%m/%Y"), cliente, val, val, 1)
+                    )
         else:
-            agg = defaultdict(lambda: {"sum": 0.0, "days": set()})
-            for (cli, day), val in val_per_giorno.items():
-                k = (cli, day.year, day.month)
-                agg[k]["sum"] += val
-                agg[k]["days"].add(day)
-
-            sorted_keys = sorted(agg.keys(), key=lambda k: (k[1], k[2], k[0]))
-            for (cli, y, m) in sorted_keys:
-                dati = agg[(cli, y, m)]
-                n_days = len(dati["days"])
-                tot = dati["sum"]
-
-                # ✅ M² EFFETTIVI (non medi): valore reale sull'ULTIMO giorno del periodo considerato per quel mese
-                if n_days > 0:
-                    last_day = max(dati["days"])
-                    eff = float(val_per_giorno.get((cli, last_day), 0.0))
-                else:
-                    eff = 0.0
-
-                risultati_finali.append(
-                    pack_row(f"{m:02d}/{y}", cli, tot, eff, n_days)
-                )
+            for (y, m, a, b) in _segmenti_mensili(d_start, d_end):
+                for cli in sorted(occupazione):
+                    valori, presenti = occupazione[cli]
+                    giorni_presenti = np.flatnonzero(presenti[a:b] > 0)
+                    n_days = int(giorni_presenti.size)
+                    if n_days == 0:
+                        continue
+                    tot = int(valori[a:b][giorni_presenti].sum())
+
+                    # ✅ M² EFFETTIVI (non medi): valore reale sull'ULTIMO giorno del periodo considerato per quel mese
+                    eff = int(valori[a + giorni_presenti[-1]])
+
+                    risultati_finali.append(
+                        pack_row(f"{m:02d}/{y}", cli, tot, eff, n_days)
+                    )
 
         return risultati_finali
 
@@ -475,11 +611,9 @@ def register_fatturazione_routes(app_obj, deps):
         - Per ogni giorno: somma n_colli degli articoli che risultano "presenti" quel giorno.
         - Presente = data_ingresso <= giorno AND (data_uscita è vuota oppure data_uscita > giorno)
         """
-        from collections import defaultdict
+        import numpy as np
         from datetime import timedelta, date, datetime
 
-        colli_per_giorno = defaultdict(float)
-
         def to_date_obj(d):
             if not d:
                 return None
@@ -502,6 +636,7 @@ def register_fatturazione_routes(app_obj, deps):
         if not d_start or not d_end:
             return []
 
+        intervalli = []
         for art in articoli:
             try:
                 colli = float(int(art.n_colli or 0))
@@ -511,61 +646,55 @@ def register_fatturazione_routes(app_obj, deps):
             if colli <= 0:
                 continue
 
-            d_ingr = to_date_obj(art.data_ingresso)
+            d_ingr = to_date_obj(art.data_ingresso_dt)
             if not d_ingr:
                 continue
 
-            d_usc = to_date_obj(art.data_uscita)
+            d_usc = to_date_obj(art.data_uscita_dt)
 
-            # Range di verifica nel periodo
+            # Range di verifica nel periodo: presente fino al giorno prima dell'uscita
             start = max(d_ingr, d_start)
-            end = d_end
+            end = min(d_usc - timedelta(days=1), d_end) if d_usc else d_end
 
             if end < start:
                 continue
 
             cliente_key = (art.cliente or "SCONOSCIUTO").strip().upper()
+            intervalli.append((cliente_key, start, end, colli))
 
-            curr = start
-            while curr <= end:
-                presente = (d_ingr <= curr) and ((d_usc is None) or (d_usc > curr))
-                if presente:
-                    colli_per_giorno[(cliente_key, curr)] += colli
-                curr += timedelta(days=1)
-
+        occupazione = _occupazione_giornaliera(intervalli, d_start, d_end)
         risultati = []
 
         if raggruppamento == "giorno":
-            keys = sorted(colli_per_giorno.keys(), key=lambda k: (k[0], k[1]))
-            for cli, day in keys:
-                v = colli_per_giorno[(cli, day)]
-                risultati.append({
-                    "periodo": day.strftime("%d/%m/%Y"),
-                    "cliente": cli,
-                    "tot": f"{v:.0f}",
-                    "medio": f"{v:.0f}",
-                    "giorni": 1
-                })
+            for cli in sorted(occupazione):
+                valori, presenti = occupazione[cli]
+                for idx in np.flatnonzero(presenti > 0):
+                    v = float(valori[idx]) / OCCUPAZIONE_SCALA
+                    day = d_start + timedelta(days=int(idx))
+                    risultati.append({
+                        "periodo": day.strftime("%d/%m/%Y"),
+                        "cliente": cli,
+                        "tot": f"{v:.0f}",
+                        "medio": f"{v:.0f}",
+                        "giorni": 1
+                    })
         else:
-            agg = defaultdict(lambda: {"sum": 0.0, "days": set()})
-            for (cli, day), v in colli_per_giorno.items():
-                k = (cli, day.year, day.month)
-                agg[k]["sum"] += v
-                agg[k]["days"].add(day)
-
-            keys = sorted(agg.keys(), key=lambda k: (k[1], k[2], k[0]))
-            for cli, y, m in keys:
-                dati = agg[(cli, y, m)]
-                n_days = len(dati["days"])
-                tot = dati["sum"]
-                avg = tot / n_days if n_days else 0.0
-                risultati.append({
-                    "periodo": f"{m:02d}/{y}",
-                    "cliente": cli,
-                    "tot": f"{tot:.0f}",
-                    "medio": f"{avg:.0f}",
-                    "giorni": n_days
-                })
+            for y, m, a, b in _segmenti_mensili(d_start, d_end):
+                for cli in sorted(occupazione):
+                    valori, presenti = occupazione[cli]
+                    giorni_presenti = np.flatnonzero(presenti[a:b] > 0)
+                    n_days = int(giorni_presenti.size)
+                    if n_days == 0:
+                        continue
+                    tot = float(valori[a:b][giorni_presenti].sum()) / OCCUPAZIONE_SCALA
+                    avg = tot / n_days if n_days else 0.0
+                    risultati.append({
+                        "periodo": f"{m:02d}/{y}",
+                        "cliente": cli,
+                        "tot": f"{tot:.0f}",
+                        "medio": f"{avg:.0f}",
+                        "giorni": n_days
+                    })
 
         return risultati
 
@@ -621,7 +750,16 @@ def register_fatturazione_routes(app_obj, deps):
                 if cliente_val:
                     cliente_norm = normalize_text_key(cliente_val)
                     if cliente_norm:
-                        query = query.filter(normalized_sql_text(Articolo.cliente) == cliente_norm)
+                        query = query.filter(Articolo.cliente_key == cliente_norm)
+
+                # Solo gli articoli presenti nel periodo (range sulle colonne DATE indicizzate)
+                d_da = _safe_date_ymd(data_da_str)
+                d_a = _safe_date_ymd(data_a_str)
+                if d_da and d_a:
+                    query = query.filter(
+                        Articolo.data_ingresso_dt <= d_a,
+                        or_(Articolo.data_uscita_dt == None, Articolo.data_uscita_dt > d_da),
+                    )
 
                 articoli = query.all()
                 db.close()
@@ -10,6 +10,208 @@ Sono state spostate qui le funzioni principali collegate a:
 Il file principale resta più leggero e le route mantengono gli stessi endpoint.
 """
 
+import os
+import re
+import threading
+import time
+
+
+# ========================================================
+# OCR PAGINE PDF IN PARALLELO (ProcessPoolExecutor)
+# ========================================================
+# Le funzioni di questa sezione sono a livello di modulo perché vengono
+# eseguite nei processi worker (avviati con "spawn": importano solo questo
+# modulo, non l'applicazione).
+# PDF_OCR_WORKERS: processi OCR (default min(4, CPU); 0 = OCR sequenziale nel processo web).
+# PDF_OCR_TIMEOUT: secondi massimi per ogni esecuzione di tesseract su una pagina.
+_OCR_POOL = {'executor': None, 'workers': 0}
+_OCR_POOL_LOCK = threading.Lock()
+
+
+def _ocr_workers():
+    try:
+        return max(0, int(os.environ.get('PDF_OCR_WORKERS', '') or min(4, os.cpu_count() or 1)))
+    except ValueError:
+        return min(4, os.cpu_count() or 1)
+
+
+def _ocr_timeout():
+    try:
+        return max(5.0, float(os.environ.get('PDF_OCR_TIMEOUT', '60') or 60))
+    except ValueError:
+        return 60.0
+
+
+# Orientamento: tesseract OSD su una miniatura decide la rotazione, poi un solo OCR
+# a piena risoluzione. Se OSD non è disponibile o poco affidabile si torna ai
+# tentativi 0°/270°.
+OSD_MINIATURA = 800          # lato massimo (px) della miniatura per OSD
+OSD_CONFIDENZA_MIN = 1.5     # sotto questa confidenza OSD l'angolo non viene usato
+OCR_PUNTEGGIO_MIN = 40       # caratteri alfanumerici minimi per considerare buono un OCR
+OCR_PUNTEGGIO_SICURO = 450   # oltre questi caratteri la rotazione è giusta senza altre verifiche
+
+
+def _ocr_punteggio(txt):
+    return len(re.findall(r"[A-Za-z0-9]", txt or ""))
+
+
+def _ocr_ruotata(img, rot, timeout):
+    import pytesseract
+
+    im = img.rotate(rot, expand=True) if rot else img
+    return pytesseract.image_to_string(im, lang='eng', config='--psm 6', timeout=timeout) or ""
+
+
+def _ocr_orientamento(img, timeout):
+    """Rotazione da applicare (gradi antiorari come Image.rotate) secondo tesseract OSD, o None."""
+    import pytesseract
+
+    try:
+        thumb = img.convert('L')
+        thumb.thumbnail((OSD_MINIATURA, OSD_MINIATURA))
+        osd = pytesseract.image_to_osd(
+            thumb, config='-c min_characters_to_try=5',
+            output_type=pytesseract.Output.DICT, timeout=timeout,
+        )
+        if float(osd.get('orientation_conf') or 0) < OSD_CONFIDENZA_MIN:
+            return None
+        # OSD indica i gradi in senso orario per raddrizzare la pagina.
+        return (360 - int(osd.get('rotate') or 0)) % 360
+    except Exception:
+        return None
+
+
+def _ocr_immagine(img, page_no, timeout, angolo=None):
+    """OCR robusto per scansioni dritte o ruotate: restituisce (testo, rotazione usata).
+
+    angolo è la rotazione suggerita (già vista su questo documento o fornitore):
+    se l'OCR a quell'angolo supera OCR_PUNTEGGIO_SICURO non serve altro.
+    Altrimenti decide OSD: se conferma l'angolo suggerito basta OCR_PUNTEGGIO_MIN,
+    se ne indica un altro vince il testo migliore dei due. Se nemmeno così
+    l'OCR è buono si provano 0°/270° e resta il testo con più caratteri.
+    """
+    best_txt, best_rot = "", None
+    provate = set()
+
+    def _prova(rot):
+        nonlocal best_txt, best_rot
+        provate.add(rot)
+        try:
+            txt = _ocr_ruotata(img, rot, timeout)
+        except Exception:
+            return False
+        if _ocr_punteggio(txt) > _ocr_punteggio(best_txt):
+            best_txt, best_rot = txt, rot
+        return _ocr_punteggio(txt) >= OCR_PUNTEGGIO_MIN
+
+    if angolo is not None:
+        _prova(angolo)
+        if _ocr_punteggio(best_txt) > OCR_PUNTEGGIO_SICURO:
+            return best_txt, best_rot
+    rilevato = _ocr_orientamento(img, timeout)
+    if rilevato is not None:
+        if rilevato not in provate:
+            _prova(rilevato)
+        if _ocr_punteggio(best_txt) >= OCR_PUNTEGGIO_MIN:
+            return best_txt, best_rot
+
+    # Nei PDF VARD/Fincantieri le packing list sono spesso da pag. 4 in poi e ruotate.
+    for rot in ((270, 0) if page_no >= 4 else (0, 270)):
+        if rot in provate:
+            continue
+        _prova(rot)
+        # Se la rotazione è già sufficiente, non insiste.
+        if _ocr_punteggio(best_txt) > OCR_PUNTEGGIO_SICURO:
+            break
+    return best_txt, best_rot
+
+
+def _ocr_pagina_pdf(path, page_index, timeout, angolo=None):
+    """Worker: rasterizza la pagina (100 dpi) e ne restituisce (testo OCR, rotazione)."""
+    import pdfplumber
+
+    try:
+        with pdfplumber.open(path) as pdf:
+            page = pdf.pages[page_index]
+            img = page.to_image(resolution=100).original
+            return _ocr_immagine(img, page_index + 1, timeout, angolo)
+    except Exception:
+        return "", None
+
+
+def _ocr_executor():
+    workers = _ocr_workers()
+    with _OCR_POOL_LOCK:
+        if _OCR_POOL['executor'] is None or _OCR_POOL['workers'] != workers:
+            if _OCR_POOL['executor'] is not None:
+                _OCR_POOL['executor'].shutdown(wait=False, cancel_futures=True)
+                _OCR_POOL['executor'] = None
+            if workers > 0:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                _OCR_POOL['executor'] = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            _OCR_POOL['workers'] = workers
+        return _OCR_POOL['executor'], workers
+
+
+def _ocr_reset_executor(executor):
+    with _OCR_POOL_LOCK:
+        if _OCR_POOL['executor'] is executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            _OCR_POOL['executor'] = None
+
+
+def ocr_pagine_pdf(path, indici, angoli=None):
+    """OCR delle pagine indicate (indici 0-based): {indice: (testo, rotazione)}, in ordine di pagina.
+
+    Le pagine vengono distribuite sul pool di processi; ogni pagina ha un tempo
+    massimo (PDF_OCR_TIMEOUT per esecuzione di tesseract): oltre, il suo testo OCR resta vuoto.
+    angoli: rotazione suggerita per pagina ({indice: gradi}) o per tutte (int).
+    Se il pool non è disponibile l'OCR viene eseguito in sequenza nel processo corrente.
+    """
+    import math
+    import time
+    from concurrent.futures import TimeoutError as FuturesTimeout
+    from concurrent.futures.process import BrokenProcessPool
+
+    indici = list(indici)
+    if not indici:
+        return {}
+    if not isinstance(angoli, dict):
+        angoli = dict.fromkeys(indici, angoli)
+    timeout = _ocr_timeout()
+    executor, workers = _ocr_executor()
+    if executor is None or len(indici) == 1:
+        return {i: _ocr_pagina_pdf(path, i, timeout, angoli.get(i)) for i in indici}
+
+    try:
+        futures = [(i, executor.submit(_ocr_pagina_pdf, path, i, timeout, angoli.get(i))) for i in indici]
+    except (BrokenProcessPool, RuntimeError):
+        _ocr_reset_executor(executor)
+        return {i: _ocr_pagina_pdf(path, i, timeout, angoli.get(i)) for i in indici}
+
+    # Nel caso peggiore OSD e quattro esecuzioni OCR per pagina, più il margine per rasterizzare.
+    per_pagina = timeout * 5 + 30
+    scadenza = time.monotonic() + per_pagina * math.ceil(len(indici) / workers)
+    testi = {}
+    for i, fut in futures:
+        try:
+            testi[i] = fut.result(timeout=max(0.0, scadenza - time.monotonic()))
+        except FuturesTimeout:
+            fut.cancel()
+            testi[i] = ("", None)
+        except BrokenProcessPool:
+            # Un worker è terminato in modo anomalo (es. memoria): la pagina viene rifatta qui.
+            _ocr_reset_executor(executor)
+            testi[i] = _ocr_pagina_pdf(path, i, timeout, angoli.get(i))
+        except Exception:
+            testi[i] = ("", None)
+    return testi
+
+
 
 def register_import_pdf_routes(app_obj, deps):
     globals().update(deps)
@@ -17,821 +219,911 @@ def register_import_pdf_routes(app_obj, deps):
     print("[OK] IMPORT PDF - SALVATAGGIO PEZZI ROBUSTO - VERSIONE 5")
 
     # --- HELPER ESTRAZIONE PDF (Necessario per Import PDF) ---
+    def _osd_angoli_fornitore(fornitore, pagine):
+        """Rotazione OCR suggerita dal fornitore per ogni pagina richiesta (numerate da 1): {pagina: gradi}.
+
+        Le rotazioni sono salvate per posizione di pagina (es. VARD: 0° le prime tre,
+        270° le packing list dopo); una pagina oltre l'ultima vista usa l'ultima posizione nota.
+        """
+        if not fornitore or not pagine:
+            return {}
+        visti = {
+            int(p): int(v)
+            for p, v in ocr_cache_leggi(f"FORNITORE:{fornitore}"[:64], 'osd:v2', range(1, max(pagine) + 1)).items()
+        }
+        angoli = {}
+        for pagina in pagine:
+            precedenti = [p for p in visti if p <= pagina]
+            if precedenti:
+                angoli[pagina] = visti[max(precedenti)]
+        return angoli
+
+    def _osd_salva_angoli_fornitore(fornitore, angoli):
+        if fornitore:
+            ocr_cache_salva(f"FORNITORE:{fornitore}"[:64], 'osd:v2', {p: str(a) for p, a in angoli.items()})
+
+
+    # --- PARSER DDT: funzioni definite una volta alla registrazione del modulo ---
+    from datetime import date, datetime
+
+    def _to_float_it(s):
+        s = (s or "").strip()
+        if not s:
+            return None
+        s = s.replace(".", "").replace(",", ".")
+        try:
+            return float(s)
+        except Exception:
+            return None
 
+    def _to_int(s):
+        try:
+            return int(float(str(s).strip().replace(",", ".")))
+        except Exception:
+            return None
+
+    # Pattern dei codici articolo, compilati una volta: l'ordine è la priorità
+    # (vince il primo pattern che trova qualcosa nella riga, non il più a sinistra).
+    _SPAZI_RE = re.compile(r"\s+")
+    _NON_ALNUM_RE = re.compile(r"[^A-Z0-9]+")
+    _CODICE_TOKEN_RE = tuple(re.compile(p) for p in (
+        r"\d{6,8}-\d{4}-\d+-\d+",
+        r"\d{6,8}-\d{4}",
+        r"ITM\d{5,}",
+        r"U\d{6,}",
+        r"[A-Z]{1,4}/\d{4,8}",
+        r"\d{4}\.\d{3}",
+        r"[0-9A-Z]{3,}(?:[-/.][0-9A-Z]{2,}){1,}",
+    ))
+    _CODICE_RIGA_RE = tuple(re.compile(p) for p in (
+        r"\b\d{6,8}-\d{4}-\d+-\d+\b",
+        r"\b\d{6,8}-\d{4}\b",
+        r"\bITM\d{5,}\b",
+        r"\bU\d{6,}\b",
+        r"\b[A-Z]{1,4}/\d{4,8}\b",
+        r"\b\d{4}\.\d{3}\b",
+        r"\b[0-9A-Z]{3,}(?:[-/.][0-9A-Z]{2,}){1,}\b",
+        r"\bW\d{8,}[A-Z0-9]*\b",
+        r"\b\d{7,12}\b",
+    ))
+
+    def _clean_spaces(s):
+        return _SPAZI_RE.sub(" ", (s or "")).strip()
+
+    def _norm(s):
+        return _NON_ALNUM_RE.sub("", (s or "").upper())
+
+    def _looks_like_code(tok):
+        tok = (tok or "").strip().upper()
+        if not tok:
+            return False
+        return any(p.fullmatch(tok) for p in _CODICE_TOKEN_RE)
+
+    def _first_code_in_line(line):
+        for pat in _CODICE_RIGA_RE:
+            m = pat.search(line)
+            if m:
+                return m.group(0).strip()
+        return ""
+
+    def _canonical_client_from_text(full_text, lines):
+        t = (full_text or "").upper()
+        destination_zone = " ".join(
+            ln for ln in lines
+            if re.search(r"DESTINAT|DESTINAZIONE|DELIVERY ADDRESS|LUOGO DESTINAZIONE MERCE|LUOGO DESTINAZIONE|CLIENTE", ln, re.I)
+            or ('C/O CAMAR' in ln.upper())
+        ).upper()
+        zone = destination_zone or t
+
+        alias_map = {
+            'GALVANO TECNICA': [r'COTUGNO\s+GALVANOTECNICA', r'GALVANO ?TECNICA', r'GALVANOTECNICA'],
+            'FINCANTIERI': [r'FINCANTIERI'],
+            'AMICO': [r'AMICO\s*&\s*CO', r'AMICO'],
+            'DUFERCO': [r'DUFERCO'],
+            'WINGECO': [r'WINGECO'],
+            'DE WAVE': [r'DE\s*WAVE'],
+            'RF-DE WAVE': [r'RF\s*[- ]\s*DE\s*WAVE'],
+            'DE WAVE SAMA': [r'DE\s*WAVE\s*SAMA'],
+            'MARINE INTERIORS': [r'MARINE\s+INTERIORS'],
+            'SIEMGROUP': [r'SIEMGROUP', r'SIEM\s+GROUP'],
+            'SGDP': [r'SGDP'],
+            'SCORZA': [r'SCORZA'],
+        }
+
+        for canonical, pats in alias_map.items():
+            if any(re.search(p, zone, re.I) for p in pats):
+                return canonical
+        for canonical, pats in alias_map.items():
+            if any(re.search(p, t, re.I) for p in pats):
+                return canonical
 
-    def extract_data_from_ddt_pdf(path):
-        import pdfplumber
-        import pytesseract
-        import re
-        from datetime import date, datetime
-
-        def _to_float_it(s):
-            s = (s or "").strip()
-            if not s:
-                return None
-            s = s.replace(".", "").replace(",", ".")
-            try:
-                return float(s)
-            except Exception:
-                return None
-
-        def _to_int(s):
-            try:
-                return int(float(str(s).strip().replace(",", ".")))
-            except Exception:
-                return None
+        try:
+            clienti_validi = get_clienti_utenti()
+        except Exception:
+            clienti_validi = []
+        for c in clienti_validi:
+            if _norm(c) and _norm(c) in _norm(zone):
+                return c
+        for c in clienti_validi:
+            if _norm(c) and _norm(c) in _norm(t):
+                return c
+        return ""
+
+    def _extract_supplier(lines, full_text):
+        known = [
+            r'ATOTECH(?:\s+ITALIA)?\s+S\.R\.L\.?',
+            r'MKS\s+ATOTECH',
+            r'HALTON\s+MARINE\s+OY',
+            r'CO\. ?ME\. ?FRI\.?[-A-Z ]*S\.P\.A\.?',
+            r'FINCANTIERI\s+S\.P\.A\.?',
+            r'AMICO\s*&\s*CO\.\s*S\.P\.A\.?',
+            r'AMICO\s*&\s*CO',
+            r'ATENA\s+S\.?R\.?L\.?',
+            r'FERTUBI\s+FRIULI(?:\s+S\.?R\.?L\.?)?',
+        ]
+        head = lines[:80]
+        joined_head = "\n".join(head)
+        for pat in known:
+            m = re.search(pat, joined_head, re.I)
+            if m:
+                val = _clean_spaces(m.group(0).replace('MKS ', ''))
+                return val
+
+        bad_words = ('LOGISTICA', 'LOGISTICS', 'VETTORE', 'CORRIERE', 'TRASPORT', 'CA.MAR', 'CAMAR')
+        company_re = re.compile(r'([A-Z0-9&.,\- ]{3,}(?:S\.R\.L\.?|S\.P\.A\.?|SRL|SPA|OY|LTD|GMBH|SAS))', re.I)
+        for ln in head:
+            cand = _clean_spaces(ln)
+            if not cand or any(b in cand.upper() for b in bad_words):
+                continue
+            m = company_re.search(cand)
+            if m:
+                return _clean_spaces(m.group(1))
+        return ""
+
+    def _extract_meta(lines, full_text, path):
+        meta = {
+            "cliente": _canonical_client_from_text(full_text, lines),
+            "fornitore": _extract_supplier(lines, full_text),
+            "commessa": "",
+            "n_ddt": "",
+            "data_ingresso": date.today().strftime("%Y-%m-%d"),
+        }
+        # Se il file si chiama tipo "ARRIVO N°32_26 FINCANTIERI.pdf", precompila N. Arrivo = 32/26
+        try:
+            fname = os.path.basename(str(path))
+            m_arr = re.search(r"ARRIVO\s*N[°º.]?\s*(\d+)\s*[_/-]\s*(\d+)", fname, re.I)
+            if m_arr:
+                meta["n_arrivo"] = f"{m_arr.group(1)}/{m_arr.group(2)}"
+        except Exception:
+            pass
+
+        for ln in lines:
+            if not meta['n_ddt']:
+                for pat in [
+                    r"(?:DDT\s*N[°º.]?|N[°º.]?\s*DDT|NUMERO\s*BOLLA|DELIVERY\s*NOTE|DOCUMENTO\s*DI\s*TRASPORTO)\s*[:\-]?\s*([A-Z0-9./\-]{4,})",
+                    r"\b(DN\d{5,})\b",
+                    r"\b([A-Z]{1,3}\d{5,})\b",
+                ]:
+                    m = re.search(pat, ln, re.I)
+                    if m:
+                        val = m.group(1).strip()
+                        if val.upper() not in ('D.D.T', 'DDT'):
+                            meta['n_ddt'] = val
+                            break
 
-        def _clean_spaces(s):
-            return re.sub(r"\s+", " ", (s or "")).strip()
-
-        def _norm(s):
-            return re.sub(r"[^A-Z0-9]+", "", (s or "").upper())
-
-        def _looks_like_code(tok):
-            tok = (tok or "").strip().upper()
-            if not tok:
-                return False
-            patterns = [
-                r"\d{6,8}-\d{4}-\d+-\d+",
-                r"\d{6,8}-\d{4}",
-                r"ITM\d{5,}",
-                r"U\d{6,}",
-                r"[A-Z]{1,4}/\d{4,8}",
-                r"\d{4}\.\d{3}",
-                r"[0-9A-Z]{3,}(?:[-/.][0-9A-Z]{2,}){1,}",
-            ]
-            return any(re.fullmatch(p, tok) for p in patterns)
-
-        def _first_code_in_line(line):
-            patterns = [
-                r"\b\d{6,8}-\d{4}-\d+-\d+\b",
-                r"\b\d{6,8}-\d{4}\b",
-                r"\bITM\d{5,}\b",
-                r"\bU\d{6,}\b",
-                r"\b[A-Z]{1,4}/\d{4,8}\b",
-                r"\b\d{4}\.\d{3}\b",
-                r"\b[0-9A-Z]{3,}(?:[-/.][0-9A-Z]{2,}){1,}\b",
-                r"\bW\d{8,}[A-Z0-9]*\b",
-                r"\b\d{7,12}\b",
-            ]
-            for pat in patterns:
-                m = re.search(pat, line)
+            if not meta['commessa']:
+                m = re.search(r"(?:COMMESSA|ORDINE\s*/\s*CONTRATTO|YOUR\s+ORDER\s+NO\.?|VS\.?\s*RIF\.?|RIFERIMENTO)\s*[:\-]?\s*([A-Z0-9./\-]{4,})", ln, re.I)
                 if m:
-                    return m.group(0).strip()
-            return ""
-
-        def _ocr_page(page):
-            """OCR robusto per scansioni dritte o ruotate.
-            Ottimizzato per i PDF Fincantieri/VARD: le pagine di packing list sono spesso ruotate.
-            """
-            try:
-                img = page.to_image(resolution=100).original
-                page_no = int(getattr(page, 'page_number', 1) or 1)
-
-                # Nei PDF VARD/Fincantieri le packing list sono spesso da pag. 4 in poi e ruotate.
-                rotations = (270, 0) if page_no >= 4 else (0, 270)
-                best_txt = ""
-                best_score = 0
-                for rot in rotations:
-                    try:
-                        im = img.rotate(rot, expand=True) if rot else img
-                        txt = pytesseract.image_to_string(im, lang='eng', config='--psm 6') or ""
-                        score = len(re.findall(r"[A-Za-z0-9]", txt))
-                        if score > best_score:
-                            best_score = score
-                            best_txt = txt
-                        # Se la prima rotazione è già sufficiente, non insiste.
-                        if score > 450:
-                            break
-                    except Exception:
-                        pass
-                return best_txt
-            except Exception:
-                return ""
+                    meta['commessa'] = m.group(1).strip()
 
-        def _extract_text(pdf):
-            chunks = []
-            for page in pdf.pages:
-                txt = (page.extract_text() or "").strip()
-                if len(re.findall(r"[A-Za-z0-9]", txt)) < 40:
-                    ocr_txt = _ocr_page(page).strip()
-                    if len(re.findall(r"[A-Za-z0-9]", ocr_txt)) > len(re.findall(r"[A-Za-z0-9]", txt)):
-                        txt = ocr_txt
-                chunks.append(txt)
-            return "\n".join([c for c in chunks if c])
-
-        def _canonical_client_from_text(full_text, lines):
-            t = (full_text or "").upper()
-            destination_zone = " ".join(
-                ln for ln in lines
-                if re.search(r"DESTINAT|DESTINAZIONE|DELIVERY ADDRESS|LUOGO DESTINAZIONE MERCE|LUOGO DESTINAZIONE|CLIENTE", ln, re.I)
-                or ('C/O CAMAR' in ln.upper())
-            ).upper()
-            zone = destination_zone or t
-
-            alias_map = {
-                'GALVANO TECNICA': [r'COTUGNO\s+GALVANOTECNICA', r'GALVANO ?TECNICA', r'GALVANOTECNICA'],
-                'FINCANTIERI': [r'FINCANTIERI'],
-                'AMICO': [r'AMICO\s*&\s*CO', r'AMICO'],
-                'DUFERCO': [r'DUFERCO'],
-                'WINGECO': [r'WINGECO'],
-                'DE WAVE': [r'DE\s*WAVE'],
-                'RF-DE WAVE': [r'RF\s*[- ]\s*DE\s*WAVE'],
-                'DE WAVE SAMA': [r'DE\s*WAVE\s*SAMA'],
-                'MARINE INTERIORS': [r'MARINE\s+INTERIORS'],
-                'SIEMGROUP': [r'SIEMGROUP', r'SIEM\s+GROUP'],
-                'SGDP': [r'SGDP'],
-                'SCORZA': [r'SCORZA'],
-            }
-
-            for canonical, pats in alias_map.items():
-                if any(re.search(p, zone, re.I) for p in pats):
-                    return canonical
-            for canonical, pats in alias_map.items():
-                if any(re.search(p, t, re.I) for p in pats):
-                    return canonical
+        if not meta['commessa']:
+            m = re.search(r"\b(00\d{4,}[A-Z]{1,5}|SE-COP-\d+|OV\d+|[A-Z]{2}\d{6,})\b", full_text, re.I)
+            if m:
+                meta['commessa'] = m.group(1).strip()
 
+        m = re.search(r"\b(\d{2}/\d{2}/\d{4})\b", full_text)
+        if m:
             try:
-                clienti_validi = get_clienti_utenti()
-            except Exception:
-                clienti_validi = []
-            for c in clienti_validi:
-                if _norm(c) and _norm(c) in _norm(zone):
-                    return c
-            for c in clienti_validi:
-                if _norm(c) and _norm(c) in _norm(t):
-                    return c
-            return ""
-
-        def _extract_supplier(lines, full_text):
-            known = [
-                r'ATOTECH(?:\s+ITALIA)?\s+S\.R\.L\.?',
-                r'MKS\s+ATOTECH',
-                r'HALTON\s+MARINE\s+OY',
-                r'CO\. ?ME\. ?FRI\.?[-A-Z ]*S\.P\.A\.?',
-                r'FINCANTIERI\s+S\.P\.A\.?',
-                r'AMICO\s*&\s*CO\.\s*S\.P\.A\.?',
-                r'AMICO\s*&\s*CO',
-                r'ATENA\s+S\.?R\.?L\.?',
-                r'FERTUBI\s+FRIULI(?:\s+S\.?R\.?L\.?)?',
-            ]
-            head = lines[:80]
-            joined_head = "\n".join(head)
-            for pat in known:
-                m = re.search(pat, joined_head, re.I)
-                if m:
-                    val = _clean_spaces(m.group(0).replace('MKS ', ''))
-                    return val
-
-            bad_words = ('LOGISTICA', 'LOGISTICS', 'VETTORE', 'CORRIERE', 'TRASPORT', 'CA.MAR', 'CAMAR')
-            company_re = re.compile(r'([A-Z0-9&.,\- ]{3,}(?:S\.R\.L\.?|S\.P\.A\.?|SRL|SPA|OY|LTD|GMBH|SAS))', re.I)
-            for ln in head:
-                cand = _clean_spaces(ln)
-                if not cand or any(b in cand.upper() for b in bad_words):
-                    continue
-                m = company_re.search(cand)
-                if m:
-                    return _clean_spaces(m.group(1))
-            return ""
-
-        def _extract_meta(lines, full_text):
-            meta = {
-                "cliente": _canonical_client_from_text(full_text, lines),
-                "fornitore": _extract_supplier(lines, full_text),
-                "commessa": "",
-                "n_ddt": "",
-                "data_ingresso": date.today().strftime("%Y-%m-%d"),
-            }
-            # Se il file si chiama tipo "ARRIVO N°32_26 FINCANTIERI.pdf", precompila N. Arrivo = 32/26
-            try:
-                fname = os.path.basename(str(path))
-                m_arr = re.search(r"ARRIVO\s*N[°º.]?\s*(\d+)\s*[_/-]\s*(\d+)", fname, re.I)
-                if m_arr:
-                    meta["n_arrivo"] = f"{m_arr.group(1)}/{m_arr.group(2)}"
+                meta['data_ingresso'] = datetime.strptime(m.group(1), "%d/%m/%Y").strftime("%Y-%m-%d")
             except Exception:
                 pass
-
-            for ln in lines:
-                if not meta['n_ddt']:
-                    for pat in [
-                        r"(?:DDT\s*N[°º.]?|N[°º.]?\s*DDT|NUMERO\s*BOLLA|DELIVERY\s*NOTE|DOCUMENTO\s*DI\s*TRASPORTO)\s*[:\-]?\s*([A-Z0-9./\-]{4,})",
-                        r"\b(DN\d{5,})\b",
-                        r"\b([A-Z]{1,3}\d{5,})\b",
-                    ]:
-                        m = re.search(pat, ln, re.I)
-                        if m:
-                            val = m.group(1).strip()
-                            if val.upper() not in ('D.D.T', 'DDT'):
-                                meta['n_ddt'] = val
-                                break
-
-                if not meta['commessa']:
-                    m = re.search(r"(?:COMMESSA|ORDINE\s*/\s*CONTRATTO|YOUR\s+ORDER\s+NO\.?|VS\.?\s*RIF\.?|RIFERIMENTO)\s*[:\-]?\s*([A-Z0-9./\-]{4,})", ln, re.I)
-                    if m:
-                        meta['commessa'] = m.group(1).strip()
-
-            if not meta['commessa']:
-                m = re.search(r"\b(00\d{4,}[A-Z]{1,5}|SE-COP-\d+|OV\d+|[A-Z]{2}\d{6,})\b", full_text, re.I)
-                if m:
-                    meta['commessa'] = m.group(1).strip()
-
-            m = re.search(r"\b(\d{2}/\d{2}/\d{4})\b", full_text)
+        else:
+            m = re.search(r"\b(\d{1,2}\.\d{1,2}\.\d{4})\b", full_text)
             if m:
                 try:
-                    meta['data_ingresso'] = datetime.strptime(m.group(1), "%d/%m/%Y").strftime("%Y-%m-%d")
+                    meta['data_ingresso'] = datetime.strptime(m.group(1), "%d.%m.%Y").strftime("%Y-%m-%d")
                 except Exception:
                     pass
-            else:
-                m = re.search(r"\b(\d{1,2}\.\d{1,2}\.\d{4})\b", full_text)
-                if m:
-                    try:
-                        meta['data_ingresso'] = datetime.strptime(m.group(1), "%d.%m.%Y").strftime("%Y-%m-%d")
-                    except Exception:
-                        pass
 
-            return {k: _clean_spaces(v) for k, v in meta.items()}
+        return {k: _clean_spaces(v) for k, v in meta.items()}
 
-        def _merge_rows(rows):
-            merged = {}
-            for r in rows:
-                key = (r.get('codice') or '', r.get('descrizione') or '', r.get('lotto') or '', r.get('serial_number') or '')
-                if key not in merged:
-                    merged[key] = dict(r)
-                else:
-                    merged[key]['colli'] = to_int_eu(merged[key].get('colli')) + to_int_eu(r.get('colli'))
-                    try:
-                        merged[key]['pezzi'] = float(merged[key].get('pezzi') or 0) + float(r.get('pezzi') or 0)
-                    except Exception:
-                        pass
-                    if not merged[key].get('pezzi_articolo') and r.get('pezzi_articolo'):
-                        merged[key]['pezzi_articolo'] = r.get('pezzi_articolo')
-                    if not merged[key].get('um') and r.get('um'):
-                        merged[key]['um'] = r.get('um')
-            return list(merged.values())
-
-        def _base_row(codice='', descrizione='', colli=0, pezzi=0, um='', pezzi_articolo='', lotto='', serial_number=''):
-            return {
-                'codice': (codice or '').strip(),
-                'descrizione': _clean_spaces(descrizione),
-                'colli': colli if colli is not None else 0,
-                'pezzi': pezzi if pezzi is not None else 0,
-                'um': (um or '').strip().upper(),
-                'pezzi_articolo': (pezzi_articolo or '').strip(),
-                'lotto': (lotto or '').strip(),
-                'serial_number': (serial_number or '').strip(),
-            }
-
-        def _parse_atotech(lines):
-            """Parser dedicato ai DDT Atotech/Galvano.
-
-            Regole:
-            - ogni riga articolo del PDF resta una riga distinta;
-            - anche codice e lotto uguali NON vengono uniti;
-            - Colli = Pezzi per Galvano;
-            - Peso/Q.tà contiene la quantità in KG riportata nel documento;
-            - i lotti Atotech nel formato B0xx... vengono normalizzati in BOxx....
-            """
-            rows = []
+    def _merge_rows(rows):
+        merged = {}
+        for r in rows:
+            key = (r.get('codice') or '', r.get('descrizione') or '', r.get('lotto') or '', r.get('serial_number') or '')
+            if key not in merged:
+                merged[key] = dict(r)
+            else:
+                merged[key]['colli'] = to_int_eu(merged[key].get('colli')) + to_int_eu(r.get('colli'))
+                try:
+                    merged[key]['pezzi'] = float(merged[key].get('pezzi') or 0) + float(r.get('pezzi') or 0)
+                except Exception:
+                    pass
+                if not merged[key].get('pezzi_articolo') and r.get('pezzi_articolo'):
+                    merged[key]['pezzi_articolo'] = r.get('pezzi_articolo')
+                if not merged[key].get('um') and r.get('um'):
+                    merged[key]['um'] = r.get('um')
+        return list(merged.values())
+
+    def _base_row(codice='', descrizione='', colli=0, pezzi=0, um='', pezzi_articolo='', lotto='', serial_number=''):
+        return {
+            'codice': (codice or '').strip(),
+            'descrizione': _clean_spaces(descrizione),
+            'colli': colli if colli is not None else 0,
+            'pezzi': pezzi if pezzi is not None else 0,
+            'um': (um or '').strip().upper(),
+            'pezzi_articolo': (pezzi_articolo or '').strip(),
+            'lotto': (lotto or '').strip(),
+            'serial_number': (serial_number or '').strip(),
+        }
+
+    def _parse_atotech(lines):
+        """Parser dedicato ai DDT Atotech/Galvano.
+
+        Regole:
+        - ogni riga articolo del PDF resta una riga distinta;
+        - anche codice e lotto uguali NON vengono uniti;
+        - Colli = Pezzi per Galvano;
+        - Peso/Q.tà contiene la quantità in KG riportata nel documento;
+        - i lotti Atotech nel formato B0xx... vengono normalizzati in BOxx....
+        """
+        rows = []
+        current = None
+
+        codice_re = re.compile(r"\b(\d{6,8}-\d{4}-\d+-\d+)\b")
+        imballi = r"SAC|CAN|PAL|BOX|CRT|CASSA|FUSTO|FUSTI|TANICA|TANICHE|DRP|UN"
+
+        def _normalizza_lotto_atotech_ocr(value):
+            lot = re.sub(r"\s+", "", (value or "").upper())
+            lot = re.sub(r"[^A-Z0-9./-]", "", lot)
+
+            # Formato Atotech tipico: BO26G00697.
+            # L'OCR legge spesso la seconda lettera O come zero.
+            m = re.fullmatch(r"([B8])([O0])(\d{2})(13|B|8|[A-Z])(\d{3,})", lot)
+            if m:
+                prima = "B"
+                seconda = "O"
+                lettera = "B" if m.group(4) in {"13", "8"} else m.group(4)
+                return f"{prima}{seconda}{m.group(3)}{lettera}{m.group(5)}"
+            return lot
+
+        def _finish_current():
+            nonlocal current
+            if not current:
+                return
+            if re.fullmatch(r"\d{6,8}-\d{4}-\d+-\d+", current.get("codice") or ""):
+                if not current.get("colli"):
+                    current["colli"] = 1
+                if not current.get("pezzi_articolo"):
+                    current["pezzi_articolo"] = str(current["colli"])
+                rows.append(current)
             current = None
 
-            codice_re = re.compile(r"\b(\d{6,8}-\d{4}-\d+-\d+)\b")
-            imballi = r"SAC|CAN|PAL|BOX|CRT|CASSA|FUSTO|FUSTI|TANICA|TANICHE|DRP|UN"
+        for ln in lines:
+            line = _clean_spaces(ln)
+            if not line:
+                continue
 
-            def _normalizza_lotto_atotech_ocr(value):
-                lot = re.sub(r"\s+", "", (value or "").upper())
-                lot = re.sub(r"[^A-Z0-9./-]", "", lot)
+            m_code = codice_re.search(line)
+            if m_code:
+                _finish_current()
+                codice = m_code.group(1).strip()
+                rest = _clean_spaces(line.replace(codice, " ", 1))
+
+                # Riga standard Atotech:
+                # DESCRIZIONE CAN 6 150,00 156,90 KG 150,00
+                m_row = re.match(
+                    rf"^(.*?)\s+\b({imballi})\b\s+(\d{{1,5}})\s+"
+                    r"(\d+(?:[.,]\d+)?)\s+(\d+(?:[.,]\d+)?)\s+"
+                    r"(KG|PZ|NR|UN|N)\b\s+(-?\d+(?:[.,]\d+)?)\s*$",
+                    rest,
+                    re.I
+                )
 
-                # Formato Atotech tipico: BO26G00697.
-                # L'OCR legge spesso la seconda lettera O come zero.
-                m = re.fullmatch(r"([B8])([O0])(\d{2})(13|B|8|[A-Z])(\d{3,})", lot)
-                if m:
-                    prima = "B"
-                    seconda = "O"
-                    lettera = "B" if m.group(4) in {"13", "8"} else m.group(4)
-                    return f"{prima}{seconda}{m.group(3)}{lettera}{m.group(5)}"
-                return lot
-
-            def _finish_current():
-                nonlocal current
-                if not current:
-                    return
-                if re.fullmatch(r"\d{6,8}-\d{4}-\d+-\d+", current.get("codice") or ""):
-                    if not current.get("colli"):
-                        current["colli"] = 1
-                    if not current.get("pezzi_articolo"):
-                        current["pezzi_articolo"] = str(current["colli"])
-                    rows.append(current)
-                current = None
-
-            for ln in lines:
-                line = _clean_spaces(ln)
-                if not line:
-                    continue
+                if m_row:
+                    descr = _clean_spaces(m_row.group(1))
+                    colli = _to_int(m_row.group(3)) or 0
+                    um = (m_row.group(6) or "").upper()
+                    qta = _to_float_it(m_row.group(7)) or 0
+                else:
+                    descr = rest
+                    colli = 0
+                    um = ""
+                    qta = 0
 
-                m_code = codice_re.search(line)
-                if m_code:
-                    _finish_current()
-                    codice = m_code.group(1).strip()
-                    rest = _clean_spaces(line.replace(codice, " ", 1))
-
-                    # Riga standard Atotech:
-                    # DESCRIZIONE CAN 6 150,00 156,90 KG 150,00
-                    m_row = re.match(
-                        rf"^(.*?)\s+\b({imballi})\b\s+(\d{{1,5}})\s+"
-                        r"(\d+(?:[.,]\d+)?)\s+(\d+(?:[.,]\d+)?)\s+"
-                        r"(KG|PZ|NR|UN|N)\b\s+(-?\d+(?:[.,]\d+)?)\s*$",
-                        rest,
-                        re.I
-                    )
+                current = _base_row(
+                    codice=codice,
+                    descrizione=descr,
+                    colli=colli,
+                    pezzi=qta,
+                    um=um,
+                    pezzi_articolo=str(colli) if colli else "",
+                    lotto="",
+                    serial_number=""
+                )
+                continue
 
-                    if m_row:
-                        descr = _clean_spaces(m_row.group(1))
-                        colli = _to_int(m_row.group(3)) or 0
-                        um = (m_row.group(6) or "").upper()
-                        qta = _to_float_it(m_row.group(7)) or 0
-                    else:
-                        descr = rest
-                        colli = 0
-                        um = ""
-                        qta = 0
-
-                    current = _base_row(
-                        codice=codice,
-                        descrizione=descr,
-                        colli=colli,
-                        pezzi=qta,
-                        um=um,
-                        pezzi_articolo=str(colli) if colli else "",
-                        lotto="",
-                        serial_number=""
-                    )
+            if current is not None:
+                mlot = re.search(
+                    r"\bLOTTO\b\s*[:\-]?\s*([A-Z0-9\-./]+)",
+                    line,
+                    re.I
+                )
+                if mlot:
+                    current["lotto"] = _normalizza_lotto_atotech_ocr(mlot.group(1))
                     continue
 
-                if current is not None:
-                    mlot = re.search(
-                        r"\bLOTTO\b\s*[:\-]?\s*([A-Z0-9\-./]+)",
-                        line,
-                        re.I
-                    )
-                    if mlot:
-                        current["lotto"] = _normalizza_lotto_atotech_ocr(mlot.group(1))
-                        continue
-
-                    # Fallback se l'OCR spezza la riga articolo e mette
-                    # imballo/colli/pesi nella riga successiva.
-                    m_pack = re.search(
-                        rf"\b({imballi})\b\s+(\d{{1,5}})\s+"
-                        r"(\d+(?:[.,]\d+)?)\s+(\d+(?:[.,]\d+)?)\s+"
-                        r"(KG|PZ|NR|UN|N)\b\s+(-?\d+(?:[.,]\d+)?)",
-                        line,
-                        re.I
-                    )
-                    if m_pack and not current.get("colli"):
-                        colli = _to_int(m_pack.group(2)) or 0
-                        current["colli"] = colli
-                        current["um"] = (m_pack.group(5) or "").upper()
-                        current["pezzi"] = _to_float_it(m_pack.group(6)) or 0
-                        current["pezzi_articolo"] = str(colli) if colli else ""
-
-            _finish_current()
-            return rows
-
-        def _parse_comefri(lines):
-            rows = []
-            for ln in lines:
-                m = re.search(r"^(?:\d+\s+)?([A-Z]{1,4}/\d{3,8})\s+(U\d{6,}|[A-Z0-9.\-/]{5,})\s+(.+?)\s+(PZ|KG|NR)\s+(\d+(?:[.,]\d+)?)\s*$", ln, re.I)
+                # Fallback se l'OCR spezza la riga articolo e mette
+                # imballo/colli/pesi nella riga successiva.
+                m_pack = re.search(
+                    rf"\b({imballi})\b\s+(\d{{1,5}})\s+"
+                    r"(\d+(?:[.,]\d+)?)\s+(\d+(?:[.,]\d+)?)\s+"
+                    r"(KG|PZ|NR|UN|N)\b\s+(-?\d+(?:[.,]\d+)?)",
+                    line,
+                    re.I
+                )
+                if m_pack and not current.get("colli"):
+                    colli = _to_int(m_pack.group(2)) or 0
+                    current["colli"] = colli
+                    current["um"] = (m_pack.group(5) or "").upper()
+                    current["pezzi"] = _to_float_it(m_pack.group(6)) or 0
+                    current["pezzi_articolo"] = str(colli) if colli else ""
+
+        _finish_current()
+        return rows
+
+    def _parse_comefri(lines):
+        rows = []
+        for ln in lines:
+            m = re.search(r"^(?:\d+\s+)?([A-Z]{1,4}/\d{3,8})\s+(U\d{6,}|[A-Z0-9.\-/]{5,})\s+(.+?)\s+(PZ|KG|NR)\s+(\d+(?:[.,]\d+)?)\s*$", ln, re.I)
+            if m:
+                articolo_cliente = m.group(1).strip()
+                codice = m.group(2).strip()
+                descr = m.group(3).strip()
+                um = m.group(4).upper()
+                qta = _to_float_it(m.group(5)) or 0
+                rows.append(_base_row(codice, descr, 1, qta, um, str(_to_int(qta) or '')))
+        return rows
+
+    def _parse_amico(lines):
+        rows = []
+        i = 0
+        while i < len(lines):
+            ln = lines[i]
+            if re.fullmatch(r"\d{1,3}", ln.strip()):
+                collo = _to_int(ln.strip()) or 0
+                block = []
+                j = i + 1
+                while j < len(lines) and len(block) < 6:
+                    nxt = lines[j]
+                    if re.fullmatch(r"\d{1,3}", nxt.strip()) and block:
+                        break
+                    block.append(nxt)
+                    if re.search(r"\b\d{4}\.\d{3}\b.*\b\d+(?:[.,]\d+)?\b$", nxt):
+                        break
+                    j += 1
+                joined = " ".join(block)
+                m = re.search(r"(.+?)\s+(\d{4}\.\d{3})\s+(\d+(?:[.,]\d+)?)\s*$", joined)
                 if m:
-                    articolo_cliente = m.group(1).strip()
-                    codice = m.group(2).strip()
-                    descr = m.group(3).strip()
-                    um = m.group(4).upper()
-                    qta = _to_float_it(m.group(5)) or 0
-                    rows.append(_base_row(codice, descr, 1, qta, um, str(_to_int(qta) or '')))
+                    descr = m.group(1)
+                    codice = m.group(2)
+                    qta = _to_float_it(m.group(3)) or 0
+                    rows.append(_base_row(codice, descr, collo, qta, 'PZ', str(_to_int(qta) or '')))
+                    i = j
+            i += 1
+        return rows
+
+    def _parse_halton(lines):
+        rows = []
+        for idx, ln in enumerate(lines):
+            if 'ITM' not in ln.upper():
+                continue
+            m = re.search(r"\b(ITM\d{5,})\b\s+(.+?)\s+(\d+(?:[.,]\d+)?)\s+(?:\d+(?:[.,]\d+)?\s+)?(PCS|PZ|KG)\b", ln, re.I)
+            if m:
+                codice = m.group(1)
+                descr = m.group(2)
+                qta = _to_float_it(m.group(3)) or 0
+                um = m.group(4).upper()
+                extra = []
+                k = idx + 1
+                while k < len(lines) and len(extra) < 3:
+                    nxt = lines[k]
+                    if _first_code_in_line(nxt) or re.search(r"^\d+\s+\d+\s+ITM", nxt):
+                        break
+                    if not re.search(r"COMMODITY CODE|COUNTRY OF ORIGIN|EARLIER DELIVERED|PAGE\b", nxt, re.I):
+                        extra.append(nxt)
+                    k += 1
+                descr = _clean_spaces(" ".join([descr] + extra))
+                rows.append(_base_row(codice, descr, 0, qta, um, str(_to_int(qta) or '')))
+        return rows
+
+    def _parse_fincantieri_generic(lines):
+        """Parser dedicato Fincantieri/VARD.
+
+        Regola richiesta:
+        - Codice articolo = Numero Package + Marca pezzo
+        - Pezzi = colonna QTY
+        - Descrizione = descrizione/merce letta dalla packing list
+        - Colli = numero package, se leggibile, altrimenti 1
+        - Peso = gross weight, se leggibile
+        """
+        rows = []
+        full = "\n".join(lines)
+        up = full.upper()
+
+        # Attiva solo sui documenti Fincantieri/VARD/packing list.
+        is_fincantieri_vard = bool(
+            re.search(r"FINCANTIERI", up)
+            and re.search(r"\bVARD\b|SHIPYARDS|PACKING\s*LIST|C6333", up)
+        )
+
+        # Caso pedane / nessun codice articolo già gestito in precedenza.
+        if re.search(r"\bPEDANE\b", full, re.I):
+            m_qty = re.search(r"\b(\d+)\s+PZ\s+PEDANE\b", full, re.I)
+            m_colli = re.search(r"NUMERO\s+COLLI\s+(\d+)", full, re.I)
+            m_peso = re.search(r"TOTALE:\s*\d+\s+(\d+[.,]\d+)", full, re.I)
+            qty = _to_int(m_qty.group(1)) if m_qty else 0
+            colli = _to_int(m_colli.group(1)) if m_colli else qty
+            peso = _to_float_it(m_peso.group(1)) if m_peso else qty
+            rows.append(_base_row('', 'PEDANE', colli or 0, peso or 0, 'KG', str(qty or '')))
+
+        if not is_fincantieri_vard:
             return rows
 
-        def _parse_amico(lines):
-            rows = []
-            i = 0
-            while i < len(lines):
-                ln = lines[i]
-                if re.fullmatch(r"\d{1,3}", ln.strip()):
-                    collo = _to_int(ln.strip()) or 0
-                    block = []
-                    j = i + 1
-                    while j < len(lines) and len(block) < 6:
-                        nxt = lines[j]
-                        if re.fullmatch(r"\d{1,3}", nxt.strip()) and block:
-                            break
-                        block.append(nxt)
-                        if re.search(r"\b\d{4}\.\d{3}\b.*\b\d+(?:[.,]\d+)?\b$", nxt):
-                            break
-                        j += 1
-                    joined = " ".join(block)
-                    m = re.search(r"(.+?)\s+(\d{4}\.\d{3})\s+(\d+(?:[.,]\d+)?)\s*$", joined)
-                    if m:
-                        descr = m.group(1)
-                        codice = m.group(2)
-                        qta = _to_float_it(m.group(3)) or 0
-                        rows.append(_base_row(codice, descr, collo, qta, 'PZ', str(_to_int(qta) or '')))
-                        i = j
-                i += 1
-            return rows
+        def _clean_ocr_cell(s):
+            s = _clean_spaces(s or '')
+            s = s.replace('|', ' ')
+            s = re.sub(r"[\[\]{}]+", " ", s)
+            s = re.sub(r"\s+", " ", s).strip(" -_;:,.|")
+            return s
+
+        def _fix_package_no(s):
+            s = _clean_ocr_cell(s)
+            s = s.replace(',', '.')
+            # 620/14.04.2026, 8976/05.05.2026, ecc.
+            m = re.search(r"(\d{2,5}\s*/\s*\d{1,2}[./]\d{1,2}[./]\d{4})", s)
+            if not m:
+                return ''
+            val = re.sub(r"\s+", "", m.group(1)).replace('/', '/', 1)
+            return val.replace('.', '.')
+
+        def _extract_nums_tail(s):
+            # Ritorna possibili quantità, colli, peso dalla coda della riga.
+            nums = re.findall(r"(?<![A-Z0-9/])\d+(?:[.,]\d+)?(?![A-Z0-9/])", s)
+            # Rimuove numeri che fanno parte del package/date, tenendo quelli dopo U/M se possibile.
+            after_um = s
+            m_um = re.search(r"\b(PCS|PZ|SET|KG)\b", s, re.I)
+            if m_um:
+                after_um = s[m_um.end():]
+                nums2 = re.findall(r"\d+(?:[.,]\d+)?", after_um)
+                if nums2:
+                    nums = nums2
+            qty = _to_int(nums[0]) if nums else 1
+            colli = _to_int(nums[1]) if len(nums) >= 2 else 1
+            peso = _to_float_it(nums[-1]) if len(nums) >= 3 else None
+            if not qty or qty < 0:
+                qty = 1
+            if not colli or colli < 0:
+                colli = 1
+            return qty, colli, peso
+
+        def _row_from_line(ln):
+            raw = _clean_ocr_cell(ln)
+            if not re.search(r"PACKING\s*LIST|POCTING|PACING|PACKINGL", raw, re.I):
+                return None
+            pkg = _fix_package_no(raw)
+            if not pkg:
+                return None
 
-        def _parse_halton(lines):
-            rows = []
-            for idx, ln in enumerate(lines):
-                if 'ITM' not in ln.upper():
-                    continue
-                m = re.search(r"\b(ITM\d{5,})\b\s+(.+?)\s+(\d+(?:[.,]\d+)?)\s+(?:\d+(?:[.,]\d+)?\s+)?(PCS|PZ|KG)\b", ln, re.I)
-                if m:
-                    codice = m.group(1)
-                    descr = m.group(2)
-                    qta = _to_float_it(m.group(3)) or 0
-                    um = m.group(4).upper()
-                    extra = []
-                    k = idx + 1
-                    while k < len(lines) and len(extra) < 3:
-                        nxt = lines[k]
-                        if _first_code_in_line(nxt) or re.search(r"^\d+\s+\d+\s+ITM", nxt):
-                            break
-                        if not re.search(r"COMMODITY CODE|COUNTRY OF ORIGIN|EARLIER DELIVERED|PAGE\b", nxt, re.I):
-                            extra.append(nxt)
-                        k += 1
-                    descr = _clean_spaces(" ".join([descr] + extra))
-                    rows.append(_base_row(codice, descr, 0, qta, um, str(_to_int(qta) or '')))
-            return rows
+            # Parte prima del package = descrizione generale, se utile.
+            before, after = raw.split(pkg, 1)
+            before = re.sub(r"^\s*\d+\s*", "", before)
+            before = re.sub(r"PACKING\s*LIST", "", before, flags=re.I)
+            before = re.sub(r"\b(?:WARTSILA|VARD|LUMINITA|SCENSHIP|SCANSHIP|OFFICINA\s+MECCANICA)\b", "", before, flags=re.I)
+            before = _clean_ocr_cell(before)
+
+            # Parte dopo il package = marca pezzo / descrizione, prima di UM/quantità.
+            after0 = after
+            marca = re.split(r"\b(?:PCS|PZ|SET|KG)\b", after0, flags=re.I)[0]
+            marca = _clean_ocr_cell(marca)
+            marca = re.sub(r"\b(?:FAT|LOT|TOTAL|TOTALE)\b.*$", "", marca, flags=re.I).strip()
+
+            # Se l'OCR mette la descrizione nella riga prima e lascia marca vuota, usa before.
+            descr = marca or before or 'Packing list Fincantieri'
+            if before and marca and before.upper() not in marca.upper():
+                # Mantiene una descrizione più completa senza sporcare troppo.
+                descr = _clean_ocr_cell(f"{before} {marca}")
+
+            # Evita righe troppo generiche/gruppi pacchi.
+            if re.fullmatch(r"(?i)(PACKING|LIST|PACKING LIST|VARD|WARTSILA)", descr or ''):
+                return None
 
-        def _parse_fincantieri_generic(lines):
-            """Parser dedicato Fincantieri/VARD.
-
-            Regola richiesta:
-            - Codice articolo = Numero Package + Marca pezzo
-            - Pezzi = colonna QTY
-            - Descrizione = descrizione/merce letta dalla packing list
-            - Colli = numero package, se leggibile, altrimenti 1
-            - Peso = gross weight, se leggibile
-            """
-            rows = []
-            full = "\n".join(lines)
-            up = full.upper()
-
-            # Attiva solo sui documenti Fincantieri/VARD/packing list.
-            is_fincantieri_vard = bool(
-                re.search(r"FINCANTIERI", up)
-                and re.search(r"\bVARD\b|SHIPYARDS|PACKING\s*LIST|C6333", up)
+            qty, colli, peso = _extract_nums_tail(after0)
+            um_m = re.search(r"\b(PCS|PZ|SET|KG)\b", after0, re.I)
+            um = 'PZ'
+            if um_m:
+                um_raw = um_m.group(1).upper()
+                um = {'PCS': 'PZ', 'SET': 'PZ'}.get(um_raw, um_raw)
+
+            codice = _clean_ocr_cell(f"PACKAGE No.{pkg} - {descr}")
+            return _base_row(
+                codice=codice,
+                descrizione=descr,
+                colli=colli or 1,
+                pezzi=peso if peso is not None else qty,
+                um='KG' if peso is not None else um,
+                pezzi_articolo=str(qty or 1),
             )
 
-            # Caso pedane / nessun codice articolo già gestito in precedenza.
-            if re.search(r"\bPEDANE\b", full, re.I):
-                m_qty = re.search(r"\b(\d+)\s+PZ\s+PEDANE\b", full, re.I)
-                m_colli = re.search(r"NUMERO\s+COLLI\s+(\d+)", full, re.I)
-                m_peso = re.search(r"TOTALE:\s*\d+\s+(\d+[.,]\d+)", full, re.I)
-                qty = _to_int(m_qty.group(1)) if m_qty else 0
-                colli = _to_int(m_colli.group(1)) if m_colli else qty
-                peso = _to_float_it(m_peso.group(1)) if m_peso else qty
-                rows.append(_base_row('', 'PEDANE', colli or 0, peso or 0, 'KG', str(qty or '')))
-
-            if not is_fincantieri_vard:
-                return rows
-
-            def _clean_ocr_cell(s):
-                s = _clean_spaces(s or '')
-                s = s.replace('|', ' ')
-                s = re.sub(r"[\[\]{}]+", " ", s)
-                s = re.sub(r"\s+", " ", s).strip(" -_;:,.|")
-                return s
-
-            def _fix_package_no(s):
-                s = _clean_ocr_cell(s)
-                s = s.replace(',', '.')
-                # 620/14.04.2026, 8976/05.05.2026, ecc.
-                m = re.search(r"(\d{2,5}\s*/\s*\d{1,2}[./]\d{1,2}[./]\d{4})", s)
-                if not m:
-                    return ''
-                val = re.sub(r"\s+", "", m.group(1)).replace('/', '/', 1)
-                return val.replace('.', '.')
-
-            def _extract_nums_tail(s):
-                # Ritorna possibili quantità, colli, peso dalla coda della riga.
-                nums = re.findall(r"(?<![A-Z0-9/])\d+(?:[.,]\d+)?(?![A-Z0-9/])", s)
-                # Rimuove numeri che fanno parte del package/date, tenendo quelli dopo U/M se possibile.
-                after_um = s
-                m_um = re.search(r"\b(PCS|PZ|SET|KG)\b", s, re.I)
-                if m_um:
-                    after_um = s[m_um.end():]
-                    nums2 = re.findall(r"\d+(?:[.,]\d+)?", after_um)
-                    if nums2:
-                        nums = nums2
-                qty = _to_int(nums[0]) if nums else 1
-                colli = _to_int(nums[1]) if len(nums) >= 2 else 1
-                peso = _to_float_it(nums[-1]) if len(nums) >= 3 else None
-                if not qty or qty < 0:
-                    qty = 1
-                if not colli or colli < 0:
-                    colli = 1
-                return qty, colli, peso
-
-            def _row_from_line(ln):
-                raw = _clean_ocr_cell(ln)
-                if not re.search(r"PACKING\s*LIST|POCTING|PACING|PACKINGL", raw, re.I):
-                    return None
-                pkg = _fix_package_no(raw)
-                if not pkg:
-                    return None
-
-                # Parte prima del package = descrizione generale, se utile.
-                before, after = raw.split(pkg, 1)
-                before = re.sub(r"^\s*\d+\s*", "", before)
-                before = re.sub(r"PACKING\s*LIST", "", before, flags=re.I)
-                before = re.sub(r"\b(?:WARTSILA|VARD|LUMINITA|SCENSHIP|SCANSHIP|OFFICINA\s+MECCANICA)\b", "", before, flags=re.I)
-                before = _clean_ocr_cell(before)
-
-                # Parte dopo il package = marca pezzo / descrizione, prima di UM/quantità.
-                after0 = after
-                marca = re.split(r"\b(?:PCS|PZ|SET|KG)\b", after0, flags=re.I)[0]
-                marca = _clean_ocr_cell(marca)
-                marca = re.sub(r"\b(?:FAT|LOT|TOTAL|TOTALE)\b.*$", "", marca, flags=re.I).strip()
-
-                # Se l'OCR mette la descrizione nella riga prima e lascia marca vuota, usa before.
-                descr = marca or before or 'Packing list Fincantieri'
-                if before and marca and before.upper() not in marca.upper():
-                    # Mantiene una descrizione più completa senza sporcare troppo.
-                    descr = _clean_ocr_cell(f"{before} {marca}")
-
-                # Evita righe troppo generiche/gruppi pacchi.
-                if re.fullmatch(r"(?i)(PACKING|LIST|PACKING LIST|VARD|WARTSILA)", descr or ''):
-                    return None
-
-                qty, colli, peso = _extract_nums_tail(after0)
-                um_m = re.search(r"\b(PCS|PZ|SET|KG)\b", after0, re.I)
-                um = 'PZ'
-                if um_m:
-                    um_raw = um_m.group(1).upper()
-                    um = {'PCS': 'PZ', 'SET': 'PZ'}.get(um_raw, um_raw)
-
-                codice = _clean_ocr_cell(f"PACKAGE No.{pkg} - {descr}")
-                return _base_row(
-                    codice=codice,
-                    descrizione=descr,
-                    colli=colli or 1,
-                    pezzi=peso if peso is not None else qty,
-                    um='KG' if peso is not None else um,
-                    pezzi_articolo=str(qty or 1),
-                )
-
-            # Scansione righe OCR. Una riga = una riga di packing list quando possibile.
-            for ln in lines:
-                row = _row_from_line(ln)
+        # Scansione righe OCR. Una riga = una riga di packing list quando possibile.
+        for ln in lines:
+            row = _row_from_line(ln)
+            if row:
+                rows.append(row)
+
+        # Fallback: se alcune righe sono state spezzate, unisci piccole finestre di righe.
+        if len(rows) < 3:
+            for i in range(len(lines)):
+                joined = _clean_ocr_cell(' '.join(lines[i:i+3]))
+                row = _row_from_line(joined)
                 if row:
                     rows.append(row)
 
-            # Fallback: se alcune righe sono state spezzate, unisci piccole finestre di righe.
-            if len(rows) < 3:
-                for i in range(len(lines)):
-                    joined = _clean_ocr_cell(' '.join(lines[i:i+3]))
-                    row = _row_from_line(joined)
-                    if row:
-                        rows.append(row)
-
-            # Dedup mantenendo il primo risultato.
-            dedup = []
-            seen = set()
-            for r in rows:
-                key = (r.get('codice') or '').upper()
-                if key and key not in seen:
-                    seen.add(key)
-                    dedup.append(r)
-
-            return dedup
-
-        def _parse_generic(lines):
-            extracted_rows = []
-            last_row = None
-            full_for_profile = "\n".join(lines)
-            is_atotech_doc = bool(re.search(r"ATOTECH|MKS", full_for_profile, re.I))
-            for line in lines:
-                if last_row is not None:
-                    m_lotto = re.search(r"\bLOTTO\b\s*[:\-]?\s*([A-Z0-9\-./]+)", line, flags=re.I)
-                    if m_lotto:
-                        last_row['lotto'] = m_lotto.group(1).strip()
-                        continue
-                    m_ser = re.search(r"\b(?:SERIAL(?:E)?|SERIAL\s*NUMBER|MATRICOLA|S/?N)\b\s*[:\-]?\s*([A-Z0-9\-./]+)", line, flags=re.I)
-                    if m_ser:
-                        last_row['serial_number'] = m_ser.group(1).strip()
-                        continue
-
-                if re.search(r"^(CLIENTE|FORNITORE|DESTINATARIO|MITTENTE|COMMESSA|N\.?\s*DDT|DDT|BOLLA|DATA)\b", line, re.I):
+        # Dedup mantenendo il primo risultato.
+        dedup = []
+        seen = set()
+        for r in rows:
+            key = (r.get('codice') or '').upper()
+            if key and key not in seen:
+                seen.add(key)
+                dedup.append(r)
+
+        return dedup
+
+    # Parser generico: una riga alla volta, pattern compilati una volta.
+    _ATOTECH_DOC_RE = re.compile(r"ATOTECH|MKS", re.I)
+    _GEN_LOTTO_RE = re.compile(r"\bLOTTO\b\s*[:\-]?\s*([A-Z0-9\-./]+)", re.I)
+    _GEN_SERIALE_RE = re.compile(r"\b(?:SERIAL(?:E)?|SERIAL\s*NUMBER|MATRICOLA|S/?N)\b\s*[:\-]?\s*([A-Z0-9\-./]+)", re.I)
+    _GEN_INTESTAZIONE_RE = re.compile(r"^(CLIENTE|FORNITORE|DESTINATARIO|MITTENTE|COMMESSA|N\.?\s*DDT|DDT|BOLLA|DATA)\b", re.I)
+    _GEN_PEDANE_RE = re.compile(r"\bPEDANE\b", re.I)
+    _GEN_UM_RE = re.compile(r"\b(KG|KGS|PZ|PZS|NR|N\.?|UN|PCS)\b", re.I)
+    _GEN_COLLI_RE = re.compile(r"\bCOLLI\b\s*[:\-]?\s*(\d+)", re.I)
+    _GEN_PEZZI_CODICE_RE = re.compile(r"^(\d{6,8})-(\d{4})-(\d+)-")
+    _GEN_LOTTO_SERIALE_SUB_RE = re.compile(r"\b(?:LOTTO|SERIAL(?:E)?|SERIAL\s*NUMBER|MATRICOLA|S/?N)\b\s*[:\-]?\s*[A-Z0-9\-./]+", re.I)
+    _GEN_NUMERI_RE = re.compile(r"\d+(?:[.,]\d+)?")
+    _GEN_LOTTO_SUB_RE = re.compile(r"\bLOTTO\b\s*[:\-]?\s*[A-Z0-9\-./]+", re.I)
+    _GEN_SERIALE_SUB_RE = re.compile(r"\b(?:SERIAL(?:E)?|SERIAL\s*NUMBER|MATRICOLA|S/?N)\b\s*[:\-]?\s*[A-Z0-9\-./]+", re.I)
+    _GEN_IMBALLI_SUB_RE = re.compile(r"\b(CAN|PAL|BOX|CRT|CASS|COLLI?|PCS)\b", re.I)
+
+    def _parse_generic(lines):
+        extracted_rows = []
+        last_row = None
+        full_for_profile = "\n".join(lines)
+        is_atotech_doc = bool(_ATOTECH_DOC_RE.search(full_for_profile))
+        for line in lines:
+            if last_row is not None:
+                m_lotto = _GEN_LOTTO_RE.search(line)
+                if m_lotto:
+                    last_row['lotto'] = m_lotto.group(1).strip()
+                    continue
+                m_ser = _GEN_SERIALE_RE.search(line)
+                if m_ser:
+                    last_row['serial_number'] = m_ser.group(1).strip()
                     continue
 
-                codice = _first_code_in_line(line)
+            if _GEN_INTESTAZIONE_RE.search(line):
+                continue
 
-                # Nei PDF Atotech/Galvano il generico non deve prendere P.IVA,
-                # telefono, ordine interno, DDT o altri numeri di intestazione.
-                # Lasciamo passare solo i veri codici articolo Atotech.
-                if is_atotech_doc:
-                    if not re.fullmatch(r"\d{6,8}-\d{4}-\d+-\d+", codice or ""):
-                        continue
+            codice = _first_code_in_line(line)
 
-                if not codice and not re.search(r"\bPEDANE\b", line, re.I):
+            # Nei PDF Atotech/Galvano il generico non deve prendere P.IVA,
+            # telefono, ordine interno, DDT o altri numeri di intestazione.
+            # Lasciamo passare solo i veri codici articolo Atotech.
+            if is_atotech_doc:
+                if not _CODICE_TOKEN_RE[0].fullmatch(codice or ""):
                     continue
 
-                rest = _clean_spaces(line.replace(codice, ' ', 1)) if codice else line
-                um = ''
-                um_m = re.search(r"\b(KG|KGS|PZ|PZS|NR|N\.?|UN|PCS)\b", line, flags=re.I)
-                if um_m:
-                    um = um_m.group(1).upper().replace('.', '')
-                    um = {'KGS': 'KG', 'PZS': 'PZ', 'PCS': 'PZ'}.get(um, um)
-
-                colli = None
-                m_colli = re.search(r"\bCOLLI\b\s*[:\-]?\s*(\d+)", line, flags=re.I)
-                if m_colli:
-                    colli = _to_int(m_colli.group(1))
-                else:
-                    tokens = rest.split()
-                    for tok in tokens:
-                        if tok.isdigit():
-                            v = _to_int(tok)
-                            if v is not None and 0 <= v <= 9999:
-                                colli = v
-                                break
-
-                lotto = ''
-                m_lotto_inline = re.search(r"\bLOTTO\b\s*[:\-]?\s*([A-Z0-9\-./]+)", line, flags=re.I)
-                if m_lotto_inline:
-                    lotto = m_lotto_inline.group(1).strip()
-
-                serial = ''
-                m_ser_inline = re.search(r"\b(?:SERIAL(?:E)?|SERIAL\s*NUMBER|MATRICOLA|S/?N)\b\s*[:\-]?\s*([A-Z0-9\-./]+)", line, flags=re.I)
-                if m_ser_inline:
-                    serial = m_ser_inline.group(1).strip()
-
-                pezzi_articolo = ''
-                m_pz_code = re.match(r"^(\d{6,8})-(\d{4})-(\d+)-", codice or '')
-                if m_pz_code:
-                    pezzi_articolo = m_pz_code.group(3).lstrip('0') or m_pz_code.group(3)
-
-                temp_for_nums = line
-                if codice:
-                    temp_for_nums = temp_for_nums.replace(codice, ' ')
-                temp_for_nums = re.sub(r"\b(?:LOTTO|SERIAL(?:E)?|SERIAL\s*NUMBER|MATRICOLA|S/?N)\b\s*[:\-]?\s*[A-Z0-9\-./]+", ' ', temp_for_nums, flags=re.I)
-                nums = re.findall(r"\d+(?:[.,]\d+)?", temp_for_nums)
-                qta = None
-                if nums:
-                    preferred = None
-                    for n in nums:
-                        if ',' in n or '.' in n:
-                            preferred = n
-                    if preferred is None:
-                        preferred = nums[-1]
-                    qta = _to_float_it(preferred)
-
-                descrizione = rest
-                descrizione = re.sub(r"\bLOTTO\b\s*[:\-]?\s*[A-Z0-9\-./]+", ' ', descrizione, flags=re.I)
-                descrizione = re.sub(r"\b(?:SERIAL(?:E)?|SERIAL\s*NUMBER|MATRICOLA|S/?N)\b\s*[:\-]?\s*[A-Z0-9\-./]+", ' ', descrizione, flags=re.I)
-                descrizione = re.sub(r"\b(CAN|PAL|BOX|CRT|CASS|COLLI?|PCS)\b", ' ', descrizione, flags=re.I)
-                if colli is not None:
-                    descrizione = re.sub(rf"\b{re.escape(str(colli))}\b", ' ', descrizione, count=1)
-                if um:
-                    descrizione = re.sub(rf"\b{re.escape(um)}\b", ' ', descrizione, flags=re.I)
-                descrizione = _clean_spaces(descrizione)
-
-                if not codice and not descrizione:
-                    continue
+            if not codice and not _GEN_PEDANE_RE.search(line):
+                continue
 
-                row = _base_row(codice, descrizione, colli if colli is not None else 0, qta if qta is not None else 0, um, pezzi_articolo, lotto, serial)
-                extracted_rows.append(row)
-                last_row = row
-            return extracted_rows
-
-        def _profile_fix_meta(meta, lines, full_text):
-            txt = "\n".join(lines)
-            up = (txt + "\n" + (full_text or '')).upper()
-            meta = dict(meta or {})
-
-            if re.search(r"COTUGNO\s+GALVANOTECNICA|GALVANO\s*TECNICA", up):
-                meta['cliente'] = 'GALVANO TECNICA'
-            if re.search(r"MARINE\s+INTERIORS", up):
-                meta['cliente'] = 'MARINE INTERIORS'
-            if re.search(r"DE\s+WAVE", up):
-                meta['cliente'] = 'DE WAVE'
-            if re.search(r"FINCANTIERI", up) and re.search(r"\bVARD\b|SHIPYARDS|C6333|PACKING\s*LIST", up):
-                meta['cliente'] = 'FINCANTIERI'
-                meta['fornitore'] = meta.get('fornitore') or 'VARD'
-
-            if re.search(r"ATOTECH|MKS", up):
-                meta['fornitore'] = 'ATOTECH ITALIA S.R.L.'
-            if re.search(r"\bATENA\b", up):
-                meta['fornitore'] = 'ATENA S.R.L.'
-            if re.search(r"FERTUBI\s+FRIULI", up):
-                meta['fornitore'] = 'FERTUBI FRIULI S.R.L.'
-
-            if not meta.get('n_ddt'):
-                for pat in [
-                    r"SERIA\s*[:\-]?\s*(?:VSRTL\s*[*#-]?)?\s*(\d{3,})",
-                    r"\bVSRTL\s*[*#-]?(\d{3,})\b",
-                    r"NUMERO\s+BOLLA\s+(?:DATA\s+BOLLA\s+)?([A-Z0-9./-]{3,})",
-                    r"\b(AT\d{5,})\b",
-                    r"NUMERO\s+DOCUMENTO\s+(\d{3,})",
-                    r"DOCUMENTO\s+DI\s+TRASPORTO.*?NUMERO\s+(\d{3,})",
-                    r"\bNUMERO\b\s*\n?\s*(\d{3,})\s+\d{1,2}/\d{1,2}/\d{4}",
-                ]:
-                    m = re.search(pat, txt, re.I | re.S)
-                    if m:
-                        meta['n_ddt'] = m.group(1).strip(); break
+            rest = _clean_spaces(line.replace(codice, ' ', 1)) if codice else line
+            um = ''
+            um_m = _GEN_UM_RE.search(line)
+            if um_m:
+                um = um_m.group(1).upper().replace('.', '')
+                um = {'KGS': 'KG', 'PZS': 'PZ', 'PCS': 'PZ'}.get(um, um)
+
+            colli = None
+            m_colli = _GEN_COLLI_RE.search(line)
+            if m_colli:
+                colli = _to_int(m_colli.group(1))
+            else:
+                tokens = rest.split()
+                for tok in tokens:
+                    if tok.isdigit():
+                        v = _to_int(tok)
+                        if v is not None and 0 <= v <= 9999:
+                            colli = v
+                            break
 
-            if not meta.get('commessa'):
-                for pat in [
-                    r"ORDINE\s+INTERNO\s+(\d{5,})",
-                    r"RIF\.?\s*\(OR\)\s*N\.?\s*(\d+)",
-                    r"FUORI\s+ORDINE\s+(REF/?\d+)",
-                    r"(REGENT\s+VOYAGER[-\s]*\d*)",
-                ]:
-                    m = re.search(pat, txt, re.I)
-                    if m:
-                        meta['commessa'] = _clean_spaces(m.group(1)); break
+            lotto = ''
+            m_lotto_inline = _GEN_LOTTO_RE.search(line)
+            if m_lotto_inline:
+                lotto = m_lotto_inline.group(1).strip()
 
-            if not meta.get('data_ingresso') or meta.get('data_ingresso') == date.today().strftime('%Y-%m-%d'):
-                m = re.search(r"\b(\d{1,2}[/.]\d{1,2}[/.]\d{4})\b", txt)
+            serial = ''
+            m_ser_inline = _GEN_SERIALE_RE.search(line)
+            if m_ser_inline:
+                serial = m_ser_inline.group(1).strip()
+
+            pezzi_articolo = ''
+            m_pz_code = _GEN_PEZZI_CODICE_RE.match(codice or '')
+            if m_pz_code:
+                pezzi_articolo = m_pz_code.group(3).lstrip('0') or m_pz_code.group(3)
+
+            temp_for_nums = line
+            if codice:
+                temp_for_nums = temp_for_nums.replace(codice, ' ')
+            temp_for_nums = _GEN_LOTTO_SERIALE_SUB_RE.sub(' ', temp_for_nums)
+            nums = _GEN_NUMERI_RE.findall(temp_for_nums)
+            qta = None
+            if nums:
+                preferred = None
+                for n in nums:
+                    if ',' in n or '.' in n:
+                        preferred = n
+                if preferred is None:
+                    preferred = nums[-1]
+                qta = _to_float_it(preferred)
+
+            descrizione = rest
+            descrizione = _GEN_LOTTO_SUB_RE.sub(' ', descrizione)
+            descrizione = _GEN_SERIALE_SUB_RE.sub(' ', descrizione)
+            descrizione = _GEN_IMBALLI_SUB_RE.sub(' ', descrizione)
+            if colli is not None:
+                descrizione = re.sub(rf"\b{re.escape(str(colli))}\b", ' ', descrizione, count=1)
+            if um:
+                descrizione = re.sub(rf"\b{re.escape(um)}\b", ' ', descrizione, flags=re.I)
+            descrizione = _clean_spaces(descrizione)
+
+            if not codice and not descrizione:
+                continue
+
+            row = _base_row(codice, descrizione, colli if colli is not None else 0, qta if qta is not None else 0, um, pezzi_articolo, lotto, serial)
+            extracted_rows.append(row)
+            last_row = row
+        return extracted_rows
+
+    def _profile_fix_meta(meta, lines, full_text):
+        txt = "\n".join(lines)
+        up = (txt + "\n" + (full_text or '')).upper()
+        meta = dict(meta or {})
+
+        if re.search(r"COTUGNO\s+GALVANOTECNICA|GALVANO\s*TECNICA", up):
+            meta['cliente'] = 'GALVANO TECNICA'
+        if re.search(r"MARINE\s+INTERIORS", up):
+            meta['cliente'] = 'MARINE INTERIORS'
+        if re.search(r"DE\s+WAVE", up):
+            meta['cliente'] = 'DE WAVE'
+        if re.search(r"FINCANTIERI", up) and re.search(r"\bVARD\b|SHIPYARDS|C6333|PACKING\s*LIST", up):
+            meta['cliente'] = 'FINCANTIERI'
+            meta['fornitore'] = meta.get('fornitore') or 'VARD'
+
+        if re.search(r"ATOTECH|MKS", up):
+            meta['fornitore'] = 'ATOTECH ITALIA S.R.L.'
+        if re.search(r"\bATENA\b", up):
+            meta['fornitore'] = 'ATENA S.R.L.'
+        if re.search(r"FERTUBI\s+FRIULI", up):
+            meta['fornitore'] = 'FERTUBI FRIULI S.R.L.'
+
+        if not meta.get('n_ddt'):
+            for pat in [
+                r"SERIA\s*[:\-]?\s*(?:VSRTL\s*[*#-]?)?\s*(\d{3,})",
+                r"\bVSRTL\s*[*#-]?(\d{3,})\b",
+                r"NUMERO\s+BOLLA\s+(?:DATA\s+BOLLA\s+)?([A-Z0-9./-]{3,})",
+                r"\b(AT\d{5,})\b",
+                r"NUMERO\s+DOCUMENTO\s+(\d{3,})",
+                r"DOCUMENTO\s+DI\s+TRASPORTO.*?NUMERO\s+(\d{3,})",
+                r"\bNUMERO\b\s*\n?\s*(\d{3,})\s+\d{1,2}/\d{1,2}/\d{4}",
+            ]:
+                m = re.search(pat, txt, re.I | re.S)
                 if m:
-                    try:
-                        meta['data_ingresso'] = datetime.strptime(m.group(1).replace('.', '/'), '%d/%m/%Y').strftime('%Y-%m-%d')
-                    except Exception:
-                        pass
+                    meta['n_ddt'] = m.group(1).strip(); break
+
+        if not meta.get('commessa'):
+            for pat in [
+                r"ORDINE\s+INTERNO\s+(\d{5,})",
+                r"RIF\.?\s*\(OR\)\s*N\.?\s*(\d+)",
+                r"FUORI\s+ORDINE\s+(REF/?\d+)",
+                r"(REGENT\s+VOYAGER[-\s]*\d*)",
+            ]:
+                m = re.search(pat, txt, re.I)
+                if m:
+                    meta['commessa'] = _clean_spaces(m.group(1)); break
 
-            meta.setdefault('magazzino', 'STRUPPA')
-            meta.setdefault('stato', 'NAZIONALE')
-            return meta
+        if not meta.get('data_ingresso') or meta.get('data_ingresso') == date.today().strftime('%Y-%m-%d'):
+            m = re.search(r"\b(\d{1,2}[/.]\d{1,2}[/.]\d{4})\b", txt)
+            if m:
+                try:
+                    meta['data_ingresso'] = datetime.strptime(m.group(1).replace('.', '/'), '%d/%m/%Y').strftime('%Y-%m-%d')
+                except Exception:
+                    pass
 
-        def _parse_marine_interiors(lines):
-            rows = []
-            for idx, ln in enumerate(lines):
-                m = re.search(r"\b(W\d{8,}[A-Z0-9]*)\b", ln, re.I)
-                if not m:
-                    continue
-                codice = m.group(1).strip()
-                block = [ln.replace(codice, ' ')]
-                j = idx + 1
-                while j < len(lines) and len(block) < 5:
-                    nxt = lines[j]
-                    if re.search(r"\bW\d{8,}[A-Z0-9]*\b", nxt, re.I):
-                        break
-                    block.append(nxt)
-                    # in queste bolle la quantità è spesso sul finale della descrizione, es. PZ 2,000
-                    if re.search(r"\bPZ\b\s+\d+(?:[.,]\d+)?", nxt, re.I):
-                        break
-                    j += 1
-                joined = _clean_spaces(' '.join(block))
-                m_qta = re.search(r"\b(PZ|KG|MT|NR)\b\s+(\d+(?:[.,]\d+)?)", joined, re.I)
-                um = m_qta.group(1).upper() if m_qta else 'PZ'
-                qta = _to_float_it(m_qta.group(2)) if m_qta else 0
-                descr = re.sub(r"\b(PZ|KG|MT|NR)\b\s+\d+(?:[.,]\d+)?", ' ', joined, flags=re.I)
-                descr = _clean_spaces(descr)
-                rows.append(_base_row(codice, descr, 1, qta or 0, um, str(_to_int(qta) or '') if qta else ''))
-            return rows
+        meta.setdefault('magazzino', 'STRUPPA')
+        meta.setdefault('stato', 'NAZIONALE')
+        return meta
 
-        def _parse_fertubi_dewave(lines):
-            rows = []
-            txt = "\n".join(lines)
-            if not re.search(r"FERTUBI\s+FRIULI|TUBI\s+SALD", txt, re.I):
-                return rows
-            for idx, ln in enumerate(lines):
-                m = re.search(r"\b(\d{7,12})\b", ln)
-                if not m:
-                    continue
-                codice = m.group(1)
-                block = [ln.replace(codice, ' ')]
-                j = idx + 1
-                while j < len(lines) and len(block) < 7:
-                    nxt = lines[j]
-                    if re.search(r"\b\d{7,12}\b", nxt) and block:
-                        break
-                    block.append(nxt)
-                    if re.search(r"\b(MT|KG|PZ)\b\s+\d+(?:[.,]\d+)?", nxt, re.I):
-                        break
-                    j += 1
-                joined = _clean_spaces(' '.join(block))
-                # esempio Fertubi: dimensioni 30 15 1.5 MT 66,00 62,00
-                m_tail = re.search(r"(.*?)(?:\b\d+(?:[.,]\d+)?\s+\d+(?:[.,]\d+)?\s+\d+(?:[.,]\d+)?\s+)?\b(MT|KG|PZ)\b\s+(\d+(?:[.,]\d+)?)(?:\s+(\d+(?:[.,]\d+)?))?", joined, re.I)
-                if m_tail:
-                    descr = _clean_spaces(m_tail.group(1))
-                    um = m_tail.group(2).upper()
-                    qta = _to_float_it(m_tail.group(3)) or 0
-                    peso = _to_float_it(m_tail.group(4)) if m_tail.group(4) else qta
-                else:
-                    descr, um, qta, peso = joined, '', 0, 0
-                rows.append(_base_row(codice, descr, 1, peso or qta or 0, um, str(_to_int(qta) or '')))
+    def _parse_marine_interiors(lines):
+        rows = []
+        for idx, ln in enumerate(lines):
+            m = re.search(r"\b(W\d{8,}[A-Z0-9]*)\b", ln, re.I)
+            if not m:
+                continue
+            codice = m.group(1).strip()
+            block = [ln.replace(codice, ' ')]
+            j = idx + 1
+            while j < len(lines) and len(block) < 5:
+                nxt = lines[j]
+                if re.search(r"\bW\d{8,}[A-Z0-9]*\b", nxt, re.I):
+                    break
+                block.append(nxt)
+                # in queste bolle la quantità è spesso sul finale della descrizione, es. PZ 2,000
+                if re.search(r"\bPZ\b\s+\d+(?:[.,]\d+)?", nxt, re.I):
+                    break
+                j += 1
+            joined = _clean_spaces(' '.join(block))
+            m_qta = re.search(r"\b(PZ|KG|MT|NR)\b\s+(\d+(?:[.,]\d+)?)", joined, re.I)
+            um = m_qta.group(1).upper() if m_qta else 'PZ'
+            qta = _to_float_it(m_qta.group(2)) if m_qta else 0
+            descr = re.sub(r"\b(PZ|KG|MT|NR)\b\s+\d+(?:[.,]\d+)?", ' ', joined, flags=re.I)
+            descr = _clean_spaces(descr)
+            rows.append(_base_row(codice, descr, 1, qta or 0, um, str(_to_int(qta) or '') if qta else ''))
+        return rows
+
+    def _parse_fertubi_dewave(lines):
+        rows = []
+        txt = "\n".join(lines)
+        if not re.search(r"FERTUBI\s+FRIULI|TUBI\s+SALD", txt, re.I):
             return rows
+        for idx, ln in enumerate(lines):
+            m = re.search(r"\b(\d{7,12})\b", ln)
+            if not m:
+                continue
+            codice = m.group(1)
+            block = [ln.replace(codice, ' ')]
+            j = idx + 1
+            while j < len(lines) and len(block) < 7:
+                nxt = lines[j]
+                if re.search(r"\b\d{7,12}\b", nxt) and block:
+                    break
+                block.append(nxt)
+                if re.search(r"\b(MT|KG|PZ)\b\s+\d+(?:[.,]\d+)?", nxt, re.I):
+                    break
+                j += 1
+            joined = _clean_spaces(' '.join(block))
+            # esempio Fertubi: dimensioni 30 15 1.5 MT 66,00 62,00
+            m_tail = re.search(r"(.*?)(?:\b\d+(?:[.,]\d+)?\s+\d+(?:[.,]\d+)?\s+\d+(?:[.,]\d+)?\s+)?\b(MT|KG|PZ)\b\s+(\d+(?:[.,]\d+)?)(?:\s+(\d+(?:[.,]\d+)?))?", joined, re.I)
+            if m_tail:
+                descr = _clean_spaces(m_tail.group(1))
+                um = m_tail.group(2).upper()
+                qta = _to_float_it(m_tail.group(3)) or 0
+                peso = _to_float_it(m_tail.group(4)) if m_tail.group(4) else qta
+            else:
+                descr, um, qta, peso = joined, '', 0, 0
+            rows.append(_base_row(codice, descr, 1, peso or qta or 0, um, str(_to_int(qta) or '')))
+        return rows
+
+    def _row_signature_for_dedup(r):
+        """Firma robusta per evitare doppioni OCR.
+        Non usa solo la descrizione completa perché l'OCR può leggerla in modo leggermente diverso.
+        """
+        codice = _norm(r.get('codice') or '')
+        descr = _norm(r.get('descrizione') or '')
+        lotto = _norm(r.get('lotto') or '')
+        seriale = _norm(r.get('serial_number') or '')
+        # Se il codice è presente, è la chiave più affidabile.
+        # Lotto/seriale distinguono eventuali righe uguali ma realmente diverse.
+        if codice:
+            return ('COD', codice, lotto, seriale)
+        # Senza codice uso descrizione + lotto/seriale.
+        return ('DESC', descr, lotto, seriale)
+
+    # Layout fornitore dichiarati come dati: (nome, attivazione, parser righe).
+    # Il pattern di attivazione è cercato una volta sul testo del documento e copre
+    # tutte le righe che il parser potrebbe leggere: i parser dei layout assenti non
+    # scorrono nemmeno le righe. L'ordine è la priorità delle righe prima del dedup.
+    DDT_LAYOUT = (
+        ('atotech', re.compile(r"\b\d{6,8}-\d{4}-\d+-\d+\b"), _parse_atotech),
+        ('comefri', re.compile(r"[A-Z]{1,4}/\d{3,8}", re.I), _parse_comefri),
+        ('amico', re.compile(r"\d{4}\.\d{3}"), _parse_amico),
+        ('halton', re.compile(r"ITM", re.I), _parse_halton),
+        ('marine_interiors', re.compile(r"\bW\d{8,}[A-Z0-9]*\b", re.I), _parse_marine_interiors),
+        ('fertubi_dewave', re.compile(r"FERTUBI\s+FRIULI|TUBI\s+SALD", re.I), _parse_fertubi_dewave),
+        ('fincantieri_vard', re.compile(r"PEDANE|FINCANTIERI", re.I), _parse_fincantieri_generic),
+    )
+
+    def extract_data_from_ddt_pdf(path, tempi=None):
+        """Meta e righe del DDT. Se passato, tempi riceve i secondi per fase: testo, ocr, parsing."""
+        misure = {'testo': 0.0, 'ocr': 0.0}
+        inizio = time.perf_counter()
+        try:
+            return _estrai_ddt_pdf(path, misure)
+        finally:
+            if tempi is not None:
+                totale = time.perf_counter() - inizio
+                tempi['testo'] = misure['testo']
+                tempi['ocr'] = misure['ocr']
+                tempi['parsing'] = max(0.0, totale - misure['testo'] - misure['ocr'])
 
-        with pdfplumber.open(path) as pdf:
-            full_text = _extract_text(pdf)
+    def _estrai_ddt_pdf(path, misure):
+        import pdfplumber
+
+        def _extract_text(pdf):
+            """Testo del documento; il secondo valore è False se l'OCR di qualche pagina non è riuscito."""
+            chunks = [(page.extract_text() or "").strip() for page in pdf.pages]
+            # Le pagine con poco testo (scansioni) vanno in OCR, in parallelo sul pool.
+            da_ocr = [i for i, txt in enumerate(chunks) if len(re.findall(r"[A-Za-z0-9]", txt)) < 40]
+            # OCR già eseguito sullo stesso file (cache per pagina, numerata da 1).
+            ocr_testi = {p - 1: v for p, v in ocr_cache_leggi(digest, 'ddt_ocr:v1', [i + 1 for i in da_ocr]).items()}
+            mancanti = [i for i in da_ocr if i not in ocr_testi]
+            if mancanti:
+                # Rotazione suggerita: quella già vista sulla pagina, altrimenti quella del fornitore
+                # (riconosciuto dal testo incorporato delle altre pagine, se c'è).
+                angoli = {p - 1: int(v) for p, v in ocr_cache_leggi(digest, 'osd:v1', [i + 1 for i in mancanti]).items()}
+                testo_incorporato = "\n".join(c for c in chunks if c)
+                fornitore = _norm(_extract_supplier(testo_incorporato.splitlines(), testo_incorporato))
+                angoli_fornitore = _osd_angoli_fornitore(fornitore, [i + 1 for i in mancanti])
+                inizio_ocr = time.perf_counter()
+                nuovi = ocr_pagine_pdf(
+                    path, mancanti, {i: angoli.get(i, angoli_fornitore.get(i + 1)) for i in mancanti}
+                )
+                misure['ocr'] += time.perf_counter() - inizio_ocr
+                ocr_cache_salva(digest, 'ddt_ocr:v1', {i + 1: (v or "").strip() for i, (v, _) in nuovi.items()})
+                ruotate = {i + 1: str(rot) for i, (_, rot) in nuovi.items() if rot is not None}
+                ocr_cache_salva(digest, 'osd:v1', ruotate)
+                angoli_documento.update(ruotate)
+                ocr_testi.update({i: v for i, (v, _) in nuovi.items()})
+            completo = True
+            for i in da_ocr:
+                ocr_txt = (ocr_testi.get(i) or "").strip()
+                completo = completo and bool(ocr_txt)
+                if len(re.findall(r"[A-Za-z0-9]", ocr_txt)) > len(re.findall(r"[A-Za-z0-9]", chunks[i])):
+                    chunks[i] = ocr_txt
+            return "\n".join([c for c in chunks if c]), completo
+
+        # Stesso file già letto: il testo completo arriva dalla cache documenti.
+        inizio_testo = time.perf_counter()
+        digest = ocr_cache_digest(path)
+        angoli_documento = {}
+        full_text = ocr_cache_leggi(digest, 'ddt_pdf:v1').get(0)
+        if full_text is None:
+            with pdfplumber.open(path) as pdf:
+                full_text, completo = _extract_text(pdf)
+            if completo:
+                ocr_cache_salva(digest, 'ddt_pdf:v1', {0: full_text})
+
+        misure['testo'] = time.perf_counter() - inizio_testo - misure['ocr']
 
         lines = [_clean_spaces(l) for l in full_text.splitlines() if _clean_spaces(l)]
-        meta = _profile_fix_meta(_extract_meta(lines, full_text), lines, full_text)
+        meta = _profile_fix_meta(_extract_meta(lines, full_text, path), lines, full_text)
+        if angoli_documento:
+            # Rotazioni per posizione di pagina: suggerite per i prossimi documenti dello stesso fornitore.
+            _osd_salva_angoli_fornitore(_norm(_extract_supplier(lines, full_text)), angoli_documento)
 
         # I DDT Atotech/Galvano vengono gestiti esclusivamente dal parser dedicato.
         # Non passano dal parser generico, dal dedup o da _merge_rows:
         # due righe con lo stesso codice e lo stesso lotto devono restare distinte.
-        is_atotech_doc = bool(re.search(r"ATOTECH|MKS", full_text, re.I))
+        is_atotech_doc = bool(_ATOTECH_DOC_RE.search(full_text))
         if is_atotech_doc:
             atotech_rows = _parse_atotech(lines)
             if atotech_rows:
@@ -845,34 +1137,16 @@ def register_import_pdf_routes(app_obj, deps):
         # codici articolo. Per questo il parser generico viene eseguito sempre.
         # I duplicati vengono comunque eliminati più sotto con _row_signature_for_dedup(),
         # dando priorità al codice articolo come chiave affidabile.
+        testo_righe = "\n".join(lines)
         specific_rows = []
-        specific_rows.extend(_parse_atotech(lines))
-        specific_rows.extend(_parse_comefri(lines))
-        specific_rows.extend(_parse_amico(lines))
-        specific_rows.extend(_parse_halton(lines))
-        specific_rows.extend(_parse_marine_interiors(lines))
-        specific_rows.extend(_parse_fertubi_dewave(lines))
-        specific_rows.extend(_parse_fincantieri_generic(lines))
+        for _nome, attivazione, parser in DDT_LAYOUT:
+            if attivazione.search(testo_righe):
+                specific_rows.extend(parser(lines))
 
         generic_rows = _parse_generic(lines)
 
         rows = specific_rows + generic_rows
 
-        def _row_signature_for_dedup(r):
-            """Firma robusta per evitare doppioni OCR.
-            Non usa solo la descrizione completa perché l'OCR può leggerla in modo leggermente diverso.
-            """
-            codice = _norm(r.get('codice') or '')
-            descr = _norm(r.get('descrizione') or '')
-            lotto = _norm(r.get('lotto') or '')
-            seriale = _norm(r.get('serial_number') or '')
-            # Se il codice è presente, è la chiave più affidabile.
-            # Lotto/seriale distinguono eventuali righe uguali ma realmente diverse.
-            if codice:
-                return ('COD', codice, lotto, seriale)
-            # Senza codice uso descrizione + lotto/seriale.
-            return ('DESC', descr, lotto, seriale)
-
         # pulizia righe improbabili / preferenza codice articolo vero
         cleaned = []
         seen = set()
@@ -899,6 +1173,9 @@ def register_import_pdf_routes(app_obj, deps):
 
         return meta, _merge_rows(cleaned)
 
+    # Disponibile anche fuori dalle route (es. tools/bench_ddt_import.py).
+    globals()["extract_data_from_ddt_pdf"] = extract_data_from_ddt_pdf
+
     # --- ROUTE IMPORT PDF (PROTETTA ADMIN) ---
     @app.route('/import_pdf', methods=['GET', 'POST'])
     @login_required
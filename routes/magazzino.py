@@ -20,7 +20,7 @@ def register_magazzino_routes(app_obj, deps):
         import re
         import math
         from sqlalchemy.orm import selectinload
-        from sqlalchemy import func
+        from sqlalchemy import func, or_
         from datetime import datetime, date
 
         db = SessionLocal()
@@ -39,17 +39,13 @@ def register_magazzino_routes(app_obj, deps):
             except Exception:
                 pass
 
-            # 1) Query Base
-            qs = (
-                db.query(Articolo)
-                .options(selectinload(Articolo.attachments))
-                .order_by(Articolo.id_articolo.desc())
-            )
+            # 1) Query Base (tutti i filtri vengono applicati in SQL)
+            qs = db.query(Articolo).order_by(Articolo.id_articolo.desc())
 
             # 2) Filtri Base (cliente)
             if session.get('role') == 'client':
                 user_key_norm = normalize_text_key(current_user.id or '')
-                cliente_db_norm = normalized_sql_text(Articolo.cliente)
+                cliente_db_norm = Articolo.cliente_key
 
                 qs = qs.filter(cliente_db_norm == user_key_norm)
 
@@ -57,7 +53,7 @@ def register_magazzino_routes(app_obj, deps):
                 if args.get('cliente'):
                     cliente_norm = normalize_text_key(args.get('cliente'))
                     if cliente_norm:
-                        qs = qs.filter(normalized_sql_text(Articolo.cliente) == cliente_norm)
+                        qs = qs.filter(Articolo.cliente_key == cliente_norm)
 
             # 3) Filtro ID
             if args.get('id'):
@@ -82,7 +78,7 @@ def register_magazzino_routes(app_obj, deps):
             for field in text_filters:
                 val = args.get(field)
                 if val and val.strip():
-                    qs = qs.filter(getattr(Articolo, field).ilike(f"%{val.strip()}%"))
+                    qs = qs.filter(articoli_search_filter(val, [field]))
 
             # 5) Filtro M2 (range DA/A + compatibilità col vecchio campo singolo)
             m2_da = args.get('m2_da')
@@ -113,27 +109,17 @@ def register_magazzino_routes(app_obj, deps):
             if m2_da_f is None and m2_a_f is None and m2_legacy:
                 m2_filter = parse_float_filter(m2_legacy)
 
-            # 5) Recupero righe (per filtro date in Python)
-            all_rows = qs.all()
-
-            if m2_da_f is not None or m2_a_f is not None:
-                tmp = []
-                for r in all_rows:
-                    n = _to_float_it(r.m2)
-                    if n is None:
-                        continue
-                    if m2_da_f is not None and n < m2_da_f:
-                        continue
-                    if m2_a_f is not None and n > m2_a_f:
-                        continue
-                    tmp.append(r)
-                all_rows = tmp
-            elif m2_filter is not None:
-                all_rows = [r for r in all_rows if match_numeric_filter(r.m2, m2_filter)]
-
-            filtered_rows = []
+            if m2_da_f is not None:
+                qs = qs.filter(Articolo.m2 >= m2_da_f)
+            if m2_a_f is not None:
+                qs = qs.filter(Articolo.m2 <= m2_a_f)
+            if m2_filter is not None:
+                if m2_filter[0] == 'range':
+                    qs = qs.filter(Articolo.m2.between(m2_filter[1], m2_filter[2]))
+                else:
+                    qs = qs.filter(Articolo.m2.between(m2_filter[1] - 0.0005, m2_filter[1] + 0.0005))
 
-            # 6) Filtri Date
+            # 6) Filtri Date (colonne DATE indicizzate)
             def get_date_arg(k):
                 v = args.get(k)
                 try:
@@ -144,80 +130,37 @@ def register_magazzino_routes(app_obj, deps):
             d_ing_da, d_ing_a = get_date_arg('data_ing_da'), get_date_arg('data_ing_a')
             d_usc_da, d_usc_a = get_date_arg('data_usc_da'), get_date_arg('data_usc_a')
 
-            def parse_d(val):
-                if isinstance(val, date):
-                    return val
-                if not val:
-                    return None
-                if isinstance(val, str):
-                    try:
-                        return datetime.strptime(val[:10], "%Y-%m-%d").date()
-                    except:
-                        return None
-                return None
-
-            if any([d_ing_da, d_ing_a, d_usc_da, d_usc_a]):
-                for r in all_rows:
-                    keep = True
-
-                    # Ingresso
-                    if d_ing_da or d_ing_a:
-                        rd = parse_d(r.data_ingresso)
-                        if not rd or (d_ing_da and rd < d_ing_da) or (d_ing_a and rd > d_ing_a):
-                            keep = False
-
-                    # Uscita
-                    if keep and (d_usc_da or d_usc_a):
-                        rd = parse_d(r.data_uscita)
-                        if not rd or (d_usc_da and rd < d_usc_da) or (d_usc_a and rd > d_usc_a):
-                            keep = False
-
-                    if keep:
-                        filtered_rows.append(r)
-            else:
-                filtered_rows = all_rows
+            if d_ing_da:
+                qs = qs.filter(Articolo.data_ingresso_dt >= d_ing_da)
+            if d_ing_a:
+                qs = qs.filter(Articolo.data_ingresso_dt <= d_ing_a)
+            if d_usc_da:
+                qs = qs.filter(Articolo.data_uscita_dt >= d_usc_da)
+            if d_usc_a:
+                qs = qs.filter(Articolo.data_uscita_dt <= d_usc_a)
 
             # ✅ 7) FILTRO: SOLO IN GIACENZA / SOLO USCITE
             # In giacenza = NON ha data_uscita e NON ha n_ddt_uscita
             # Uscite = ha data_uscita oppure n_ddt_uscita
+            ha_ddt_usc = func.coalesce(func.trim(Articolo.n_ddt_uscita), '') != ''
             if args.get("solo_giacenza") == "1" and args.get("solo_uscite") != "1":
-                tmp = []
-                for r in filtered_rows:
-                    has_data_usc = parse_d(r.data_uscita) is not None
-                    has_ddt_usc = bool((r.n_ddt_uscita or "").strip())
-                    if (not has_data_usc) and (not has_ddt_usc):
-                        tmp.append(r)
-                filtered_rows = tmp
+                qs = qs.filter(Articolo.data_uscita_dt.is_(None), ~ha_ddt_usc)
             elif args.get("solo_uscite") == "1":
-                tmp = []
-                for r in filtered_rows:
-                    has_data_usc = parse_d(r.data_uscita) is not None
-                    has_ddt_usc = bool((r.n_ddt_uscita or "").strip())
-                    if has_data_usc or has_ddt_usc:
-                        tmp.append(r)
-                filtered_rows = tmp
-
-            # 8) Totali (sui risultati filtrati)
-            total_colli = 0
-            total_m2 = 0.0
-            total_peso = 0.0
-
-            for r in filtered_rows:
-                try:
-                    total_colli += int(r.n_colli or 0)
-                except:
-                    pass
-                try:
-                    total_m2 += float(r.m2) if r.m2 else 0.0
-                except:
-                    pass
-                try:
-                    total_peso += float(r.peso) if r.peso else 0.0
-                except:
-                    pass
-
-            # 9) Paginazione
-            total_items = len(filtered_rows)
+                qs = qs.filter(or_(Articolo.data_uscita_dt.isnot(None), ha_ddt_usc))
+
+            # 8) Totali (sui risultati filtrati) con una sola query aggregata
+            totali = qs.with_entities(
+                func.count(Articolo.id_articolo),
+                func.coalesce(func.sum(Articolo.n_colli), 0),
+                func.coalesce(func.sum(Articolo.m2), 0.0),
+                func.coalesce(func.sum(Articolo.peso), 0.0),
+            ).order_by(None).one()
+            total_items = int(totali[0] or 0)
+            total_colli = int(totali[1] or 0)
+            total_m2 = float(totali[2] or 0.0)
+            total_peso = float(totali[3] or 0.0)
+
+            # 9) Paginazione: carica solo le righe (e gli allegati) della pagina richiesta
             total_pages = math.ceil(total_items / PER_PAGE) if total_items else 1
 
             if page < 1:
@@ -225,9 +168,12 @@ def register_magazzino_routes(app_obj, deps):
             if page > total_pages:
                 page = total_pages
 
-            start = (page - 1) * PER_PAGE
-            end = start + PER_PAGE
-            current_page_rows = filtered_rows[start:end]
+            current_page_rows = (
+                qs.options(selectinload(Articolo.attachments))
+                .offset((page - 1) * PER_PAGE)
+                .limit(PER_PAGE)
+                .all()
+            )
 
             # ✅ FIX: parametri senza "page"
             search_params = request.args.copy()
@@ -454,7 +400,10 @@ def register_magazzino_routes(app_obj, deps):
         q = db.query(Articolo)
         cn = normalize_text_key(cliente)
         if cn:
-            q = q.filter(normalized_sql_text(Articolo.cliente) == cn)
+            q = q.filter(Articolo.cliente_key == cn)
+        # data_uscita_dt IS NULL è implicito nella data testuale vuota: permette l'uso
+        # dell'indice composto (cliente_key, data_uscita_dt).
+        q = q.filter(Articolo.data_uscita_dt == None)
         q = q.filter(or_(Articolo.data_uscita == None, Articolo.data_uscita == ''))
         q = q.filter(or_(Articolo.n_ddt_uscita == None, Articolo.n_ddt_uscita == ''))
 
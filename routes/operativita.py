@@ -55,7 +55,7 @@ def register_operativita_routes(app, deps):
         giorno = giorno or date.today()
         art_filters = []
         if cliente:
-            art_filters.append(func.upper(func.coalesce(Articolo.cliente, "")) == cliente.upper())
+            art_filters.append(Articolo.cliente_key == normalize_text_key(cliente))
 
         entrata_f = art_filters + [_article_date_filter(Articolo.data_ingresso, giorno)]
         uscita_f = art_filters + [_article_date_filter(Articolo.data_uscita, giorno)]
@@ -186,7 +186,7 @@ def register_operativita_routes(app, deps):
                 qt = db.query(Trasporto).filter(Trasporto.data >= start, Trasporto.data <= end)
                 ql = db.query(Lavorazione).filter(Lavorazione.data >= start, Lavorazione.data <= end)
                 if cliente:
-                    cf = func.upper(func.coalesce(Articolo.cliente, '')) == cliente.upper()
+                    cf = Articolo.cliente_key == normalize_text_key(cliente)
                     qin, qout = qin.filter(cf), qout.filter(cf)
                     qt = qt.filter(func.upper(func.coalesce(Trasporto.cliente, '')) == cliente.upper())
                     ql = ql.filter(func.upper(func.coalesce(Lavorazione.cliente, '')) == cliente.upper())
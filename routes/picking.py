@@ -510,7 +510,7 @@ def register_picking_routes(app_obj, deps):
             # Match ESATTO e normalizzato: evita che l'admin mescoli clienti simili
             articoli = (
                 db.query(Articolo)
-                .filter(normalized_sql_text(Articolo.cliente) == cliente_key)
+                .filter(Articolo.cliente_key == cliente_key)
                 .all()
             )
 
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark e accuratezza dell'Import PDF (extract_data_from_ddt_pdf).
+
+Il corpus è in tools/ddt_corpus/: ogni file JSON descrive un DDT sintetico/anonimizzato
+(righe di testo per pagina) e il risultato atteso (meta e righe). I PDF vengono generati
+in locale con reportlab a ogni esecuzione, nelle varianti richieste dal file:
+- testo: PDF con testo incorporato;
+- scansione: la stessa pagina rasterizzata a 200 dpi e salvata come sola immagine (serve tesseract);
+- scansione_ruotata: come scansione, ma con la pagina girata di 90°.
+
+Per ogni documento riporta pagine/s, tempo per fase (testo, OCR, parsing) e accuratezza
+per campo rispetto al JSON atteso. La cache OCR è disattivata e il database è un sqlite
+temporaneo, salvo DATABASE_URL impostata.
+
+Uso (dalla cartella del progetto):
+    python tools/bench_ddt_import.py                       # tutto il corpus
+    python tools/bench_ddt_import.py --solo-testo          # senza varianti scansionate
+    python tools/bench_ddt_import.py --ripetizioni 5 --differenze
+    python tools/bench_ddt_import.py --soglia 100          # exit 1 se l'accuratezza scende sotto il 100%
+    python tools/bench_ddt_import.py --salva-pdf /tmp/ddt  # conserva i PDF generati
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(RADICE, 'tools', 'ddt_corpus')
+DPI_SCANSIONE = 200
+MAX_DIFFERENZE = 12  # differenze mostrate per documento con --differenze
+
+
+# ------------------------------------------------------------
+# Generazione PDF
+# ------------------------------------------------------------
+def _pdf_testo(pagine, percorso):
+    """Una pagina A4 per elemento di pagine: ogni riga di testo a 14 pt di distanza."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(percorso, pagesize=A4)
+    for righe in pagine:
+        y = A4[1] - 50
+        for riga in righe:
+            grassetto = riga.startswith('**')
+            c.setFont('Helvetica-Bold' if grassetto else 'Helvetica', 10)
+            c.drawString(40, y, riga.lstrip('*'))
+            y -= 14
+        c.showPage()
+    c.save()
+
+
+def _pdf_scansione(percorso_testo, percorso, rotazione=0):
+    """Rasterizza il PDF di testo e lo salva come PDF di sole immagini (JPEG in scala di grigi)."""
+    import pypdfium2 as pdfium
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    sorgente = pdfium.PdfDocument(percorso_testo)
+    c = canvas.Canvas(percorso, pagesize=A4)
+    try:
+        for pagina in sorgente:
+            img = pagina.render(scale=DPI_SCANSIONE / 72).to_pil().convert('L')
+            if rotazione:
+                img = img.rotate(rotazione, expand=True)
+            buf = io.BytesIO()
+            img.save(buf, 'JPEG', quality=80)
+            buf.seek(0)
+            larghezza, altezza = (A4[1], A4[0]) if rotazione in (90, 270) else A4
+            c.setPageSize((larghezza, altezza))
+            c.drawImage(ImageReader(buf), 0, 0, width=larghezza, height=altezza)
+            c.showPage()
+        c.save()
+    finally:
+        sorgente.close()
+
+
+def genera_pdf(documento, variante, cartella):
+    base = os.path.join(cartella, documento['nome'])
+    percorso_testo = f"{base}__testo.pdf"
+    if not os.path.exists(percorso_testo):
+        _pdf_testo(documento['pagine'], percorso_testo)
+    if variante == 'testo':
+        return percorso_testo
+    percorso = f"{base}__{variante}.pdf"
+    _pdf_scansione(percorso_testo, percorso, 90 if variante == 'scansione_ruotata' else 0)
+    return percorso
+
+
+# ------------------------------------------------------------
+# Confronto con il risultato atteso
+# ------------------------------------------------------------
+def _valore(v):
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return round(float(v), 3)
+    s = re.sub(r'\s+', ' ', str(v if v is not None else '')).strip().upper()
+    try:
+        return round(float(s.replace(',', '.')), 3) if re.fullmatch(r'-?\d+(?:[.,]\d+)?', s) else s
+    except ValueError:
+        return s
+
+
+def _chiave_riga(riga):
+    return _valore(riga.get('codice')) or ('DESC', _valore(riga.get('descrizione')))
+
+
+def confronta(atteso, meta, righe):
+    """Campi corretti/attesi, righe mancanti/in più e l'elenco delle differenze."""
+    differenze = []
+    corretti = totali = 0
+
+    for campo, valore in (atteso.get('meta') or {}).items():
+        totali += 1
+        if _valore(meta.get(campo)) == _valore(valore):
+            corretti += 1
+        else:
+            differenze.append(f"meta.{campo}: atteso {valore!r}, letto {meta.get(campo)!r}")
+
+    lette = {}
+    for r in righe:
+        lette.setdefault(_chiave_riga(r), []).append(r)
+    mancanti = 0
+    for r_att in atteso.get('righe') or []:
+        totali += len(r_att)
+        candidati = lette.get(_chiave_riga(r_att))
+        if not candidati:
+            mancanti += 1
+            differenze.append(f"riga mancante: {r_att.get('codice') or r_att.get('descrizione')!r}")
+            continue
+        r = candidati.pop(0)
+        for campo, valore in r_att.items():
+            if _valore(r.get(campo)) == _valore(valore):
+                corretti += 1
+            else:
+                differenze.append(
+                    f"{r_att.get('codice') or r_att.get('descrizione')}.{campo}: atteso {valore!r}, letto {r.get(campo)!r}"
+                )
+    extra = sum(len(v) for v in lette.values())
+    for v in lette.values():
+        for r in v:
+            differenze.append(f"riga in più: {r.get('codice') or r.get('descrizione')!r}")
+    return {'corretti': corretti, 'totali': totali, 'mancanti': mancanti, 'extra': extra, 'differenze': differenze}
+
+
+# ------------------------------------------------------------
+# Esecuzione
+# ------------------------------------------------------------
+def _carica_estrattore():
+    """Importa l'applicazione (DB sqlite temporaneo, cache OCR spenta) e restituisce l'estrattore."""
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench_ddt_'), 'bench.db'))
+    os.environ['OCR_CACHE_MAX_MB'] = '0'
+    sys.path.insert(0, RADICE)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import gestionale_web_full  # noqa: F401  (registra le route e l'estrattore)
+    import routes.import_pdf as import_pdf
+    return import_pdf.extract_data_from_ddt_pdf
+
+
+def _tesseract_disponibile():
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def _pagine_pdf(percorso):
+    import pypdfium2 as pdfium
+    pdf = pdfium.PdfDocument(percorso)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def esegui(estrai, documento, variante, percorso, ripetizioni):
+    migliori = None
+    for _ in range(max(1, ripetizioni)):
+        tempi = {}
+        inizio = time.perf_counter()
+        meta, righe = estrai(percorso, tempi)
+        tempi['totale'] = time.perf_counter() - inizio
+        if migliori is None or tempi['totale'] < migliori['totale']:
+            migliori = tempi
+    esito = confronta(documento.get('atteso') or {}, meta, righe)
+    esito.update(documento=documento['nome'], variante=variante, pagine=_pagine_pdf(percorso), tempi=migliori)
+    return esito
+
+
+def _riga_report(e):
+    t = e['tempi']
+    accuratezza = 100.0 * e['corretti'] / e['totali'] if e['totali'] else 100.0
+    return (f"{e['documento']:<28} {e['variante']:<17} {e['pagine']:>3} {e['pagine'] / t['totale']:8.1f} "
+            f"{t['testo'] * 1000:8.1f} {t['ocr'] * 1000:9.1f} {t['parsing'] * 1000:8.1f} "
+            f"{accuratezza:7.1f}% {e['mancanti']:>4} {e['extra']:>4}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('documenti', nargs='*', help='nomi dei documenti del corpus (default: tutti)')
+    parser.add_argument('--corpus', default=CORPUS_DIR)
+    parser.add_argument('--ripetizioni', type=int, default=3, help='esecuzioni per documento (vale il tempo migliore)')
+    parser.add_argument('--solo-testo', action='store_true', help='salta le varianti scansionate')
+    parser.add_argument('--differenze', action='store_true', help='mostra i campi diversi dal risultato atteso')
+    parser.add_argument('--soglia', type=float, help='accuratezza minima complessiva in %% (exit 1 se inferiore)')
+    parser.add_argument('--json', help='scrive i risultati anche in questo file JSON')
+    parser.add_argument('--salva-pdf', help='cartella dove generare (e lasciare) i PDF del corpus')
+    args = parser.parse_args()
+
+    documenti = []
+    for percorso in sorted(glob.glob(os.path.join(args.corpus, '*.json'))):
+        with open(percorso, encoding='utf-8') as fh:
+            doc = json.load(fh)
+        doc.setdefault('nome', os.path.splitext(os.path.basename(percorso))[0])
+        if not args.documenti or doc['nome'] in args.documenti:
+            documenti.append(doc)
+    if not documenti:
+        sys.exit(f"Nessun documento nel corpus {args.corpus}")
+
+    estrai = _carica_estrattore()
+    ocr = not args.solo_testo and _tesseract_disponibile()
+    if not args.solo_testo and not ocr:
+        print("tesseract non disponibile: varianti scansionate saltate.")
+
+    cartella = args.salva_pdf or tempfile.mkdtemp(prefix='ddt_corpus_')
+    os.makedirs(cartella, exist_ok=True)
+    esiti = []
+    print(f"{'documento':<28} {'variante':<17} {'pag':>3} {'pag/s':>8} {'testo ms':>8} {'OCR ms':>9} "
+          f"{'pars. ms':>8} {'accur.':>8} {'manc':>4} {'extra':>4}")
+    for doc in documenti:
+        for variante in doc.get('varianti') or ['testo']:
+            if variante != 'testo' and not ocr:
+                continue
+            percorso = genera_pdf(doc, variante, cartella)
+            # L'OCR è lento e deterministico: una sola esecuzione basta.
+            e = esegui(estrai, doc, variante, percorso, args.ripetizioni if variante == 'testo' else 1)
+            esiti.append(e)
+            print(_riga_report(e))
+            if args.differenze:
+                for d in e['differenze'][:MAX_DIFFERENZE]:
+                    print(f"    - {d}")
+                if len(e['differenze']) > MAX_DIFFERENZE:
+                    print(f"    ... altre {len(e['differenze']) - MAX_DIFFERENZE} differenze (vedi --json)")
+
+    print()
+    for tipo, filtro in (('testo', lambda e: e['variante'] == 'testo'),
+                         ('scansioni', lambda e: e['variante'] != 'testo')):
+        gruppo = [e for e in esiti if filtro(e)]
+        if not gruppo:
+            continue
+        pagine = sum(e['pagine'] for e in gruppo)
+        durata = sum(e['tempi']['totale'] for e in gruppo)
+        fasi = {f: sum(e['tempi'][f] for e in gruppo) for f in ('testo', 'ocr', 'parsing')}
+        corretti = sum(e['corretti'] for e in gruppo)
+        totali = sum(e['totali'] for e in gruppo)
+        print(f"{tipo:<10} {pagine:>4} pagine  {pagine / durata:8.1f} pag/s   "
+              f"testo {fasi['testo']:.3f} s  OCR {fasi['ocr']:.3f} s  parsing {fasi['parsing']:.3f} s   "
+              f"accuratezza {100.0 * corretti / totali if totali else 100.0:.1f}% ({corretti}/{totali} campi)")
+
+    corretti = sum(e['corretti'] for e in esiti)
+    totali = sum(e['totali'] for e in esiti)
+    accuratezza = 100.0 * corretti / totali if totali else 100.0
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump({'accuratezza': accuratezza, 'documenti': esiti}, fh, ensure_ascii=False, indent=2)
+    if args.salva_pdf:
+        print(f"PDF generati in {cartella}")
+    if args.soglia is not None and accuratezza < args.soglia:
+        print(f"Accuratezza {accuratezza:.1f}% sotto la soglia {args.soglia:.1f}%")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
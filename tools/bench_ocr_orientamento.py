@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark OCR pagine scansionate: rotazione "a tentativi" contro pre-passaggio OSD.
+
+Confronta, sulle stesse immagini di pagina:
+- tentativi: OCR a 0°/270° (come prima dell'OSD), fino a due esecuzioni per pagina;
+- osd: orientamento da tesseract OSD su miniatura + un solo OCR a piena risoluzione;
+- osd+cache: rotazione già nota (documento/fornitore), un solo OCR; OSD solo se il testo è scarso.
+
+Uso (dalla cartella del progetto, serve tesseract installato):
+    python tools/bench_ocr_orientamento.py                  # pagine sintetiche (reportlab)
+    python tools/bench_ocr_orientamento.py file1.pdf ...    # PDF scansionati reali
+Opzioni: --pagine N (pagine sintetiche, default 8), --ruotate K (ogni K pagine una ruotata, default 2).
+
+Le pag/s hanno senso solo con tesseract reale: con un tesseract simulato contano
+solo le chiamate OCR/OSD, non il costo dell'OSD rispetto a un OCR completo.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytesseract  # noqa: E402
+
+import routes.import_pdf as import_pdf  # noqa: E402
+
+
+def _pagine_sintetiche(n, ogni_ruotata):
+    """Pagine tipo DDT/packing list generate con reportlab e rasterizzate a 100 dpi."""
+    import pypdfium2 as pdfium
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    immagini = []
+    for i in range(n):
+        buf = io.BytesIO()
+        c = canvas.Canvas(buf, pagesize=A4)
+        c.setFont('Helvetica-Bold', 14)
+        c.drawString(50, 800, f'DOCUMENTO DI TRASPORTO N. {1000 + i} DEL 0{1 + i % 9}/03/2025')
+        c.setFont('Helvetica', 11)
+        c.drawString(50, 780, 'FORNITORE: ESEMPIO FORNITURE S.R.L. - DESTINATARIO: CAMAR S.R.L.')
+        y = 740
+        for r in range(30):
+            c.drawString(50, y, f'{r + 1:>3}  COD{i:02d}{r:04d}  TUBO ACCIAIO DN{20 + r} L=6000   PZ {1 + r % 7}   KG {12.5 + r:.1f}')
+            y -= 20
+        c.showPage()
+        c.save()
+        pagina = pdfium.PdfDocument(buf.getvalue())[0]
+        img = pagina.render(scale=100 / 72).to_pil().convert('RGB')
+        # Scansione ruotata: la pagina va raddrizzata con rotate(270).
+        if ogni_ruotata and i % ogni_ruotata == ogni_ruotata - 1:
+            img = img.rotate(90, expand=True)
+        immagini.append((i + 1, img))
+    return immagini
+
+
+def _pagine_pdf(percorsi):
+    import pdfplumber
+
+    immagini = []
+    for percorso in percorsi:
+        with pdfplumber.open(percorso) as pdf:
+            for page in pdf.pages:
+                immagini.append((page.page_number, page.to_image(resolution=100).original))
+    return immagini
+
+
+class _Contatore:
+    """Conta le chiamate a tesseract (OCR completi e OSD)."""
+
+    def __init__(self):
+        self.ocr = 0
+        self.osd = 0
+        self._ocr = pytesseract.image_to_string
+        self._osd = pytesseract.image_to_osd
+
+    def __enter__(self):
+        def ocr(*a, **k):
+            self.ocr += 1
+            return self._ocr(*a, **k)
+
+        def osd(*a, **k):
+            self.osd += 1
+            return self._osd(*a, **k)
+
+        pytesseract.image_to_string = ocr
+        pytesseract.image_to_osd = osd
+        return self
+
+    def __exit__(self, *exc):
+        pytesseract.image_to_string = self._ocr
+        pytesseract.image_to_osd = self._osd
+
+
+def _esegui(nome, immagini, timeout, angoli=None, senza_osd=False):
+    originale = import_pdf._ocr_orientamento
+    if senza_osd:
+        import_pdf._ocr_orientamento = lambda img, timeout: None
+    try:
+        with _Contatore() as cont:
+            t0 = time.perf_counter()
+            risultati = [
+                import_pdf._ocr_immagine(img, page_no, timeout, (angoli or {}).get(k))
+                for k, (page_no, img) in enumerate(immagini)
+            ]
+            durata = time.perf_counter() - t0
+    finally:
+        import_pdf._ocr_orientamento = originale
+    punteggio = sum(import_pdf._ocr_punteggio(txt) for txt, _ in risultati)
+    print(f"{nome:<12} {len(immagini) / durata:8.2f} pag/s  {durata:7.2f} s  "
+          f"OCR {cont.ocr:3d}  OSD {cont.osd:3d}  caratteri {punteggio}")
+    return risultati, durata
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pdf', nargs='*', help='PDF scansionati da usare al posto delle pagine sintetiche')
+    parser.add_argument('--pagine', type=int, default=8)
+    parser.add_argument('--ruotate', type=int, default=2)
+    args = parser.parse_args()
+
+    try:
+        pytesseract.get_tesseract_version()
+    except Exception as e:
+        sys.exit(f"tesseract non disponibile: {e}")
+
+    immagini = _pagine_pdf(args.pdf) if args.pdf else _pagine_sintetiche(args.pagine, args.ruotate)
+    timeout = import_pdf._ocr_timeout()
+    print(f"Pagine: {len(immagini)}  (timeout tesseract {timeout:.0f} s)")
+
+    _, t_tentativi = _esegui('tentativi', immagini, timeout, senza_osd=True)
+    risultati, t_osd = _esegui('osd', immagini, timeout)
+    angoli = {k: rot for k, (_, rot) in enumerate(risultati) if rot is not None}
+    _, t_cache = _esegui('osd+cache', immagini, timeout, angoli=angoli)
+
+    print(f"Guadagno osd: x{t_tentativi / t_osd:.2f}   osd+cache: x{t_tentativi / t_cache:.2f}")
+
+
+if __name__ == '__main__':
+    main()
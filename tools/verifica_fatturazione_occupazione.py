@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+Verifica del calcolo occupazione di calcola_costi (NumPy, routes/fatturazione.py)
+contro il vecchio calcolo giorno per giorno, riportato qui sotto invariato come riferimento.
+
+Genera articoli casuali con seme fisso (date, m2/colli anche vuoti, negativi o testuali,
+clienti con spazi/minuscole) e confronta le righe di _calcola_logica_costi (m2, m2 con area
+manovra, colli) e di _calcola_logica_colli_giacenza su più periodi, per giorno e per mese.
+
+Periodo, cliente e giorni devono coincidere sempre; i valori pure, salvo una differenza nota:
+il nuovo calcolo somma le quantità in milionesimi interi e arrotonda il millesimo per
+eccesso a metà sul valore esatto, il vecchio sommava float nell'ordine degli articoli.
+Quando il valore esatto cade a metà del millesimo (es. 12.3445) il vecchio può stampare
+12.344 o 12.345 a seconda dell'errore accumulato. Queste righe vengono ricontrollate sul
+valore esatto e contate a parte; ogni altra differenza fa uscire lo script con codice 1.
+
+Uso (dalla cartella del progetto, servono numpy e le dipendenze di requirements.txt):
+    python tools/verifica_fatturazione_occupazione.py
+    python tools/verifica_fatturazione_occupazione.py --articoli 20000 --seme 3
+"""
+
+import argparse
+import ast
+import calendar
+import os
+import random
+import sys
+import textwrap
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+PROGETTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Funzioni di routes/fatturazione.py sotto verifica (definite dentro register_fatturazione_routes).
+NUOVE = (
+    'OCCUPAZIONE_SCALA', '_formatta_milionesimi', '_occupazione_giornaliera', '_segmenti_mensili',
+    '_calcola_logica_costi', '_calcola_logica_colli_giacenza',
+)
+
+
+def _carica_nuove():
+    """Estrae dal sorgente le funzioni annidate del modulo route e le esegue in un namespace."""
+    percorso = os.path.join(PROGETTO, 'routes', 'fatturazione.py')
+    with open(percorso, encoding='utf-8') as f:
+        src = f.read()
+    ns = {'date': date, 'datetime': datetime, 'timedelta': timedelta, 'calendar': calendar}
+    for nodo in ast.walk(ast.parse(src)):
+        nome = None
+        if isinstance(nodo, ast.FunctionDef):
+            nome = nodo.name
+        elif isinstance(nodo, ast.Assign) and isinstance(nodo.targets[0], ast.Name):
+            nome = nodo.targets[0].id
+        if nome in NUOVE and nome not in ns:
+            exec(textwrap.dedent(ast.get_source_segment(src, nodo)), ns)
+    mancanti = [n for n in NUOVE if n not in ns]
+    if mancanti:
+        sys.exit(f"Non trovate in routes/fatturazione.py: {', '.join(mancanti)}")
+    return ns
+
+
+# --- Riferimento: calcolo giorno per giorno precedente alla versione NumPy ---
+
+def vecchio_calcola_logica_costi(articoli, data_da, data_a, raggruppamento, m2_multiplier: float = 1.0, metric: str = "m2"):
+    """
+    metric:
+      - "m2"    => usa art.m2
+      - "colli" => usa art.n_colli
+      - "pezzi" => usa art.pezzi / art.pezzo
+    Ritorna SEMPRE anche m2_tot/m2_medio per compatibilità template.
+    """
+    from collections import defaultdict
+    from datetime import timedelta, date, datetime
+
+    val_per_giorno = defaultdict(float)
+
+    def to_date_obj(d):
+        if not d:
+            return None
+        if isinstance(d, datetime):
+            return d.date()
+        if isinstance(d, date):
+            return d
+        s = str(d).strip().split(" ")[0]
+        if len(s) < 8 or not s[0].isdigit():
+            return None
+        for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d"):
+            try:
+                return datetime.strptime(s, fmt).date()
+            except:
+                pass
+        return None
+
+    d_start = to_date_obj(data_da)
+    d_end = to_date_obj(data_a)
+    if not d_start or not d_end:
+        return []
+
+    metric = (metric or "m2").strip().lower()
+
+    def get_qty(art):
+        # ✅ M2
+        if metric == "m2":
+            try:
+                val_m2 = str(getattr(art, "m2", "") or "").replace(",", ".")
+                m2 = float(val_m2) if val_m2 else 0.0
+            except:
+                m2 = 0.0
+            if m2 <= 0:
+                return 0.0
+
+            # Area manovra (solo se metric == m2)
+            try:
+                m2 = m2 * float(m2_multiplier or 1.0)
+            except:
+                pass
+
+            return float(m2)
+
+        # ✅ COLLI
+        if metric == "colli":
+            try:
+                return float(int(getattr(art, "n_colli", 0) or 0))
+            except:
+                return 0.0
+
+        # ✅ PEZZI
+        if metric == "pezzi":
+            raw = getattr(art, "pezzi", None)
+            if raw is None:
+                raw = getattr(art, "pezzo", None)
+            try:
+                return float(int(raw or 0))
+            except:
+                return 0.0
+
+        # fallback
+        return 0.0
+
+    for art in articoli:
+        qty = get_qty(art)
+        if qty <= 0:
+            continue
+
+        d_ingr = to_date_obj(getattr(art, "data_ingresso_dt", None))
+        if not d_ingr:
+            continue
+
+        d_usc = to_date_obj(getattr(art, "data_uscita_dt", None))
+
+        inizio = max(d_ingr, d_start)
+        if d_usc:
+            fine = min(d_usc - timedelta(days=1), d_end)
+        else:
+            fine = d_end
+
+        if fine < inizio:
+            continue
+
+        cliente_key = (getattr(art, "cliente", None) or "SCONOSCIUTO").strip().upper()
+
+        curr = inizio
+        while curr <= fine:
+            val_per_giorno[(cliente_key, curr)] += qty
+            curr += timedelta(days=1)
+
+    risultati_finali = []
+
+    def pack_row(periodo, cliente, tot, medio, giorni):
+        # ✅ compatibilità: restituisco SEMPRE anche m2_tot/m2_medio
+        # così il template admin che stampa r.m2_tot / r.m2_medio funziona sempre.
+        tot_s = f"{tot:.3f}" if isinstance(tot, (int, float)) else str(tot)
+        med_s = f"{medio:.3f}" if isinstance(medio, (int, float)) else str(medio)
+
+        return {
+            "periodo": periodo,
+            "cliente": cliente,
+            # chiavi nuove "neutre"
+            "tot": tot_s,
+            "medio": med_s,
+            "giorni": giorni,
+            # chiavi legacy del template
+            "m2_tot": tot_s,
+            "m2_medio": med_s,
+        }
+
+    if raggruppamento == "giorno":
+        sorted_keys = sorted(val_per_giorno.keys(), key=lambda k: (k[0], k[1]))
+        for cliente, giorno in sorted_keys:
+            val = val_per_giorno[(cliente, giorno)]
+            risultati_finali.append(
+                pack_row(giorno.strftime("%d/%m/%Y"), cliente, val, val, 1)
+            )
+    else:
+        agg = defaultdict(lambda: {"sum": 0.0, "days": set()})
+        for (cli, day), val in val_per_giorno.items():
+            k = (cli, day.year, day.month)
+            agg[k]["sum"] += val
+            agg[k]["days"].add(day)
+
+        sorted_keys = sorted(agg.keys(), key=lambda k: (k[1], k[2], k[0]))
+        for (cli, y, m) in sorted_keys:
+            dati = agg[(cli, y, m)]
+            n_days = len(dati["days"])
+            tot = dati["sum"]
+
+            # ✅ M² EFFETTIVI (non medi): valore reale sull'ULTIMO giorno del periodo considerato per quel mese
+            if n_days > 0:
+                last_day = max(dati["days"])
+                eff = float(val_per_giorno.get((cli, last_day), 0.0))
+            else:
+                eff = 0.0
+
+            risultati_finali.append(
+                pack_row(f"{m:02d}/{y}", cli, tot, eff, n_days)
+            )
+
+    return risultati_finali
+
+
+def vecchio_calcola_logica_colli_giacenza(articoli, data_da, data_a, raggruppamento):
+    """
+    Calcola i COLLI in GIACENZA nel periodo (fotografia giornaliera o mensile),
+    togliendo quelli già usciti.
+
+    - Per ogni giorno: somma n_colli degli articoli che risultano "presenti" quel giorno.
+    - Presente = data_ingresso <= giorno AND (data_uscita è vuota oppure data_uscita > giorno)
+    """
+    from collections import defaultdict
+    from datetime import timedelta, date, datetime
+
+    colli_per_giorno = defaultdict(float)
+
+    def to_date_obj(d):
+        if not d:
+            return None
+        if isinstance(d, datetime):
+            return d.date()
+        if isinstance(d, date):
+            return d
+        s = str(d).strip().split(' ')[0]
+        if len(s) < 8 or not s[0].isdigit():
+            return None
+        for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d"):
+            try:
+                return datetime.strptime(s, fmt).date()
+            except Exception:
+                pass
+        return None
+
+    d_start = to_date_obj(data_da)
+    d_end = to_date_obj(data_a)
+    if not d_start or not d_end:
+        return []
+
+    for art in articoli:
+        try:
+            colli = float(int(art.n_colli or 0))
+        except Exception:
+            colli = 0.0
+
+        if colli <= 0:
+            continue
+
+        d_ingr = to_date_obj(art.data_ingresso_dt)
+        if not d_ingr:
+            continue
+
+        d_usc = to_date_obj(art.data_uscita_dt)
+
+        # Range di verifica nel periodo
+        start = max(d_ingr, d_start)
+        end = d_end
+
+        if end < start:
+            continue
+
+        cliente_key = (art.cliente or "SCONOSCIUTO").strip().upper()
+
+        curr = start
+        while curr <= end:
+            presente = (d_ingr <= curr) and ((d_usc is None) or (d_usc > curr))
+            if presente:
+                colli_per_giorno[(cliente_key, curr)] += colli
+            curr += timedelta(days=1)
+
+    risultati = []
+
+    if raggruppamento == "giorno":
+        keys = sorted(colli_per_giorno.keys(), key=lambda k: (k[0], k[1]))
+        for cli, day in keys:
+            v = colli_per_giorno[(cli, day)]
+            risultati.append({
+                "periodo": day.strftime("%d/%m/%Y"),
+                "cliente": cli,
+                "tot": f"{v:.0f}",
+                "medio": f"{v:.0f}",
+                "giorni": 1
+            })
+    else:
+        agg = defaultdict(lambda: {"sum": 0.0, "days": set()})
+        for (cli, day), v in colli_per_giorno.items():
+            k = (cli, day.year, day.month)
+            agg[k]["sum"] += v
+            agg[k]["days"].add(day)
+
+        keys = sorted(agg.keys(), key=lambda k: (k[1], k[2], k[0]))
+        for cli, y, m in keys:
+            dati = agg[(cli, y, m)]
+            n_days = len(dati["days"])
+            tot = dati["sum"]
+            avg = tot / n_days if n_days else 0.0
+            risultati.append({
+                "periodo": f"{m:02d}/{y}",
+                "cliente": cli,
+                "tot": f"{tot:.0f}",
+                "medio": f"{avg:.0f}",
+                "giorni": n_days
+            })
+
+    return risultati
+
+
+# --- Verifica ---
+
+def _articoli(n, seme):
+    rnd = random.Random(seme)
+    clienti = ['FINCANTIERI', 'de wave ', None, 'GALVANO', '  ', 'Duferco']
+    articoli = []
+    for _ in range(n):
+        d_in = date(2024, 1, 1) + timedelta(days=rnd.randint(0, 900))
+        d_out = d_in + timedelta(days=rnd.randint(-5, 400)) if rnd.random() < 0.6 else None
+        articoli.append(SimpleNamespace(
+            cliente=rnd.choice(clienti),
+            m2=rnd.choice([None, '', 0, -1, round(rnd.random() * 12, 3), '2,5', round(rnd.random() * 3, 1)]),
+            n_colli=rnd.choice([None, 0, -2, rnd.randint(1, 9), '3']),
+            pezzo=rnd.randint(0, 5),
+            data_ingresso_dt=d_in if rnd.random() > 0.02 else None,
+            data_uscita_dt=d_out,
+        ))
+    return articoli
+
+
+def _valori_esatti(articoli, riga, moltiplicatore, scala, da, a):
+    """tot e medio esatti (milionesimi interi) di una riga m2 di _calcola_logica_costi."""
+    d_da, d_a = date.fromisoformat(da), date.fromisoformat(a)
+    if riga['periodo'].count('/') == 2:
+        giorni = [datetime.strptime(riga['periodo'], '%d/%m/%Y').date()]
+    else:
+        mese, anno = map(int, riga['periodo'].split('/'))
+        giorni = [date(anno, mese, g) for g in range(1, calendar.monthrange(anno, mese)[1] + 1)]
+        giorni = [g for g in giorni if d_da <= g <= d_a]
+    per_giorno = dict.fromkeys(giorni, 0)
+    presenti = set()
+    for art in articoli:
+        try:
+            m2 = float(str(art.m2 or '').replace(',', '.') or 0)
+        except ValueError:
+            m2 = 0.0
+        if m2 <= 0 or not art.data_ingresso_dt:
+            continue
+        if (art.cliente or 'SCONOSCIUTO').strip().upper() != riga['cliente']:
+            continue
+        qty = round(m2 * moltiplicatore * scala)
+        for g in giorni:
+            if art.data_ingresso_dt <= g and (art.data_uscita_dt is None or art.data_uscita_dt > g):
+                per_giorno[g] += qty
+                presenti.add(g)
+    # medio: valore dell'ultimo giorno con articoli presenti (M² effettivi di fine periodo).
+    return sum(per_giorno.values()), per_giorno[max(presenti)] if presenti else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--articoli', type=int, default=3000)
+    parser.add_argument('--seme', type=int, default=7)
+    args = parser.parse_args()
+
+    nuove = _carica_nuove()
+    articoli = _articoli(args.articoli, args.seme)
+    periodi = [('2025-01-01', '2025-12-31'), ('2024-02-10', '2026-03-05'), ('2025-06-15', '2025-06-15'), ('2025-03-01', '2025-02-01')]
+    casi = [
+        ('_calcola_logica_costi', vecchio_calcola_logica_costi, {}),
+        ('_calcola_logica_costi', vecchio_calcola_logica_costi, {'m2_multiplier': 1.25}),
+        ('_calcola_logica_costi', vecchio_calcola_logica_costi, {'metric': 'colli'}),
+        ('_calcola_logica_colli_giacenza', vecchio_calcola_logica_colli_giacenza, {}),
+    ]
+    errori = arrotondamenti = righe = 0
+    for da, a in periodi:
+        for raggruppamento in ('giorno', 'mese'):
+            for nome, vecchia, kw in casi:
+                t0 = time.perf_counter()
+                attese = vecchia(articoli, da, a, raggruppamento, **kw)
+                t1 = time.perf_counter()
+                ottenute = nuove[nome](articoli, da, a, raggruppamento, **kw)
+                t2 = time.perf_counter()
+                esito = 'ok'
+                if len(attese) != len(ottenute):
+                    esito = f'RIGHE {len(attese)} != {len(ottenute)}'
+                    errori += 1
+                for x, y in zip(attese, ottenute):
+                    righe += 1
+                    if x == y:
+                        continue
+                    chiavi = ('periodo', 'cliente', 'giorni')
+                    if any(x[k] != y[k] for k in chiavi) or kw.get('metric') or nome != '_calcola_logica_costi':
+                        esito = f'DIFF {x} / {y}'
+                        errori += 1
+                        continue
+                    # Solo m2: ammesso lo scarto di un millesimo se il valore esatto è a metà.
+                    scala = nuove['OCCUPAZIONE_SCALA']
+                    esatti = dict(zip(('tot', 'medio'), _valori_esatti(
+                        articoli, y, kw.get('m2_multiplier', 1.0), scala, da, a)))
+                    spiegata = all(
+                        x[k] == y[k] or (
+                            y[k] == nuove['_formatta_milionesimi'](esatti[k]) and esatti[k] % 1000 == 500
+                            and abs(float(x[k]) - float(y[k])) < 0.0011
+                        )
+                        for k in ('tot', 'medio')
+                    )
+                    if spiegata:
+                        arrotondamenti += 1
+                    else:
+                        esito = f'DIFF {x} / {y} (esatti {esatti})'
+                        errori += 1
+                print(f"{nome:32} {str(kw):24} {da}..{a} {raggruppamento:6} {len(ottenute):6} righe "
+                      f"{t1 - t0:7.3f}s -> {t2 - t1:6.3f}s  {esito}")
+    print(f"Righe confrontate: {righe}  arrotondamenti a metà millesimo: {arrotondamenti}  differenze: {errori}")
+    sys.exit(1 if errori else 0)
+
+
+if __name__ == '__main__':
+    main()